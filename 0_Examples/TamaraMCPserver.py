@@ -1,290 +1,155 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 from dataclasses import dataclass, field
-import math
-from mcp.server.fastmcp import FastMCP
-import snap7
-from snap7.util import set_real, get_real, set_bool, get_bool
-
-# Initialize FastMCP server
-mcp = FastMCP("tamara")
-
-# System constants
-P_MIN_BAR = 0.2      # Minimum pressure (bar)
-T_PRIME_S = 0.5      # Prime delay for amorcage + priming (s)
-T_MIN_S = 3          # Minimum runtime for stable pressure (s)
-MU_REF = 1005.0      # Reference viscosity - water at 20°C (μPa·s)
-MANIFOLD_VOL = {     # Maximum volumes for manifolds (mL)
-    "SMALL": 1.7,
-    "LARGE": 23.0
-}
-
-# Solvent properties at 20°C
-SOLVENT_PROPERTIES = {
-    'ethanol': {
-        'viscosity': 1184.0,  # Base viscosity at 20°C (μPa·s)
-        'sensitivity': 22.0,  # Temperature sensitivity (μPa·s/°C)
-        'molar_volume': 22.0  # Molar volume (mL/mol)
-    },
-    'ipa': {
-        'viscosity': 2381.0,
-        'sensitivity': 68.0,
-        'molar_volume': 103.0
-    },
-    'acetone': {
-        'viscosity': 324.0,
-        'sensitivity': 3.0,
-        'molar_volume': 74.0
-    },
-    'methanol': {
-        'viscosity': 594.0,
-        'sensitivity': 7.0,
-        'molar_volume': 40.0
-    }
-}
-
-# Chip-specific geometry resistances
-CHIP_RESISTANCES = {
-    "BAFFLE": {
-        "1": 14.43,     # Linear resistance (mbar·s/μL)
-        "2": 59.80,
-        "3": 3.08,
-        "1a": 0.04118,  # Quadratic resistance (mbar·s²/μL²)
-        "2a": 0.28768,
-        "3a": 0.03947
-    },
-    "HERRINGBONE": {
-        "1": 12.06,
-        "2": 61.29,
-        "3": 5.09,
-        "1a": 0.07357,
-        "2a": 0.25822,
-        "3a": 0.0
-    }
-}
-
-# === PLC Connection Settings ===
-PLC_IP = "192.168.0.1"     # <-- Replace with actual IP
-DB_NUMBER = 9               # DB9 = DB_Experiments_
-BYTE_INDEX = 2              # Byte offset for sequence start
-# BIT_INDEX = 0              # Bit offset for
-
-# ---------------------------------------------------------------------------
-# Sequencing layer constants (mirrors mcp_params.py)
-# ---------------------------------------------------------------------------
-MODE_RUN = "RUN"
-MODE_CLEAN = "CLEAN"
-MODE_PRESSURE_TEST = "PRESSURE_TEST"
-
-CLEAN_CONSTANT = "constant"
-CLEAN_ALTERNATE = "alternate"
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import logging
+import os
+import sys
+from mcp.server.fastmcp import FastMCP, Context
+
+# The PLC whitelist and tag registry live with the graph agent
+AGENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "7_Tamara_Agent")
+sys.path.insert(0, AGENT_DIR)
+os.makedirs('logs', exist_ok=True)  # plc_tool logs to ./logs/tamara_plc.log
+from plc_tool import PLCInterface  # noqa: E402
+# Crunching model (mirrors FB_2a-Crunching) and sequence builder
+from crunching import (  # noqa: E402, F401 (re-exported for existing callers)
+    SOLVENT_PROPERTIES, MODE_RUN, MODE_CLEAN, MODE_PRESSURE_TEST, CLEAN_CONSTANT, CLEAN_ALTERNATE,
+    RunParameters, compute_derived_parameters, validate_parameters, build_sequence,
+)
+
+logger = logging.getLogger(__name__)
+
+STATUS_URI = "tamara://status"
+PLC_MODES = ("hardware", "sim")   # MCP_PLC_MODE; required, there is no silent simulator fallback
+STATUS_POLL_S = float(os.getenv("MCP_STATUS_POLL_S", "0.25"))  # one poll loop for all watchers
+
+class StatusHub:
+    """Single shared DB9 status poller fanning change-only updates out to all watchers.
+
+    The poller only talks to the PLC while at least one client is waiting in
+    ``watch_status``; N watchers cost the same two block reads per cycle as one.
+    """
+    def __init__(self, session: "PLCSession", interval: float = STATUS_POLL_S) -> None:
+        self.session = session
+        self.interval = interval
+        self.snapshot: Dict[str, Any] = {}
+        self.version = 0
+        self.waiters = 0                    # watch_status calls currently blocked
+        self._changed = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+        self._seq_started_at: Optional[float] = None
+        self.sequence_duration_s = 0.0      # set by send_to_tamara from the durations block
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def _progress(self, start_seq: bool) -> Optional[int]:
+        """Estimated sequence progress in 5 % steps, from elapsed time vs. the uploaded durations."""
+        loop_time = asyncio.get_running_loop().time()
+        if not start_seq:
+            self._seq_started_at = None
+            return None
+        if self._seq_started_at is None:
+            self._seq_started_at = loop_time
+        if self.sequence_duration_s <= 0:
+            return None
+        fraction = min(1.0, (loop_time - self._seq_started_at) / self.sequence_duration_s)
+        return int(fraction * 20) * 5
+
+    async def poll_once(self) -> bool:
+        """Read DB9 once and publish if anything changed. Returns True on change."""
+        async with self.session.lock:
+            self.session.plc.ensure_connected()
+            snapshot = self.session.plc.read_status_snapshot()
+        snapshot["progress_pct"] = self._progress(snapshot["start_seq"])
+        if snapshot == self.snapshot:
+            return False
+        async with self._changed:
+            self.snapshot = snapshot
+            self.version += 1
+            self._changed.notify_all()
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            if self.waiters:
+                try:
+                    await self.poll_once()
+                except Exception as e:
+                    logger.warning(f"Status poll failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def wait_for_change(self, since_version: int, timeout_s: float) -> bool:
+        """Block until version > since_version or the timeout expires."""
+        self.waiters += 1
+        try:
+            async with self._changed:
+                return await asyncio.wait_for(
+                    self._changed.wait_for(lambda: self.version > since_version), timeout_s
+                )
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiters -= 1
 
 @dataclass
-class RunParameters:
-    # User inputs
-    tfr: float                  # Total Flow Rate (mL/min)
-    frr: int                    # Flow Rate Ratio (aqueous:solvent)
-    tar_vol: float             # Target Volume (mL)
-    temp: float                # Temperature (°C)
-    chip_id: str               # Chip type (BAFFLE/HERRINGBONE)
-    manifold: str              # Manifold size (SMALL/LARGE)
-    viscosity_org: float       # Base viscosity of organic at 20°C (μPa·s)
-    viscosity_sens: float      # Viscosity temperature sensitivity (μPa·s/°C)
-    molar_vol: float          # Molar volume of organic (mL/mol)
-    lab_pressure: float        # Maximum input pressure (bar)
-
-    # Derived parameters
-    mu1: float = 0.0          # Viscosity of aqueous phase (μPa·s)
-    mu2: float = 0.0          # Viscosity of organic phase (μPa·s)
-    n: float = 0.0            # Ratio of organic to aqueous phase
-    mu3: float = 0.0          # Viscosity of mixture (μPa·s)
-    tfrmin: float = 0.0       # Minimum total flow rate (mL/min)
-    tfrmax: float = 0.0       # Maximum total flow rate (mL/min)
-    
-    # Adjusted resistances
-    resis: Dict[str,float] = field(default_factory=dict)
-    
-    # Effective linear & quad resistances
-    r1: float = 0.0
-    ra1: float = 0.0
-    r2: float = 0.0
-    ra2: float = 0.0
-    
-    # Split volumes & runtime
-    v1: float = 0.0           # Organic phase volume
-    v2: float = 0.0           # Aqueous phase volume
-    run_time: float = 0.0     # Runtime (Amorcage + priming + run) (s)
-    
-    # Flows
-    flow1: float = 0.0
-    flow2: float = 0.0
-    
-    # Pressures (bar)
-    press1: float = 0.0
-    press2: float = 0.0
-
-def compute_derived_parameters(rp: RunParameters) -> None:
-    """Compute all derived parameters for a RunParameters instance."""
-    # 1. Dynamic Viscosity Calculations
-    rp.mu1 = 1005.0 - 23.0 * (rp.temp - 20.0)  # Aqueous phase viscosity (water)
-    rp.mu2 = rp.viscosity_org - rp.viscosity_sens * (rp.temp - 20.0)
-    rp.n = rp.frr * (rp.molar_vol / 18.0)  # FRR is already the ratio
-    rp.mu3 = (rp.mu1 * rp.n + rp.mu2) / (1 + rp.n)
-
-    # 2. Viscosity-Adjusted Resistances
-    base_resis = CHIP_RESISTANCES[rp.chip_id]
-    for seg, base in base_resis.items():
-        if seg in ("1", "1a"):
-            mu_i = rp.mu1
-        elif seg in ("2", "2a"):
-            mu_i = rp.mu2
-        else:
-            mu_i = rp.mu3
-        rp.resis[seg] = base * (mu_i / MU_REF)
-
-    # 3. Effective Resistance per Line
-    fr_rate = rp.frr  # FRR is already the ratio
-    rp.r1 = rp.resis["1"] * (fr_rate / (1 + fr_rate)) + rp.resis["3"]
-    rp.ra1 = rp.resis["1a"] * ((fr_rate / (1 + fr_rate)) ** 2) + rp.resis["3a"]
-    rp.r2 = rp.resis["2"] * (1 / (1 + fr_rate)) + rp.resis["3"]
-    rp.ra2 = rp.resis["2a"] * ((1 / (1 + fr_rate)) ** 2) + rp.resis["3a"]
-
-    # 4. Compute TFRmin and TFRmax (in mL/min)
-    p_min_mbar = P_MIN_BAR * 1000
-    p_max_mbar = 0.9 * rp.lab_pressure * 1000
-
-    # TFRmin calculations
-    if rp.ra1 != 0:
-        tfrmin1 = (-rp.r1 + math.sqrt(rp.r1**2 + 4 * p_min_mbar * rp.ra1)) / (2 * rp.ra1)
-    else:
-        tfrmin1 = p_min_mbar / rp.r1
-    
-    if rp.ra2 != 0:
-        tfrmin2 = (-rp.r2 + math.sqrt(rp.r2**2 + 4 * p_min_mbar * rp.ra2)) / (2 * rp.ra2)
-    else:
-        tfrmin2 = p_min_mbar / rp.r2
-    
-    tfrmin_ul_per_s = max(tfrmin1, tfrmin2)
-    rp.tfrmin = tfrmin_ul_per_s / 1000 * 60
-
-    # TFRmax calculations
-    if rp.ra1 != 0:
-        tfrmax1 = (-rp.r1 + math.sqrt(rp.r1**2 + 4 * p_max_mbar * rp.ra1)) / (2 * rp.ra1)
-    else:
-        tfrmax1 = p_max_mbar / rp.r1
-    
-    if rp.ra2 != 0:
-        tfrmax2 = (-rp.r2 + math.sqrt(rp.r2**2 + 4 * p_max_mbar * rp.ra2)) / (2 * rp.ra2)
-    else:
-        tfrmax2 = p_max_mbar / rp.r2
-    
-    tfrmax_ul_per_s = min(tfrmax1, tfrmax2)
-    tfrmax_time = rp.tar_vol / T_MIN_S  # mL/s
-    tfrmax_time_ml_min = tfrmax_time * 60  # mL/min
-    rp.tfrmax = min(tfrmax_ul_per_s / 1000 * 60, tfrmax_time_ml_min)
-    
-    if rp.tfrmax <= rp.tfrmin:
-        rp.tfrmax = rp.tfrmin + 1
-
-    # 5. Volumes and Runtime
-    rp.v1 = rp.tar_vol / (1 + fr_rate)  # organic phase
-    rp.v2 = rp.v1 * fr_rate             # aqueous phase
-    tfr_ml_per_s = rp.tfr / 60
-    rp.run_time = rp.tar_vol / tfr_ml_per_s + T_PRIME_S
-
-    # 6. Flows and Pressures
-    Q = rp.tfr * 1000 / 60  # Convert to μL/s
-    rp.flow1 = rp.tfr * (fr_rate / (1 + fr_rate))
-    rp.flow2 = rp.tfr * (1 / (1 + fr_rate))
-    rp.press1 = (Q * rp.r1 + Q**2 * rp.ra1 + 10) / 1000  # bar
-    rp.press2 = (Q * rp.r2 + Q**2 * rp.ra2 + 10) / 1000  # bar
-
-def validate_parameters(rp: RunParameters) -> tuple[List[str], List[str], List[str]]:
-    """Validate parameters and return errors, warnings, and recommendations."""
-    errs, warns, recs = [], [], []
-    max_pressure = 0.9 * rp.lab_pressure
-    
-    # Pressure limits
-    for name, p in (("press1", rp.press1), ("press2", rp.press2)):
-        if p < P_MIN_BAR or p > max_pressure:
-            errs.append(f"{name}={p:.2f} bar out of [{P_MIN_BAR},{max_pressure:.2f}] bar")
-            recs.append("Consider adjusting TFR or FRR to bring pressures within limits")
-    
-    # Manifold capacity
-    limit = MANIFOLD_VOL[rp.manifold]
-    total_vol = rp.v1 + rp.v2
-    if total_vol > limit:
-        if rp.manifold == "SMALL" and total_vol <= MANIFOLD_VOL["LARGE"]:
-            warns.append(f"Total volume {total_vol:.2f} mL exceeds SMALL manifold capacity")
-            recs.append("Switch to LARGE manifold")
-        else:
-            errs.append(f"Total volume {total_vol:.2f} mL exceeds {rp.manifold} manifold capacity")
-            recs.append("Reduce target volume or adjust TFR/FRR")
-    
-    # FRR limit
-    if not (1 <= rp.frr <= 10):
-        errs.append(f"FRR={rp.frr} out of [1,10] allowed range")
-        recs.append("Adjust FRR to be between 1 and 10")
-    
-    # TFR dynamic limits
-    if not (rp.tfrmin <= rp.tfr <= rp.tfrmax):
-        errs.append(f"TFR={rp.tfr:.2f} mL/min out of [{rp.tfrmin:.2f},{rp.tfrmax:.2f}] mL/min")
-        recs.append("Adjust TFR to be within computed limits")
-    
-    return errs, warns, list(set(recs))  # Remove duplicate recommendations
-
-def build_sequence(rp: RunParameters, mode: str = MODE_RUN, clean_type: Optional[str] = None) -> List[float]:
-    """Return a 10-element PLC sequence array based on the requested mode.
-
-    Parameters
-    ----------
-    rp : RunParameters
-        Object populated with ``press1``, ``press2`` and ``run_time``.
-    mode : str, default "RUN"
-        One of ``MODE_RUN``, ``MODE_CLEAN`` or ``MODE_PRESSURE_TEST``.
-    clean_type : Optional[str]
-        Required when ``mode == MODE_CLEAN``. Either ``CLEAN_CONSTANT`` or
-        ``CLEAN_ALTERNATE``.
-    """
+class PLCSession:
+    """Long-lived PLC connection shared by all tool calls and client sessions of this server."""
+    plc: PLCInterface
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)  # snap7 clients are not re-entrant
+    status: Optional[StatusHub] = None
+    users: int = 0
 
-    # ------------------------- RUN (mode 0) ------------------------------
-    if mode == MODE_RUN:
-        mode_code = 0.0
-        # 30 % – 60 % – 100 % pressure ramp
-        p_factors = (0.3, 0.6, 1.0)
-        durations = (rp.run_time * 0.10, rp.run_time * 0.10, rp.run_time * 0.80)
-
-        p1_vals = [rp.press1 * f for f in p_factors]
-        p2_vals = [rp.press2 * f for f in p_factors]
-
-    # ---------------------- CLEAN (modes 1 & 2) --------------------------
-    elif mode == MODE_CLEAN:
-        if clean_type == CLEAN_CONSTANT:
-            mode_code = 1.0
-            p1_vals = [rp.press1 * 0.5, 0.0, 0.0]
-            p2_vals = [rp.press2 * 0.5, 0.0, 0.0]
-            durations = (10.0, 0.0, 0.0)
-        elif clean_type == CLEAN_ALTERNATE:
-            mode_code = 2.0
-            p1_vals = [rp.press1, 0.0, rp.press1]
-            p2_vals = [rp.press2, 0.0, rp.press2]
-            durations = (5.0, 5.0, 5.0)
-        else:
-            raise ValueError("When mode is CLEAN, clean_type must be 'constant' or 'alternate'.")
+_SESSION: Optional[PLCSession] = None
 
-    # ------------------- PRESSURE TEST (mode 3) --------------------------
-    elif mode == MODE_PRESSURE_TEST:
-        mode_code = 3.0
-        p1_vals = [rp.press1, 0.0, 0.0]
-        p2_vals = [rp.press2, 0.0, 0.0]
-        durations = (5.0, 0.0, 0.0)
+def open_plc() -> PLCInterface:
+    """Open the PLC selected by MCP_PLC_MODE (PLC_IP / PLC_RACK / PLC_SLOT from env).
 
-    else:
-        raise ValueError(f"Unknown mode '{mode}'.")
+    In hardware mode an unreachable PLC is not replaced by the simulator: the
+    session stays disconnected and every PLC tool call returns the connection error.
+    """
+    mode = os.getenv("MCP_PLC_MODE", "").strip().lower()
+    if mode not in PLC_MODES:
+        raise RuntimeError(f"Set MCP_PLC_MODE to one of {PLC_MODES} (got {mode!r})")
+    plc = PLCInterface(simulate=mode == "sim", fallback_to_sim=False)
+    logger.info(f"MCP PLC mode: {mode}" + ("" if mode == "sim" else f" ({plc.ip})"))
+    return plc
+
+@asynccontextmanager
+async def plc_lifespan(_server: FastMCP) -> AsyncIterator[PLCSession]:
+    """Share one PLC connection and status poller across every client session.
+
+    HTTP transports enter the lifespan once per client, so the session is
+    reference-counted rather than created here each time.
+    """
+    global _SESSION
+    if _SESSION is None:
+        _SESSION = PLCSession(plc=open_plc())
+        _SESSION.status = StatusHub(_SESSION)
+        _SESSION.status.start()
+    session = _SESSION
+    session.users += 1
+    try:
+        yield session
+    finally:
+        session.users -= 1
+        if session.users == 0:
+            await session.status.stop()
+            session.plc.disconnect()
+            _SESSION = None
 
-    sequence = [mode_code, *p1_vals, *p2_vals, *durations]
-    if len(sequence) != 10:
-        raise AssertionError("Generated PLC sequence must have exactly 10 elements.")
-    return sequence
+# Initialize FastMCP server
+mcp = FastMCP("tamara", lifespan=plc_lifespan)
 
 @mcp.tool()
 async def compute_parameters(
@@ -460,46 +325,66 @@ async def compute_parameters(
         return f"Error: {str(e)}"
 
 @mcp.tool()
-async def send_to_tamara(sequence: List[float], mode: str = MODE_RUN) -> str:
+async def send_to_tamara(sequence: List[float], ctx: Context, mode: str = MODE_RUN) -> str:
     """Send sequence to TAMARA via PLC and read back for verification.
     
     Args:
         sequence: List of 10 float values for the sequence
         mode: Operation mode (RUN/CLEAN/PRESSURE_TEST)
     """
+    session: PLCSession = ctx.request_context.lifespan_context
     try:
-        # Connect to PLC
-        client = snap7.client.Client()
-        client.connect(PLC_IP, 0, 1)  # Rack=0, Slot=1 for S7-1200
-        if not client.get_connected():
-            return "Error: Could not connect to PLC."
-
-        # Prepare data: pack 10 floats (REAL, 4 bytes each) into a bytearray
-        data = bytearray(40)  # 10 * 4 bytes
-        for i, value in enumerate(sequence):
-            set_real(data, i * 4, float(value))
-
-        # Write to PLC DB
-        client.db_write(DB_NUMBER, BYTE_INDEX, data)
-
-        # Write to PLC DB (b_StartSeq)
-        StartSeq_data = bytearray(1)
-        set_bool(StartSeq_data, 0, 1, True)
-        client.db_write(DB_NUMBER, 166, StartSeq_data) #Having hard-coded this value is not safe. For now, it's the only way to start the sequence.
-
-        # Read back the same 40 bytes
-        # Optionally unpack and check values
-        readback = client.db_read(DB_NUMBER, BYTE_INDEX, 40)
-        readback_values = [get_real(readback, i * 4) for i in range(10)]
-
-        client.disconnect()
+        async with session.lock:
+            session.plc.ensure_connected()
+            # Whitelisted block write + read-back verification, then b_START_SEQ
+            readback_values = session.plc.write_sequence(sequence)
+        session.status.sequence_duration_s = sum(readback_values[7:])  # drives progress_pct
+        target = "SIM" if session.plc.simulated else session.plc.ip
         return (
-            f"Successfully sent {mode} sequence to TAMARA PLC: {sequence}\n"
+            f"Successfully sent {mode} sequence to TAMARA PLC ({target}): {sequence}\n"
             f"Read-back values from PLC: {[f'{v:.2f}' for v in readback_values]}"
         )
     except Exception as e:
         return f"Error sending sequence to TAMARA: {str(e)}"
 
+# ---------------------------------------------------------------------------
+# Status streaming: long-poll tool (and a readable resource), one shared poller
+#
+# watch_status is the supported way to follow the status. The low-level server of
+# the installed mcp package advertises resources.subscribe=False, so spec-compliant
+# clients never send resources/subscribe and push notifications would not arrive.
+# ---------------------------------------------------------------------------
+
+def _status_payload(hub: StatusHub) -> str:
+    return json.dumps({"version": hub.version, **hub.snapshot})
+
+@mcp.resource(STATUS_URI, mime_type="application/json")
+async def tamara_status() -> str:
+    """Current DB9 status (machine/operation mode, command bits, CRUNCH_VALID, progress).
+
+    Read once from the PLC; use the ``watch_status`` tool to wait for changes.
+    """
+    hub = _SESSION.status
+    await hub.poll_once()
+    return _status_payload(hub)
+
+@mcp.tool()
+async def watch_status(ctx: Context, since_version: int = 0, timeout_s: float = 30.0) -> str:
+    """Wait for the next TAMARA status change and return it as JSON.
+
+    Pass the ``version`` from the previous result to receive only the next
+    change; returns immediately if the status already moved on.
+
+    Args:
+        since_version: Last status version seen by the caller (0 for the current status)
+        timeout_s: Maximum time to wait for a change (s)
+    """
+    hub: StatusHub = ctx.request_context.lifespan_context.status
+    changed = await hub.wait_for_change(since_version, timeout_s)
+    if not changed and not hub.snapshot:
+        return "No status available yet (PLC not polled)."
+    return _status_payload(hub) if changed else json.dumps({"version": hub.version, "changed": False})
+
 if __name__ == "__main__":
     # Initialize and run the server
     mcp.run(transport='stdio')
@@ -1,4 +1,5 @@
 import os
+import sys
 
 from dotenv import load_dotenv
 from langchain.chains import create_history_aware_retriever, create_retrieval_chain
@@ -6,7 +7,12 @@ from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_community.vectorstores import Chroma
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
+
+# The embedding cache lives with the graph agent
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "7_Tamara_Agent"))
+from embedding_cache import cached_embeddings  # noqa: E402
+from prompt_registry import PromptRegistry  # noqa: E402
 
 # Load environment variables from .env
 load_dotenv()
@@ -16,7 +22,7 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 persistent_directory = os.path.join(current_dir, "db", "chroma_db_with_metadata_Knowledge_base")
 
 # Define the embedding model
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+embeddings = cached_embeddings(model="text-embedding-3-small")
 
 # Load the existing vector store with the embedding function
 db = Chroma(persist_directory=persistent_directory, embedding_function=embeddings)
@@ -61,37 +67,46 @@ history_aware_retriever = create_history_aware_retriever(
 # Answer question prompt
 # This system prompt helps the AI understand that it should provide concise answers
 # based on the retrieved context and indicates what to do if the answer is unknown
-prompt_path = os.path.join(current_dir, "Prompts", "Matthieu_V0.txt") #Basic.txt, Matthieu_V0.txt
+# Prompts are loaded once by the registry and reloaded when a file is edited
+prompts = PromptRegistry([os.path.join(current_dir, "Prompts")])
+QA_PROMPT = "Matthieu_V0"  # Basic, Matthieu_V0
 
-# Read the QA system prompt from file
-with open(prompt_path, 'r') as file:
-    qa_system_prompt = file.read().strip()
 
-# Create a prompt template for answering questions
-qa_prompt = ChatPromptTemplate.from_messages(
-    [
-        ("system", qa_system_prompt),
-        MessagesPlaceholder("chat_history"),
-        ("human", "{input}"),
-    ]
-)
+def build_rag_chain(qa_system_prompt):
+    # Create a prompt template for answering questions
+    qa_prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", qa_system_prompt),
+            MessagesPlaceholder("chat_history"),
+            ("human", "{input}"),
+        ]
+    )
+
+    # Create a chain to combine documents for question answering
+    # `create_stuff_documents_chain` feeds all retrieved context into the LLM
+    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
+
+    # Create a retrieval chain that combines the history-aware retriever and the question answering chain
+    return create_retrieval_chain(history_aware_retriever, question_answer_chain)
 
-# Create a chain to combine documents for question answering
-# `create_stuff_documents_chain` feeds all retrieved context into the LLM
-question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
 
-# Create a retrieval chain that combines the history-aware retriever and the question answering chain
-rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+qa_prompt_file = prompts.get(QA_PROMPT)
+rag_chain = build_rag_chain(qa_prompt_file.text)
 
 
 # Function to simulate a continual chat
 def continual_chat():
+    global qa_prompt_file, rag_chain
     print("Start chatting with the AI! Type 'exit' to end the conversation.")
     chat_history = []  # Collect chat history here (a sequence of messages)
     while True:
         query = input("You: ")
         if query.lower() == "exit":
             break
+        # Rebuild the chain only if the prompt file changed since the last question
+        prompt = prompts.get(QA_PROMPT)
+        if prompt.sha256 != qa_prompt_file.sha256:
+            qa_prompt_file, rag_chain = prompt, build_rag_chain(prompt.text)
         # Process the user's query through the retrieval chain
         result = rag_chain.invoke({"input": query, "chat_history": chat_history})
         # Display the AI's response
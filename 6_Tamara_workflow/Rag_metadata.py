@@ -1,9 +1,13 @@
 import os
+import sys
 from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader
 from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
+
+# Incremental ingestion and the embedding cache live with the graph agent
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "7_Tamara_Agent"))
+from kb_ingest import sync_knowledge_base  # noqa: E402
+from embedding_cache import cached_embeddings  # noqa: E402
 
 # Load environment variables from .env
 load_dotenv()
@@ -21,53 +25,27 @@ persistent_directory = os.path.join(db_dir, "chroma_db_with_metadata_Knowledge_b
 print(f"Knowledge base directory: {knowledge_base_dir}")
 print(f"Persistent directory: {persistent_directory}")
 
-# Check if the Chroma vector store already exists
-if not os.path.exists(persistent_directory):
-    print("Persistent directory does not exist. Initializing vector store...")
-
-    # Ensure the knowledge_base directory exists
-    if not os.path.exists(knowledge_base_dir):
-        raise FileNotFoundError(
-            f"The directory {knowledge_base_dir} does not exist. Please check the path."
-        )
-
-    # List all text files in the directory
-    knowledge_base_files = [f for f in os.listdir(knowledge_base_dir) if f.endswith(".txt")]
-
-    # Read the text content from each file and store it with metadata
-    documents = []
-    for knowledge_base_file in knowledge_base_files:
-        file_path = os.path.join(knowledge_base_dir, knowledge_base_file)
-        loader = TextLoader(file_path)
-        knowledge_base_docs = loader.load()
-        for doc in knowledge_base_docs:
-            # Add metadata to each document indicating its source
-            doc.metadata = {"source": knowledge_base_file}
-            documents.append(doc)
-
-    #Recursive character based splitting of the documents into chunks
-    # Attempts to split text at natural boundaries (sentences, paragraphs) within character limit.
-    # Balances between maintaining coherence and adhering to character limits.
-    rec_char_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500, chunk_overlap=50)
-    rec_char_docs = rec_char_splitter.split_documents(documents)
-
-    # Display information about the split documents
-    print("\n--- Document Chunks Information ---")
-    print(f"Number of document chunks: {len(rec_char_docs)}")
-
-    # Create embeddings
-    print("\n--- Creating embeddings ---")
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small"
-    )  # Update to a valid embedding model if needed, 'text-embedding-ada-002' is better but more expensive
-    print("\n--- Finished creating embeddings ---")
-
-    # Create the vector store and persist it
-    print("\n--- Creating and persisting vector store ---")
-    db = Chroma.from_documents(
-        rec_char_docs, embeddings, persist_directory=persistent_directory)
-    print("\n--- Finished creating and persisting vector store ---")
-
-else:
-    print("Vector store already exists. No need to initialize.")
+# Ensure the knowledge_base directory exists
+if not os.path.exists(knowledge_base_dir):
+    raise FileNotFoundError(
+        f"The directory {knowledge_base_dir} does not exist. Please check the path."
+    )
+
+# Recursive character based splitting of the documents into chunks
+# Attempts to split text at natural boundaries (sentences, paragraphs) within character limit.
+# Balances between maintaining coherence and adhering to character limits.
+rec_char_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=500, chunk_overlap=50)
+
+embeddings = cached_embeddings(
+    model="text-embedding-3-small"
+)  # Cached on disk by (model, chunk hash); update to a valid embedding model if needed, 'text-embedding-ada-002' is better but more expensive
+
+# Create or incrementally update the vector store: a manifest of file/chunk hashes
+# beside the DB means only new or edited chunks are embedded, removed files are dropped
+print("\n--- Syncing vector store ---")
+os.makedirs(persistent_directory, exist_ok=True)
+db = Chroma(persist_directory=persistent_directory, embedding_function=embeddings)
+report = sync_knowledge_base(db, knowledge_base_dir, persistent_directory,
+                             splitter=rec_char_splitter, extensions=(".txt",))
+print(f"\n--- Finished syncing vector store: {report.summary()} ---")
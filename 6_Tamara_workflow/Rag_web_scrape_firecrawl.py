@@ -1,9 +1,15 @@
 import os
+import sys
 from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import FireCrawlLoader
 from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
+
+# The embedding cache lives with the graph agent
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "7_Tamara_Agent"))
+from embedding_cache import cached_embeddings  # noqa: E402
+# Incremental re-crawl (ETag / Last-Modified / content hash per URL)
+from web_crawl import sync_website  # noqa: E402
 
 # Load environment variables from .env
 load_dotenv()
@@ -48,7 +54,7 @@ def create_vector_store():
     print(f"Sample chunk:\n{rec_split_docs[0].page_content}\n")
 
     # Step 3: Create embeddings for the document chunks
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+    embeddings = cached_embeddings(model="text-embedding-3-small")
 
     # Step 4: Create and persist the vector store with the embeddings
     print(f"\n--- Creating vector store in {persistent_directory} ---")
@@ -58,17 +64,29 @@ def create_vector_store():
     print(f"--- Finished creating vector store in {persistent_directory} ---")
 
 
-# Check if the Chroma vector store already exists
-if not os.path.exists(persistent_directory):
-    create_vector_store()
-else:
-    print(
-        f"Vector store {persistent_directory} already exists. No need to initialize.")
+def refresh_vector_store(store):
+    """Re-crawl the website and upsert only the pages that changed since the last run."""
+    print("Refreshing the website vector store...")
+    report = sync_website(store, persistent_directory, seeds=["https://www.insidetx.com"],
+                          embedding="text-embedding-3-small")
+    print(f"--- {report.summary()} ---")
+
+
+# WEB_CRAWLER=firecrawl keeps the original one-off Firecrawl scrape; by default the
+# site is re-crawled incrementally on every run
+if os.getenv("WEB_CRAWLER", "incremental") == "firecrawl":
+    if not os.path.exists(persistent_directory):
+        create_vector_store()
+    else:
+        print(
+            f"Vector store {persistent_directory} already exists. No need to initialize.")
 
 # Load the vector store with the embeddings
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+embeddings = cached_embeddings(model="text-embedding-3-small")
 db = Chroma(persist_directory=persistent_directory,
             embedding_function=embeddings)
+if os.getenv("WEB_CRAWLER", "incremental") != "firecrawl":
+    refresh_vector_store(db)
 
 
 # Step 5: Query the vector store
@@ -17,7 +17,7 @@ import typer
 from rich.console import Console
 from rich.prompt import Prompt
 from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
+from embedding_cache import cached_embeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains import create_history_aware_retriever, create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
@@ -272,7 +272,7 @@ class TamaraAgent:
         # Initialize RAG components
         self.vectorstore = Chroma(
             persist_directory="7_Tamara_Agent/db/chroma_db_with_metadata_Knowledge_base",
-            embedding_function=OpenAIEmbeddings(
+            embedding_function=cached_embeddings(
                 model="text-embedding-3-small"
             )
         )
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+answer_cache.py — Semantic cache for repeated knowledge questions
+
+Operators ask the same handful of questions many times a day ("what is the flow rate
+range", "how do I clean"), and each one pays retrieval plus an LLM generation.
+``SemanticAnswerCache`` sits in front of ``answer_with_rag``:
+
+- key: the normalised question (exact match first, no embedding needed), otherwise the
+  question embedding, matched by cosine similarity ≥ ``threshold``
+- eviction: entries older than ``ttl_s`` expire; beyond ``max_entries`` the least
+  recently used entry is dropped
+- invalidation: the whole cache is cleared when the KB manifest (kb_manifest.json)
+  changes, i.e. after any ingestion that added, edited or removed chunks, and when
+  the ``version`` passed to ``get``/``put`` changes (tamara_graph passes the QA
+  prompt's sha256, so an edited prompt is not answered from the old prompt's answers)
+
+Only questions that do not depend on the conversation are cached (see
+tamara_graph.answer_with_rag). The cache is in memory, per agent process.
+
+Environment (read by ``from_env``):
+  ANSWER_CACHE        - 0 disables the cache (default 1)
+  ANSWER_CACHE_SIM    - cosine similarity for a semantic hit (default 0.95)
+  ANSWER_CACHE_TTL_S  - entry lifetime in seconds (default 86400)
+  ANSWER_CACHE_SIZE   - maximum entries (default 256)
+"""
+
+from __future__ import annotations
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.95   # max vs min flow rate questions sit around 0.9: stay above them
+DEFAULT_TTL_S = 24 * 3600
+DEFAULT_MAX_ENTRIES = 256
+
+_CONTRACTIONS = {"what's": "what is", "how's": "how is", "where's": "where is", "who's": "who is",
+                 "can't": "cannot", "don't": "do not", "doesn't": "does not", "isn't": "is not",
+                 "it's": "it is", "i'm": "i am"}
+_CONTRACTION_RE = re.compile(r"\b(" + "|".join(re.escape(c) for c in _CONTRACTIONS) + r")\b")
+_NON_WORD_RE = re.compile(r"[^a-z0-9.:/%+\- ]+")
+_SPACE_RE = re.compile(r"\s+")
+
+def normalize_question(question: str) -> str:
+    """Lowercase, expand contractions, drop punctuation and trailing dots, collapse whitespace."""
+    text = _CONTRACTION_RE.sub(lambda m: _CONTRACTIONS[m.group(1)], question.lower().replace("’", "'"))
+    text = _SPACE_RE.sub(" ", _NON_WORD_RE.sub(" ", text)).strip(" .:")
+    return text
+
+def file_fingerprint(path: str) -> Optional[str]:
+    """SHA-256 of a file's bytes, or None if it does not exist."""
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    vector: np.ndarray
+    created: float
+    hits: int = 0
+
+class SemanticAnswerCache:
+    """Thread-safe TTL/LRU cache of answers, looked up by question similarity."""
+
+    def __init__(self, embeddings, threshold: float = DEFAULT_THRESHOLD, ttl_s: float = DEFAULT_TTL_S,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, manifest_path: Optional[str] = None,
+                 clock: Callable[[], float] = time.time) -> None:
+        """
+        Args:
+            embeddings: Query embedder (the same provider the KB uses; its cache makes repeats free)
+            threshold: Minimum cosine similarity for a semantic hit
+            ttl_s: Entry lifetime
+            max_entries: LRU capacity
+            manifest_path: KB manifest whose change clears the cache (None = never)
+            clock: Time source (tests)
+        """
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self.manifest_path = manifest_path
+        self.clock = clock
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()   # normalised question → entry
+        self._lock = threading.Lock()
+        self._stat: Optional[Tuple[int, int]] = None
+        self._kb_version = self._manifest_version()
+        self._answer_version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls, embeddings, manifest_path: Optional[str] = None) -> Optional["SemanticAnswerCache"]:
+        if os.getenv("ANSWER_CACHE", "1") == "0":
+            return None
+        return cls(embeddings,
+                   threshold=float(os.getenv("ANSWER_CACHE_SIM", DEFAULT_THRESHOLD)),
+                   ttl_s=float(os.getenv("ANSWER_CACHE_TTL_S", DEFAULT_TTL_S)),
+                   max_entries=int(os.getenv("ANSWER_CACHE_SIZE", DEFAULT_MAX_ENTRIES)),
+                   manifest_path=manifest_path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---- invalidation ---------------------------------------------------------------
+    def _manifest_version(self) -> Optional[str]:
+        if not self.manifest_path:
+            return None
+        try:
+            st = os.stat(self.manifest_path)
+            self._stat = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            self._stat = None
+        return file_fingerprint(self.manifest_path)
+
+    def _check_kb(self) -> None:
+        """Clear everything if the KB manifest changed (stat first, hash only when it moved)."""
+        if not self.manifest_path:
+            return
+        try:
+            st = os.stat(self.manifest_path)
+            stat: Optional[Tuple[int, int]] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stat = None
+        if stat == self._stat:
+            return
+        version = self._manifest_version()
+        if version != self._kb_version:
+            if self._entries:
+                logger.info(f"KB manifest changed; dropping {len(self._entries)} cached answers")
+            self._entries.clear()
+            self._kb_version = version
+            self.invalidations += 1
+
+    def _check_version(self, version: Optional[str]) -> None:
+        """Clear everything if the answers' version (the QA prompt) changed."""
+        if version is None or version == self._answer_version:
+            return
+        if self._answer_version is not None:
+            if self._entries:
+                logger.info(f"Answer version changed; dropping {len(self._entries)} cached answers")
+            self._entries.clear()
+            self.invalidations += 1
+        self._answer_version = version
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    # ---- lookup / store ---------------------------------------------------------------
+    def _embed(self, question: str) -> np.ndarray:
+        vec = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+    def _expire(self, now: float) -> None:
+        for key in [k for k, e in self._entries.items() if now - e.created > self.ttl_s]:
+            del self._entries[key]
+
+    def get(self, question: str, version: Optional[str] = None) -> Optional[CachedAnswer]:
+        """Cached answer for ``question`` (or a close paraphrase), or None.
+
+        ``version`` identifies what produced the answers (see module docstring)."""
+        key = normalize_question(question)
+        with self._lock:
+            self._check_kb()
+            self._check_version(version)
+            self._expire(self.clock())
+            entry = self._entries.get(key)
+            candidates = list(self._entries.items()) if entry is None else []
+        if entry is None and candidates:
+            vec = self._embed(key)
+            sims = np.stack([e.vector for _k, e in candidates]) @ vec
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                key, entry = candidates[best]
+                logger.debug(f"Semantic cache hit ({sims[best]:.3f}): {question!r} ~ {entry.question!r}")
+        with self._lock:
+            if entry is None or key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            self.hits += 1
+            return entry
+
+    def put(self, question: str, answer: str, version: Optional[str] = None) -> None:
+        key = normalize_question(question)
+        vec = self._embed(key)
+        with self._lock:
+            self._check_kb()
+            self._check_version(version)
+            self._entries[key] = CachedAnswer(question=question, answer=answer, vector=vec, created=self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return (f"answer cache {len(self._entries)} entries, hits {self.hits}/{total} ({rate:.0%}), "
+                f"invalidations {self.invalidations}")
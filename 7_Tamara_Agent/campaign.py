@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+campaign.py — Multi-run campaign scheduler for TAMARA
+
+Takes a queue of formulations, inserts the CLEAN and PRESSURE_TEST cycles the
+maintenance rules require (solvent change, chip change, every N runs), orders the
+queue to minimise total instrument time and solvent switches, and executes the
+resulting steps through ``PLCInterface.write_sequence`` with progress callbacks.
+
+Ordering
+--------
+Maintenance is only triggered at (chip, solvent) boundaries or by run counters, so
+runs sharing a chip and solvent are kept together (in queue order) and only the
+order of those groups is optimised: exhaustively up to ``EXHAUSTIVE_GROUP_LIMIT``
+groups, otherwise chip-major / solvent-minor. Plans are ranked by total time, then
+solvent switches, then chip changes.
+
+Usage:
+  plan = plan_campaign([Formulation("A", rp_a, "ethanol"), ...], MaintenanceRules(clean_every_n_runs=5))
+  print(plan.format())
+  with PLCInterface() as plc:
+      progress = CampaignRunner(plc, plan, on_progress=print).run()
+"""
+
+from __future__ import annotations
+import itertools
+import logging
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from crunching import (
+    RunParameters, compute_derived_parameters, validate_parameters, pack_sequence, sequence_values,
+    SEQUENCE_FORMAT, MODE_RUN, MODE_CLEAN, MODE_PRESSURE_TEST, CLEAN_CONSTANT,
+)
+from plc_tool import PLCInterface, MachineMode, ModeCmds, PLC_STATES, STANDBY_STATE
+
+logger = logging.getLogger(__name__)
+
+EXHAUSTIVE_GROUP_LIMIT = 7   # 7! = 5040 candidate orders
+SEQUENCE_POLL_S = 0.5        # MACHINE_MODE poll interval while a step runs
+SEQUENCE_START_TIMEOUT_S = 10.0
+SEQUENCE_TIMEOUT_MARGIN_S = 30.0
+
+# ----------------------------------------------------------------------------
+# Plan model
+# ----------------------------------------------------------------------------
+
+@dataclass
+class Formulation:
+    """One queued RUN: user inputs plus the solvent identity used for changeover rules."""
+    name: str
+    rp: RunParameters
+    solvent: str
+
+    @property
+    def chip(self) -> str:
+        return self.rp.chip_id
+
+@dataclass
+class MaintenanceRules:
+    """When CLEAN / PRESSURE_TEST cycles are required between runs."""
+    clean_on_solvent_change: bool = True
+    clean_on_chip_change: bool = True
+    pressure_test_on_chip_change: bool = True
+    pressure_test_at_start: bool = True
+    clean_at_end: bool = True
+    clean_every_n_runs: Optional[int] = None          # runs since the last clean
+    pressure_test_every_n_runs: Optional[int] = None  # runs since the last pressure test
+    clean_type: str = CLEAN_CONSTANT
+    chip_change_s: float = 120.0     # manual chip swap (s)
+    solvent_change_s: float = 60.0   # manual reservoir swap (s)
+
+@dataclass
+class CampaignStep:
+    """One sequence upload. Cycle pressures come from ``formulation`` (the next run)."""
+    mode: str
+    reason: str
+    formulation: Formulation
+    duration_s: float
+    sequence: bytes = b""
+    manual_action: Optional[str] = None   # operator action required before the step
+    manual_s: float = 0.0
+
+    @property
+    def total_s(self) -> float:
+        return self.duration_s + self.manual_s
+
+@dataclass
+class CampaignPlan:
+    steps: List[CampaignStep]
+
+    @property
+    def total_s(self) -> float:
+        return sum(s.total_s for s in self.steps)
+
+    @property
+    def run_s(self) -> float:
+        return sum(s.duration_s for s in self.steps if s.mode == MODE_RUN)
+
+    @property
+    def solvent_switches(self) -> int:
+        return _count_changes([s.formulation.solvent for s in self.steps if s.mode == MODE_RUN])
+
+    @property
+    def chip_changes(self) -> int:
+        return _count_changes([s.formulation.chip for s in self.steps if s.mode == MODE_RUN])
+
+    def format(self) -> str:
+        lines = [f"{i + 1:>3}. {s.mode:<13} {s.total_s:8.1f} s  {s.formulation.name} ({s.reason})"
+                 + (f" [manual: {s.manual_action}]" if s.manual_action else "")
+                 for i, s in enumerate(self.steps)]
+        lines.append(f"Total {self.total_s:.1f} s (runs {self.run_s:.1f} s), "
+                     f"{self.solvent_switches} solvent switch(es), {self.chip_changes} chip change(s)")
+        return "\n".join(lines)
+
+def _count_changes(values: Sequence[str]) -> int:
+    return sum(1 for a, b in zip(values, values[1:]) if a != b)
+
+# ----------------------------------------------------------------------------
+# Planning
+# ----------------------------------------------------------------------------
+
+def _cycle_duration(mode: str, clean_type: Optional[str]) -> float:
+    """Duration of a CLEAN / PRESSURE_TEST sequence; independent of the pressures."""
+    return sum(sequence_values(0.0, 0.0, 0.0, mode, clean_type)[7:])
+
+def _schedule(groups: Sequence[List[Formulation]], rules: MaintenanceRules) -> List[CampaignStep]:
+    """Expand an ordering of (chip, solvent) groups into steps, without packing sequences."""
+    clean_s = _cycle_duration(MODE_CLEAN, rules.clean_type)
+    test_s = _cycle_duration(MODE_PRESSURE_TEST, None)
+    steps: List[CampaignStep] = []
+    prev: Optional[Formulation] = None
+    since_clean = since_test = 0
+    for f in (f for group in groups for f in group):
+        chip_change = prev is not None and f.chip != prev.chip
+        solvent_change = prev is not None and f.solvent != prev.solvent
+        manual = [a for a, hit in (("swap chip", chip_change), ("change solvent", solvent_change)) if hit]
+        manual_s = rules.chip_change_s * chip_change + rules.solvent_change_s * solvent_change
+
+        clean_reasons = [r for r, hit in (
+            ("chip change", chip_change and rules.clean_on_chip_change),
+            ("solvent change", solvent_change and rules.clean_on_solvent_change),
+            (f"every {rules.clean_every_n_runs} runs",
+             bool(rules.clean_every_n_runs) and since_clean >= (rules.clean_every_n_runs or 0)),
+        ) if hit]
+        test_reasons = [r for r, hit in (
+            ("campaign start", prev is None and rules.pressure_test_at_start),
+            ("chip change", chip_change and rules.pressure_test_on_chip_change),
+            (f"every {rules.pressure_test_every_n_runs} runs",
+             bool(rules.pressure_test_every_n_runs) and since_test >= (rules.pressure_test_every_n_runs or 0)),
+        ) if hit]
+
+        if clean_reasons:
+            steps.append(CampaignStep(MODE_CLEAN, ", ".join(clean_reasons), f, clean_s))
+            since_clean = 0
+        if test_reasons:
+            steps.append(CampaignStep(MODE_PRESSURE_TEST, ", ".join(test_reasons), f, test_s))
+            since_test = 0
+        steps.append(CampaignStep(MODE_RUN, "queued", f, f.rp.run_time))
+        if manual:
+            # The operator acts before the first step of this changeover
+            first = steps[-1 - bool(clean_reasons) - bool(test_reasons)]
+            first.manual_action, first.manual_s = " + ".join(manual), manual_s
+        since_clean += 1
+        since_test += 1
+        prev = f
+    if prev is not None and rules.clean_at_end:
+        steps.append(CampaignStep(MODE_CLEAN, "campaign end", prev, clean_s))
+    return steps
+
+def _plan_key(steps: List[CampaignStep]) -> Tuple[float, int, int]:
+    plan = CampaignPlan(steps)
+    return (round(plan.total_s, 6), plan.solvent_switches, plan.chip_changes)
+
+def plan_campaign(formulations: Sequence[Formulation],
+                  rules: Optional[MaintenanceRules] = None) -> CampaignPlan:
+    """Order the queue and insert maintenance cycles.
+
+    Args:
+        formulations: Queued runs; each is crunched and must pass validate_parameters
+        rules: Maintenance rules (defaults to MaintenanceRules())
+
+    Returns:
+        The plan with packed, wire-ready sequences for every step.
+
+    Raises:
+        ValueError: If any formulation fails validation (all errors are reported).
+    """
+    rules = rules or MaintenanceRules()
+    failures = []
+    for f in formulations:
+        compute_derived_parameters(f.rp)
+        errs, _warns, _recs = validate_parameters(f.rp)
+        if errs:
+            failures.append(f"{f.name}: {'; '.join(errs)}")
+    if failures:
+        raise ValueError("Invalid formulations in campaign:\n" + "\n".join(failures))
+
+    grouped: Dict[Tuple[str, str], List[Formulation]] = {}
+    for f in formulations:
+        grouped.setdefault((f.chip, f.solvent), []).append(f)
+    groups = list(grouped.values())
+
+    if len(groups) <= EXHAUSTIVE_GROUP_LIMIT:
+        candidates = itertools.permutations(groups)
+    else:
+        chips = list(dict.fromkeys(f.chip for f in formulations))
+        candidates = [sorted(groups, key=lambda g: chips.index(g[0].chip))]  # stable: solvents in queue order
+    best = min((_schedule(order, rules) for order in candidates), key=_plan_key, default=[])
+
+    for step in best:
+        step.sequence = pack_sequence(step.formulation.rp, step.mode,
+                                      rules.clean_type if step.mode == MODE_CLEAN else None)
+    plan = CampaignPlan(best)
+    logger.info(f"Campaign planned: {len(formulations)} runs in {len(plan.steps)} steps, "
+                f"{plan.total_s:.1f} s, {plan.solvent_switches} solvent switch(es)")
+    return plan
+
+# ----------------------------------------------------------------------------
+# Execution
+# ----------------------------------------------------------------------------
+
+@dataclass
+class CampaignProgress:
+    total_steps: int
+    planned_s: float
+    completed_steps: int = 0
+    completed_s: float = 0.0
+    state: str = "pending"          # pending/running/done/aborted/failed
+    current: Optional[CampaignStep] = None
+    error: Optional[str] = None
+    log: List[str] = field(default_factory=list)
+
+    @property
+    def percent(self) -> float:
+        return 100.0 * self.completed_s / self.planned_s if self.planned_s else 100.0
+
+class CampaignRunner:
+    """Executes a CampaignPlan step by step through one PLCInterface.
+
+    Each step is one verified ``write_sequence``; the runner then polls MACHINE_MODE
+    until the PLC has entered the step's mode and returned to STANDBY (bounded by the
+    step duration plus a margin), and clears b_START_SEQ for the next step. Any other
+    PLC state (fault, safe purge, e-stop, ...) fails the step. The simulator has no
+    state machine, so the runner waits ``duration * sim_time_scale`` instead.
+    """
+    def __init__(self, plc: PLCInterface, plan: CampaignPlan,
+                 on_progress: Optional[Callable[[CampaignProgress], None]] = None,
+                 confirm: Optional[Callable[[CampaignStep], bool]] = None,
+                 poll_s: float = SEQUENCE_POLL_S,
+                 start_timeout_s: float = SEQUENCE_START_TIMEOUT_S,
+                 timeout_margin_s: float = SEQUENCE_TIMEOUT_MARGIN_S,
+                 sim_time_scale: float = 1.0) -> None:
+        """
+        Args:
+            plc: Connected (or connectable) PLC interface
+            plan: Plan from plan_campaign
+            on_progress: Called after every state change
+            confirm: Called before steps with a manual action; returning False aborts.
+                Without it, manual actions are only logged.
+            poll_s: MACHINE_MODE poll interval (s)
+            start_timeout_s: Time allowed for the PLC to enter the step's mode (s)
+            timeout_margin_s: Extra time allowed beyond a step's planned duration (s)
+            sim_time_scale: Fraction of the planned duration to wait on the simulator
+        """
+        self.plc = plc
+        self.plan = plan
+        self.on_progress = on_progress
+        self.confirm = confirm
+        self.poll_s = poll_s
+        self.start_timeout_s = start_timeout_s
+        self.timeout_margin_s = timeout_margin_s
+        self.sim_time_scale = sim_time_scale
+        self.progress = CampaignProgress(total_steps=len(plan.steps), planned_s=plan.total_s)
+        self._cancel = threading.Event()
+
+    def cancel(self) -> None:
+        """Stop after aborting the running step (thread-safe)."""
+        self._cancel.set()
+
+    def _update(self, message: str) -> None:
+        self.progress.log.append(message)
+        logger.info(f"Campaign: {message}")
+        if self.on_progress:
+            self.on_progress(self.progress)
+
+    def _wait_done(self, step: CampaignStep) -> None:
+        try:
+            if self.plc.simulated:
+                self._cancel.wait(step.duration_s * self.sim_time_scale)
+            else:
+                self._wait_plc_standby(step)
+        finally:
+            self.plc.stop_sequence()
+
+    def _wait_plc_standby(self, step: CampaignStep) -> None:
+        mode = MachineMode[step.mode]
+        start = time.monotonic()
+        started = False
+        while True:
+            state = self.plc.read_status()
+            if state == mode:
+                started = True
+            elif state == STANDBY_STATE:
+                if started:
+                    return
+            else:
+                self._abort(mode)
+                raise RuntimeError(f"PLC entered {PLC_STATES.get(state, state)} during the {step.mode} step")
+            elapsed = time.monotonic() - start
+            if not started and elapsed > self.start_timeout_s:
+                raise TimeoutError(f"PLC did not enter {step.mode} within {self.start_timeout_s:.0f} s")
+            if elapsed > step.duration_s + self.timeout_margin_s:
+                self._abort(mode)
+                raise TimeoutError(f"{step.mode} step did not finish within {step.duration_s:.1f} s "
+                                   f"+ {self.timeout_margin_s:.0f} s")
+            if self._cancel.wait(self.poll_s):
+                self._abort(mode)
+                return
+
+    def _abort(self, mode: MachineMode) -> None:
+        try:
+            self.plc.pulse_cmd(mode, ModeCmds.STOP)
+        except Exception as e:
+            logger.error(f"Failed to stop the {mode.name} sequence: {e}")
+
+    def run(self) -> CampaignProgress:
+        """Execute all steps; returns the final progress (check ``state``)."""
+        p = self.progress
+        p.state = "running"
+        self._update(f"started: {p.total_steps} steps, {p.planned_s:.1f} s planned")
+        try:
+            for i, step in enumerate(self.plan.steps):
+                if self._cancel.is_set():
+                    break
+                p.current = step
+                if step.manual_action:
+                    if self.confirm and not self.confirm(step):
+                        p.state = "aborted"
+                        self._update(f"step {i + 1}: operator declined '{step.manual_action}'")
+                        return p
+                    self._update(f"step {i + 1}: manual action '{step.manual_action}'")
+                self.plc.ensure_connected()
+                self.plc.write_sequence(step.sequence)
+                self._update(f"step {i + 1}/{p.total_steps}: {step.mode} for {step.formulation.name} "
+                             f"({step.reason})")
+                self._wait_done(step)
+                if self._cancel.is_set():
+                    break
+                p.completed_steps += 1
+                p.completed_s += step.total_s
+                self._update(f"step {i + 1} done ({p.percent:.0f}%)")
+        except Exception as e:
+            p.state, p.error = "failed", str(e)
+            logger.error(f"Campaign failed at step {p.completed_steps + 1}: {e}")
+            self._update(f"failed: {e}")
+            return p
+        p.current = None
+        p.state = "aborted" if self._cancel.is_set() else "done"
+        self._update(p.state)
+        return p
+
+def decode_step(step: CampaignStep) -> List[float]:
+    """The float32 values a step writes to r_SEQUENCE."""
+    return list(struct.unpack(SEQUENCE_FORMAT, step.sequence))
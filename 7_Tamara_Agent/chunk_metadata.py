@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+chunk_metadata.py — Chunk metadata for filtered retrieval
+
+Chunks used to carry only ``{"source": path}`` (plus ``section`` since table_chunker),
+so every question searched manuals, specifications, competitor comparisons and
+review papers alike. At ingestion ``chunk_metadata`` adds:
+
+- ``doc_type``: manual | spec | competitor | review, from the file name
+- one boolean flag per detected entity (``chip_herringbone``, ``solvent_ethanol``,
+  ``mode_clean``, ...), from the chunk text and its section heading; flags are stored
+  only when true, which keeps them valid Chroma metadata and cheap to filter on
+- ``entities``: the same entities as a readable string ("chip:herringbone;mode:clean")
+
+At query time ``infer_filter`` turns the entities and explicit document-type words of
+a question into a Chroma ``where`` filter (one clause per category, OR within a
+category, AND across categories). ``matches`` evaluates the same filter in Python for
+the BM25 index and the flat vector store. HybridRetriever tops up with unfiltered
+results when a filter leaves too few chunks, so a filter narrows but never empties
+the context.
+
+Bump METADATA_VERSION when the vocabularies or rules change: kb_ingest then rewrites
+the metadata of every chunk (embeddings come from the embedding cache).
+"""
+
+from __future__ import annotations
+import re
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+METADATA_VERSION = 1
+
+# (doc_type, file-name pattern), first match wins; anything else is literature
+DOC_TYPE_RULES: Sequence[Tuple[str, re.Pattern]] = (
+    ("manual", re.compile(r"manual|user[ _-]?guide", re.I)),
+    ("spec", re.compile(r"specification|datasheet|data[ _-]sheet", re.I)),
+    ("review", re.compile(r"review|article", re.I)),   # before "vs": "Liposomes vs LNPs" is a review
+    ("competitor", re.compile(r"\bvs\.?\b|versus|alternative|competitor", re.I)),
+)
+DEFAULT_DOC_TYPE = "review"
+
+# category → canonical name → pattern (matched on lowercased text)
+ENTITIES: Dict[str, Dict[str, re.Pattern]] = {
+    "chip": {
+        "herringbone": re.compile(r"herringbone|\bshm\b"),
+        "baffle": re.compile(r"\bbaffles?\b"),
+        "t_junction": re.compile(r"\bt[- ]junctions?\b|\bt-mixers?\b"),
+        "tree": re.compile(r"tree[- ]shaped"),
+    },
+    "solvent": {
+        "ethanol": re.compile(r"\bethanol\b|\betoh\b"),
+        "water": re.compile(r"\bwater\b"),
+        "methanol": re.compile(r"\bmethanol\b"),
+        "isopropanol": re.compile(r"\bisopropanol\b|\bisopropyl alcohol\b|\bipa\b"),
+        "dmso": re.compile(r"\bdmso\b|dimethyl sulfoxide"),
+        "chloroform": re.compile(r"\bchloroform\b"),
+        "acetone": re.compile(r"\bacetone\b"),
+        "buffer": re.compile(r"\bpbs\b|\bcitrate\b|\bbuffers?\b"),
+    },
+    "mode": {
+        "clean": re.compile(r"\bclean(?:ing|ed)?\b"),
+        "pressure_test": re.compile(r"pressure[- ]test"),
+        "run": re.compile(r"\brun (?:mode|parameters|screen|menu)\b"),
+    },
+}
+
+# explicit document-type words in a question
+QUERY_DOC_TYPES: Sequence[Tuple[str, re.Pattern]] = (
+    ("competitor", re.compile(r"\b(?:ignite|spark|nanoassemblr|competitors?|competition|alternatives?)\b", re.I)),
+    ("manual", re.compile(r"\b(?:manual|user guide)\b", re.I)),
+    ("spec", re.compile(r"\b(?:specs?|specifications?|datasheet)\b", re.I)),
+    ("review", re.compile(r"\b(?:literature|papers?|reviews?|studies|publications?)\b", re.I)),
+)
+
+def flag(category: str, name: str) -> str:
+    return f"{category}_{name}"
+
+def doc_type(source: str) -> str:
+    name = source.rsplit("/", 1)[-1]
+    return next((kind for kind, pattern in DOC_TYPE_RULES if pattern.search(name)), DEFAULT_DOC_TYPE)
+
+def detect_entities(text: str) -> Dict[str, List[str]]:
+    """Category → canonical entity names found in ``text``."""
+    lowered = text.lower()
+    found: Dict[str, List[str]] = {}
+    for category, names in ENTITIES.items():
+        hits = [name for name, pattern in names.items() if pattern.search(lowered)]
+        if hits:
+            found[category] = hits
+    return found
+
+def chunk_metadata(source: str, text: str, section: str = "") -> Dict[str, Any]:
+    """Metadata added to a chunk at ingestion (see module docstring)."""
+    entities = detect_entities(f"{section}\n{text}")
+    metadata: Dict[str, Any] = {"doc_type": doc_type(source)}
+    for category, names in entities.items():
+        for name in names:
+            metadata[flag(category, name)] = True
+    if entities:
+        metadata["entities"] = ";".join(f"{c}:{n}" for c, names in entities.items() for n in names)
+    return metadata
+
+def _any_of(clauses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+def infer_filter(question: str) -> Optional[Dict[str, Any]]:
+    """Chroma ``where`` filter implied by a question, or None when it names nothing specific."""
+    clauses: List[Dict[str, Any]] = []
+    kinds = [kind for kind, pattern in QUERY_DOC_TYPES if pattern.search(question)]
+    if kinds:
+        clauses.append(_any_of([{"doc_type": kind} for kind in kinds]))
+    for category, names in detect_entities(question).items():
+        clauses.append(_any_of([{flag(category, name): True} for name in names]))
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+_OPERATORS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+def matches(metadata: Mapping[str, Any], where: Optional[Mapping[str, Any]]) -> bool:
+    """Evaluate a Chroma-style ``where`` filter ($and, $or, $eq, $ne, $in, $nin) against metadata."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, c) for c in condition):
+                return False
+        elif isinstance(condition, Mapping):
+            for op, operand in condition.items():
+                if op not in _OPERATORS:
+                    raise ValueError(f"Unsupported filter operator {op!r}")
+                if not _OPERATORS[op](metadata.get(key), operand):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
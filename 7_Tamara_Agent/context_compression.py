@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+context_compression.py — Rerank, diversify and budget the retrieved context
+
+``create_stuff_documents_chain`` pastes every retrieved chunk into the prompt, so the
+number of chunks drives token cost and time to first token. ``CompressingRetriever``
+wraps the KB retriever and, per question:
+
+1. reranks the candidates: lexical coverage of the question's terms weighted by BM25
+   IDF (default), or a local cross-encoder when ``sentence-transformers`` is installed
+   and RERANKER=cross-encoder
+2. selects in MMR order (relevance vs. overlap with chunks already chosen), so the
+   md/txt near-copies and adjacent overlapping chunks don't fill the prompt
+3. drops chunks below a relevance floor (always keeping the best one)
+4. stops at a token budget and a maximum chunk count
+
+Environment (see tamara_graph._kb_retriever):
+  KB_COMPRESS        - 0 disables this stage (default 1)
+  KB_FETCH_K         - candidates fetched before compression (default 15)
+  KB_TOP_K           - maximum chunks kept (default 6)
+  KB_CONTEXT_TOKENS  - context token budget (default 1500)
+  KB_RELEVANCE_FLOOR - minimum rerank score in [0, 1] (default 0.2)
+  KB_MMR_LAMBDA      - relevance/diversity trade-off (default 0.7; 1 = relevance only)
+  RERANKER           - lexical (default) | cross-encoder (RERANK_MODEL, default ms-marco-MiniLM-L-6-v2)
+
+Run:
+  $ python context_compression.py                # context size and retrieval latency vs the old k=15 chain
+  $ python context_compression.py --with-llm     # also answer latency (needs an LLM backend)
+"""
+
+from __future__ import annotations
+import argparse
+import math
+import os
+import statistics
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from retrieval import tokenize
+from table_chunker import token_counter
+
+DEFAULT_FETCH_K = 15
+DEFAULT_MAX_DOCS = 6
+DEFAULT_TOKEN_BUDGET = 1500
+DEFAULT_RELEVANCE_FLOOR = 0.2
+DEFAULT_MMR_LAMBDA = 0.7
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+BENCHMARK_QUESTIONS = [
+    "What is the total flow rate range of TAMARA?",
+    "What FRR values are supported?",
+    "How do I clean the chip after a run?",
+    "What pressure does the inlet gas supply need?",
+    "How do I install the microfluidic chip?",
+    "What should I do before starting a pressure test?",
+    "Which solvents are compatible with the wetted materials?",
+    "How does the flow rate ratio affect lipid nanoparticle size?",
+]
+
+# ----------------------------------------------------------------------------
+# Rerankers
+# ----------------------------------------------------------------------------
+
+class LexicalReranker:
+    """Share of the question's IDF-weighted terms present in the chunk (0..1)."""
+
+    def __init__(self, bm25=None) -> None:
+        self.bm25 = bm25   # retrieval.BM25Index, for corpus IDF (uniform weights without it)
+
+    def _idf(self, term: str) -> float:
+        if self.bm25 is None or not len(self.bm25):
+            return 1.0
+        df = len(self.bm25.postings.get(term, ()))
+        n = len(self.bm25)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def score(self, query: str, docs: Sequence[Document]) -> List[float]:
+        terms = set(tokenize(query))
+        if not terms:
+            return [0.0] * len(docs)
+        weights = {t: self._idf(t) for t in terms}
+        total = sum(weights.values()) or 1.0
+        return [sum(w for t, w in weights.items() if t in present) / total
+                for present in (set(tokenize(d.page_content)) for d in docs)]
+
+class CrossEncoderReranker:
+    """Local cross-encoder (sentence-transformers); logits squashed to 0..1."""
+
+    def __init__(self, model: Optional[str] = None) -> None:
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("RERANKER=cross-encoder needs sentence-transformers: "
+                              "pip install sentence-transformers") from e
+        self.model = CrossEncoder(model or os.getenv("RERANK_MODEL", DEFAULT_CROSS_ENCODER))
+
+    def score(self, query: str, docs: Sequence[Document]) -> List[float]:
+        if not docs:
+            return []
+        logits = self.model.predict([(query, d.page_content) for d in docs])
+        return [1.0 / (1.0 + math.exp(-float(x))) for x in logits]
+
+def get_reranker(bm25=None, kind: Optional[str] = None):
+    kind = (kind or os.getenv("RERANKER", "lexical")).lower()
+    if kind == "lexical":
+        return LexicalReranker(bm25)
+    if kind in ("cross-encoder", "cross_encoder"):
+        return CrossEncoderReranker()
+    raise ValueError(f"Unknown RERANKER={kind!r} (expected lexical or cross-encoder)")
+
+# ----------------------------------------------------------------------------
+# Selection
+# ----------------------------------------------------------------------------
+
+def _term_cosine(a: Counter, b: Counter) -> float:
+    dot = sum(v * b.get(t, 0) for t, v in a.items())
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+def mmr_order(scores: Sequence[float], docs: Sequence[Document], lambda_mult: float) -> List[int]:
+    """Indices in maximal-marginal-relevance order (term-vector cosine as redundancy)."""
+    vectors = [Counter(tokenize(d.page_content)) for d in docs]
+    remaining = list(range(len(docs)))
+    order: List[int] = []
+    while remaining:
+        def _mmr(i: int) -> float:
+            redundancy = max((_term_cosine(vectors[i], vectors[j]) for j in order), default=0.0)
+            return lambda_mult * scores[i] - (1 - lambda_mult) * redundancy
+        best = max(remaining, key=lambda i: (_mmr(i), -i))
+        order.append(best)
+        remaining.remove(best)
+    return order
+
+@dataclass
+class CompressionStats:
+    candidates: int = 0
+    kept: int = 0
+    below_floor: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+    elapsed_s: float = 0.0
+
+class CompressingRetriever(BaseRetriever):
+    """Post-retrieval rerank → MMR → relevance floor → token budget around ``base``.
+
+    One instance serves every question (and thread) of the agent, so nothing is
+    stored per call: ``compress_with_stats`` returns the stats of its own call.
+    """
+
+    base: Any
+    reranker: Any
+    max_docs: int = DEFAULT_MAX_DOCS
+    token_budget: int = DEFAULT_TOKEN_BUDGET
+    relevance_floor: float = DEFAULT_RELEVANCE_FLOOR
+    mmr_lambda: float = DEFAULT_MMR_LAMBDA
+    count_tokens: Optional[Callable[[str], int]] = None    # default: token_counter(), set once
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.count_tokens is None:
+            self.count_tokens = token_counter()
+
+    def compress(self, query: str, docs: Sequence[Document]) -> List[Document]:
+        return self.compress_with_stats(query, docs)[0]
+
+    def compress_with_stats(self, query: str,
+                            docs: Sequence[Document]) -> Tuple[List[Document], CompressionStats]:
+        start = time.perf_counter()
+        count = self.count_tokens
+        stats = CompressionStats(candidates=len(docs))
+        lengths = [count(d.page_content) for d in docs]
+        stats.tokens_in = sum(lengths)
+        scores = self.reranker.score(query, docs)
+
+        kept: List[Document] = []
+        used = 0
+        for i in mmr_order(scores, docs, self.mmr_lambda):
+            if len(kept) >= self.max_docs:
+                break
+            if kept and scores[i] < self.relevance_floor:
+                stats.below_floor += 1
+                continue
+            if kept and used + lengths[i] > self.token_budget:
+                continue
+            used += lengths[i]
+            doc = docs[i]
+            kept.append(Document(page_content=doc.page_content, id=doc.id,
+                                 metadata={**doc.metadata, "rerank_score": round(scores[i], 4)}))
+        stats.kept, stats.tokens_out = len(kept), used
+        stats.elapsed_s = time.perf_counter() - start
+        return kept, stats
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: Optional[CallbackManagerForRetrieverRun] = None) -> List[Document]:
+        return self.compress(query, self.base.invoke(query))
+
+# ----------------------------------------------------------------------------
+# Benchmark
+# ----------------------------------------------------------------------------
+
+def _p50(values: Sequence[float]) -> float:
+    return statistics.median(values) if values else 0.0
+
+def benchmark(questions: Sequence[str] = BENCHMARK_QUESTIONS, with_llm: bool = False) -> Dict[str, Dict[str, float]]:
+    """Context tokens, chunk count and latency: previous k=15 similarity chain vs. the current one.
+
+    Uses the agent's own KB index and backends (tamara_graph); with ``with_llm`` each
+    question is also answered by both chains.
+    """
+    import tamara_graph as tg
+    from langchain.chains import create_retrieval_chain
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+    from langchain_core.prompts import ChatPromptTemplate
+
+    persist = tg._persist_dir()
+    vectorstore = tg._ingest_if_needed(persist, tg._txt_dir())
+    retrievers = {
+        "vector k=15 (previous)": vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 15}),
+        "compressed (current)": tg._kb_retriever(vectorstore, persist),
+    }
+    count = token_counter()
+    llm = tg.get_chat_model(temperature=0.1) if with_llm else None
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Answer using only this context:\n\n{context}"), ("human", "{input}")])
+
+    results: Dict[str, Dict[str, float]] = {}
+    for name, retriever in retrievers.items():
+        tokens, chunks, retrieve_s, answer_s = [], [], [], []
+        chain = create_retrieval_chain(retriever, create_stuff_documents_chain(llm, prompt)) if llm else None
+        for q in questions:
+            start = time.perf_counter()
+            docs = retriever.invoke(q)
+            retrieve_s.append(time.perf_counter() - start)
+            chunks.append(len(docs))
+            tokens.append(sum(count(d.page_content) for d in docs))
+            if chain is not None:
+                start = time.perf_counter()
+                chain.invoke({"input": q})
+                answer_s.append(time.perf_counter() - start)
+        results[name] = {"chunks": _p50(chunks), "context_tokens": _p50(tokens),
+                         "retrieve_ms": _p50(retrieve_s) * 1000, "answer_s": _p50(answer_s)}
+    return results
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Benchmark context compression against the previous k=15 chain")
+    parser.add_argument("--with-llm", action="store_true", help="also time full answers")
+    args = parser.parse_args()
+    load_dotenv()
+
+    results = benchmark(with_llm=args.with_llm)
+    print(f"{'retriever':<24} {'chunks':>7} {'ctx tokens':>11} {'retrieve ms':>12} {'answer s':>9}   (medians)")
+    for name, r in results.items():
+        answer = f"{r['answer_s']:>9.2f}" if args.with_llm else f"{'-':>9}"
+        print(f"{name:<24} {r['chunks']:>7.0f} {r['context_tokens']:>11.0f} {r['retrieve_ms']:>12.1f} {answer}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+crunching.py — TAMARA crunching model and PLC sequence builder
+
+Python mirror of the PLC function block FB_2a-Crunching (see PLC_stuff/), used to
+pre-validate formulation inputs locally and to build the 10-element REAL sequence
+array written to DB9 by the MCP server (0_Examples/TamaraMCPserver.py).
+
+Sequence layout (SEQUENCE_LENGTH = 10 REALs, big-endian on the wire):
+    [mode_code, press1 x3, press2 x3, durations x3]
+
+Batch generation
+----------------
+``pack_sequence`` memoizes the full crunch + sequence build on the rounded user
+inputs and returns wire-ready big-endian float32 bytes; ``build_sequence_batch``
+concatenates those payloads for a queue of runs, so repeated formulations cost a
+cache lookup and no per-value packing.
+"""
+
+from __future__ import annotations
+import math
+import struct
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+SEQUENCE_LENGTH = 10   # must match plc_tool.DB_CONFIG['SEQUENCE']['r_SEQUENCE']['count']
+SEQUENCE_FORMAT = f">{SEQUENCE_LENGTH}f"  # S7 REAL = big-endian IEEE-754 float32
+SEQUENCE_CACHE_DECIMALS = 4   # rounding of user inputs in the cache key
+SEQUENCE_CACHE_SIZE = 1024
+
+# System constants
+P_MIN_BAR = 0.2      # Minimum pressure (bar)
+T_PRIME_S = 0.5      # Prime delay for amorcage + priming (s)
+T_MIN_S = 3          # Minimum runtime for stable pressure (s)
+TFR_WINDOW_MIN = 0.1 # Minimum TFR window when TFRmax <= TFRmin (mL/min), as in FB_2a Network 4
+MU_REF = 1005.0      # Reference viscosity - water at 20°C (μPa·s)
+MANIFOLD_VOL = {     # Maximum volumes for manifolds (mL)
+    "SMALL": 1.7,
+    "LARGE": 23.0
+}
+
+# Solvent properties at 20°C
+SOLVENT_PROPERTIES = {
+    'ethanol': {
+        'viscosity': 1184.0,  # Base viscosity at 20°C (μPa·s)
+        'sensitivity': 22.0,  # Temperature sensitivity (μPa·s/°C)
+        'molar_volume': 22.0  # Molar volume (mL/mol)
+    },
+    'ipa': {
+        'viscosity': 2381.0,
+        'sensitivity': 68.0,
+        'molar_volume': 103.0
+    },
+    'acetone': {
+        'viscosity': 324.0,
+        'sensitivity': 3.0,
+        'molar_volume': 74.0
+    },
+    'methanol': {
+        'viscosity': 594.0,
+        'sensitivity': 7.0,
+        'molar_volume': 40.0
+    }
+}
+
+# Chip-specific geometry resistances
+CHIP_RESISTANCES = {
+    "BAFFLE": {
+        "1": 14.43,     # Linear resistance (mbar·s/μL)
+        "2": 59.80,
+        "3": 3.08,
+        "1a": 0.04118,  # Quadratic resistance (mbar·s²/μL²)
+        "2a": 0.28768,
+        "3a": 0.03947
+    },
+    "HERRINGBONE": {
+        "1": 12.06,
+        "2": 61.29,
+        "3": 5.09,
+        "1a": 0.07357,
+        "2a": 0.25822,
+        "3a": 0.0
+    }
+}
+
+# ---------------------------------------------------------------------------
+# Sequencing layer constants (mirrors mcp_params.py)
+# ---------------------------------------------------------------------------
+MODE_RUN = "RUN"
+MODE_CLEAN = "CLEAN"
+MODE_PRESSURE_TEST = "PRESSURE_TEST"
+
+CLEAN_CONSTANT = "constant"
+CLEAN_ALTERNATE = "alternate"
+
+@dataclass
+class RunParameters:
+    # User inputs
+    tfr: float                  # Total Flow Rate (mL/min)
+    frr: int                    # Flow Rate Ratio (aqueous:solvent)
+    tar_vol: float             # Target Volume (mL)
+    temp: float                # Temperature (°C)
+    chip_id: str               # Chip type (BAFFLE/HERRINGBONE)
+    manifold: str              # Manifold size (SMALL/LARGE)
+    viscosity_org: float       # Base viscosity of organic at 20°C (μPa·s)
+    viscosity_sens: float      # Viscosity temperature sensitivity (μPa·s/°C)
+    molar_vol: float          # Molar volume of organic (mL/mol)
+    lab_pressure: float        # Maximum input pressure (bar)
+
+    # Derived parameters
+    mu1: float = 0.0          # Viscosity of aqueous phase (μPa·s)
+    mu2: float = 0.0          # Viscosity of organic phase (μPa·s)
+    n: float = 0.0            # Ratio of organic to aqueous phase
+    mu3: float = 0.0          # Viscosity of mixture (μPa·s)
+    tfrmin: float = 0.0       # Minimum total flow rate (mL/min)
+    tfrmax: float = 0.0       # Maximum total flow rate (mL/min)
+    
+    # Adjusted resistances
+    resis: Dict[str,float] = field(default_factory=dict)
+    
+    # Effective linear & quad resistances
+    r1: float = 0.0
+    ra1: float = 0.0
+    r2: float = 0.0
+    ra2: float = 0.0
+    
+    # Split volumes & runtime
+    v1: float = 0.0           # Organic phase volume
+    v2: float = 0.0           # Aqueous phase volume
+    run_time: float = 0.0     # Runtime (Amorcage + priming + run) (s)
+    
+    # Flows
+    flow1: float = 0.0
+    flow2: float = 0.0
+    
+    # Pressures (bar)
+    press1: float = 0.0
+    press2: float = 0.0
+
+def compute_derived_parameters(rp: RunParameters) -> None:
+    """Compute all derived parameters for a RunParameters instance."""
+    # 1. Dynamic Viscosity Calculations
+    rp.mu1 = 1005.0 - 23.0 * (rp.temp - 20.0)  # Aqueous phase viscosity (water)
+    rp.mu2 = rp.viscosity_org - rp.viscosity_sens * (rp.temp - 20.0)
+    rp.n = rp.frr * (rp.molar_vol / 18.0)  # FRR is already the ratio
+    rp.mu3 = (rp.mu1 * rp.n + rp.mu2) / (1 + rp.n)
+
+    # 2. Viscosity-Adjusted Resistances
+    base_resis = CHIP_RESISTANCES[rp.chip_id]
+    for seg, base in base_resis.items():
+        if seg in ("1", "1a"):
+            mu_i = rp.mu1
+        elif seg in ("2", "2a"):
+            mu_i = rp.mu2
+        else:
+            mu_i = rp.mu3
+        rp.resis[seg] = base * (mu_i / MU_REF)
+
+    # 3. Effective Resistance per Line
+    fr_rate = rp.frr  # FRR is already the ratio
+    rp.r1 = rp.resis["1"] * (fr_rate / (1 + fr_rate)) + rp.resis["3"]
+    rp.ra1 = rp.resis["1a"] * ((fr_rate / (1 + fr_rate)) ** 2) + rp.resis["3a"]
+    rp.r2 = rp.resis["2"] * (1 / (1 + fr_rate)) + rp.resis["3"]
+    rp.ra2 = rp.resis["2a"] * ((1 / (1 + fr_rate)) ** 2) + rp.resis["3a"]
+
+    # 4. Compute TFRmin and TFRmax (in mL/min)
+    p_min_mbar = P_MIN_BAR * 1000
+    p_max_mbar = 0.9 * rp.lab_pressure * 1000
+
+    # TFRmin calculations
+    if rp.ra1 != 0:
+        tfrmin1 = (-rp.r1 + math.sqrt(rp.r1**2 + 4 * p_min_mbar * rp.ra1)) / (2 * rp.ra1)
+    else:
+        tfrmin1 = p_min_mbar / rp.r1
+    
+    if rp.ra2 != 0:
+        tfrmin2 = (-rp.r2 + math.sqrt(rp.r2**2 + 4 * p_min_mbar * rp.ra2)) / (2 * rp.ra2)
+    else:
+        tfrmin2 = p_min_mbar / rp.r2
+    
+    tfrmin_ul_per_s = max(tfrmin1, tfrmin2)
+    rp.tfrmin = tfrmin_ul_per_s / 1000 * 60
+
+    # TFRmax calculations
+    if rp.ra1 != 0:
+        tfrmax1 = (-rp.r1 + math.sqrt(rp.r1**2 + 4 * p_max_mbar * rp.ra1)) / (2 * rp.ra1)
+    else:
+        tfrmax1 = p_max_mbar / rp.r1
+    
+    if rp.ra2 != 0:
+        tfrmax2 = (-rp.r2 + math.sqrt(rp.r2**2 + 4 * p_max_mbar * rp.ra2)) / (2 * rp.ra2)
+    else:
+        tfrmax2 = p_max_mbar / rp.r2
+    
+    tfrmax_ul_per_s = min(tfrmax1, tfrmax2)
+    tfrmax_time = rp.tar_vol / T_MIN_S  # mL/s
+    tfrmax_time_ml_min = tfrmax_time * 60  # mL/min
+    rp.tfrmax = min(tfrmax_ul_per_s / 1000 * 60, tfrmax_time_ml_min)
+    
+    if rp.tfrmax <= rp.tfrmin:
+        rp.tfrmax = rp.tfrmin + TFR_WINDOW_MIN
+
+    # 5. Volumes and Runtime
+    rp.v1 = rp.tar_vol / (1 + fr_rate)  # organic phase
+    rp.v2 = rp.v1 * fr_rate             # aqueous phase
+    tfr_ml_per_s = rp.tfr / 60
+    rp.run_time = rp.tar_vol / tfr_ml_per_s + T_PRIME_S
+
+    # 6. Flows and Pressures
+    Q = rp.tfr * 1000 / 60  # Convert to μL/s
+    rp.flow1 = rp.tfr * (fr_rate / (1 + fr_rate))
+    rp.flow2 = rp.tfr * (1 / (1 + fr_rate))
+    rp.press1 = (Q * rp.r1 + Q**2 * rp.ra1 + 10) / 1000  # bar
+    rp.press2 = (Q * rp.r2 + Q**2 * rp.ra2 + 10) / 1000  # bar
+
+def validate_parameters(rp: RunParameters) -> tuple[List[str], List[str], List[str]]:
+    """Validate parameters and return errors, warnings, and recommendations."""
+    errs, warns, recs = [], [], []
+    max_pressure = 0.9 * rp.lab_pressure
+    
+    # Pressure limits
+    for name, p in (("press1", rp.press1), ("press2", rp.press2)):
+        if p < P_MIN_BAR or p > max_pressure:
+            errs.append(f"{name}={p:.2f} bar out of [{P_MIN_BAR},{max_pressure:.2f}] bar")
+            recs.append("Consider adjusting TFR or FRR to bring pressures within limits")
+    
+    # Manifold capacity
+    limit = MANIFOLD_VOL[rp.manifold]
+    total_vol = rp.v1 + rp.v2
+    if total_vol > limit:
+        if rp.manifold == "SMALL" and total_vol <= MANIFOLD_VOL["LARGE"]:
+            warns.append(f"Total volume {total_vol:.2f} mL exceeds SMALL manifold capacity")
+            recs.append("Switch to LARGE manifold")
+        else:
+            errs.append(f"Total volume {total_vol:.2f} mL exceeds {rp.manifold} manifold capacity")
+            recs.append("Reduce target volume or adjust TFR/FRR")
+    
+    # FRR limit
+    if not (1 <= rp.frr <= 10):
+        errs.append(f"FRR={rp.frr} out of [1,10] allowed range")
+        recs.append("Adjust FRR to be between 1 and 10")
+    
+    # TFR dynamic limits
+    if not (rp.tfrmin <= rp.tfr <= rp.tfrmax):
+        errs.append(f"TFR={rp.tfr:.2f} mL/min out of [{rp.tfrmin:.2f},{rp.tfrmax:.2f}] mL/min")
+        recs.append("Adjust TFR to be within computed limits")
+    
+    return errs, warns, list(set(recs))  # Remove duplicate recommendations
+
+def build_sequence(rp: RunParameters, mode: str = MODE_RUN, clean_type: Optional[str] = None) -> List[float]:
+    """Return a 10-element PLC sequence array based on the requested mode.
+
+    Parameters
+    ----------
+    rp : RunParameters
+        Object populated with ``press1``, ``press2`` and ``run_time``.
+    mode : str, default "RUN"
+        One of ``MODE_RUN``, ``MODE_CLEAN`` or ``MODE_PRESSURE_TEST``.
+    clean_type : Optional[str]
+        Required when ``mode == MODE_CLEAN``. Either ``CLEAN_CONSTANT`` or
+        ``CLEAN_ALTERNATE``.
+    """
+    return sequence_values(rp.press1, rp.press2, rp.run_time, mode, clean_type)
+
+def sequence_values(press1: float, press2: float, run_time: float,
+                    mode: str = MODE_RUN, clean_type: Optional[str] = None) -> List[float]:
+    """``build_sequence`` from the only three derived values it uses.
+
+    Elements 7-9 are the phase durations (s); CLEAN and PRESSURE_TEST durations do
+    not depend on the pressures or run time, so planners can read them from
+    ``sequence_values(0.0, 0.0, 0.0, mode, clean_type)``.
+    """
+    # ------------------------- RUN (mode 0) ------------------------------
+    if mode == MODE_RUN:
+        mode_code = 0.0
+        # 30 % – 60 % – 100 % pressure ramp
+        p_factors = (0.3, 0.6, 1.0)
+        durations = (run_time * 0.10, run_time * 0.10, run_time * 0.80)
+
+        p1_vals = [press1 * f for f in p_factors]
+        p2_vals = [press2 * f for f in p_factors]
+
+    # ---------------------- CLEAN (modes 1 & 2) --------------------------
+    elif mode == MODE_CLEAN:
+        if clean_type == CLEAN_CONSTANT:
+            mode_code = 1.0
+            p1_vals = [press1 * 0.5, 0.0, 0.0]
+            p2_vals = [press2 * 0.5, 0.0, 0.0]
+            durations = (10.0, 0.0, 0.0)
+        elif clean_type == CLEAN_ALTERNATE:
+            mode_code = 2.0
+            p1_vals = [press1, 0.0, press1]
+            p2_vals = [press2, 0.0, press2]
+            durations = (5.0, 5.0, 5.0)
+        else:
+            raise ValueError("When mode is CLEAN, clean_type must be 'constant' or 'alternate'.")
+
+    # ------------------- PRESSURE TEST (mode 3) --------------------------
+    elif mode == MODE_PRESSURE_TEST:
+        mode_code = 3.0
+        p1_vals = [press1, 0.0, 0.0]
+        p2_vals = [press2, 0.0, 0.0]
+        durations = (5.0, 0.0, 0.0)
+
+    else:
+        raise ValueError(f"Unknown mode '{mode}'.")
+
+    sequence = [mode_code, *p1_vals, *p2_vals, *durations]
+    if len(sequence) != SEQUENCE_LENGTH:
+        raise AssertionError(f"Generated PLC sequence must have exactly {SEQUENCE_LENGTH} elements.")
+    return sequence
+
+# ---------------------------------------------------------------------------
+# Memoized, wire-ready batch generation
+# ---------------------------------------------------------------------------
+
+def _cache_key(rp: RunParameters) -> tuple:
+    """Rounded user inputs; manifold is excluded as it does not affect the sequence."""
+    r = SEQUENCE_CACHE_DECIMALS
+    return (round(rp.tfr, r), int(rp.frr), round(rp.tar_vol, r), round(rp.temp, r), rp.chip_id,
+            round(rp.viscosity_org, r), round(rp.viscosity_sens, r), round(rp.molar_vol, r),
+            round(rp.lab_pressure, r))
+
+@lru_cache(maxsize=SEQUENCE_CACHE_SIZE)
+def _packed_sequence(key: tuple, mode: str, clean_type: Optional[str]) -> bytes:
+    tfr, frr, tar_vol, temp, chip_id, visc, sens, molar_vol, lab_pressure = key
+    rp = RunParameters(tfr=tfr, frr=frr, tar_vol=tar_vol, temp=temp, chip_id=chip_id, manifold="SMALL",
+                       viscosity_org=visc, viscosity_sens=sens, molar_vol=molar_vol,
+                       lab_pressure=lab_pressure)
+    compute_derived_parameters(rp)
+    return struct.pack(SEQUENCE_FORMAT, *build_sequence(rp, mode, clean_type))
+
+def pack_sequence(rp: RunParameters, mode: str = MODE_RUN, clean_type: Optional[str] = None) -> bytes:
+    """Crunch ``rp`` and return its sequence as 40 big-endian float32 bytes (one ``db_write``).
+
+    Only the user inputs of ``rp`` are read (derived fields are recomputed), and
+    results are memoized on those inputs rounded to SEQUENCE_CACHE_DECIMALS.
+    """
+    return _packed_sequence(_cache_key(rp), mode, clean_type)
+
+def build_sequence_batch(runs: Iterable[RunParameters], mode: str = MODE_RUN,
+                         clean_type: Optional[str] = None) -> bytes:
+    """Packed sequences for a queue of runs, concatenated in order.
+
+    Run ``i`` occupies bytes ``[i*40, (i+1)*40)``; see ``iter_packed``.
+    """
+    return b"".join(pack_sequence(rp, mode, clean_type) for rp in runs)
+
+def iter_packed(buffer: bytes) -> List[memoryview]:
+    """Zero-copy 40-byte views over a ``build_sequence_batch`` buffer."""
+    size = struct.calcsize(SEQUENCE_FORMAT)
+    if len(buffer) % size:
+        raise ValueError(f"Buffer length {len(buffer)} is not a multiple of {size}")
+    view = memoryview(buffer)
+    return [view[i:i + size] for i in range(0, len(buffer), size)]
+
+def sequence_cache_info():
+    """``functools`` cache statistics for the packed-sequence memo."""
+    return _packed_sequence.cache_info()
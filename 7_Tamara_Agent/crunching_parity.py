@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+crunching_parity.py — Python model vs. PLC FB_2a-Crunching parity and benchmark
+
+The crunching formulas exist twice: in ``crunching.compute_derived_parameters`` /
+``validate_parameters`` (local pre-validation) and in ``PLC_stuff/FB_2a-Crunching.txt``
+(what actually sets CRUNCH_VALID). This module holds a line-by-line transcription of
+the FB_2a networks, evaluated in float32 (S7 REAL) and vectorized with NumPy, and
+compares both paths over random inputs.
+
+Known, intentional divergences (reported, not counted as failures):
+- ``tfrmax``: the Python model additionally caps TFRmax at ``tar_vol / T_MIN_S``
+  (minimum stable runtime). It is therefore only ever stricter than the PLC.
+- ``valid``: a SMALL-manifold overflow that fits the LARGE manifold is a warning in
+  Python ("Switch to LARGE manifold") but a rejection on the PLC.
+
+Run:
+  $ python crunching_parity.py                    # 200k samples
+  $ python crunching_parity.py --samples 500000 --seed 7
+"""
+
+from __future__ import annotations
+import argparse
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import numpy as np
+
+from crunching import (
+    RunParameters, compute_derived_parameters, validate_parameters,
+    CHIP_RESISTANCES, MANIFOLD_VOL, MU_REF, P_MIN_BAR, T_MIN_S, T_PRIME_S, SOLVENT_PROPERTIES,
+)
+
+# Outputs compared one-to-one (Python attribute name → FB_2a variable)
+COMPARED_OUTPUTS = {
+    'mu1': 'r_mu1', 'mu2': 'r_mu2', 'n': 'r_n', 'mu3': 'r_mu3',
+    'r1': 'r_r1', 'ra1': 'r_ra1', 'r2': 'r_r2', 'ra2': 'r_ra2',
+    'tfrmin': 'r_tfrmin', 'tfrmax': 'r_tfrmax',
+    'press1': 'r_PressureRun1', 'press2': 'r_PressureRun2', 'run_time': 'r_run_time',
+    'v1': 'r_AqueousVolume', 'v2': 'r_SolventVolume',
+}
+# FB_2a indexes r_CHIP_RES[i_Chip_ID, 0..5] as 1, 1a, 2, 2a, 3, 3a; i_Chip_ID follows plc_tool.ChipID
+CHIP_ORDER = ['BAFFLE', 'HERRINGBONE']
+SEGMENTS = ['1', '1a', '2', '2a', '3', '3a']
+MANIFOLD_ORDER = ['SMALL', 'LARGE']  # plc_tool.ManifoldID
+
+F32 = np.float32
+
+# ----------------------------------------------------------------------------
+# Random inputs
+# ----------------------------------------------------------------------------
+
+def sample_inputs(n: int, seed: int = 0) -> Dict[str, np.ndarray]:
+    """Random user inputs covering valid and invalid regions (FRR 0..12, wide TFR)."""
+    rng = np.random.default_rng(seed)
+    presets = list(SOLVENT_PROPERTIES.values())
+    preset_idx = rng.integers(0, len(presets) + 1, n)  # last index = random custom solvent
+    visc = rng.uniform(300.0, 2500.0, n)
+    sens = rng.uniform(0.0, 1.0, n) * (visc - 50.0) / 40.0   # keeps mu2 > 0 up to 60 °C
+    molar = rng.uniform(18.0, 110.0, n)
+    for i, props in enumerate(presets):
+        mask = preset_idx == i
+        visc[mask], sens[mask], molar[mask] = props['viscosity'], props['sensitivity'], props['molar_volume']
+    # Presets such as IPA go non-physical (mu2 <= 0) well below 60 °C; stay inside their range
+    temp = np.minimum(rng.uniform(5.0, 60.0, n), 20.0 + (visc - 50.0) / np.maximum(sens, 1e-9))
+    return {
+        'tfr': rng.uniform(0.1, 20.0, n),
+        'frr': rng.integers(0, 13, n),
+        'tar_vol': rng.uniform(0.05, 30.0, n),
+        'temp': temp,
+        'chip': rng.integers(0, 2, n),
+        'manifold': rng.integers(0, 2, n),
+        'visc': visc,
+        'sens': sens,
+        'molar': molar,
+        'lab_pressure': rng.uniform(0.5, 8.0, n),
+    }
+
+# ----------------------------------------------------------------------------
+# FB_2a-Crunching transcription (float32, vectorized)
+# ----------------------------------------------------------------------------
+
+def fb_2a_crunching(inputs: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Evaluate FB_2a Networks 1-5 and 7 in REAL arithmetic for every sample.
+
+    Network 6 (Amorcage/Priming pressures) has no Python counterpart and is skipped.
+    Outputs zeroed by the PLC on validation failure are returned *before* zeroing,
+    together with ``b_Valid``.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        temp = inputs['temp'].astype(F32)
+        frr = inputs['frr'].astype(F32)
+        tfr = inputs['tfr'].astype(F32)
+        tar_vol = inputs['tar_vol'].astype(F32)
+        lab_pressure = inputs['lab_pressure'].astype(F32)
+        mu_ref = F32(MU_REF)
+        chip_res = np.array([[CHIP_RESISTANCES[c][s] for s in SEGMENTS] for c in CHIP_ORDER], dtype=F32)
+        manifold_vol = np.array([MANIFOLD_VOL[m] for m in MANIFOLD_ORDER], dtype=F32)
+
+        out: Dict[str, np.ndarray] = {}
+        # Network 1: derived viscosities & mixing ratio
+        out['r_mu1'] = F32(1005.0) - F32(23.0) * (temp - F32(20.0))
+        out['r_mu2'] = inputs['visc'].astype(F32) - inputs['sens'].astype(F32) * (temp - F32(20.0))
+        out['r_n'] = frr * (inputs['molar'].astype(F32) / F32(18.0))
+        out['r_mu3'] = (out['r_mu1'] * out['r_n'] + out['r_mu2']) / (F32(1.0) + out['r_n'])
+
+        # Network 2: viscosity-scaled resistances
+        base = chip_res[inputs['chip']]
+        res1 = base[:, 0] * (out['r_mu1'] / mu_ref)
+        res1a = base[:, 1] * (out['r_mu1'] / mu_ref)
+        res2 = base[:, 2] * (out['r_mu2'] / mu_ref)
+        res2a = base[:, 3] * (out['r_mu2'] / mu_ref)
+        res3 = base[:, 4] * (out['r_mu3'] / mu_ref)
+        res3a = base[:, 5] * (out['r_mu3'] / mu_ref)
+
+        # Network 3: effective resistances
+        aq = frr / (F32(1.0) + frr)
+        org = F32(1.0) / (F32(1.0) + frr)
+        out['r_r1'] = res1 * aq + res3
+        out['r_ra1'] = res1a * aq ** 2 + res3a
+        out['r_r2'] = res2 * org + res3
+        out['r_ra2'] = res2a * org ** 2 + res3a
+
+        # Network 4: TFRmin / TFRmax
+        p_min = F32(P_MIN_BAR) * F32(1000.0)
+        p_max = F32(0.9) * lab_pressure * F32(1000.0)
+
+        def _root(r: np.ndarray, ra: np.ndarray, p) -> np.ndarray:
+            quad = (-r + np.sqrt(r ** 2 + F32(4.0) * p * ra)) / (F32(2.0) * ra)
+            return np.where(ra != 0, quad, p / r).astype(F32)
+
+        out['r_tfrmin'] = (np.maximum(_root(out['r_r1'], out['r_ra1'], p_min), _root(out['r_r2'], out['r_ra2'], p_min))
+                           * F32(60.0) / F32(1000.0))
+        tfrmax = (np.minimum(_root(out['r_r1'], out['r_ra1'], p_max), _root(out['r_r2'], out['r_ra2'], p_max))
+                  * F32(60.0) / F32(1000.0))
+        out['r_tfrmax'] = np.where(tfrmax <= out['r_tfrmin'], out['r_tfrmin'] + F32(0.1), tfrmax).astype(F32)
+
+        # Network 5: flows, pressures, run time
+        q = tfr * F32(1000.0) / F32(60.0)
+        out['r_PressureRun1'] = (q * out['r_r1'] + q * q * out['r_ra1'] + F32(10.0)) / F32(1000.0)
+        out['r_PressureRun2'] = (q * out['r_r2'] + q * q * out['r_ra2'] + F32(10.0)) / F32(1000.0)
+        out['r_run_time'] = tar_vol / (tfr / F32(60.0)) + F32(T_PRIME_S)
+
+        # Network 7: validation
+        p_hi = F32(0.9) * lab_pressure
+        valid = ~((out['r_PressureRun1'] < F32(P_MIN_BAR)) | (out['r_PressureRun1'] > p_hi)
+                  | (out['r_PressureRun2'] < F32(P_MIN_BAR)) | (out['r_PressureRun2'] > p_hi))
+        out['r_AqueousVolume'] = tar_vol / (F32(1.0) + frr)
+        out['r_SolventVolume'] = out['r_AqueousVolume'] * frr
+        valid &= ~((out['r_AqueousVolume'] + out['r_SolventVolume']) > manifold_vol[inputs['manifold']])
+        valid &= ~((frr < F32(1.0)) | (frr > F32(10.0)))
+        valid &= ~((tfr < out['r_tfrmin']) | (tfr > out['r_tfrmax']))
+        out['b_Valid'] = valid
+    return out
+
+# ----------------------------------------------------------------------------
+# Python model path
+# ----------------------------------------------------------------------------
+
+def python_model(inputs: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Run compute_derived_parameters + validate_parameters per sample (the pre-validation path)."""
+    n = len(inputs['tfr'])
+    columns: Dict[str, List[float]] = {name: [] for name in COMPARED_OUTPUTS}
+    valid: List[bool] = []
+    rows = zip(*(inputs[k].tolist() for k in
+                 ('tfr', 'frr', 'tar_vol', 'temp', 'chip', 'manifold', 'visc', 'sens', 'molar', 'lab_pressure')))
+    for tfr, frr, tar_vol, temp, chip, manifold, visc, sens, molar, lab_pressure in rows:
+        rp = RunParameters(tfr=tfr, frr=frr, tar_vol=tar_vol, temp=temp, chip_id=CHIP_ORDER[chip],
+                           manifold=MANIFOLD_ORDER[manifold], viscosity_org=visc, viscosity_sens=sens,
+                           molar_vol=molar, lab_pressure=lab_pressure)
+        compute_derived_parameters(rp)
+        errs, _warns, _recs = validate_parameters(rp)
+        for name in COMPARED_OUTPUTS:
+            columns[name].append(getattr(rp, name))
+        valid.append(not errs)
+    result = {name: np.fromiter(values, dtype=np.float64, count=n) for name, values in columns.items()}
+    result['valid'] = np.array(valid, dtype=bool)
+    return result
+
+# ----------------------------------------------------------------------------
+# Comparison
+# ----------------------------------------------------------------------------
+
+@dataclass
+class ParityReport:
+    samples: int
+    max_rel_dev: Dict[str, float] = field(default_factory=dict)
+    python_s: float = 0.0
+    plc_s: float = 0.0
+    valid_disagreements: int = 0
+    explained_disagreements: Dict[str, int] = field(default_factory=dict)
+    unexplained_disagreements: int = 0
+    tfrmax_time_capped: int = 0
+
+    def format(self) -> str:
+        lines = [f"Crunching parity over {self.samples:,} samples",
+                 f"{'output':<10} {'max rel. deviation':>20}"]
+        lines += [f"{name:<10} {dev:>20.3e}" for name, dev in self.max_rel_dev.items()]
+        lines += [
+            "",
+            f"tfrmax capped by T_MIN_S (Python only): {self.tfrmax_time_capped:,}",
+            f"valid disagreements: {self.valid_disagreements:,} "
+            f"(explained {self.explained_disagreements}, unexplained {self.unexplained_disagreements})",
+            "",
+            f"Python model : {self.python_s:8.3f} s  ({1e6 * self.python_s / self.samples:7.2f} µs/sample)",
+            f"FB_2a (NumPy): {self.plc_s:8.3f} s  ({1e6 * self.plc_s / self.samples:7.2f} µs/sample)",
+        ]
+        return "\n".join(lines)
+
+def _rel_dev(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.abs(a - b) / np.maximum(np.abs(b), 1e-6)
+
+def compare(n: int = 200_000, seed: int = 0) -> ParityReport:
+    """Evaluate both paths on the same ``n`` random inputs and summarise deviations."""
+    inputs = sample_inputs(n, seed)
+    t0 = time.perf_counter()
+    py = python_model(inputs)
+    t1 = time.perf_counter()
+    plc = fb_2a_crunching(inputs)
+    t2 = time.perf_counter()
+
+    report = ParityReport(samples=n, python_s=t1 - t0, plc_s=t2 - t1)
+    tfrmax_time = inputs['tar_vol'] / T_MIN_S * 60
+    time_capped = tfrmax_time < plc['r_tfrmax'].astype(np.float64)
+    report.tfrmax_time_capped = int(time_capped.sum())
+    for name, plc_name in COMPARED_OUTPUTS.items():
+        dev = _rel_dev(py[name], plc[plc_name].astype(np.float64))
+        if name == 'tfrmax':
+            dev = dev[~time_capped]  # intentional: Python is stricter there
+        report.max_rel_dev[name] = float(dev.max()) if dev.size else 0.0
+
+    disagree = py['valid'] != plc['b_Valid']
+    report.valid_disagreements = int(disagree.sum())
+    total_vol = inputs['tar_vol']
+    manifold_warning = ((inputs['manifold'] == MANIFOLD_ORDER.index('SMALL'))
+                        & (total_vol > MANIFOLD_VOL['SMALL']) & (total_vol <= MANIFOLD_VOL['LARGE']))
+    # Boundary samples: any compared quantity within float32 rounding of its limit
+    tfr = inputs['tfr']
+    near_limit = (np.isclose(tfr, plc['r_tfrmin'], rtol=1e-5) | np.isclose(tfr, plc['r_tfrmax'], rtol=1e-5)
+                  | np.isclose(plc['r_PressureRun1'], P_MIN_BAR, rtol=1e-5)
+                  | np.isclose(plc['r_PressureRun2'], P_MIN_BAR, rtol=1e-5)
+                  | np.isclose(plc['r_PressureRun1'], 0.9 * inputs['lab_pressure'], rtol=1e-5)
+                  | np.isclose(plc['r_PressureRun2'], 0.9 * inputs['lab_pressure'], rtol=1e-5)
+                  | np.isclose(total_vol, MANIFOLD_VOL['SMALL'], rtol=1e-5)
+                  | np.isclose(total_vol, MANIFOLD_VOL['LARGE'], rtol=1e-5))
+    causes = {
+        'manifold_warning': disagree & manifold_warning,
+        'tfrmax_time_cap': disagree & ~manifold_warning & time_capped,
+    }
+    explained = causes['manifold_warning'] | causes['tfrmax_time_cap']
+    causes['float32_boundary'] = disagree & ~explained & near_limit
+    explained |= causes['float32_boundary']
+    report.explained_disagreements = {k: int(v.sum()) for k, v in causes.items()}
+    report.unexplained_disagreements = int((disagree & ~explained).sum())
+    return report
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Python vs. FB_2a-Crunching parity benchmark")
+    parser.add_argument("--samples", type=int, default=200_000, help="Number of random input sets")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed")
+    args = parser.parse_args()
+    print(compare(args.samples, args.seed).format())
+
+if __name__ == "__main__":
+    main()
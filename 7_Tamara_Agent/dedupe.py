@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+dedupe.py — Ingestion-time duplicate and near-duplicate chunk detection
+
+``Knowledge_base/md`` and ``Knowledge_base/txt`` hold the same documents in two formats;
+pointing ingestion at their parent doubled the index and filled the top-k with copies.
+``ChunkDeduper`` keeps one canonical chunk per passage:
+
+- exact copies: SHA-1 of the normalised text (lowercased, markup and whitespace stripped)
+- near copies: MinHash over word shingles with LSH banding for candidate lookup, confirmed
+  by the estimated Jaccard similarity (default ≥ 0.85); chunks too short to shingle
+  reliably are only matched exactly
+
+kb_ingest consults it before embedding: a duplicate chunk is recorded in the manifest
+against its canonical chunk instead of being embedded and stored.
+"""
+
+from __future__ import annotations
+import hashlib
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+NUM_PERM = 64
+BANDS = 16              # 16 bands x 4 rows: pairs above ~0.5 Jaccard become candidates
+SHINGLE_WORDS = 3
+MIN_SHINGLES = 8        # below this only exact matches count
+DEFAULT_THRESHOLD = 0.85
+
+_PRIME = 4294967311     # smallest prime above 2**32; a < 2**31 keeps a*x + b inside uint64
+_rng = np.random.default_rng(0x7A3A)
+_PERM_A = _rng.integers(1, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, size=NUM_PERM, dtype=np.uint64)
+_WORD_RE = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+
+def normalize(text: str) -> str:
+    """Lowercased words only: table pipes, heading marks, padding and punctuation are ignored."""
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+def exact_key(text: str) -> str:
+    return hashlib.sha1(normalize(text).encode("utf-8")).hexdigest()
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> Set[str]:
+    words = normalize(text).split()
+    return {" ".join(words[i:i + size]) for i in range(max(0, len(words) - size + 1))}
+
+def minhash(items: Set[str]) -> np.ndarray:
+    """NUM_PERM-value MinHash signature of a set of shingles."""
+    hashes = np.fromiter((int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+                          for s in items), dtype=np.uint64, count=len(items))
+    return ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % np.uint64(_PRIME)).min(axis=1)
+
+def jaccard(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(sig_a == sig_b))
+
+class ChunkDeduper:
+    """Index of canonical chunks; ``find`` returns the canonical id a new chunk duplicates."""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD) -> None:
+        self.threshold = threshold
+        self._exact: Dict[str, str] = {}                     # normalised hash → chunk id
+        self._keys: Dict[str, str] = {}                      # chunk id → normalised hash
+        self._sigs: Dict[str, np.ndarray] = {}               # chunk id → signature
+        self._buckets: Dict[Tuple[int, bytes], Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _bands(self, sig: np.ndarray) -> List[Tuple[int, bytes]]:
+        rows = NUM_PERM // BANDS
+        return [(b, sig[b * rows:(b + 1) * rows].tobytes()) for b in range(BANDS)]
+
+    def _signature(self, text: str) -> Optional[np.ndarray]:
+        items = shingles(text)
+        return minhash(items) if len(items) >= MIN_SHINGLES else None
+
+    def find(self, text: str) -> Optional[str]:
+        """Canonical chunk id that ``text`` duplicates, or None."""
+        hit = self._exact.get(exact_key(text))
+        if hit is not None:
+            return hit
+        sig = self._signature(text)
+        if sig is None:
+            return None
+        candidates: Set[str] = set()
+        for band in self._bands(sig):
+            candidates |= self._buckets.get(band, set())
+        best = max(candidates, key=lambda cid: jaccard(sig, self._sigs[cid]), default=None)
+        if best is not None and jaccard(sig, self._sigs[best]) >= self.threshold:
+            return best
+        return None
+
+    def add(self, chunk_id: str, text: str) -> None:
+        if chunk_id in self._keys:
+            return
+        key = exact_key(text)
+        self._keys[chunk_id] = key
+        self._exact.setdefault(key, chunk_id)
+        sig = self._signature(text)
+        if sig is not None:
+            self._sigs[chunk_id] = sig
+            for band in self._bands(sig):
+                self._buckets.setdefault(band, set()).add(chunk_id)
+
+    def remove(self, chunk_id: str) -> None:
+        key = self._keys.pop(chunk_id, None)
+        if key is None:
+            return
+        if self._exact.get(key) == chunk_id:
+            del self._exact[key]
+        sig = self._sigs.pop(chunk_id, None)
+        if sig is not None:
+            for band in self._bands(sig):
+                bucket = self._buckets.get(band)
+                if bucket is not None:
+                    bucket.discard(chunk_id)
+                    if not bucket:
+                        del self._buckets[band]
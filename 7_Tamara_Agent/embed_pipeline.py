@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+embed_pipeline.py — Concurrent, rate-limit-aware embedding
+
+``ConcurrentEmbeddings`` wraps an ``Embeddings`` provider and turns one large
+``embed_documents`` call (what ``Chroma.add_documents`` issues) into sized batches
+sent from a bounded worker pool. Requests and approximate tokens are metered by
+token buckets so the pool stays under the provider's RPM/TPM limits, and failed
+batches are retried with exponential backoff and jitter.
+
+Ingestion (kb_ingest.py) streams file by file: load → split → dedupe (chunk ids)
+→ embed (this module, behind the embedding cache) → upsert.
+
+The worker pool lives as long as the object: use it as a context manager, or call
+``close_embeddings`` when a run that built its own embeddings is done.
+
+Environment (read by ``from_env``):
+  EMBED_BATCH_SIZE  - texts per request (default 64)
+  EMBED_WORKERS     - concurrent requests (default 4)
+  EMBED_RPM         - requests per minute (default: unlimited)
+  EMBED_TPM         - tokens per minute, estimated as chars/4 (default: unlimited)
+  EMBED_MAX_RETRIES - retries per batch (default 5)
+"""
+
+from __future__ import annotations
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 30.0
+CHARS_PER_TOKEN = 4   # rough estimate used for TPM metering
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens/s refilled up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until ``tokens`` are available; returns the time waited (s)."""
+        tokens = min(tokens, self.capacity)  # an oversized request waits for a full bucket
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+@dataclass
+class PipelineStats:
+    texts: int = 0
+    unique: int = 0
+    batches: int = 0
+    retries: int = 0
+    throttled_s: float = 0.0
+    elapsed_s: float = 0.0
+
+    @property
+    def chunks_per_s(self) -> float:
+        return self.texts / self.elapsed_s if self.elapsed_s else 0.0
+
+class ConcurrentEmbeddings(Embeddings):
+    """Batched, concurrent, rate-limited and retried ``embed_documents``."""
+
+    def __init__(self, embeddings: Embeddings, batch_size: int = DEFAULT_BATCH_SIZE,
+                 workers: int = DEFAULT_WORKERS, requests_per_min: Optional[float] = None,
+                 tokens_per_min: Optional[float] = None, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_s: float = BACKOFF_BASE_S) -> None:
+        """
+        Args:
+            embeddings: Provider to call (configure its own retries off, e.g. max_retries=0)
+            batch_size: Texts per provider request
+            workers: Maximum concurrent requests
+            requests_per_min: RPM limit (None = unlimited)
+            tokens_per_min: TPM limit, tokens estimated as len(text)/4 (None = unlimited)
+            max_retries: Retries per batch before the error propagates
+            backoff_s: First retry delay; doubles per attempt, capped at BACKOFF_MAX_S
+        """
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self._requests = TokenBucket(requests_per_min / 60.0, max(1.0, requests_per_min / 60.0)) \
+            if requests_per_min else None
+        self._tokens = TokenBucket(tokens_per_min / 60.0, tokens_per_min) if tokens_per_min else None
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed")
+        self._stats_lock = threading.Lock()
+        self.stats = PipelineStats()   # cumulative
+        self.last = PipelineStats()    # most recent embed_documents call
+
+    @classmethod
+    def from_env(cls, embeddings: Embeddings) -> "ConcurrentEmbeddings":
+        def _num(name: str) -> Optional[float]:
+            value = os.getenv(name)
+            return float(value) if value else None
+        return cls(embeddings,
+                   batch_size=int(os.getenv("EMBED_BATCH_SIZE", DEFAULT_BATCH_SIZE)),
+                   workers=int(os.getenv("EMBED_WORKERS", DEFAULT_WORKERS)),
+                   requests_per_min=_num("EMBED_RPM"),
+                   tokens_per_min=_num("EMBED_TPM"),
+                   max_retries=int(os.getenv("EMBED_MAX_RETRIES", DEFAULT_MAX_RETRIES)))
+
+    # ---- one batch ----------------------------------------------------------------
+    def _throttle(self, batch: List[str]) -> None:
+        waited = 0.0
+        if self._requests:
+            waited += self._requests.acquire(1)
+        if self._tokens:
+            waited += self._tokens.acquire(sum(len(t) for t in batch) / CHARS_PER_TOKEN)
+        if waited:
+            with self._stats_lock:
+                self.last.throttled_s += waited
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            self._throttle(batch)
+            try:
+                vectors = self.embeddings.embed_documents(batch)
+                if len(vectors) != len(batch):
+                    raise ValueError(f"Provider returned {len(vectors)} vectors for {len(batch)} texts")
+                return vectors
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(BACKOFF_MAX_S, self.backoff_s * 2 ** attempt) * (0.5 + random.random() / 2)
+                logger.warning(f"Embedding batch of {len(batch)} failed ({e}); retry {attempt + 1} in {delay:.2f}s")
+                with self._stats_lock:
+                    self.last.retries += 1
+                time.sleep(delay)
+        raise AssertionError("unreachable")
+
+    # ---- Embeddings API -------------------------------------------------------------
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        unique: Dict[str, int] = {}
+        for t in texts:
+            unique.setdefault(t, len(unique))
+        distinct = list(unique)
+        batches = [distinct[i:i + self.batch_size] for i in range(0, len(distinct), self.batch_size)]
+
+        self.last = PipelineStats(texts=len(texts), unique=len(distinct), batches=len(batches))
+        results: List[List[float]] = []
+        for vectors in self._pool.map(self._embed_batch, batches):  # preserves batch order
+            results.extend(vectors)
+        self.last.elapsed_s = time.perf_counter() - start
+
+        with self._stats_lock:
+            for name in ("texts", "unique", "batches", "retries", "throttled_s", "elapsed_s"):
+                setattr(self.stats, name, getattr(self.stats, name) + getattr(self.last, name))
+        if texts:
+            logger.info(f"Embedded {len(texts)} chunks ({len(distinct)} unique, {len(batches)} batches, "
+                        f"{self.last.retries} retries) at {self.last.chunks_per_s:.1f} chunks/s")
+        return [results[unique[t]] for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self._throttle([text])
+        return self.embeddings.embed_query(text)
+
+    def close(self) -> None:
+        """Shut the worker pool down (waits for batches in flight); safe to call twice."""
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self) -> "ConcurrentEmbeddings":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def close_embeddings(embeddings: Embeddings) -> None:
+    """Release the pool / cache behind ``embeddings`` (no-op for providers without ``close``)."""
+    close = getattr(embeddings, "close", None)
+    if close is not None:
+        close()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+embedding_cache.py — Persistent embedding cache keyed by (model, chunk hash)
+
+``CachedEmbeddings`` wraps any LangChain ``Embeddings`` object and stores every
+vector it computes in a small SQLite file as raw float32 bytes, keyed by the model
+name and the SHA-256 of the text. Re-indexing, chunk-size experiments and test
+rebuilds then only pay for text the cache has never seen; identical texts within
+one call are embedded once.
+
+Use ``cached_embeddings()`` wherever ``OpenAIEmbeddings(...)`` was built directly;
+cache misses go through the concurrent, rate-limited pipeline in embed_pipeline.py.
+
+Environment:
+  EMBEDDING_CACHE_PATH - cache file (default: ./db/embedding_cache.sqlite3 next to this module)
+  EMBEDDING_CACHE=0    - disable the cache (returns the bare embeddings object)
+"""
+
+from __future__ import annotations
+import array
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db", "embedding_cache.sqlite3")
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+_SQL_BATCH = 500   # keys per SELECT ... IN (...) (SQLite variable limit is 999 on old builds)
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _model_name(embeddings: Embeddings) -> str:
+    for attr in ("model", "model_name"):
+        value = getattr(embeddings, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    return type(embeddings).__name__
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that reads through a persistent SQLite float32 cache."""
+
+    def __init__(self, embeddings: Embeddings, path: Optional[str] = None, model: Optional[str] = None) -> None:
+        """
+        Args:
+            embeddings: Underlying embeddings (e.g. OpenAIEmbeddings)
+            path: SQLite file (default: EMBEDDING_CACHE_PATH or DEFAULT_CACHE_PATH)
+            model: Cache namespace (default: the wrapped object's ``model`` attribute)
+        """
+        self.embeddings = embeddings
+        self.model = model or _model_name(embeddings)
+        self._query_model = f"{self.model}#query"  # some models embed queries differently
+        self.path = path or os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, hash))"
+        )
+        self._conn.commit()
+
+    # ---- storage ------------------------------------------------------------
+    def _get(self, hashes: Sequence[str], model: str) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for i in range(0, len(hashes), _SQL_BATCH):
+                batch = list(hashes[i:i + _SQL_BATCH])
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                )
+                for h, blob in rows:
+                    found[h] = array.array("f", blob).tolist()
+        return found
+
+    def _put(self, items: Dict[str, List[float]], model: str) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, dim, vector) VALUES (?, ?, ?, ?)",
+                [(model, h, len(v), array.array("f", v).tobytes()) for h, v in items.items()],
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model,)).fetchone()[0]
+
+    def close(self) -> None:
+        """Close the cache database and the wrapped provider (e.g. its embedding pool)."""
+        from embed_pipeline import close_embeddings
+
+        with self._lock:
+            self._conn.close()
+        close_embeddings(self.embeddings)
+
+    # ---- Embeddings API ---------------------------------------------------------
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(t) for t in texts]
+        cached = self._get(list(dict.fromkeys(hashes)), self.model)
+        missing = {h: t for h, t in zip(hashes, texts) if h not in cached}
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self._put(fresh, self.model)
+            # Return what the cache will return next time (float32-rounded)
+            cached.update({h: array.array("f", v).tolist() for h, v in fresh.items()})
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+        return [cached[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        h = text_hash(text)
+        cached = self._get([h], self._query_model)
+        if h in cached:
+            self.hits += 1
+            return cached[h]
+        self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self._put({h: vector}, self._query_model)
+        return array.array("f", vector).tolist()
+
+def cached_embeddings(model: str = DEFAULT_EMBEDDING_MODEL, path: Optional[str] = None, **kwargs) -> Embeddings:
+    """``OpenAIEmbeddings(model=model, **kwargs)`` behind the embedding pipeline and the
+    persistent cache (unless EMBEDDING_CACHE=0)."""
+    from langchain_openai import OpenAIEmbeddings
+    from embed_pipeline import ConcurrentEmbeddings
+
+    kwargs.setdefault("max_retries", 0)  # the pipeline retries with backoff per batch
+    embeddings = ConcurrentEmbeddings.from_env(OpenAIEmbeddings(model=model, **kwargs))
+    if os.getenv("EMBEDDING_CACHE", "1") == "0":
+        return embeddings
+    return CachedEmbeddings(embeddings, path=path, model=model)
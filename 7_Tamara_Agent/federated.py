@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+federated.py — Parallel retrieval across several document collections
+
+The agent has two indexes: the knowledge base (manuals, specifications) and the
+Inside Therapeutics website crawl (``db/chroma_db_InsideTxWeb_firecrawl``, built by
+6_Tamara_workflow/Rag_web_scrape_firecrawl.py). ``FederatedRetriever`` queries every
+``Source`` at once on a shared thread pool, so the question pays the slowest source
+rather than the sum, and then:
+
+1. maps each source's scores to 0..1, times the source weight, so rankings from
+   different scorers can be merged. Scores stay absolute wherever the scorer allows,
+   so a weak hit stays weak instead of becoming its source's 1.0: rerank scores
+   (context_compression.py) are already 0..1, vector stores are calibrated on cosine
+   (``min_similarity`` scores 0, ``full_similarity`` or more scores 1); only rank-only
+   scores (RRF, or none) are min-max normalised within the source
+2. merges by that score, at most ``quota`` chunks per source and ``k`` overall,
+   dropping chunks whose text another source already returned
+3. trims the merged list to ``token_budget`` (when set), so chunks from sources
+   outside context_compression.py still count against KB_CONTEXT_TOKENS
+4. tags each chunk with ``origin`` (the source name) and ``federated_score``
+
+Sub-retriever calls run with the retriever's child callbacks, so tracing sees them;
+per-source timings are logged (debug), not stored on the shared retriever.
+
+A source that fails or exceeds ``timeout_s`` is skipped with a warning, so the KB
+still answers when the web index is missing or slow. Vector-store sources drop hits
+below ``min_similarity`` (cosine) before normalisation, so a source with nothing
+relevant contributes nothing rather than a "best of the bad" chunk.
+
+Environment (see tamara_graph._federated_retriever):
+  RAG_WEB          - 0 leaves the website collection out (default 1; it is only used
+                     with the embedding model it was built with, text-embedding-3-small)
+  WEB_CHROMA_DIR   - website collection (default ./db/chroma_db_InsideTxWeb_firecrawl); the agent
+                     queries a working copy in ./db/runtime, never the directory itself
+  WEB_FLAT_DIR     - website flat index, used with VECTOR_STORE=flat when it exists
+                     (default ./db/flat_db_InsideTxWeb, built by web_crawl.py --store flat)
+  WEB_QUOTA        - maximum website chunks per question (default 2)
+  WEB_WEIGHT       - website score weight relative to the KB (default 0.8)
+  WEB_MIN_SIM      - minimum cosine similarity of a website chunk (default 0.3)
+  WEB_FULL_SIM     - cosine at which a website chunk scores as high as the best KB chunk (default 0.75)
+"""
+
+from __future__ import annotations
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, Callbacks
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from reformulation import cosine_from_distance
+from table_chunker import token_counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT_S = 10.0
+DEFAULT_WEB_QUOTA = 2
+DEFAULT_WEB_WEIGHT = 0.8
+DEFAULT_WEB_MIN_SIM = 0.3
+DEFAULT_WEB_FULL_SIM = 0.75
+SCORE_KEYS = ("rerank_score", "rrf_score")   # set by context_compression / retrieval
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="federated")
+
+Hits = List[Tuple[Document, float]]   # (document, score), best first; higher is better
+
+def calibrate_scores(low: float, high: float) -> Callable[[Hits], Hits]:
+    """Absolute scores mapped linearly so ``low`` → 0 and ``high`` (or more) → 1."""
+    span = max(high - low, 1e-6)
+    return lambda hits: [(d, min(1.0, max(0.0, (s - low) / span))) for d, s in hits]
+
+def rerank_or_normalize(hits: Hits) -> Hits:
+    """Rerank scores (already 0..1) as they are; anything else min-max normalised."""
+    if hits and all("rerank_score" in d.metadata for d, _s in hits):
+        return [(d, min(1.0, max(0.0, s))) for d, s in hits]
+    return normalize_scores(hits)
+
+def normalize_scores(hits: Hits) -> Hits:
+    """Min-max scores to 0..1 within one source (all-equal or single hits score 1)."""
+    if not hits:
+        return []
+    scores = [s for _d, s in hits]
+    lo, hi = min(scores), max(scores)
+    if hi - lo < 1e-12:
+        return [(d, 1.0) for d, _s in hits]
+    return [(d, (s - lo) / (hi - lo)) for d, s in hits]
+
+@dataclass
+class Source:
+    name: str                           # stored as the chunks' ``origin``
+    search: Callable[[str, Callbacks], Hits]   # (query, callbacks for sub-runs)
+    quota: int
+    weight: float = 1.0
+    normalize: Callable[[Hits], Hits] = normalize_scores   # raw scores → 0..1
+
+    @classmethod
+    def from_retriever(cls, name: str, retriever, quota: int, weight: float = 1.0) -> "Source":
+        """Ranked retriever; scores from ``rerank_score``/``rrf_score`` metadata, else rank-based."""
+        def search(query: str, callbacks: Callbacks = None) -> Hits:
+            docs = retriever.invoke(query, config={"callbacks": callbacks})
+            hits = []
+            for rank, doc in enumerate(docs):
+                score = next((doc.metadata[key] for key in SCORE_KEYS if key in doc.metadata), None)
+                hits.append((doc, float(score) if score is not None else 1.0 / (rank + 1)))
+            return hits
+        return cls(name, search, quota, weight, rerank_or_normalize)
+
+    @classmethod
+    def from_vectorstore(cls, name: str, vectorstore, quota: int, weight: float = 1.0,
+                         min_similarity: float = 0.0, full_similarity: float = DEFAULT_WEB_FULL_SIM,
+                         fetch_k: Optional[int] = None) -> "Source":
+        """Vector store scored by absolute cosine similarity (Chroma distances converted)."""
+        def search(query: str, callbacks: Callbacks = None) -> Hits:
+            hits = vectorstore.similarity_search_with_score(query, k=fetch_k or quota)
+            scored = [(doc, cosine_from_distance(vectorstore, distance)) for doc, distance in hits]
+            return [(doc, sim) for doc, sim in scored if sim >= min_similarity]
+        return cls(name, search, quota, weight, calibrate_scores(min_similarity, full_similarity))
+
+def _text_key(doc: Document) -> str:
+    return hashlib.sha1(" ".join(doc.page_content.split()).lower().encode("utf-8")).hexdigest()
+
+def merge(results: Dict[str, Hits], sources: Sequence[Source], k: int) -> List[Document]:
+    """Quota-limited merge of per-source hits by weighted, normalised score."""
+    candidates = []
+    for order, source in enumerate(sources):
+        for rank, (doc, score) in enumerate(source.normalize(results.get(source.name, []))):
+            candidates.append((score * source.weight, order, rank, source, doc))
+    candidates.sort(key=lambda c: (-c[0], c[1], c[2]))
+
+    taken: Dict[str, int] = {}
+    seen = set()
+    merged: List[Document] = []
+    for score, _order, _rank, source, doc in candidates:
+        if len(merged) >= k:
+            break
+        if taken.get(source.name, 0) >= source.quota:
+            continue
+        key = _text_key(doc)
+        if key in seen:
+            continue
+        seen.add(key)
+        taken[source.name] = taken.get(source.name, 0) + 1
+        metadata = {**doc.metadata, "origin": source.name, "federated_score": round(score, 4)}
+        if "source" not in metadata and (doc.metadata.get("sourceURL") or doc.metadata.get("url")):
+            metadata["source"] = doc.metadata.get("sourceURL") or doc.metadata.get("url")
+        merged.append(Document(page_content=doc.page_content, metadata=metadata, id=doc.id))
+    return merged
+
+def fit_budget(docs: Sequence[Document], token_budget: int,
+               count_tokens: Optional[Callable[[str], int]] = None) -> List[Document]:
+    """Docs in order while they fit ``token_budget`` (the first one is always kept)."""
+    count = count_tokens or token_counter()
+    kept: List[Document] = []
+    used = 0
+    for doc in docs:
+        tokens = count(doc.page_content)
+        if kept and used + tokens > token_budget:
+            continue
+        used += tokens
+        kept.append(doc)
+    return kept
+
+class FederatedRetriever(BaseRetriever):
+    """Query several sources concurrently and merge them (see module docstring)."""
+
+    sources: List[Source]
+    k: int = 6
+    timeout_s: float = DEFAULT_TIMEOUT_S
+    token_budget: Optional[int] = None          # applied after the merge (None: no budget)
+    count_tokens: Optional[Callable[[str], int]] = None
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: Optional[CallbackManagerForRetrieverRun] = None) -> List[Document]:
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}     # this call's only (the retriever is shared)
+        callbacks = run_manager.get_child() if run_manager else None
+
+        def timed(source: Source) -> Hits:
+            t0 = time.perf_counter()
+            try:
+                return source.search(query, callbacks)
+            finally:
+                timings[source.name] = time.perf_counter() - t0
+
+        futures = {source.name: _executor.submit(timed, source) for source in self.sources}
+        results: Dict[str, Hits] = {}
+        for name, future in futures.items():
+            remaining = max(0.0, self.timeout_s - (time.perf_counter() - start))
+            try:
+                results[name] = future.result(timeout=remaining)
+            except FutureTimeout:
+                logger.warning(f"Source {name!r} timed out after {self.timeout_s:.1f}s; answering without it")
+            except Exception as e:
+                logger.warning(f"Source {name!r} failed; answering without it: {e}")
+        timings["total"] = time.perf_counter() - start
+        merged = merge(results, self.sources, self.k)
+        if self.token_budget is not None:
+            merged = fit_budget(merged, self.token_budget, self.count_tokens)
+        logger.debug(f"Federated retrieval {timings}: " +
+                     ", ".join(f"{s.name} {sum(d.metadata['origin'] == s.name for d in merged)}" for s in self.sources))
+        return merged
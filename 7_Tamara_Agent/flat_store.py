@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+flat_store.py — Memory-mapped flat vector store for the (small) knowledge base
+
+The KB holds a few thousand chunks at most, so an exact scan is cheaper than the
+machinery around it: every agent start pays the ``chromadb`` import, its SQLite open
+and the HNSW load. ``FlatVectorStore`` is a LangChain ``VectorStore`` that keeps
+
+- ``flat_vectors.<generation>.npy`` — unit-length float32 embeddings, one row per chunk,
+  opened with ``np.load(mmap_mode="r")`` (pages are read on first use)
+- ``flat_meta.json`` — ids, texts, metadata and the vectors file name
+
+and answers top-k with one matrix-vector product plus ``argpartition``. Writes go to a
+new vectors file first and then atomically replace the sidecar, so a crash never pairs
+a sidecar with the wrong matrix. ``bulk_writes`` defers saving during an ingestion run;
+``checkpoint`` saves before the run records progress in its manifest.
+
+It implements what the agent uses of Chroma (``add_documents(ids=)``, ``delete(ids=)``,
+``get(ids=, include=)``, ``similarity_search[_with_score](filter=)``, ``as_retriever``), so
+kb_ingest, retrieval and reformulation work unchanged. Scores are cosine distances
+(``distance_space = "cosine"``).
+
+Environment:
+  VECTOR_STORE - chroma (default) or flat; each backend has its own index directory
+                 (see tamara_graph._persist_dir), the KB is embedded again on first use
+
+Run:
+  $ python flat_store.py                    # cold start and query latency, flat vs Chroma
+  $ python flat_store.py --queries 200 --repeats 5
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from chunk_metadata import matches
+
+logger = logging.getLogger(__name__)
+
+META_NAME = "flat_meta.json"
+FORMAT_VERSION = 1
+BACKENDS = ("chroma", "flat")
+
+def vector_store_backend(backend: Optional[str] = None) -> str:
+    """VECTOR_STORE (chroma | flat), validated."""
+    name = (backend or os.getenv("VECTOR_STORE", "chroma")).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown VECTOR_STORE={name!r} (expected one of {', '.join(BACKENDS)})")
+    return name
+
+def open_vectorstore(persist_directory: str, embeddings: Embeddings, backend: Optional[str] = None) -> VectorStore:
+    """Open the KB store in ``persist_directory`` with the selected backend (Chroma imported lazily)."""
+    if vector_store_backend(backend) == "flat":
+        return FlatVectorStore(persist_directory, embeddings)
+    from langchain_chroma import Chroma
+    return Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+
+def bulk_writes(vectorstore):
+    """Context manager deferring a FlatVectorStore's saves to the end of the block (no-op for Chroma)."""
+    bulk = getattr(vectorstore, "bulk", None)
+    return bulk() if bulk is not None else nullcontext()
+
+def checkpoint(vectorstore) -> None:
+    """Persist writes deferred by ``bulk_writes`` now (no-op for Chroma, which persists each write).
+
+    Call it before recording the written chunks elsewhere (an ingestion manifest), so a
+    crash never leaves a manifest listing vectors that were not saved.
+    """
+    flush = getattr(vectorstore, "checkpoint", None)
+    if flush is not None:
+        flush()
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+# ----------------------------------------------------------------------------
+# Store
+# ----------------------------------------------------------------------------
+
+class FlatVectorStore(VectorStore):
+    """Exact cosine search over a memory-mapped float32 matrix (see module docstring)."""
+
+    distance_space = "cosine"
+
+    def __init__(self, persist_directory: Optional[str], embedding: Embeddings) -> None:
+        """
+        Args:
+            persist_directory: Directory of the vectors file and sidecar (None = in memory only)
+            embedding: Embeddings used for documents and queries
+        """
+        self.persist_directory = persist_directory
+        self._embedding = embedding
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._positions: Dict[str, int] = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._vectors_file: Optional[str] = None
+        self._deferred = 0
+        self._dirty = False
+        if persist_directory:
+            os.makedirs(persist_directory, exist_ok=True)
+            self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # ---- persistence -----------------------------------------------------------------
+    def _meta_path(self) -> str:
+        return os.path.join(self.persist_directory, META_NAME)
+
+    def _load(self) -> None:
+        try:
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{self._meta_path()}: unsupported flat index version {meta.get('version')}")
+        ids = meta["ids"]
+        if ids:
+            vectors = np.load(os.path.join(self.persist_directory, meta["vectors"]), mmap_mode="r")
+            if vectors.shape[0] != len(ids):
+                raise ValueError(f"{self._meta_path()}: {len(ids)} ids but {vectors.shape[0]} vectors")
+            self._vectors = vectors
+        self._vectors_file = meta.get("vectors")
+        self._ids, self._texts, self._metadatas = ids, meta["texts"], meta["metadatas"]
+        self._positions = {cid: i for i, cid in enumerate(ids)}
+
+    def _save(self) -> None:
+        """New vectors file, then atomic sidecar replace (the commit point), then drop the old file."""
+        if not self.persist_directory:
+            return
+        if self._deferred:
+            self._dirty = True
+            return
+        old = self._vectors_file
+        name = f"flat_vectors.{uuid.uuid4().hex[:12]}.npy" if self._ids else None
+        if name:
+            tmp = os.path.join(self.persist_directory, name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(self._vectors, dtype=np.float32))
+            os.replace(tmp, os.path.join(self.persist_directory, name))
+        meta = {"version": FORMAT_VERSION, "vectors": name, "ids": self._ids,
+                "texts": self._texts, "metadatas": self._metadatas}
+        tmp = self._meta_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._meta_path())
+        self._vectors_file = name
+        self._dirty = False
+        if old and old != name:
+            try:
+                os.remove(os.path.join(self.persist_directory, old))
+            except OSError:   # still mapped (Windows) — harmless, replaced on the next save
+                pass
+
+    @contextmanager
+    def bulk(self) -> Iterator["FlatVectorStore"]:
+        """Defer saves until the outermost ``bulk`` block exits."""
+        self._deferred += 1
+        try:
+            yield self
+        finally:
+            self._deferred -= 1
+            if not self._deferred and self._dirty:
+                self._save()
+
+    def checkpoint(self) -> None:
+        """Save pending writes now, even inside a ``bulk`` block."""
+        if self._dirty:
+            deferred, self._deferred = self._deferred, 0
+            try:
+                self._save()
+            finally:
+                self._deferred = deferred
+
+    # ---- writes ----------------------------------------------------------------------
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  *, ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        """Embed and upsert ``texts`` (an existing id is replaced, as with Chroma's upsert)."""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        new = _normalize(np.asarray(self._embedding.embed_documents(texts), dtype=np.float32))
+        if len(self._ids) and new.shape[1] != self._vectors.shape[1]:
+            raise ValueError(f"Embedding dimension {new.shape[1]} does not match the index ({self._vectors.shape[1]})")
+
+        replace = [i for i, cid in enumerate(ids) if cid in self._positions]
+        if replace:
+            self._vectors = np.array(self._vectors)   # writable copy of the mapped matrix
+            for i in replace:
+                pos = self._positions[ids[i]]
+                self._vectors[pos] = new[i]
+                self._texts[pos], self._metadatas[pos] = texts[i], dict(metadatas[i] or {})
+        fresh = [i for i in range(len(texts)) if ids[i] not in self._positions]
+        # a batch may repeat an id: the last occurrence wins
+        last = {ids[i]: i for i in fresh}
+        fresh = [i for i in fresh if last[ids[i]] == i]
+        if fresh:
+            base = self._vectors if len(self._ids) else np.zeros((0, new.shape[1]), dtype=np.float32)
+            self._vectors = np.concatenate([base, new[fresh]])
+            for i in fresh:
+                self._positions[ids[i]] = len(self._ids)
+                self._ids.append(ids[i])
+                self._texts.append(texts[i])
+                self._metadatas.append(dict(metadatas[i] or {}))
+        self._save()
+        return ids
+
+    def add_documents(self, documents: List[Document], **kwargs: Any) -> List[str]:
+        ids = kwargs.pop("ids", None)
+        if ids is None and any(d.id for d in documents):
+            ids = [d.id or str(uuid.uuid4()) for d in documents]
+        return self.add_texts([d.page_content for d in documents], [d.metadata for d in documents],
+                              ids=ids, **kwargs)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        drop = {self._positions[cid] for cid in ids or () if cid in self._positions}
+        if not drop:
+            return True
+        keep = [i for i in range(len(self._ids)) if i not in drop]
+        self._vectors = np.array(self._vectors[keep]) if keep else np.zeros((0, 0), dtype=np.float32)
+        self._ids = [self._ids[i] for i in keep]
+        self._texts = [self._texts[i] for i in keep]
+        self._metadatas = [self._metadatas[i] for i in keep]
+        self._positions = {cid: i for i, cid in enumerate(self._ids)}
+        self._save()
+        return True
+
+    # ---- reads -----------------------------------------------------------------------
+    def get(self, ids: Optional[Sequence[str]] = None, include: Optional[Sequence[str]] = None,
+            **kwargs: Any) -> Dict[str, Any]:
+        """Chroma-style ``get``: {"ids", "documents", "metadatas"} (the latter two when included)."""
+        include = ("documents", "metadatas") if include is None else include
+        positions = (range(len(self._ids)) if ids is None
+                     else [self._positions[cid] for cid in ids if cid in self._positions])
+        out: Dict[str, Any] = {"ids": [self._ids[i] for i in positions]}
+        if "documents" in include:
+            out["documents"] = [self._texts[i] for i in positions]
+        if "metadatas" in include:
+            out["metadatas"] = [self._metadatas[i] for i in positions]
+        return out
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        return [self._document(self._positions[cid]) for cid in ids if cid in self._positions]
+
+    def _document(self, pos: int) -> Document:
+        return Document(page_content=self._texts[pos], metadata=dict(self._metadatas[pos]), id=self._ids[pos])
+
+    def _search(self, vector: Sequence[float], k: int,
+                filter: Optional[Dict[str, Any]] = None) -> List[Tuple[int, float]]:
+        if not self._ids or k <= 0:
+            return []
+        q = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        q = q / norm if norm else q
+        if filter:   # Chroma-style where clause: score only the matching rows
+            rows = np.flatnonzero([matches(m, filter) for m in self._metadatas])
+            if not len(rows):
+                return []
+            sims = self._vectors[rows] @ q
+        else:
+            rows, sims = None, self._vectors @ q
+        k = min(k, len(sims))
+        top = np.argpartition(-sims, k - 1)[:k] if k < len(sims) else np.arange(len(sims))
+        top = top[np.argsort(-sims[top], kind="stable")]
+        return [(int(rows[i]) if rows is not None else int(i), float(sims[i])) for i in top]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Top-k documents with cosine distance (1 - cosine similarity), optionally filtered by metadata."""
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, filter=filter)
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Dict[str, Any]] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        return [(self._document(i), 1.0 - sim) for i, sim in self._search(embedding, k, filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                          **kwargs: Any) -> List[Document]:
+        return [doc for doc, _distance in self.similarity_search_with_score(query, k, filter=filter)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _distance in self.similarity_search_with_score_by_vector(embedding, k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._cosine_relevance_score_fn
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   *, ids: Optional[List[str]] = None, persist_directory: Optional[str] = None,
+                   **kwargs: Any) -> "FlatVectorStore":
+        store = cls(persist_directory, embedding)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+# ----------------------------------------------------------------------------
+# Benchmark
+# ----------------------------------------------------------------------------
+
+_COLD_START = """
+import json, sys, time
+start = time.perf_counter()
+from flat_store import open_vectorstore
+from providers import get_embeddings
+store = open_vectorstore(sys.argv[1], get_embeddings(), sys.argv[2])
+opened = time.perf_counter()
+store.similarity_search("What is the flow rate range?", k=6)
+print(json.dumps({"open_s": opened - start, "first_query_s": time.perf_counter() - start}))
+"""
+
+def cold_start(persist_directory: str, backend: str) -> Dict[str, float]:
+    """Import + open + first query in a fresh interpreter (what an agent start pays)."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    out = subprocess.run([sys.executable, "-c", _COLD_START, persist_directory, backend],
+                         cwd=here, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def benchmark(kb_dir: str, work_dir: str, queries: int = 100, repeats: int = 3) -> Dict[str, Dict[str, float]]:
+    """Sync the KB into each backend under ``work_dir``, then time cold start and queries."""
+    from embed_pipeline import close_embeddings
+    from kb_ingest import sync_knowledge_base
+    from providers import embedding_id, get_embeddings
+
+    embeddings = get_embeddings()
+    questions = ["What is the total flow rate range?", "How do I clean the chip?", "What FRR values are supported?",
+                 "What pressure does the gas inlet need?", "How do I install the microfluidic chip?"]
+    try:
+        vectors = [embeddings.embed_query(q) for q in questions]
+        results: Dict[str, Dict[str, float]] = {}
+        for backend in BACKENDS:
+            persist = os.path.join(work_dir, backend)
+            os.makedirs(persist, exist_ok=True)
+            store = open_vectorstore(persist, embeddings, backend)
+            with bulk_writes(store):
+                sync_knowledge_base(store, kb_dir, persist, embedding=embedding_id())
+            chunks = len(store.get(include=[])["ids"])
+            latencies = []
+            for i in range(queries):
+                start = time.perf_counter()
+                store.similarity_search_by_vector(vectors[i % len(vectors)], k=15)
+                latencies.append(time.perf_counter() - start)
+            del store
+            starts = [cold_start(persist, backend) for _ in range(repeats)]
+            results[backend] = {
+                "chunks": chunks,
+                "open_s": statistics.median(s["open_s"] for s in starts),
+                "first_query_s": statistics.median(s["first_query_s"] for s in starts),
+                "query_ms": statistics.median(latencies) * 1000,
+            }
+    finally:
+        close_embeddings(embeddings)
+    return results
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Cold start and query latency: flat memory-mapped store vs Chroma")
+    parser.add_argument("--kb-dir", default=os.path.join(here, "Knowledge_base/txt"))
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3, help="cold starts per backend")
+    args = parser.parse_args()
+    load_dotenv()
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory(prefix="flat_bench_") as work_dir:
+        results = benchmark(args.kb_dir, work_dir, args.queries, args.repeats)
+    print(f"{'backend':<8} {'chunks':>7} {'open s':>8} {'1st query s':>12} {'query ms':>9}   (medians)")
+    for backend, r in results.items():
+        print(f"{backend:<8} {r['chunks']:>7.0f} {r['open_s']:>8.3f} {r['first_query_s']:>12.3f} {r['query_ms']:>9.3f}")
+
+if __name__ == "__main__":
+    main()
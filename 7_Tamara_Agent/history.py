@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+history.py — Bounded RAG chat history with a rolling summary
+
+``answer_with_rag`` used to pass the whole transcript as ``chat_history``: PLC status
+replies, parameter prompts and safety checklists included, so the prompt (and the
+history-reformulation call) grew for the whole shift. The RAG history is now:
+
+- only knowledge turns: a question and the RAG answer that directly follows it (answers
+  are marked with ``mark_rag``); control commands and operation flows are left out
+- the last ``max_turns`` turns verbatim (up to ``max_turns + FOLD_BATCH - 1`` between folds)
+- older turns folded into a running summary, ``FOLD_BATCH`` turns at a time, by
+  ``fold_turns`` (one short LLM call, made in the background after the answer has been
+  returned and joined before the next knowledge question); the summary is passed as a
+  system message ahead of the verbatim turns
+
+The summary and the number of turns it covers live in the graph state
+(``history_summary`` / ``history_summarized``), so prompt size stays roughly constant.
+
+Environment (see tamara_graph.answer_with_rag):
+  RAG_HISTORY_TURNS  - knowledge turns kept verbatim (default 4)
+  RAG_HISTORY_SUMMARY - 0 drops older turns instead of summarising them (default 1)
+"""
+
+from __future__ import annotations
+from typing import List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+DEFAULT_MAX_TURNS = 4
+FOLD_BATCH = 2               # turns folded per summarisation call
+SUMMARY_MAX_WORDS = 120
+RAG_KIND = "rag"
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of an operator's conversation with the TAMARA assistant.\n"
+    "Extend the summary with the new exchanges. Keep the topics, equipment, parameter values and "
+    "conclusions the operator may refer back to; drop pleasantries. Answer with the summary only, "
+    f"at most {SUMMARY_MAX_WORDS} words.\n\n"
+    "Current summary:\n{summary}\n\nNew exchanges:\n{exchanges}"
+)
+
+Turn = Tuple[HumanMessage, AIMessage]
+
+def mark_rag(message: AIMessage) -> AIMessage:
+    """Mark an answer as a knowledge (RAG) reply, so its turn enters the RAG history."""
+    message.additional_kwargs["tamara_kind"] = RAG_KIND
+    return message
+
+def is_rag_answer(message: BaseMessage) -> bool:
+    return isinstance(message, AIMessage) and message.additional_kwargs.get("tamara_kind") == RAG_KIND
+
+def rag_turns(messages: Sequence[BaseMessage]) -> List[Turn]:
+    """(question, answer) pairs whose answer came from RAG, oldest first."""
+    return [(prev, msg) for prev, msg in zip(messages, messages[1:])
+            if isinstance(prev, HumanMessage) and is_rag_answer(msg)]
+
+def _format(turns: Sequence[Turn]) -> str:
+    return "\n".join(f"Operator: {q.content}\nAssistant: {a.content}" for q, a in turns)
+
+def build_history(messages: Sequence[BaseMessage], summary: Optional[str] = None, summarized: int = 0,
+                  max_turns: int = DEFAULT_MAX_TURNS) -> List[BaseMessage]:
+    """RAG ``chat_history`` for the next question.
+
+    Args:
+        messages: Transcript so far, excluding the current question
+        summary: Running summary of the first ``summarized`` knowledge turns
+        summarized: Number of knowledge turns covered by ``summary``
+        max_turns: Turns kept verbatim (at most ``max_turns + FOLD_BATCH - 1`` until the next fold)
+
+    Returns:
+        [summary system message] + alternating Human/AI messages
+    """
+    turns = rag_turns(messages)
+    start = max(summarized, len(turns) - (max_turns + FOLD_BATCH - 1))
+    history: List[BaseMessage] = []
+    if summary:
+        history.append(SystemMessage(content=f"Summary of the earlier conversation: {summary}"))
+    for question, answer in turns[start:]:
+        history.extend([HumanMessage(content=question.content), AIMessage(content=answer.content)])
+    return history
+
+def turns_to_fold(messages: Sequence[BaseMessage], summarized: int = 0,
+                  max_turns: int = DEFAULT_MAX_TURNS) -> List[Turn]:
+    """Oldest unsummarised turns once more than ``max_turns + FOLD_BATCH - 1`` are verbatim, else []."""
+    turns = rag_turns(messages)
+    pending = turns[summarized:]
+    if len(pending) < max_turns + FOLD_BATCH:
+        return []
+    return pending[:len(pending) - max_turns]
+
+def fold_turns(llm, summary: Optional[str], turns: Sequence[Turn]) -> str:
+    """New running summary: ``summary`` extended with ``turns`` (one LLM call)."""
+    prompt = SUMMARY_PROMPT.format(summary=summary or "(none)", exchanges=_format(turns))
+    reply = llm.invoke([HumanMessage(content=prompt)])
+    return str(getattr(reply, "content", reply)).strip()
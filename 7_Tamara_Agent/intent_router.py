@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+intent_router.py — Local intent classification for tamara_graph.route
+
+route used substring checks ("play" in text, "stop" in text, "run" in text), so
+"display the run history" paused nothing but resumed the machine (PLAY), and "what
+stops clogging?" sent STOP to the PLC. ``IntentRouter`` classifies an utterance
+against labelled example utterances instead:
+
+- each utterance is embedded with the local HashingEmbeddings (word uni/bigrams, no
+  network, well under a millisecond) together with form markers — question form
+  (wh-word, auxiliary first, "?") and length — so "stop" and "what stops clogging?"
+  land far apart
+- the score of an intent is the cosine similarity to its nearest example (nearest
+  neighbour per intent; a centroid blurs short commands with long questions)
+- an imperative that starts with a stop or pause verb (stop, halt, abort, cancel, kill,
+  shut; pause, hold), optionally after "please" or "now", is a stop or pause command,
+  whatever else it mentions: stopping is the safe direction, so "stop the cleaning now"
+  must never turn into a cleaning question. The verb anywhere else ("explain the
+  shutdown procedure", "show me the chip holder") is left to the classifier
+- a command intent (one that talks to the PLC) is only returned when its score is at least
+  ``min_confidence`` and beats the best other intent by ``min_margin``; an uncertain
+  command phrased as a question goes to ``ask_kb`` (answering is harmless), an
+  uncertain (or negated: "don't stop the run") imperative becomes ``clarify`` (the
+  agent asks instead of acting)
+
+Exact commands ("stop", "pause", "pressure test", ...) skip the embedding entirely.
+``names_intent`` tells whether the user's own words name an intent, so a
+clarification never offers a command the user did not type.
+
+Environment (see tamara_graph.route):
+  ROUTER                 - embedding (default) | keyword (previous substring rules)
+  ROUTER_MIN_CONFIDENCE  - minimum similarity for a command intent (default 0.45)
+  ROUTER_MIN_MARGIN      - minimum lead over the runner-up intent (default 0.08)
+
+Run:
+  $ python intent_router.py                  # classify the built-in probe utterances, with latency
+  $ python intent_router.py "display the run history"
+"""
+
+from __future__ import annotations
+import argparse
+import os
+import re
+import statistics
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from providers import HashingEmbeddings
+
+COMMAND_INTENTS = ("pause", "play", "stop", "status", "run", "clean", "ptest")
+INTENTS = COMMAND_INTENTS + ("ask_kb",)
+CLARIFY = "clarify"
+DEFAULT_MIN_CONFIDENCE = 0.45
+DEFAULT_MIN_MARGIN = 0.08
+MARKER_WEIGHT = 0.5          # form markers relative to the words (both unit vectors)
+
+EXACT: Dict[str, str] = {
+    "pause": "pause", "play": "play", "resume": "play", "stop": "stop", "status": "status",
+    "run": "run", "formulate": "run", "mix": "run", "clean": "clean", "pressure test": "ptest", "ptest": "ptest",
+}
+
+EXAMPLES: Dict[str, Sequence[str]] = {
+    "pause": ("pause", "pause the run", "pause it", "pause the operation", "hold the run", "pause now",
+              "please pause", "pause cleaning", "pause the pressure test", "put the run on hold"),
+    "play": ("play", "resume", "resume the run", "continue the run", "resume operation", "unpause",
+             "continue", "resume cleaning", "play again", "carry on with the run"),
+    "stop": ("stop", "stop the run", "stop it", "stop now", "abort the run", "abort", "stop cleaning",
+             "halt the machine", "stop the operation", "cancel the run now", "emergency stop the run"),
+    "status": ("status", "what is the status", "machine status", "show status", "system status",
+               "what is tamara doing now", "is the run finished", "current state of the machine",
+               "check status", "status please", "what's the status", "is the machine running right now",
+               "is it still cleaning", "where is the run at", "machine state"),
+    "run": ("run", "start a run", "start a formulation", "formulate", "launch a run", "start mixing",
+            "make lnps", "run a synthesis", "start synthesis with frr 3 and tfr 12", "new run",
+            "run with 2 ml", "let's run a formulation", "start the run", "mix lipids now",
+            "start a run at frr 4", "run 5 ml at tfr 10", "begin a run", "go ahead and formulate"),
+    "clean": ("clean", "clean the chip", "start cleaning", "start a clean", "run a clean cycle",
+              "clean the system", "launch cleaning", "clean now", "flush the chip", "start a cleaning cycle"),
+    "ptest": ("pressure test", "run a pressure test", "start pressure test", "do a pressure test",
+              "launch the pressure test", "test the pressure", "check for leaks with a pressure test",
+              "ptest", "start a leak test"),
+    "ask_kb": (
+        "what is tamara", "what is the total flow rate range", "how does the herringbone mixer work",
+        "what is the frr", "how often should i clean the chip", "which cleaning solutions do you recommend",
+        "what stops clogging in the chip", "why does my run stop early", "display the run history",
+        "show me the run history", "how do i pause a run on the touch screen", "what does the status led mean",
+        "how long does a pressure test take", "what pressure does tamara need", "can i reuse the chips",
+        "what is the difference between liposomes and lnps", "explain the flow rate ratio",
+        "tell me about lipid nanoparticles", "which solvents are compatible", "how do i install the gasket",
+        "what happens if the run is interrupted", "how do i stop bubbles at the start of a run",
+        "what does play mean on the hmi", "why is the cleaning leaving residue",
+        "what is the optimal lipid concentration", "how is lnp size measured",
+        "describe the run parameters", "list the steps to prepare a run", "what is a pressure test",
+        "give me the chip specifications", "summarise the user manual", "list the previous runs",
+        "show the formulation log", "what is the stop button for",
+    ),
+}
+
+# Leading verbs that make an imperative a stop/pause command (also prefixes naming the intent)
+SAFE_VERBS: Dict[str, Sequence[str]] = {
+    "pause": ("pause", "hold"),
+    "stop": ("stop", "halt", "abort", "cancel", "kill", "shut"),
+}
+# Words that name an intent, for the clarification question
+INTENT_VERBS: Dict[str, Sequence[str]] = {
+    "pause": SAFE_VERBS["pause"], "stop": SAFE_VERBS["stop"],
+    "play": ("play", "resum", "continu", "unpause"),
+    "status": ("status", "state"),
+    "run": ("run", "formulat", "mix", "synthes"),
+    "clean": ("clean", "flush"),
+    "ptest": ("pressure", "leak", "ptest"),
+}
+_NEGATIONS = {"don't", "dont", "not", "never"}
+_LEAD_INS = {"please", "now"}
+
+_WH = {"what", "why", "how", "which", "when", "where", "who", "whom", "whose"}
+_AUX = {"is", "are", "can", "could", "does", "do", "did", "should", "would", "will", "may", "was", "were", "has"}
+_WORD = re.compile(r"[a-z0-9]+(?:[.'][a-z0-9]+)*")
+
+def _stem(word: str) -> str:
+    """Crude suffix stripping so "cleaning"/"cleaned"/"cleans" meet "clean"."""
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+def form_markers(text: str) -> List[str]:
+    """Tokens describing the utterance's form (question / imperative, length)."""
+    words = _WORD.findall(text.lower())
+    markers = []
+    if text.strip().endswith("?") or (words and (words[0] in _WH or words[0] in _AUX)) or _WH & set(words[:3]):
+        markers.append("xquestion")
+    else:
+        markers.append("ximperative")
+    markers.append("xshort" if len(words) <= 3 else "xlong")
+    return markers
+
+def keyword_intent(text: str) -> str:
+    """Previous substring rules (ROUTER=keyword), in their original priority order."""
+    t = text.lower()
+    if "pause" in t:
+        return "pause"
+    if "play" in t or "resume" in t:
+        return "play"
+    if "stop" in t:
+        return "stop"
+    if "status" in t:
+        return "status"
+    if any(k in t for k in ["run", "formulate", "mix"]):
+        return "run"
+    if "clean" in t:
+        return "clean"
+    if "pressure" in t and "test" in t:
+        return "ptest"
+    return "ask_kb"
+
+def names_intent(text: str, intent: str) -> bool:
+    """True when one of the words of ``text`` names ``intent`` (see INTENT_VERBS)."""
+    return any(w.startswith(verb) for w in _WORD.findall(text.lower()) for verb in INTENT_VERBS.get(intent, ()))
+
+def safe_intent(text: str) -> Optional[str]:
+    """"stop" or "pause" for an imperative led by one of their verbs (not negated), else None."""
+    if "xquestion" in form_markers(text):
+        return None
+    words = _WORD.findall(text.lower())
+    if _NEGATIONS & set(words):
+        return None    # "don't stop the run": left to the classifier and its gate
+    while words and words[0] in _LEAD_INS:
+        words = words[1:]
+    for intent, verbs in SAFE_VERBS.items():
+        if words and words[0] in verbs:
+            return intent
+    return None
+
+@dataclass
+class IntentDecision:
+    label: str                   # one of INTENTS, or CLARIFY (uncertain imperative command)
+    intent: str                  # best-scoring intent (the one to clarify, when label == CLARIFY)
+    confidence: float            # similarity of the best intent
+    margin: float                # lead over the runner-up intent
+    elapsed_ms: float = 0.0
+
+class IntentRouter:
+    """Nearest-example intent classifier over local hashing embeddings (see module docstring)."""
+
+    def __init__(self, examples: Optional[Dict[str, Sequence[str]]] = None, embeddings=None,
+                 min_confidence: float = DEFAULT_MIN_CONFIDENCE, min_margin: float = DEFAULT_MIN_MARGIN) -> None:
+        self.embeddings = embeddings or HashingEmbeddings()
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+        examples = examples or EXAMPLES
+        self.labels: List[str] = [label for label, texts in examples.items() for _ in texts]
+        self.intents: List[str] = list(examples)
+        self._matrix = np.stack([self._vector(t) for texts in examples.values() for t in texts])
+        self._masks = {intent: np.array([label == intent for label in self.labels]) for intent in self.intents}
+
+    @classmethod
+    def from_env(cls) -> "IntentRouter":
+        return cls(min_confidence=float(os.getenv("ROUTER_MIN_CONFIDENCE", DEFAULT_MIN_CONFIDENCE)),
+                   min_margin=float(os.getenv("ROUTER_MIN_MARGIN", DEFAULT_MIN_MARGIN)))
+
+    def _vector(self, text: str) -> np.ndarray:
+        """Unit vector of the stemmed words plus MARKER_WEIGHT times that of the form markers."""
+        words = " ".join(_stem(w) for w in _WORD.findall(text.lower()))
+        words_vec, markers_vec = (np.asarray(v, dtype=np.float32) for v in
+                                  self.embeddings.embed_documents([words, " ".join(form_markers(text))]))
+        vector = words_vec + MARKER_WEIGHT * markers_vec
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def scores(self, text: str) -> List[Tuple[str, float]]:
+        """(intent, similarity of its nearest example), best first."""
+        sims = self._matrix @ self._vector(text)
+        ranked = [(intent, float(sims[mask].max())) for intent, mask in self._masks.items()]
+        return sorted(ranked, key=lambda kv: -kv[1])
+
+    def classify(self, text: str) -> IntentDecision:
+        start = time.perf_counter()
+        exact = EXACT.get(" ".join(_WORD.findall(text.lower())))
+        if exact:
+            return IntentDecision(exact, exact, 1.0, 1.0, (time.perf_counter() - start) * 1000)
+        ranked = self.scores(text)
+        (best, confidence), runner_up = ranked[0], ranked[1][1]
+        margin = confidence - runner_up
+        safe = safe_intent(text)
+        if safe:
+            return IntentDecision(safe, best, confidence, margin, (time.perf_counter() - start) * 1000)
+        label = best
+        negated = bool(_NEGATIONS & set(_WORD.findall(text.lower())))
+        if best in COMMAND_INTENTS and (confidence < self.min_confidence or margin < self.min_margin or negated):
+            label = "ask_kb" if "xquestion" in form_markers(text) else CLARIFY
+        return IntentDecision(label, best, confidence, margin, (time.perf_counter() - start) * 1000)
+
+PROBES = (
+    "display the run history", "what stops clogging?", "stop", "please stop the run", "start a run with FRR 3",
+    "how do I clean the herringbone chip?", "clean the chip", "run a pressure test", "resume", "what's the status?",
+    "is the machine running?", "what is the recommended flow rate?", "mix", "play the cleaning video",
+)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Classify utterances with the local intent router")
+    parser.add_argument("text", nargs="*", help="utterances (default: built-in probes)")
+    args = parser.parse_args()
+    router = IntentRouter.from_env()
+    timings = []
+    for text in args.text or PROBES:
+        decision = router.classify(text)
+        timings.append(decision.elapsed_ms)
+        print(f"{text!r:<45} → {decision.label:<8} (best {decision.intent}, {decision.confidence:.2f}, "
+              f"margin {decision.margin:.2f}; keyword rules: {keyword_intent(text)})")
+    print(f"median {statistics.median(timings):.3f} ms, max {max(timings):.3f} ms per utterance")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+kb_ingest.py — Incremental, content-hashed knowledge-base ingestion
+
+Keeps a Chroma collection (or a flat_store index) in sync with a directory of
+.txt/.md files while only embedding what changed. A manifest (``kb_manifest.json``)
+stored in the index's persist directory records, per source file, the SHA-256 of its bytes and the ids
+of its chunks. Chunk ids are derived from (source, chunk text, occurrence), so an
+edited file only re-embeds the chunks whose text actually changed.
+
+On each sync:
+- unchanged file hash      → nothing is read beyond hashing, nothing embedded
+- changed file             → re-split; new chunk ids added, vanished ids deleted
+  (new chunks are pooled across files into ADD_BATCH_SIZE upserts, see embed_pipeline.py)
+- removed file             → all its chunk ids deleted
+- collection but no manifest (built before this module), or a manifest written
+  for another embedding model                            → rebuilt once
+
+Files are split with table_chunker.TableAwareSplitter by default (heading sections,
+table rows kept with their header). The manifest records the splitter configuration;
+when it changes every file is re-split, and again only chunks whose text changed are
+embedded.
+
+Chunks that duplicate (or nearly duplicate, MinHash) a chunk already in the index,
+such as the same document under Knowledge_base/md and Knowledge_base/txt, are not
+embedded; the manifest maps them to their canonical chunk (see dedupe.py).
+
+Each chunk's metadata carries its document type and the chips, solvents and modes
+it mentions, for query-side filtering (see chunk_metadata.py); a change of those
+rules rewrites the metadata of every chunk (the embedding cache serves their vectors).
+
+The BM25 inverted index used for hybrid retrieval (retrieval.py, ``kb_bm25.json``)
+is updated in the same pass, so it always covers exactly the chunks in the manifest.
+
+Run:
+  $ python kb_ingest.py                        # sync ./Knowledge_base/txt into ./db/chroma_db_with_metadata_Knowledge_base
+  $ python kb_ingest.py --kb-dir DIR --db-dir DIR
+"""
+
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from chunk_metadata import METADATA_VERSION, chunk_metadata
+from dedupe import ChunkDeduper
+from flat_store import checkpoint
+from retrieval import BM25Index, bm25_path
+from table_chunker import TableAwareSplitter, splitter_id
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "kb_manifest.json"
+MANIFEST_VERSION = 1
+KB_EXTENSIONS = (".txt", ".md")
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+LEGACY_SPLITTER_ID = f"RecursiveCharacterTextSplitter/{CHUNK_SIZE}/{CHUNK_OVERLAP}"  # manifests without "splitter"
+ADD_BATCH_SIZE = 256   # chunks per add_documents call; embed_pipeline splits these into requests
+
+# ----------------------------------------------------------------------------
+# Hashing & manifest
+# ----------------------------------------------------------------------------
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def chunk_id(source: str, text: str, occurrence: int = 0) -> str:
+    """Stable id for a chunk: identical text at the same source keeps its id (and its embedding)."""
+    return _sha256(f"{source}\0{occurrence}\0{text}".encode("utf-8"))
+
+def manifest_path(persist_directory: str) -> str:
+    return os.path.join(persist_directory, MANIFEST_NAME)
+
+def load_manifest(path: str) -> Optional[Dict]:
+    """Manifest dict, or None if missing/unreadable/of another version."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+def save_manifest(path: str, manifest: Dict) -> None:
+    """Write atomically so an interrupted sync never leaves a half-written manifest."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+# ----------------------------------------------------------------------------
+# Sync
+# ----------------------------------------------------------------------------
+
+@dataclass
+class IngestReport:
+    added_files: List[str] = field(default_factory=list)
+    updated_files: List[str] = field(default_factory=list)
+    deleted_files: List[str] = field(default_factory=list)
+    unchanged_files: int = 0
+    chunks_added: int = 0
+    chunks_deleted: int = 0
+    chunks_kept: int = 0
+    chunks_deduplicated: int = 0   # duplicates of a canonical chunk, not embedded or stored
+    rebuilt: bool = False
+    embed_s: float = 0.0   # time spent embedding + upserting
+
+    @property
+    def chunks_per_s(self) -> float:
+        return self.chunks_added / self.embed_s if self.embed_s else 0.0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added_files or self.updated_files or self.deleted_files or self.rebuilt)
+
+    def summary(self) -> str:
+        return (f"files +{len(self.added_files)} ~{len(self.updated_files)} -{len(self.deleted_files)} "
+                f"={self.unchanged_files}; chunks embedded {self.chunks_added}, deleted {self.chunks_deleted}, "
+                f"kept {self.chunks_kept}" + (f", duplicates skipped {self.chunks_deduplicated}"
+                                              if self.chunks_deduplicated else "")
+                + (" (rebuilt)" if self.rebuilt else "")
+                + (f"; {self.chunks_per_s:.1f} chunks/s" if self.chunks_added else ""))
+
+def default_splitter():
+    """Table-aware splitting for Docling exports; plain text keeps the previous 500/50 recursive split."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return TableAwareSplitter(fallback=RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP))
+
+def iter_kb_files(kb_dir: str, extensions: Iterable[str] = KB_EXTENSIONS) -> Dict[str, Path]:
+    """Relative POSIX path → file for every KB file under ``kb_dir``."""
+    root = Path(kb_dir)
+    if not root.is_dir():
+        return {}
+    exts = tuple(e.lower() for e in extensions)
+    return {p.relative_to(root).as_posix(): p for p in sorted(root.rglob("*"))
+            if p.is_file() and p.name.lower().endswith(exts)}
+
+def _split_file(source: str, text: str, splitter) -> List[Tuple[str, Document]]:
+    chunks = splitter.split_documents([Document(page_content=text, metadata={"source": source})])
+    seen: Dict[str, int] = {}
+    out = []
+    for chunk in chunks:
+        chunk.metadata.update(chunk_metadata(source, chunk.page_content, chunk.metadata.get("section", "")))
+        occurrence = seen.get(chunk.page_content, 0)
+        seen[chunk.page_content] = occurrence + 1
+        out.append((chunk_id(source, chunk.page_content, occurrence), chunk))
+    return out
+
+def _add(vectorstore, docs: List[Tuple[str, Document]]) -> None:
+    for i in range(0, len(docs), ADD_BATCH_SIZE):
+        batch = docs[i:i + ADD_BATCH_SIZE]
+        vectorstore.add_documents([d for _id, d in batch], ids=[_id for _id, _d in batch])
+
+def _load_lexical_index(path: str, vectorstore, files: Dict[str, Dict]) -> BM25Index:
+    """BM25 index matching the manifest, backfilled from stored chunk texts when it doesn't."""
+    expected = {cid for entry in files.values() for cid in entry["chunks"]}
+    index = BM25Index.load(path)
+    if index is not None and set(index.lengths) == expected:
+        return index
+    if not expected:
+        return BM25Index()
+    logger.info(f"BM25 index missing or stale; backfilling {len(expected)} chunks from the collection")
+    index = BM25Index.from_vectorstore(vectorstore)
+    for cid in set(index.lengths) - expected:
+        index.remove(cid)
+    return index
+
+def sync_knowledge_base(vectorstore, kb_dir: str, persist_directory: str, splitter=None,
+                        extensions: Iterable[str] = KB_EXTENSIONS, embedding: Optional[str] = None,
+                        dedupe: bool = True) -> IngestReport:
+    """Bring ``vectorstore`` in line with ``kb_dir``, embedding only changed chunks.
+
+    Args:
+        vectorstore: Chroma or FlatVectorStore (any store with add_documents(ids=), delete(ids=), get())
+        kb_dir: Directory of KB files (searched recursively)
+        persist_directory: Where the manifest lives (the Chroma persist dir)
+        splitter: Text splitter (default: TableAwareSplitter, recursive 500/50 for plain text)
+        extensions: File suffixes to ingest
+        embedding: Vector space id (providers.embedding_id()); a manifest for another one forces a rebuild
+        dedupe: Store one canonical chunk per passage (dedupe.py); duplicates are listed in the manifest
+
+    The BM25 index next to the manifest is kept in step (backfilled from the collection
+    if it is missing or out of date).
+
+    Returns:
+        What was added, updated, deleted and kept.
+    """
+    splitter = splitter or default_splitter()
+    path = manifest_path(persist_directory)
+    manifest = load_manifest(path)
+    report = IngestReport()
+    if manifest and embedding and manifest.get("embedding", embedding) != embedding:
+        logger.info(f"KB index was embedded with {manifest['embedding']}, now {embedding}; rebuilding")
+        manifest = None
+
+    if manifest is None:
+        existing = vectorstore.get(include=[])["ids"]
+        if existing:
+            logger.info(f"No KB manifest next to a non-empty collection; rebuilding ({len(existing)} chunks)")
+            vectorstore.delete(ids=existing)
+            report.chunks_deleted += len(existing)
+            report.rebuilt = True
+        manifest = {"version": MANIFEST_VERSION, "files": {}}
+    if embedding:
+        manifest["embedding"] = embedding
+    split_config = splitter_id(splitter)
+    previous_split = manifest.get("splitter", LEGACY_SPLITTER_ID)
+    reprocess_all = False
+    if manifest["files"] and previous_split != split_config:
+        logger.info(f"KB splitter changed ({previous_split} → {split_config}); re-splitting every file")
+        reprocess_all = True
+    if manifest["files"] and manifest.get("dedupe", False) != dedupe:
+        logger.info(f"KB deduplication {'enabled' if dedupe else 'disabled'}; re-evaluating every file")
+        reprocess_all = True
+    # Chunk ids depend only on text, so kept chunks are re-upserted to pick up new metadata
+    # (their embeddings come from the embedding cache)
+    refresh_metadata = bool(manifest["files"]) and manifest.get("metadata") != METADATA_VERSION
+    if refresh_metadata:
+        logger.info(f"KB chunk metadata v{manifest.get('metadata', 0)} → v{METADATA_VERSION}; rewriting every chunk")
+        reprocess_all = True
+    manifest["splitter"] = split_config
+    manifest["dedupe"] = dedupe
+    manifest["metadata"] = METADATA_VERSION
+
+    files = manifest["files"]
+    lexical_path = bm25_path(persist_directory)
+    lexical = _load_lexical_index(lexical_path, vectorstore, files)
+    current = iter_kb_files(kb_dir, extensions)
+    deduper = ChunkDeduper() if dedupe else None
+    if deduper is not None and not reprocess_all:
+        for cid, (text, _meta) in lexical.docs.items():
+            deduper.add(cid, text)
+
+    for source in sorted(set(files) - set(current)):
+        ids = files.pop(source)["chunks"]
+        if ids:
+            vectorstore.delete(ids=ids)
+        for cid in ids:
+            lexical.remove(cid)
+            if deduper is not None:
+                deduper.remove(cid)
+        report.chunks_deleted += len(ids)
+        report.deleted_files.append(source)
+
+    # Chunks from several small files are pooled into ADD_BATCH_SIZE upserts so the
+    # embedding pipeline can fill its batches; manifest entries land after their flush.
+    pending: List[Tuple[str, Document]] = []
+    pending_entries: Dict[str, Dict] = {}
+
+    def _flush() -> None:
+        start = time.perf_counter()
+        _add(vectorstore, pending)
+        report.embed_s += time.perf_counter() - start
+        lexical.add_documents([cid for cid, _doc in pending], [doc for _cid, doc in pending])
+        files.update(pending_entries)
+        lexical.save(lexical_path)
+        checkpoint(vectorstore)        # vectors on disk before the manifest lists them
+        save_manifest(path, manifest)  # progress survives an interrupted sync
+        pending.clear()
+        pending_entries.clear()
+
+    def _process(source: str, data: bytes, digest: str, entry: Optional[Dict]) -> None:
+        chunks = _split_file(source, data.decode("utf-8", errors="ignore"), splitter)
+        old_ids = set(entry["chunks"]) if entry else set()
+        kept: List[Tuple[str, Document]] = []
+        duplicates: Dict[str, str] = {}
+        if deduper is not None:
+            for cid in old_ids:          # a file never duplicates its own previous chunks
+                deduper.remove(cid)
+        for cid, doc in chunks:
+            canonical = deduper.find(doc.page_content) if deduper is not None else None
+            if canonical is not None and canonical != cid:
+                duplicates[cid] = canonical
+                continue
+            kept.append((cid, doc))
+            if deduper is not None:
+                deduper.add(cid, doc.page_content)
+        new_ids = [cid for cid, _doc in kept]
+        stale = sorted(old_ids.difference(new_ids))
+        if stale:
+            vectorstore.delete(ids=stale)
+        for cid in stale:
+            lexical.remove(cid)
+        fresh = [(cid, doc) for cid, doc in kept if cid not in old_ids]
+
+        report.chunks_added += len(fresh)
+        report.chunks_deleted += len(stale)
+        report.chunks_kept += len(kept) - len(fresh)
+        if refresh_metadata:
+            fresh = kept
+        report.chunks_deduplicated += len(duplicates)
+        pending.extend(fresh)
+        pending_entries[source] = {"sha256": digest, "chunks": new_ids, "duplicates": duplicates}
+        if len(pending) >= ADD_BATCH_SIZE:
+            _flush()
+
+    for source, file in current.items():
+        data = file.read_bytes()
+        digest = _sha256(data)
+        entry = files.get(source)
+        if entry and entry["sha256"] == digest and not reprocess_all:
+            report.unchanged_files += 1
+            report.chunks_kept += len(entry["chunks"])
+            report.chunks_deduplicated += len(entry.get("duplicates", {}))
+            continue
+        _process(source, data, digest, entry)
+        (report.updated_files if entry else report.added_files).append(source)
+
+    # Unchanged files whose duplicates pointed at chunks that were just removed are
+    # re-evaluated, so each of those passages gets a new canonical chunk
+    if deduper is not None:
+        _flush()
+        for _ in range(len(current)):
+            live = {cid for entry in files.values() for cid in entry["chunks"]}
+            orphaned = [source for source, entry in files.items()
+                        if not set(entry.get("duplicates", {}).values()) <= live]
+            if not orphaned:
+                break
+            for source in orphaned:
+                entry = files[source]
+                touched = source in report.updated_files or source in report.added_files
+                if not touched:
+                    report.unchanged_files -= 1
+                    report.updated_files.append(source)
+                report.chunks_kept -= len(entry["chunks"])
+                report.chunks_deduplicated -= len(entry.get("duplicates", {}))
+                _process(source, current[source].read_bytes(), entry["sha256"], entry)
+            _flush()
+
+    if pending or pending_entries:
+        _flush()
+    lexical.save(lexical_path)
+    checkpoint(vectorstore)
+    save_manifest(path, manifest)
+    logger.info(f"KB sync {kb_dir}: {report.summary()}")
+    return report
+
+# ----------------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------------
+
+def main() -> None:
+    from dotenv import load_dotenv
+    from embed_pipeline import close_embeddings
+    from flat_store import BACKENDS, bulk_writes, open_vectorstore, vector_store_backend
+    from providers import embedding_id, get_embeddings, index_suffix
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Incrementally sync the knowledge base into the vector store")
+    parser.add_argument("--kb-dir", default=os.path.join(here, "Knowledge_base/txt"))
+    parser.add_argument("--store", choices=BACKENDS, default=None, help="vector store backend (default: VECTOR_STORE)")
+    parser.add_argument("--db-dir", default=None,
+                        help="persist dir (default: ./db/chroma_db_with_metadata_Knowledge_base or ./db/flat_db_Knowledge_base)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    backend = vector_store_backend(args.store)
+    default_dir = "db/flat_db_Knowledge_base" if backend == "flat" else "db/chroma_db_with_metadata_Knowledge_base"
+    db_dir = args.db_dir or os.path.join(here, default_dir + index_suffix())
+    os.makedirs(db_dir, exist_ok=True)
+    embeddings = get_embeddings()
+    try:
+        vectorstore = open_vectorstore(db_dir, embeddings, backend)
+        with bulk_writes(vectorstore):
+            report = sync_knowledge_base(vectorstore, args.kb_dir, db_dir, embedding=embedding_id())
+    finally:
+        close_embeddings(embeddings)
+    print(report.summary())
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,13 @@ Whitelisted mapping (DB9 = DB_Experiments_):
 - COMMAND_STOP (BOOL) → DB9.DBB218.2   (1=STOP, 0=RUN)
 Read-only:
 - CRUNCH_VALID (BOOL) → DB9.DBB218.3   (byte read, non-zero means TRUE)
+Sequencing (used by the MCP server):
+- SEQUENCE (10 x REAL) → DB9.DBD2..DBD38  (mode code, 3x press1, 3x press2, 3x durations)
+- b_START_SEQ (BOOL)   → DB9.DBX166.1   (start request; written by the PC only)
+- Completion: the PLC program (PLC_stuff/FB_StateHandler.txt) never clears b_START_SEQ.
+  It returns its state to STANDBY (1) when the RUN/CLEAN/PRESSURE_TEST FB reports b_Done
+  (Networks 9-11), and MACHINE_MODE carries that state (PLC_STATES), so a sequence has
+  finished once MACHINE_MODE goes from the sequence's mode back to STANDBY.
 
 Safeguards
 ----------
@@ -34,7 +41,8 @@ import os
 import time
 import logging
 import logging.handlers
-from typing import Optional, List, Dict, Any, ContextManager
+import struct
+from typing import Optional, List, Dict, Any, ContextManager, Sequence
 from contextlib import contextmanager
 from dataclasses import dataclass
 from enum import IntEnum
@@ -167,9 +175,32 @@ DB_CONFIG = {
         'b_PAUSE_PLAY': {'db_number': 9, 'start': 262.1, 'type': 'BOOL'},
         'b_CONFIRM':    {'db_number': 9, 'start': 262.2, 'type': 'BOOL'},
         'b_STOP':       {'db_number': 9, 'start': 262.3, 'type': 'BOOL'},
+    },
+    'SEQUENCE': {
+        'r_SEQUENCE':   {'db_number': 9, 'start': 2, 'type': 'REAL', 'count': 10},
+        'b_START_SEQ':  {'db_number': 9, 'start': 166.1, 'type': 'BOOL'},
     }
 }
 
+SEQUENCE_LENGTH = DB_CONFIG['SEQUENCE']['r_SEQUENCE']['count']
+
+# FB_StateHandler i_State codes as read from MACHINE_MODE (2-4 are the MachineMode values)
+PLC_STATES = {
+    0: 'INIT', 1: 'STANDBY', 2: 'RUN', 3: 'CLEAN', 4: 'PRESSURE_TEST',
+    5: 'SAFE_PURGE', 6: 'FAULTED', 7: 'RESET', 8: 'EMERGENCY_STOP',
+}
+STANDBY_STATE = 1
+
+def _bit_address(start: float) -> tuple[int, int]:
+    """Split a 'byte.bit' start address (e.g. 258.2) into (byte, bit).
+
+    Rounding is required: 258.2 % 1 evaluates to 0.19999..., which would
+    otherwise truncate to bit 1.
+    """
+    byte_offset = int(start)
+    bit_offset = int(round((start - byte_offset) * 10))
+    return byte_offset, bit_offset
+
 # ----------------------------------------------------------------------------
 # Safe simulator (used when snap7 is not available or PLC is unreachable)
 # ----------------------------------------------------------------------------
@@ -200,7 +231,7 @@ class _SimClient:
             raise PermissionError("Write blocked by whitelist. Only DB9 is allowed.")
         end = start + len(data)
         if end > len(self._db):
-            self._db.extend(b'\\x00' * (end - len(self._db)))
+            self._db.extend(b'\x00' * (end - len(self._db)))
         self._db[start:end] = data
         if self._debug:
             logger.info(f"SIM: Write DB{db_number}.DBB{start} = {[hex(b) for b in data]}")
@@ -210,7 +241,7 @@ class _SimClient:
             raise PermissionError("Read blocked by whitelist. Only DB9 is allowed.")
         end = start + size
         if end > len(self._db):
-            self._db.extend(b'\\x00' * (end - len(self._db)))
+            self._db.extend(b'\x00' * (end - len(self._db)))
         result = bytes(self._db[start:end])
         if self._debug:
             logger.info(f"SIM: Read DB{db_number}.DBB{start} = {[hex(b) for b in result]}")
@@ -221,7 +252,7 @@ class _SimClient:
         if db_number != 9:
             raise PermissionError("Write blocked by whitelist. Only DB9 is allowed.")
         if byte_offset >= len(self._db):
-            self._db.extend(b'\\x00' * (byte_offset - len(self._db) + 1))
+            self._db.extend(b'\x00' * (byte_offset - len(self._db) + 1))
         
         # Get current byte
         current_byte = self._db[byte_offset]
@@ -242,7 +273,7 @@ class _SimClient:
         if db_number != 9:
             raise PermissionError("Read blocked by whitelist. Only DB9 is allowed.")
         if byte_offset >= len(self._db):
-            self._db.extend(b'\\x00' * (byte_offset - len(self._db) + 1))
+            self._db.extend(b'\x00' * (byte_offset - len(self._db) + 1))
             
         # Get byte and check bit
         current_byte = self._db[byte_offset]
@@ -395,21 +426,37 @@ class PLCInterface:
         """Context manager exit."""
         self.disconnect()
         return False  # Don't suppress exceptions
-    def __init__(self, ip: str | None = None, rack: int = 0, slot: int = 1, simulate: bool | None = None) -> None:
+    def __init__(self, ip: str | None = None, rack: int = 0, slot: int = 1, simulate: bool | None = None,
+                 fallback_to_sim: bool = True) -> None:
+        """
+        Args:
+            simulate: Use the in-memory simulator (default: PLC_SIM, 1)
+            fallback_to_sim: Switch to the simulator when the PLC (or python-snap7) is
+                unavailable. When False, hardware stays selected: an unreachable PLC
+                leaves the interface disconnected and ensure_connected() raises.
+        """
         # Use provided values or environment variables with defaults
         self.ip = ip or os.getenv('PLC_IP', '192.168.0.1')
         self.rack = rack if ip is not None else int(os.getenv('PLC_RACK', '0'))
         self.slot = slot if ip is not None else int(os.getenv('PLC_SLOT', '1'))
+        self.fallback_to_sim = fallback_to_sim
         # Pick transport
         use_sim = simulate if simulate is not None else bool(int(os.getenv('PLC_SIM', '1')))
-        if snap7 is None:
+        if snap7 is None and not use_sim:
+            if not fallback_to_sim:
+                raise ImportError("python-snap7 is required to use the PLC hardware")
             logger.warning("python-snap7 not available → using PLC simulator")
             use_sim = True
         if use_sim:
             self.client = _SimClient()
         else:
             self.client = snap7.client.Client()  # type: ignore[attr-defined]
-        self.connect()
+        try:
+            self.connect()
+        except ConnectionError as e:
+            if fallback_to_sim:
+                raise
+            logger.error(f"{e}; retrying on the next operation")
 
     # ---- lifecycle ---------------------------------------------------------
     def connect(self) -> None:
@@ -422,6 +469,8 @@ class PLCInterface:
                 raise ConnectionError("Failed to connect to PLC")
             logger.info("PLC connected (%s)", "SIM" if isinstance(self.client, _SimClient) else self.ip)
         except Exception as e:
+            if not isinstance(self.client, _SimClient) and not self.fallback_to_sim:
+                raise ConnectionError(f"PLC {self.ip} (rack {self.rack}, slot {self.slot}) unreachable: {e}") from e
             # fallback to sim if not already sim
             if not isinstance(self.client, _SimClient):
                 logger.exception("PLC connection failed, switching to simulator. Reason: %s", e)
@@ -435,6 +484,17 @@ class PLCInterface:
             self.client.disconnect()
             logger.info("PLC disconnected")
 
+    def ensure_connected(self) -> None:
+        """Reconnect if the connection was dropped (for long-lived interfaces)."""
+        if not self.client.get_connected():
+            logger.warning("PLC connection lost, reconnecting")
+            self.connect()
+
+    @property
+    def simulated(self) -> bool:
+        """True when the in-memory simulator is in use."""
+        return isinstance(self.client, _SimClient)
+
     def _write_real(self, tag: str, value: float) -> None:
         """Write a REAL value to PLC."""
         section = None
@@ -528,15 +588,14 @@ class PLCInterface:
         else:
             # Direct tag lookup
             section = None
-            for s in ['OPERATION', 'COMMANDS_RUN', 'COMMANDS_CLEAN', 'COMMANDS_PRESSURE_TEST']:
+            for s in ['OPERATION', 'COMMANDS_RUN', 'COMMANDS_CLEAN', 'COMMANDS_PRESSURE_TEST', 'SEQUENCE']:
                 if tag in DB_CONFIG[s]:
                     section = s
                     break
             if not section:
                 raise ValueError(f"Unknown tag: {tag}")
             cfg = DB_CONFIG[section][tag]
-        byte_offset = int(cfg['start'])
-        bit_offset = int((cfg['start'] % 1) * 10)
+        byte_offset, bit_offset = _bit_address(cfg['start'])
         
         # EXTENSIVE DEBUG LOGGING
         logger.info(f"Writing BOOL {tag} = {value}")
@@ -591,15 +650,14 @@ class PLCInterface:
         else:
             # Direct tag lookup
             section = None
-            for s in ['OPERATION', 'COMMANDS_RUN', 'COMMANDS_CLEAN', 'COMMANDS_PRESSURE_TEST']:
+            for s in ['OPERATION', 'COMMANDS_RUN', 'COMMANDS_CLEAN', 'COMMANDS_PRESSURE_TEST', 'SEQUENCE']:
                 if tag in DB_CONFIG[s]:
                     section = s
                     break
             if not section:
                 raise ValueError(f"Unknown tag: {tag}")
             cfg = DB_CONFIG[section][tag]
-        byte_offset = int(cfg['start'])
-        bit_offset = int((cfg['start'] % 1) * 10)
+        byte_offset, bit_offset = _bit_address(cfg['start'])
         
         if isinstance(self.client, _SimClient):
             return self.client.db_read_bit(cfg['db_number'], byte_offset, bit_offset)
@@ -776,8 +834,7 @@ class PLCInterface:
     def read_crunch_valid(self) -> bool:
         """Read Crunch_Valid bit (DBX202.0)."""
         cfg = DB_CONFIG['OPERATION']['CRUNCH_VALID']
-        byte_offset = int(cfg['start'])  # 202 from 202.0
-        bit_offset = int((cfg['start'] % 1) * 10)  # 0 from 202.0
+        byte_offset, bit_offset = _bit_address(cfg['start'])  # (202, 0) from 202.0
         
         result = self.client.db_read(cfg['db_number'], byte_offset, 1)
         if not result:
@@ -892,6 +949,39 @@ class PLCInterface:
     def read_status(self) -> int:
         """Read the current machine status (MachineMode)."""
         return self._read_int('MACHINE_MODE')
+
+    def read_status_snapshot(self) -> Dict[str, Any]:
+        """Read modes, CRUNCH_VALID, all command bits and b_START_SEQ in two block reads.
+
+        Used by pollers that would otherwise issue ~15 single-tag reads per cycle.
+        """
+        op = DB_CONFIG['OPERATION']
+        base = op['OPERATION_MODE']['start']
+        last = int(DB_CONFIG['COMMANDS_PRESSURE_TEST']['b_STOP']['start'])
+        block = bytes(self.client.db_read(op['OPERATION_MODE']['db_number'], base, last - base + 1))
+
+        def _int(cfg: Dict[str, Any]) -> int:
+            offset = int(cfg['start']) - base
+            return struct.unpack('>h', block[offset:offset + 2])[0]
+
+        def _bool(cfg: Dict[str, Any]) -> bool:
+            byte_offset, bit_offset = _bit_address(cfg['start'])
+            return bool(block[byte_offset - base] & (1 << bit_offset))
+
+        commands = {
+            section.replace('COMMANDS_', ''): {tag: _bool(cfg) for tag, cfg in DB_CONFIG[section].items()}
+            for section in ['COMMANDS_RUN', 'COMMANDS_CLEAN', 'COMMANDS_PRESSURE_TEST']
+        }
+        seq_cfg = DB_CONFIG['SEQUENCE']['b_START_SEQ']
+        seq_byte, seq_bit = _bit_address(seq_cfg['start'])
+        seq_raw = self.client.db_read(seq_cfg['db_number'], seq_byte, 1)
+        return {
+            'operation_mode': _int(op['OPERATION_MODE']),
+            'machine_mode': _int(op['MACHINE_MODE']),
+            'crunch_valid': _bool(op['CRUNCH_VALID']),
+            'commands': commands,
+            'start_seq': bool(seq_raw and seq_raw[0] & (1 << seq_bit)),
+        }
         
     def set_machine_mode(self, mode: int) -> None:
         """Set the machine mode (status).
@@ -930,6 +1020,63 @@ class PLCInterface:
             
         logger.info(f"Operation started: {payload.machine_mode.name} mode with START bit set")
 
+    # ---- sequencing (MCP server) ------------------------------------------
+    def read_sequence(self) -> List[float]:
+        """Read the 10-element REAL sequence array (DB9.DBD2..DBD38)."""
+        cfg = DB_CONFIG['SEQUENCE']['r_SEQUENCE']
+        raw = self.client.db_read(cfg['db_number'], cfg['start'], 4 * cfg['count'])
+        return list(struct.unpack(f">{cfg['count']}f", bytes(raw)))
+
+    def write_sequence(self, sequence: Sequence[float] | bytes, start: bool = True) -> List[float]:
+        """Write the sequence array in a single block write, verify it, then set b_START_SEQ.
+
+        The whole array is packed big-endian (S7 REAL) and written with one
+        db_write, then read back in one db_read. The start bit is only set once
+        the read-back matches; on mismatch the array is zeroed and nothing starts.
+
+        Args:
+            sequence: Exactly SEQUENCE_LENGTH values (see crunching.build_sequence), or
+                the already packed 4*SEQUENCE_LENGTH bytes from crunching.pack_sequence
+            start: Set b_START_SEQ after a verified write
+
+        Returns:
+            The values read back from the PLC.
+        """
+        if isinstance(sequence, (bytes, bytearray, memoryview)):
+            data = bytes(sequence)
+            if len(data) != 4 * SEQUENCE_LENGTH:
+                raise ValueError(f"Packed sequence must be {4 * SEQUENCE_LENGTH} bytes, got {len(data)}")
+        else:
+            if len(sequence) != SEQUENCE_LENGTH:
+                raise ValueError(f"Sequence must have exactly {SEQUENCE_LENGTH} elements, got {len(sequence)}")
+            data = struct.pack(f">{SEQUENCE_LENGTH}f", *(float(v) for v in sequence))
+        cfg = DB_CONFIG['SEQUENCE']['r_SEQUENCE']
+        self.client.db_write(cfg['db_number'], cfg['start'], bytearray(data))
+
+        readback = self.read_sequence()
+        expected = struct.unpack(f">{SEQUENCE_LENGTH}f", data)  # float32-rounded
+        mismatches = [i for i, (e, a) in enumerate(zip(expected, readback)) if e != a]
+        if mismatches:
+            self.client.db_write(cfg['db_number'], cfg['start'], bytearray(4 * SEQUENCE_LENGTH))
+            raise ValueError(f"Sequence verification failed at indices {mismatches}: read back {readback}")
+
+        if start:
+            self._write_bool('SEQUENCE.b_START_SEQ', True)
+            if not self._read_bool('SEQUENCE.b_START_SEQ'):
+                raise ValueError("Failed to set SEQUENCE.b_START_SEQ")
+        logger.info(f"Sequence written and verified ({'started' if start else 'not started'}): {readback}")
+        return readback
+
+    def stop_sequence(self) -> None:
+        """Clear the b_START_SEQ request and verify; the next write_sequence starts on a fresh edge.
+
+        This does not stop a running sequence on the PLC; pulse STOP for its mode for that.
+        """
+        self._write_bool('SEQUENCE.b_START_SEQ', False)
+        if self._read_bool('SEQUENCE.b_START_SEQ'):
+            raise ValueError("Failed to clear SEQUENCE.b_START_SEQ")
+        logger.info("Sequence start bit cleared")
+
 # ----------------------------------------------------------------------------
 # Simple CLI for quick tests
 # ----------------------------------------------------------------------------
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+prompt_registry.py — Prompt files loaded once, by name and version, with hot reload
+
+build_rag_chain read Prompts/AdvancedPrompt_V0.txt on every build with the file name
+hard-coded, and the 6_Tamara_workflow scripts read theirs at import, so editing a
+prompt meant restarting the agent. ``PromptRegistry`` loads every ``*.txt`` of its
+prompt directories once and serves them by name and version:
+
+- ``AdvancedPrompt_V0.txt`` is ("AdvancedPrompt", 0), ``BasicPrompt_02.txt`` is
+  ("BasicPrompt", 2), a file without a version suffix is version 0;
+  ``get("BasicPrompt")`` returns the latest version, ``get("BasicPrompt", 1)`` or
+  ``get("BasicPrompt_01")`` a pinned one
+- ``get`` stats the files at most every ``check_interval_s`` seconds; a file is only
+  re-read when its mtime or size changed, and added or deleted files are picked up
+- a re-read file whose content hashes the same keeps its ``Prompt`` object, so the
+  system text sent to the model stays byte-identical between calls. Providers cache
+  the longest identical prompt prefix (OpenAI does this automatically above 1024
+  tokens): the system prompt comes first and ``Prompt.static_prefix`` — the text
+  before the first ``{variable}``, normally ``{context}`` at the end — never changes
+  unless the file does. Callers key derived objects (prompt templates, chains) on
+  ``Prompt.sha256``.
+
+Environment (see tamara_graph.build_rag_chain):
+  RAG_PROMPT               - QA system prompt: name (latest version) or file stem (default AdvancedPrompt_V0)
+  PROMPT_RELOAD_INTERVAL   - seconds between file change checks (default 1; 0 checks on every get)
+
+Run:
+  $ python prompt_registry.py              # list the prompts with version, size and hash
+  $ python prompt_registry.py AdvancedPrompt
+"""
+
+from __future__ import annotations
+import argparse
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PROMPT_DIR = os.path.join(SCRIPT_DIR, "Prompts")
+DEFAULT_RAG_PROMPT = "AdvancedPrompt_V0"
+DEFAULT_CHECK_INTERVAL = 1.0
+
+_VERSIONED = re.compile(r"^(?P<name>.+?)_[Vv]?(?P<version>\d+)$")
+_VARIABLE = re.compile(r"(?<!\{)\{([A-Za-z_][A-Za-z0-9_]*)\}(?!\})")
+
+def parse_stem(stem: str) -> Tuple[str, int]:
+    """("AdvancedPrompt", 0) for "AdvancedPrompt_V0", ("BasicPrompt", 1) for "BasicPrompt_01"."""
+    match = _VERSIONED.match(stem)
+    if match:
+        return match.group("name"), int(match.group("version"))
+    return stem, 0
+
+@dataclass(frozen=True)
+class Prompt:
+    name: str
+    version: int
+    path: str
+    text: str                  # file content, stripped
+    sha256: str
+    mtime: float
+    size: int
+
+    @property
+    def stem(self) -> str:
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    @property
+    def static_prefix(self) -> str:
+        """Text before the first template variable (identical on every call)."""
+        match = _VARIABLE.search(self.text)
+        return self.text[:match.start()] if match else self.text
+
+    @property
+    def variables(self) -> List[str]:
+        return list(dict.fromkeys(_VARIABLE.findall(self.text)))
+
+def _load(path: str, stat: os.stat_result) -> Prompt:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    name, version = parse_stem(os.path.splitext(os.path.basename(path))[0])
+    return Prompt(name, version, path, text, hashlib.sha256(text.encode("utf-8")).hexdigest(),
+                  stat.st_mtime, stat.st_size)
+
+class PromptRegistry:
+    """Thread-safe prompt file registry with change detection (see module docstring)."""
+
+    def __init__(self, directories: Optional[Iterable[str]] = None,
+                 check_interval_s: float = DEFAULT_CHECK_INTERVAL) -> None:
+        self.directories = list(directories or [DEFAULT_PROMPT_DIR])
+        self.check_interval_s = check_interval_s
+        self.reloads = 0
+        self._prompts: Dict[str, Prompt] = {}      # path → prompt
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, directories: Optional[Iterable[str]] = None) -> "PromptRegistry":
+        return cls(directories, check_interval_s=float(os.getenv("PROMPT_RELOAD_INTERVAL", DEFAULT_CHECK_INTERVAL)))
+
+    def _scan(self) -> None:
+        """Re-read new or modified files and forget deleted ones (caller holds the lock)."""
+        seen: Dict[str, Prompt] = {}
+        for directory in self.directories:
+            try:
+                entries = sorted(os.scandir(directory), key=lambda e: e.name)
+            except FileNotFoundError:
+                logger.warning(f"Prompt directory not found: {directory}")
+                continue
+            for entry in entries:
+                if not entry.name.endswith(".txt") or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                old = self._prompts.get(entry.path)
+                if old is not None and (old.mtime, old.size) == (stat.st_mtime, stat.st_size):
+                    seen[entry.path] = old
+                    continue
+                try:
+                    prompt = _load(entry.path, stat)
+                except OSError as e:
+                    logger.warning(f"Could not read prompt {entry.path}: {e}")
+                    if old is not None:
+                        seen[entry.path] = old
+                    continue
+                if old is not None and old.sha256 == prompt.sha256:
+                    prompt = old          # touched but unchanged: keep the same object and bytes
+                elif self._checked_at is not None:
+                    self.reloads += 1
+                    logger.info(f"Prompt {'reloaded' if old else 'added'}: {prompt.stem} ({prompt.sha256[:12]})")
+                seen[entry.path] = prompt
+        for path in self._prompts.keys() - seen.keys():
+            logger.info(f"Prompt removed: {os.path.basename(path)}")
+        self._prompts = seen
+        self._checked_at = time.monotonic()
+
+    def refresh(self, force: bool = False) -> None:
+        """Check the files for changes (at most once per ``check_interval_s`` unless forced)."""
+        with self._lock:
+            if force or self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval_s:
+                self._scan()
+
+    def available(self) -> List[Prompt]:
+        """All prompts, by name then version."""
+        self.refresh()
+        with self._lock:
+            return sorted(self._prompts.values(), key=lambda p: (p.name, p.version, p.path))
+
+    def get(self, name: str, version: Optional[int] = None) -> Prompt:
+        """Prompt by name (latest version unless ``version`` is given), else by file stem."""
+        self.refresh()
+        with self._lock:
+            prompts = list(self._prompts.values())
+        candidates = [p for p in prompts if p.name == name and (version is None or p.version == version)]
+        if not candidates and version is None:
+            candidates = [p for p in prompts if p.stem == name]   # a pinned file stem
+        if not candidates:
+            known = ", ".join(sorted({p.stem for p in prompts})) or "none"
+            wanted = name if version is None else f"{name} version {version}"
+            raise KeyError(f"Unknown prompt {wanted!r} in {', '.join(self.directories)} (available: {known})")
+        return max(candidates, key=lambda p: p.version)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="List the prompt registry, or print one prompt")
+    parser.add_argument("name", nargs="?", help="prompt name or file stem")
+    parser.add_argument("--dir", action="append", help=f"prompt directory (default: {DEFAULT_PROMPT_DIR})")
+    args = parser.parse_args()
+    registry = PromptRegistry(args.dir)
+    if args.name:
+        print(registry.get(args.name).text)
+        return
+    for prompt in registry.available():
+        print(f"{prompt.name:<20} v{prompt.version:<3} {prompt.size:>6} B  {prompt.sha256[:12]}  "
+              f"static prefix {len(prompt.static_prefix)} chars  {{{', '.join(prompt.variables)}}}  {prompt.path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+providers.py — Pluggable embedding and LLM backends (remote, local, offline)
+
+Selects the embedding model and chat model used by the RAG chain and the KB
+indexer from configuration, so retrieval also works on the air-gapped lab network:
+
+  EMBEDDING_PROVIDER   openai (default) | local | hashing
+  LLM_PROVIDER         openai (default) | local
+
+openai   - OpenAIEmbeddings / ChatOpenAI (needs OPENAI_API_KEY; OPENAI_MODEL picks the chat model)
+local    - embeddings: an OpenAI-compatible endpoint at LOCAL_EMBEDDING_BASE_URL (Ollama,
+           llama.cpp, TEI, vLLM), otherwise sentence-transformers on CPU
+           (LOCAL_EMBEDDING_MODEL, default all-MiniLM-L6-v2);
+           chat: an OpenAI-compatible endpoint at LOCAL_LLM_BASE_URL
+           (default http://localhost:11434/v1, model LOCAL_LLM_MODEL)
+hashing  - deterministic feature-hashing embedder; no model, no network. For tests and
+           smoke runs, not for answer quality.
+
+Embeddings of remote/local models go through embed_pipeline + the disk cache;
+``embedding_id()`` names the vector space so indexes of different backends never mix.
+
+Benchmark query latency of the configured backends:
+  $ python providers.py --backends hashing,local,openai --queries 20
+"""
+
+from __future__ import annotations
+import argparse
+import hashlib
+import math
+import os
+import re
+import statistics
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+DEFAULT_OPENAI_CHAT_MODEL = "gpt-3.5-turbo"
+DEFAULT_LOCAL_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_LOCAL_LLM_BASE_URL = "http://localhost:11434/v1"
+DEFAULT_LOCAL_LLM_MODEL = "llama3.1:8b"
+HASHING_DIM = 384
+
+EMBEDDING_PROVIDERS = ("openai", "local", "hashing")
+LLM_PROVIDERS = ("openai", "local")
+
+# ----------------------------------------------------------------------------
+# Offline hashing embedder
+# ----------------------------------------------------------------------------
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def _tokens(text: str) -> List[str]:
+    # Crude plural/verb stemming so "affects" matches "affect"
+    return [t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t
+            for t in _TOKEN_RE.findall(text.lower())]
+
+class HashingEmbeddings(Embeddings):
+    """Signed feature hashing of word unigrams and bigrams, log-TF weighted, L2-normalised.
+
+    Deterministic across processes and machines (blake2b, not ``hash()``).
+    """
+
+    def __init__(self, dim: int = HASHING_DIM) -> None:
+        self.dim = dim
+        self.model = f"hashing-{dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        toks = _tokens(text)
+        counts: Dict[str, int] = {}
+        for feature in toks + [f"{a} {b}" for a, b in zip(toks, toks[1:])]:
+            counts[feature] = counts.get(feature, 0) + 1
+        vec = [0.0] * self.dim
+        for feature, tf in counts.items():
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += (1.0 if (h >> 63) & 1 else -1.0) * (1.0 + math.log(tf))
+        norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+        return [v / norm for v in vec]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+# ----------------------------------------------------------------------------
+# Selection
+# ----------------------------------------------------------------------------
+
+def embedding_provider(provider: Optional[str] = None) -> str:
+    provider = (provider or os.getenv("EMBEDDING_PROVIDER", "openai")).strip().lower()
+    if provider not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER '{provider}', expected one of {EMBEDDING_PROVIDERS}")
+    return provider
+
+def llm_provider(provider: Optional[str] = None) -> str:
+    provider = (provider or os.getenv("LLM_PROVIDER", "openai")).strip().lower()
+    if provider not in LLM_PROVIDERS:
+        raise ValueError(f"Unknown LLM_PROVIDER '{provider}', expected one of {LLM_PROVIDERS}")
+    return provider
+
+def embedding_id(provider: Optional[str] = None) -> str:
+    """Name of the vector space produced by the selected backend (used for cache keys and index dirs)."""
+    provider = embedding_provider(provider)
+    if provider == "openai":
+        return os.getenv("OPENAI_EMBEDDING_MODEL", DEFAULT_OPENAI_EMBEDDING_MODEL)
+    if provider == "local":
+        return f"local:{os.getenv('LOCAL_EMBEDDING_MODEL', DEFAULT_LOCAL_EMBEDDING_MODEL)}"
+    return HashingEmbeddings().model
+
+def index_suffix(provider: Optional[str] = None) -> str:
+    """Persist-dir suffix: empty for the default OpenAI index, else a slug of embedding_id()."""
+    if embedding_provider(provider) == "openai" and embedding_id(provider) == DEFAULT_OPENAI_EMBEDDING_MODEL:
+        return ""
+    return "__" + re.sub(r"[^A-Za-z0-9._-]+", "_", embedding_id(provider))
+
+def require_api_key(embeddings: bool = True, llm: bool = True) -> None:
+    """Raise if a backend in use is OpenAI and OPENAI_API_KEY is missing."""
+    uses_openai = (embeddings and embedding_provider() == "openai") or (llm and llm_provider() == "openai")
+    if uses_openai and not os.getenv("OPENAI_API_KEY"):
+        raise ValueError("OPENAI_API_KEY environment variable is not set. Please set it in your .env file, "
+                         "or select offline backends with EMBEDDING_PROVIDER / LLM_PROVIDER.")
+
+def get_embeddings(provider: Optional[str] = None) -> Embeddings:
+    """Embeddings for the selected backend (cached and pipelined unless hashing)."""
+    from embedding_cache import CachedEmbeddings, cached_embeddings
+    from embed_pipeline import ConcurrentEmbeddings
+
+    provider = embedding_provider(provider)
+    if provider == "hashing":
+        return HashingEmbeddings()
+    if provider == "openai":
+        return cached_embeddings(embedding_id(provider), openai_api_key=os.getenv("OPENAI_API_KEY"))
+
+    model = os.getenv("LOCAL_EMBEDDING_MODEL", DEFAULT_LOCAL_EMBEDDING_MODEL)
+    base_url = os.getenv("LOCAL_EMBEDDING_BASE_URL")
+    if base_url:
+        from langchain_openai import OpenAIEmbeddings
+        inner: Embeddings = ConcurrentEmbeddings.from_env(OpenAIEmbeddings(
+            model=model, base_url=base_url, api_key=os.getenv("LOCAL_API_KEY", "local"),
+            max_retries=0, check_embedding_ctx_length=False))
+    else:
+        try:
+            try:
+                from langchain_huggingface import HuggingFaceEmbeddings
+            except ImportError:
+                from langchain_community.embeddings import HuggingFaceEmbeddings
+            inner = HuggingFaceEmbeddings(model_name=model, model_kwargs={"device": "cpu"},
+                                          encode_kwargs={"normalize_embeddings": True})
+        except ImportError as e:
+            raise ImportError("EMBEDDING_PROVIDER=local needs LOCAL_EMBEDDING_BASE_URL or "
+                              "`pip install sentence-transformers`") from e
+    if os.getenv("EMBEDDING_CACHE", "1") == "0":
+        return inner
+    return CachedEmbeddings(inner, model=embedding_id(provider))
+
+def get_chat_model(provider: Optional[str] = None, temperature: float = 0.1):
+    """Chat model for the selected backend (both are OpenAI-compatible clients)."""
+    from langchain_openai import ChatOpenAI
+
+    if llm_provider(provider) == "local":
+        return ChatOpenAI(
+            model=os.getenv("LOCAL_LLM_MODEL", DEFAULT_LOCAL_LLM_MODEL),
+            base_url=os.getenv("LOCAL_LLM_BASE_URL", DEFAULT_LOCAL_LLM_BASE_URL),
+            api_key=os.getenv("LOCAL_API_KEY", "local"),
+            temperature=temperature,
+        )
+    return ChatOpenAI(
+        model=os.getenv("OPENAI_MODEL", DEFAULT_OPENAI_CHAT_MODEL),
+        temperature=temperature,
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+    )
+
+# ----------------------------------------------------------------------------
+# Benchmark: query latency local vs. remote
+# ----------------------------------------------------------------------------
+
+BENCH_QUERIES = [
+    "What is the recommended flow rate range for TAMARA?",
+    "How does temperature affect viscosity in microfluidic mixing?",
+    "How do I clean the chip after a run?",
+    "What flow rate ratio is used for LNP formulation?",
+    "What is the difference between the baffle and herringbone chips?",
+]
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def benchmark(backends: List[str], kb_dir: str, queries: int = 20, max_files: int = 5,
+              with_llm: bool = False) -> Dict[str, Dict[str, float]]:
+    """Index ``max_files`` KB files per backend, then time ``queries`` retrievals (and LLM calls)."""
+    from langchain_chroma import Chroma
+    from embed_pipeline import close_embeddings
+    from kb_ingest import iter_kb_files, sync_knowledge_base
+
+    results: Dict[str, Dict[str, float]] = {}
+    for backend in backends:
+        with tempfile.TemporaryDirectory() as tmp:
+            kb_tmp, db_tmp = os.path.join(tmp, "kb"), os.path.join(tmp, "db")
+            os.makedirs(kb_tmp)
+            os.makedirs(db_tmp)
+            for rel, path in list(iter_kb_files(kb_dir).items())[:max_files]:
+                with open(os.path.join(kb_tmp, rel.replace("/", "_")), "wb") as f:
+                    f.write(path.read_bytes())
+            embeddings = None
+            try:
+                embeddings = get_embeddings(backend)
+                store = Chroma(collection_name="bench", persist_directory=db_tmp, embedding_function=embeddings)
+                t0 = time.perf_counter()
+                report = sync_knowledge_base(store, kb_tmp, db_tmp)
+                index_s = time.perf_counter() - t0
+                llm = get_chat_model("local" if backend in ("local", "hashing") else "openai") if with_llm else None
+                latencies = []
+                for i in range(queries):
+                    q = BENCH_QUERIES[i % len(BENCH_QUERIES)] + ("" if i < len(BENCH_QUERIES) else f" ({i})")
+                    t = time.perf_counter()
+                    docs = store.similarity_search(q, k=5)
+                    if llm is not None:
+                        llm.invoke(f"Answer briefly from: {docs[0].page_content[:500]}\n\nQ: {q}")
+                    latencies.append(time.perf_counter() - t)
+            except Exception as e:
+                print(f"{backend}: skipped ({e})")
+                continue
+            finally:
+                if embeddings is not None:
+                    close_embeddings(embeddings)
+            results[backend] = {
+                "chunks": report.chunks_added, "index_s": index_s,
+                "p50_ms": 1000 * statistics.median(latencies), "p95_ms": 1000 * _percentile(latencies, 95),
+            }
+    return results
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Query latency of embedding/LLM backends")
+    parser.add_argument("--backends", default="hashing,local,openai")
+    parser.add_argument("--kb-dir", default=os.path.join(here, "Knowledge_base/txt"))
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--max-files", type=int, default=5)
+    parser.add_argument("--with-llm", action="store_true", help="Also time one LLM call per query")
+    args = parser.parse_args()
+
+    results = benchmark(args.backends.split(","), args.kb_dir, args.queries, args.max_files, args.with_llm)
+    print(f"{'backend':<10} {'chunks':>7} {'index s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for backend, r in results.items():
+        print(f"{backend:<10} {r['chunks']:>7.0f} {r['index_s']:>9.2f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -8,16 +8,17 @@ Author: Nahashon Osinde
 """
 
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 from pathlib import Path
 import logging
 from dotenv import load_dotenv
 from rich.console import Console
 from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from providers import embedding_id, get_embeddings, index_suffix, require_api_key
+from embed_pipeline import close_embeddings
 from langchain_community.document_loaders import TextLoader
 from langchain.docstore.document import Document
+from kb_ingest import IngestReport, default_splitter, sync_knowledge_base
 
 # Configure logging
 logging.basicConfig(
@@ -29,24 +30,18 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Verify OpenAI API key is set
-if not os.getenv("OPENAI_API_KEY"):
-    raise ValueError("OPENAI_API_KEY environment variable is not set. Please set it in your .env file.")
-
 class KnowledgeBaseIndexer:
     """Handles indexing of knowledge base documents"""
     
     def __init__(self):
         self.console = Console()
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small"
-        ) # Update to a valid embedding model if needed, 'text-embedding-ada-002' is better but more expensive
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=50,
-            length_function=len,
-            is_separator_regex=False
-        )
+        # Backend from EMBEDDING_PROVIDER (openai/local/hashing, see providers.py); the OpenAI key
+        # is only required when OpenAI is selected
+        require_api_key(llm=False)
+        self.embeddings = get_embeddings()
+        self.last_report: Optional[IngestReport] = None
+        # Heading/table-aware for the Docling exports, recursive 500/50 for plain text (see table_chunker.py)
+        self.text_splitter = default_splitter()
 
     def load_documents(self, kb_dir: Path) -> List[Document]:
         """Load documents from knowledge base directory"""
@@ -70,32 +65,21 @@ class KnowledgeBaseIndexer:
 
         return documents
 
-    def build_index(self, kb_dir: str, vector_db_dir: str) -> None:
-        """Build vector store index from knowledge base documents"""
+    def build_index(self, kb_dir: str, vector_db_dir: str) -> Chroma:
+        """Sync the vector store with the knowledge base, embedding only changed chunks (see last_report)"""
         kb_path = Path(kb_dir)
         if not kb_path.exists():
             raise ValueError(f"Knowledge base directory not found: {kb_dir}")
 
-        # Load and split documents
-        documents = self.load_documents(kb_path)
-        self.console.print(f"[green]Loaded {len(documents)} documents[/green]")
-
-        chunks = self.text_splitter.split_documents(documents)
-        self.console.print(f"[green]Created {len(chunks)} chunks[/green]")
-
-        # Create and persist vector store
-        vectorstore = Chroma.from_documents(
-            documents=chunks,
-            embedding=self.embeddings,
-            persist_directory=vector_db_dir
-        )
-        vectorstore.persist()
-        self.console.print(f"[green]Index built and persisted to {vector_db_dir}[/green]")
+        vectorstore = Chroma(persist_directory=vector_db_dir, embedding_function=self.embeddings)
+        self.last_report = sync_knowledge_base(vectorstore, kb_dir, vector_db_dir, splitter=self.text_splitter,
+                                               embedding=embedding_id())
+        self.console.print(f"[green]Index synced to {vector_db_dir}: {self.last_report.summary()}[/green]")
 
         return vectorstore
 
     def smoke_test(self, vectorstore: Chroma) -> None:
-        """Run smoke tests on the built index"""
+        """Run smoke tests on the built index (retrieval_bench.py scores retrieval against the golden set)"""
         test_queries = [
             "What is the recommended flow rate range for TAMARA?",
             "How does temperature affect viscosity in microfluidic mixing?"
@@ -119,24 +103,22 @@ def main():
     current_dir = os.path.dirname(os.path.abspath(__file__))
     kb_dir = os.path.join(current_dir, "Knowledge_base/txt")
     db_dir = os.path.join(current_dir, "db")
-    vector_db_dir = os.path.join(db_dir, "chroma_db_with_metadata_Knowledge_base")
+    vector_db_dir = os.path.join(db_dir, "chroma_db_with_metadata_Knowledge_base" + index_suffix())
 
     # Ensure vector store directory exists
     os.makedirs(vector_db_dir, exist_ok=True)
 
-    # Check if vector store already exists
-    if os.path.exists(vector_db_dir) and os.listdir(vector_db_dir):
-        logger.info("Vector store already exists. No need to initialize.")
-        return
-
-    # Build index
+    # Build or incrementally update the index (see kb_ingest.py)
     indexer = KnowledgeBaseIndexer()
     try:
         vectorstore = indexer.build_index(kb_dir, vector_db_dir)
-        indexer.smoke_test(vectorstore)
+        if indexer.last_report.changed:
+            indexer.smoke_test(vectorstore)
     except Exception as e:
         logger.error(f"Error building index: {str(e)}")
         raise
+    finally:
+        close_embeddings(indexer.embeddings)  # embedding worker pool and cache connection
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
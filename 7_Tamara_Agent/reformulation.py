@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+reformulation.py — Skip the history-reformulation LLM call when it cannot help
+
+``create_history_aware_retriever`` sends every question with a non-empty history
+through an extra LLM call that rewrites it as a standalone question, roughly doubling
+RAG latency. The agent passes the whole transcript as history, so that is every
+question after the first. ``create_conditional_history_aware_retriever`` is a drop-in
+replacement that retrieves with the raw question when a fast pre-check says the
+rewrite cannot change anything:
+
+- ``empty_history``   no earlier turns
+- ``self_contained``  no pronouns, deictic words or follow-up phrasing ("it", "those",
+                      "what about", "and the ...", very short questions)
+- ``confident``       references are present, but the question's own top vector hit is
+                      already very similar (cosine ≥ RAG_REFORMULATE_MIN_SIM, default 0.65)
+
+Every decision is counted in ``ReformulationStats``; the latency saved is estimated
+from the mean duration of the reformulation calls that did run.
+"""
+
+from __future__ import annotations
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable, RunnableLambda
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_SIMILARITY = 0.65
+MIN_CONTENT_WORDS = 3     # "and the FRR?" is a follow-up even without a pronoun
+
+_REFERENCE_RE = re.compile(
+    r"\b(it|its|it's|itself|they|them|their|theirs|themselves|this|that|these|those|there|"
+    r"he|she|him|her|his|one|ones|former|latter|above|previous|previously|earlier|same|"
+    r"again|else|another|other|then|instead)\b"
+)
+_FOLLOW_UP_RE = re.compile(r"^\s*(and|or|but|so|also|what about|how about|what if|why not)\b")
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+_FILLER = frozenset("what which who how why when where is are was were do does did can could should would "
+                    "the a an of to in on for with about me please tell explain".split())
+
+def reference_reason(question: str) -> Optional[str]:
+    """Why ``question`` may depend on the conversation (None if it reads as standalone)."""
+    text = question.lower()
+    match = _REFERENCE_RE.search(text)
+    if match:
+        return f"reference:{match.group(1)}"
+    if _FOLLOW_UP_RE.match(text):
+        return "follow_up"
+    if len([w for w in _WORD_RE.findall(text) if w not in _FILLER]) < MIN_CONTENT_WORDS:
+        return "short"
+    return None
+
+def cosine_from_distance(vectorstore, distance: float) -> float:
+    """Cosine similarity from a store's distance score (unit-length embeddings)."""
+    space = getattr(vectorstore, "distance_space", None) or "l2"   # flat_store reports its own
+    collection = getattr(vectorstore, "_collection", None)
+    if collection is not None:
+        config = getattr(collection, "configuration", None) or {}
+        space = ((config.get("hnsw") or {}).get("space") or (config.get("spann") or {}).get("space") or "l2")
+    # Chroma: l2 is the squared distance (= 2 - 2cos); cosine and ip are 1 - similarity
+    return 1.0 - distance / 2.0 if space == "l2" else 1.0 - distance
+
+def top_similarity(vectorstore, question: str) -> Optional[float]:
+    """Cosine similarity of the question's best vector hit (unit-length embeddings), or None."""
+    try:
+        hits = vectorstore.similarity_search_with_score(question, k=1)
+    except Exception as e:
+        logger.debug(f"Similarity pre-check failed: {e}")
+        return None
+    if not hits:
+        return None
+    return cosine_from_distance(vectorstore, hits[0][1])
+
+@dataclass
+class ReformulationStats:
+    questions: int = 0
+    reformulated: int = 0
+    reformulation_s: float = 0.0
+    skipped: Counter = field(default_factory=Counter)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def skipped_total(self) -> int:
+        return sum(self.skipped.values())
+
+    @property
+    def skip_rate(self) -> float:
+        return self.skipped_total / self.questions if self.questions else 0.0
+
+    @property
+    def mean_reformulation_s(self) -> float:
+        return self.reformulation_s / self.reformulated if self.reformulated else 0.0
+
+    @property
+    def saved_s(self) -> float:
+        """Estimated latency saved: skipped calls x mean duration of the calls that ran."""
+        return self.skipped_total * self.mean_reformulation_s
+
+    def record_skip(self, reason: str) -> None:
+        with self._lock:
+            self.questions += 1
+            self.skipped[reason] += 1
+
+    def record_reformulation(self, seconds: float) -> None:
+        with self._lock:
+            self.questions += 1
+            self.reformulated += 1
+            self.reformulation_s += seconds
+
+    def summary(self) -> str:
+        reasons = ", ".join(f"{k} {v}" for k, v in sorted(self.skipped.items())) or "none"
+        return (f"reformulation skipped {self.skipped_total}/{self.questions} ({self.skip_rate:.0%}; {reasons}), "
+                f"mean rewrite {self.mean_reformulation_s:.2f}s, est. saved {self.saved_s:.1f}s")
+
+# Process-wide counters for the agent (tamara_graph logs the summary)
+REFORMULATION_STATS = ReformulationStats()
+
+def create_conditional_history_aware_retriever(llm, retriever, prompt, vectorstore=None,
+                                               min_similarity: Optional[float] = None,
+                                               stats: Optional[ReformulationStats] = None) -> Runnable:
+    """Like ``create_history_aware_retriever``, but only calls the LLM when the pre-check fails.
+
+    Args:
+        llm: Chat model used to rewrite the question
+        retriever: Retriever (or runnable) taking the question string
+        prompt: Contextualization prompt with ``input`` and ``chat_history`` variables
+        vectorstore: Store for the similarity pre-check (skipped when None)
+        min_similarity: Cosine threshold for the ``confident`` skip (default RAG_REFORMULATE_MIN_SIM or 0.65)
+        stats: Where decisions are counted (default: REFORMULATION_STATS)
+
+    Returns:
+        Runnable mapping {"input", "chat_history"} to retrieved documents.
+    """
+    if "input" not in prompt.input_variables:
+        raise ValueError(f"Expected `input` to be a prompt variable, but got {prompt.input_variables}")
+    if min_similarity is None:
+        min_similarity = float(os.getenv("RAG_REFORMULATE_MIN_SIM", DEFAULT_MIN_SIMILARITY))
+    stats = stats if stats is not None else REFORMULATION_STATS
+    rewrite = prompt | llm | StrOutputParser()
+
+    def _decide(inputs: Dict[str, Any]) -> Tuple[Optional[str], str]:
+        question = inputs["input"]
+        if not inputs.get("chat_history"):
+            return "empty_history", question
+        reason = reference_reason(question)
+        if reason is None:
+            return "self_contained", question
+        if vectorstore is not None:
+            similarity = top_similarity(vectorstore, question)
+            if similarity is not None and similarity >= min_similarity:
+                return "confident", question
+        return None, reason
+
+    def _retrieve(inputs: Dict[str, Any], config=None) -> List[Any]:
+        skip, detail = _decide(inputs)
+        if skip is not None:
+            stats.record_skip(skip)
+            logger.info(f"Question reformulation skipped ({skip}); {stats.summary()}")
+            return retriever.invoke(detail, config=config)
+        start = time.perf_counter()
+        question = rewrite.invoke(inputs, config=config)
+        stats.record_reformulation(time.perf_counter() - start)
+        logger.info(f"Question reformulated ({detail}) in {time.perf_counter() - start:.2f}s: {question!r}")
+        return retriever.invoke(question, config=config)
+
+    return RunnableLambda(_retrieve).with_config(run_name="chat_retriever_chain")
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+retrieval.py — Hybrid BM25 + vector retrieval for the TAMARA knowledge base
+
+Pure cosine similarity misses exact-term queries (part numbers, "FRR", chip names,
+PLC state names). ``BM25Index`` is an in-process inverted index over the same chunks
+as the vector store; it is maintained by kb_ingest during ingestion and persisted
+beside the manifest (``kb_bm25.json``). ``HybridRetriever`` runs both searches and
+merges them with reciprocal-rank fusion (RRF), so a small ``k`` still surfaces
+chunks that only one of the two methods ranks highly.
+
+Environment (see tamara_graph.build_rag_chain):
+  KB_RETRIEVER  - hybrid (default) | vector
+  KB_TOP_K      - fused chunks passed to the LLM (default 6; was 15 with vector-only)
+  KB_FILTER     - 0 disables metadata filters inferred from the question (default 1)
+"""
+
+from __future__ import annotations
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from chunk_metadata import matches
+
+BM25_NAME = "kb_bm25.json"
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60            # standard RRF damping constant
+DEFAULT_TOP_K = 6
+DEFAULT_FETCH_K = 20  # candidates taken from each ranker before fusion
+
+# Compound identifiers (FB_2a, DB9.DBX258.2, TAM-0042, 0.8-15) are kept whole and also split
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+_PART_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or that the this to was what when where which "
+    "with do does i can should my we you".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound identifiers contribute the whole token and its parts."""
+    tokens: List[str] = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        parts = _PART_RE.findall(tok)
+        if len(parts) > 1:
+            tokens.append(tok)
+        tokens.extend(p for p in parts if p not in STOPWORDS)
+    return tokens
+
+# ----------------------------------------------------------------------------
+# BM25
+# ----------------------------------------------------------------------------
+
+class BM25Index:
+    """Okapi BM25 over chunk ids, with incremental add/remove and JSON persistence."""
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B) -> None:
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}     # term → {chunk_id: tf}
+        self.lengths: Dict[str, int] = {}                 # chunk_id → token count
+        self.docs: Dict[str, Tuple[str, Dict[str, Any]]] = {}   # chunk_id → (text, metadata)
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self.lengths
+
+    def add(self, chunk_id: str, text: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+        if chunk_id in self.lengths:
+            self.remove(chunk_id)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+        length = sum(counts.values())
+        self.lengths[chunk_id] = length
+        self._total_len += length
+        self.docs[chunk_id] = (text, dict(metadata or {}))
+
+    def add_documents(self, ids: Sequence[str], docs: Sequence[Document]) -> None:
+        for chunk_id, doc in zip(ids, docs):
+            self.add(chunk_id, doc.page_content, doc.metadata)
+
+    def remove(self, chunk_id: str) -> None:
+        if chunk_id not in self.lengths:
+            return
+        text, _meta = self.docs.pop(chunk_id)
+        for term in set(tokenize(text)):
+            bucket = self.postings.get(term)
+            if bucket is not None:
+                bucket.pop(chunk_id, None)
+                if not bucket:
+                    del self.postings[term]
+        self._total_len -= self.lengths.pop(chunk_id)
+
+    def search(self, query: str, k: int = DEFAULT_FETCH_K,
+               where: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """Top ``k`` (chunk_id, score) by BM25; chunks sharing no term, or not matching the
+        Chroma-style ``where`` metadata filter, are not returned."""
+        n = len(self.lengths)
+        if not n:
+            return []
+        avg_len = self._total_len / n
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            bucket = self.postings.get(term)
+            if not bucket:
+                continue
+            idf = math.log(1 + (n - len(bucket) + 0.5) / (len(bucket) + 0.5))
+            for chunk_id, tf in bucket.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / avg_len)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        if where:
+            scores = {cid: score for cid, score in scores.items() if matches(self.docs[cid][1], where)}
+        return sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+
+    def document(self, chunk_id: str) -> Document:
+        text, metadata = self.docs[chunk_id]
+        return Document(page_content=text, metadata=dict(metadata), id=chunk_id)
+
+    # ---- persistence ----------------------------------------------------------------
+    def save(self, path: str) -> None:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": self.docs}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        """Index from ``path`` (postings are rebuilt from the stored chunks), or None if unreadable."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        index = cls(k1=data.get("k1", BM25_K1), b=data.get("b", BM25_B))
+        for chunk_id, (text, metadata) in data.get("docs", {}).items():
+            index.add(chunk_id, text, metadata)
+        return index
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "BM25Index":
+        """Backfill from the chunks already stored in a Chroma collection (no embedding calls)."""
+        data = vectorstore.get(include=["documents", "metadatas"])
+        index = cls()
+        for chunk_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"]):
+            index.add(chunk_id, text or "", metadata or {})
+        return index
+
+def bm25_path(persist_directory: str) -> str:
+    return os.path.join(persist_directory, BM25_NAME)
+
+# ----------------------------------------------------------------------------
+# Fusion
+# ----------------------------------------------------------------------------
+
+def rrf_fuse(rankings: Sequence[Sequence[str]], k: int = RRF_K,
+             weights: Optional[Sequence[float]] = None) -> List[Tuple[str, float]]:
+    """Reciprocal-rank fusion: score(id) = Σ w_i / (k + rank_i(id)), ranks starting at 1."""
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[str, float] = {}
+    for ranking, w in zip(rankings, weights):
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + w / (k + rank)
+    return sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
+
+class HybridRetriever(BaseRetriever):
+    """Vector similarity + BM25, fused with RRF; returns the top ``k`` chunks.
+
+    With ``infer_filter`` (chunk_metadata.infer_filter) both searches run over the chunks
+    matching the question's metadata filter; when fewer than ``min_filtered`` of those
+    are found, unfiltered results fill the remaining places.
+    """
+
+    vectorstore: Any
+    bm25: Any
+    k: int = DEFAULT_TOP_K
+    fetch_k: int = DEFAULT_FETCH_K
+    rrf_k: int = RRF_K
+    infer_filter: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None
+    min_filtered: int = 3
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: Optional[CallbackManagerForRetrieverRun] = None) -> List[Document]:
+        where = self.infer_filter(query) if self.infer_filter is not None else None
+        if not where:
+            return self._search(query)
+        results = self._search(query, where)
+        if len(results) < min(self.min_filtered, self.k):
+            seen = {doc.id for doc in results}
+            results += [doc for doc in self._search(query) if doc.id not in seen][:self.k - len(results)]
+        return results
+
+    def _search(self, query: str, where: Optional[Dict[str, Any]] = None) -> List[Document]:
+        if where:
+            vector_docs = self.vectorstore.similarity_search(query, k=self.fetch_k, filter=where)
+        else:
+            vector_docs = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        by_id: Dict[str, Document] = {}
+        vector_ranking: List[str] = []
+        for doc in vector_docs:
+            doc_id = doc.id or f"vec:{len(vector_ranking)}"
+            by_id.setdefault(doc_id, doc)
+            vector_ranking.append(doc_id)
+        bm25_ranking = [chunk_id for chunk_id, _score in self.bm25.search(query, k=self.fetch_k, where=where)]
+
+        results = []
+        for doc_id, score in rrf_fuse([vector_ranking, bm25_ranking], k=self.rrf_k)[:self.k]:
+            doc = by_id.get(doc_id) or self.bm25.document(doc_id)
+            doc.metadata = {**doc.metadata, "rrf_score": round(score, 6)}
+            results.append(doc)
+        return results
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+retrieval_bench.py — Retrieval quality and latency benchmark against a golden set
+
+rag_build.KnowledgeBaseIndexer.smoke_test prints the results of two queries, which
+says nothing about whether a chunking, k, reranking or backend change helped. This
+harness builds the KB index in a scratch directory and scores retrievers against a
+versioned golden set (``golden/retrieval_golden.json``: TAMARA questions → the source
+file, section heading and/or text of the chunks that answer them):
+
+- recall@k — share of a question's targets found in the first k chunks (averaged)
+- MRR      — mean reciprocal rank of the first relevant chunk (0 when none)
+- p50/p95  — retrieval latency per question (warm, after one untimed query)
+- index    — chunks, bytes on disk and ingest (split + embed + upsert) time
+
+It runs offline by default: the deterministic HashingEmbeddings (EMBEDDING_PROVIDER=
+hashing) make numbers reproducible run to run; ``--embedder env`` uses the configured
+backend instead. Retrievers:
+
+  vector      similarity search (the pre-hybrid chain)
+  hybrid      BM25 + vector fused with RRF (retrieval.py)
+  filtered    hybrid with the metadata filter inferred from the question (chunk_metadata.py)
+  compressed  hybrid candidates reranked and trimmed (context_compression.py), as the agent runs
+
+Prefer ``contains`` targets for facts that appear in several files. ``section`` targets
+match the heading recorded by table_chunker, or for splitters that record none (``--chunking
+recursive``) the markdown headings inside the chunk.
+
+Run:
+  $ python retrieval_bench.py                                   # every retriever, chroma + flat
+  $ python retrieval_bench.py --retriever hybrid --k 4 6 10 --backend flat
+  $ python retrieval_bench.py --chunking recursive --json results.json
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import logging
+import math
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_GOLDEN = os.path.join(HERE, "golden", "retrieval_golden.json")
+RETRIEVERS = ("vector", "hybrid", "filtered", "compressed")
+CHUNKINGS = ("table", "recursive")
+DEFAULT_KS = (1, 3, 6)
+
+# ----------------------------------------------------------------------------
+# Golden set & metrics
+# ----------------------------------------------------------------------------
+
+@dataclass
+class GoldenQuestion:
+    id: str
+    question: str
+    targets: List[Dict[str, str]]   # {"source"?, "section"?, "contains"?}
+
+def load_golden(path: str = DEFAULT_GOLDEN) -> tuple:
+    """(version, questions) of a golden-set file; malformed entries raise ValueError."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    questions = []
+    for item in data["questions"]:
+        targets = item.get("targets") or []
+        if not targets or any(not set(t) or set(t) - {"source", "section", "contains"} for t in targets):
+            raise ValueError(f"{path}: question {item.get('id')!r} needs targets with source/section/contains")
+        questions.append(GoldenQuestion(item["id"], item["question"], targets))
+    if len({q.id for q in questions}) != len(questions):
+        raise ValueError(f"{path}: duplicate question ids")
+    return data["version"], questions
+
+def _headings(doc: Document) -> str:
+    """Section metadata, or the chunk's own markdown heading lines for splitters that record none."""
+    section = doc.metadata.get("section")
+    if section:
+        return str(section)
+    return "\n".join(line for line in doc.page_content.splitlines() if line.lstrip().startswith("#"))
+
+def matches_target(doc: Document, target: Dict[str, str]) -> bool:
+    """Every field given in ``target`` matches the chunk (source by file name, others as substrings)."""
+    source = str(doc.metadata.get("source", "")).replace("\\", "/").rsplit("/", 1)[-1]
+    if "source" in target and source != target["source"]:
+        return False
+    if "section" in target and target["section"].lower() not in _headings(doc).lower():
+        return False
+    if "contains" in target and target["contains"].lower() not in doc.page_content.lower():
+        return False
+    return True
+
+def recall_at_k(docs: Sequence[Document], targets: Sequence[Dict[str, str]], k: int) -> float:
+    top = docs[:k]
+    return sum(any(matches_target(d, t) for d in top) for t in targets) / len(targets)
+
+def reciprocal_rank(docs: Sequence[Document], targets: Sequence[Dict[str, str]]) -> float:
+    for rank, doc in enumerate(docs, 1):
+        if any(matches_target(doc, t) for t in targets):
+            return 1.0 / rank
+    return 0.0
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+# ----------------------------------------------------------------------------
+# Index & retrievers
+# ----------------------------------------------------------------------------
+
+@dataclass
+class IndexInfo:
+    backend: str
+    chunking: str
+    chunks: int
+    index_bytes: int
+    ingest_s: float
+
+@dataclass
+class BenchResult:
+    retriever: str
+    backend: str
+    chunking: str
+    k: int
+    recall: Dict[str, float] = field(default_factory=dict)   # "recall@k" → value
+    mrr: float = 0.0
+    p50_ms: float = 0.0
+    p95_ms: float = 0.0
+    misses: List[str] = field(default_factory=list)          # question ids with nothing relevant in the top k
+
+def _splitter(chunking: str):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from kb_ingest import CHUNK_OVERLAP, CHUNK_SIZE, default_splitter
+
+    if chunking == "table":
+        return default_splitter()
+    if chunking == "recursive":
+        return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    raise ValueError(f"Unknown chunking {chunking!r} (expected one of {', '.join(CHUNKINGS)})")
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _dirs, files in os.walk(path) for name in files)
+
+def build_index(kb_dir: str, persist_directory: str, embeddings, backend: str = "flat", chunking: str = "table"):
+    """Sync ``kb_dir`` into a fresh index; returns (vectorstore, IndexInfo)."""
+    from flat_store import bulk_writes, open_vectorstore
+    from kb_ingest import sync_knowledge_base
+
+    os.makedirs(persist_directory, exist_ok=True)
+    store = open_vectorstore(persist_directory, embeddings, backend)
+    start = time.perf_counter()
+    with bulk_writes(store):
+        report = sync_knowledge_base(store, kb_dir, persist_directory, splitter=_splitter(chunking))
+    ingest_s = time.perf_counter() - start
+    return store, IndexInfo(backend, chunking, report.chunks_added, _dir_bytes(persist_directory), ingest_s)
+
+def make_retriever(kind: str, vectorstore, persist_directory: str, k: int, fetch_k: Optional[int] = None):
+    """One of RETRIEVERS over ``vectorstore`` returning at most ``k`` chunks."""
+    from chunk_metadata import infer_filter
+    from context_compression import DEFAULT_FETCH_K, CompressingRetriever, get_reranker
+    from retrieval import BM25Index, HybridRetriever, bm25_path
+
+    if kind == "vector":
+        return vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": k})
+    if kind not in RETRIEVERS:
+        raise ValueError(f"Unknown retriever {kind!r} (expected one of {', '.join(RETRIEVERS)})")
+    bm25 = BM25Index.load(bm25_path(persist_directory)) or BM25Index.from_vectorstore(vectorstore)
+    if kind == "hybrid":
+        return HybridRetriever(vectorstore=vectorstore, bm25=bm25, k=k)
+    if kind == "filtered":
+        return HybridRetriever(vectorstore=vectorstore, bm25=bm25, k=k, infer_filter=infer_filter)
+    base = HybridRetriever(vectorstore=vectorstore, bm25=bm25, k=max(k, fetch_k or DEFAULT_FETCH_K),
+                           infer_filter=infer_filter)
+    return CompressingRetriever(base=base, reranker=get_reranker(bm25, "lexical"), max_docs=k)
+
+def evaluate(retriever, questions: Sequence[GoldenQuestion], ks: Sequence[int] = DEFAULT_KS) -> Dict[str, Any]:
+    """recall@k for each k, MRR, latency percentiles and the ids of missed questions."""
+    retriever.invoke(questions[0].question)   # warm caches (BM25 load, first embedding)
+    recalls = {k: [] for k in ks}
+    rrs, latencies, misses = [], [], []
+    for q in questions:
+        start = time.perf_counter()
+        docs = retriever.invoke(q.question)
+        latencies.append(time.perf_counter() - start)
+        for k in ks:
+            recalls[k].append(recall_at_k(docs, q.targets, k))
+        rr = reciprocal_rank(docs, q.targets)
+        rrs.append(rr)
+        if rr == 0.0:
+            misses.append(q.id)
+    return {
+        "recall": {f"recall@{k}": statistics.fmean(v) for k, v in recalls.items()},
+        "mrr": statistics.fmean(rrs),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "misses": misses,
+    }
+
+# ----------------------------------------------------------------------------
+# Benchmark
+# ----------------------------------------------------------------------------
+
+def run_benchmark(kb_dir: str, questions: Sequence[GoldenQuestion], work_dir: str, embeddings,
+                  backends: Sequence[str] = ("chroma", "flat"), retrievers: Sequence[str] = RETRIEVERS,
+                  chunkings: Sequence[str] = ("table",), k_values: Sequence[int] = (6,),
+                  ks: Sequence[int] = DEFAULT_KS) -> tuple:
+    """Build one index per (backend, chunking) and evaluate every retriever at every k on it.
+
+    Returns:
+        (list of IndexInfo, list of BenchResult)
+    """
+    indexes, results = [], []
+    for chunking in chunkings:
+        for backend in backends:
+            persist = os.path.join(work_dir, f"{backend}-{chunking}")
+            store, info = build_index(kb_dir, persist, embeddings, backend, chunking)
+            indexes.append(info)
+            for k in k_values:
+                cutoffs = sorted({x for x in ks if x <= k} | {k})
+                for kind in retrievers:
+                    scores = evaluate(make_retriever(kind, store, persist, k), questions, cutoffs)
+                    results.append(BenchResult(kind, backend, chunking, k, **scores))
+    return indexes, results
+
+def _embeddings(kind: str):
+    from providers import get_embeddings
+    return get_embeddings("hashing" if kind == "hashing" else None)
+
+def main() -> None:
+    from embed_pipeline import close_embeddings
+
+    parser = argparse.ArgumentParser(description="Retrieval recall@k / MRR / latency against the golden set")
+    parser.add_argument("--kb-dir", default=os.path.join(HERE, "Knowledge_base/txt"))
+    parser.add_argument("--golden", default=DEFAULT_GOLDEN)
+    parser.add_argument("--backend", nargs="+", default=["chroma", "flat"], choices=["chroma", "flat"])
+    parser.add_argument("--retriever", nargs="+", default=list(RETRIEVERS), choices=RETRIEVERS)
+    parser.add_argument("--chunking", nargs="+", default=["table"], choices=CHUNKINGS)
+    parser.add_argument("--k", nargs="+", type=int, default=[6], help="chunks returned (one run per value)")
+    parser.add_argument("--embedder", default="hashing", choices=["hashing", "env"],
+                        help="hashing: deterministic and offline (default); env: EMBEDDING_PROVIDER")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--keep", help="build the indexes here and keep them (default: temporary directory)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if args.embedder == "env":
+        from dotenv import load_dotenv
+        load_dotenv()
+
+    version, questions = load_golden(args.golden)
+    embeddings = _embeddings(args.embedder)
+    work_dir = args.keep or tempfile.mkdtemp(prefix="retrieval_bench_")
+    try:
+        indexes, results = run_benchmark(args.kb_dir, questions, work_dir, embeddings, args.backend,
+                                         args.retriever, args.chunking, args.k)
+    finally:
+        close_embeddings(embeddings)
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"Golden set v{version}: {len(questions)} questions, embedder {getattr(embeddings, 'model', args.embedder)}")
+    print(f"{'index':<16} {'chunks':>7} {'size KB':>9} {'ingest s':>9}")
+    for info in indexes:
+        print(f"{info.backend + '/' + info.chunking:<16} {info.chunks:>7} {info.index_bytes / 1024:>9.0f} {info.ingest_s:>9.2f}")
+    recall_keys = sorted({key for r in results for key in r.recall}, key=lambda s: int(s.split("@")[1]))
+    print(f"\n{'retriever':<11} {'index':<16} {'k':>3} " + " ".join(f"{key:>9}" for key in recall_keys)
+          + f" {'MRR':>6} {'p50 ms':>7} {'p95 ms':>7}")
+    for r in results:
+        print(f"{r.retriever:<11} {r.backend + '/' + r.chunking:<16} {r.k:>3} "
+              + " ".join(f"{r.recall[key]:>9.3f}" if key in r.recall else f"{'':>9}" for key in recall_keys)
+              + f" {r.mrr:>6.3f} {r.p50_ms:>7.2f} {r.p95_ms:>7.2f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"golden_version": version, "questions": len(questions),
+                       "indexes": [asdict(i) for i in indexes], "results": [asdict(r) for r in results]}, f, indent=1)
+
+if __name__ == "__main__":
+    main()
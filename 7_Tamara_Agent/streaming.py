@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+streaming.py — Token streaming of RAG answers through the agent graph
+
+``app.invoke`` returns only after the whole answer has been generated, so the REPL
+showed nothing for several seconds per knowledge question. ``stream_turn`` runs one
+graph turn with ``app.stream(stream_mode=["messages", "values"])`` instead:
+
+- "messages" yields LLM token chunks from inside the nodes; only chunks from runs tagged
+  ``ANSWER_TAG`` (the QA model in tamara_graph.build_rag_chain) are passed to
+  ``on_token``, so the router / history-reformulation calls never leak into the output
+- "values" yields the graph state; the last one is the turn's result, as with ``invoke``
+
+Chat models stream automatically under the "messages" handler, so ``answer_with_rag``
+keeps calling ``chain.invoke``. Each turn returns a ``TurnTiming`` with the time to first
+token (measured from the start of the turn: routing + retrieval + first LLM token).
+
+Environment (see tamara_graph.repl):
+  RAG_STREAM - 0 prints answers only once complete (default 1)
+"""
+
+from __future__ import annotations
+import statistics
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any, Callable, List, Optional, Tuple
+
+ANSWER_TAG = "rag_answer"
+
+@dataclass
+class TurnTiming:
+    ttft_s: Optional[float] = None   # None when no answer tokens were streamed (cache hit, PLC command)
+    total_s: float = 0.0
+    chunks: int = 0
+    text: str = ""                   # streamed answer text
+
+    @property
+    def streamed(self) -> bool:
+        return self.ttft_s is not None
+
+def _chunk_text(chunk: Any) -> str:
+    content = getattr(chunk, "content", "")
+    if isinstance(content, str):
+        return content
+    # content blocks (e.g. [{"type": "text", "text": ...}])
+    return "".join(b.get("text", "") for b in content if isinstance(b, dict))
+
+def stream_turn(app, state, on_token: Callable[[str], None], tag: str = ANSWER_TAG,
+                config: Optional[dict] = None) -> Tuple[Any, TurnTiming]:
+    """Run one graph turn, passing answer tokens to ``on_token`` as they arrive.
+
+    Args:
+        app: Compiled LangGraph graph
+        state: Input state (as for ``app.invoke``)
+        on_token: Called with each non-empty answer token
+        tag: Run tag identifying the answer model
+        config: Optional runnable config
+
+    Returns:
+        (final state, TurnTiming)
+    """
+    timing = TurnTiming()
+    parts: List[str] = []
+    final = state
+    start = perf_counter()
+    for mode, payload in app.stream(state, config=config, stream_mode=["messages", "values"]):
+        if mode == "values":
+            final = payload
+            continue
+        chunk, metadata = payload
+        if tag not in (metadata.get("tags") or ()):
+            continue
+        text = _chunk_text(chunk)
+        if not text:
+            continue
+        if timing.ttft_s is None:
+            timing.ttft_s = perf_counter() - start
+        timing.chunks += 1
+        parts.append(text)
+        on_token(text)
+    timing.total_s = perf_counter() - start
+    timing.text = "".join(parts)
+    return final, timing
+
+def token_printer(prefix: str = "") -> Callable[[str], None]:
+    """``on_token`` callback printing tokens unbuffered, after ``prefix`` on the first one."""
+    started = False
+
+    def _print(token: str) -> None:
+        nonlocal started
+        if not started:
+            print(prefix, end="")
+            started = True
+        print(token, end="", flush=True)
+    return _print
+
+@dataclass
+class LatencyStats:
+    """Per-session time-to-first-token / total answer time of streamed answers."""
+    ttft_s: List[float] = field(default_factory=list)
+    total_s: List[float] = field(default_factory=list)
+
+    def record(self, timing: TurnTiming) -> None:
+        if timing.streamed:
+            self.ttft_s.append(timing.ttft_s)
+            self.total_s.append(timing.total_s)
+
+    def summary(self) -> str:
+        if not self.ttft_s:
+            return "streamed answers 0"
+        return (f"streamed answers {len(self.ttft_s)}, median first token {statistics.median(self.ttft_s):.2f}s, "
+                f"median complete {statistics.median(self.total_s):.2f}s")
+
+STREAM_STATS = LatencyStats()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+table_chunker.py — Structure-aware splitting for the Docling-style KB exports
+
+Most knowledge-base files (``*.tables.md`` / ``*.tables.txt``, ``User_Manual_TAMARA.txt``)
+are Docling exports: ``##`` headings, prose, and wide markdown tables whose cells are
+padded with hundreds of spaces (and dot leaders in the table of contents).
+``RecursiveCharacterTextSplitter(500, 50)`` cuts those tables mid-row, so most chunks
+are whitespace. ``TableAwareSplitter``:
+
+- collapses cell padding, dot leaders and the repeated cells Docling emits for merged cells
+  (columns repeated in every row, rows that are one spanned value; equal values in
+  distinct columns are kept)
+- keeps every table row together with the table's header row
+- packs content by heading section, repeating the heading when a section spans chunks
+  (the heading is also stored as ``section`` metadata)
+- falls back to the recursive splitter for plain text and oversized paragraphs
+
+kb_ingest uses it as the default splitter; the manifest records the splitter id, so a
+change of splitter re-splits every file (only chunks whose text changed are re-embedded).
+
+Run:
+  $ python table_chunker.py                 # chunk/token report vs RecursiveCharacterTextSplitter(500, 50)
+  $ python table_chunker.py --kb-dir DIR --chunk-size 800
+"""
+
+from __future__ import annotations
+import argparse
+import html
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.documents import Document
+
+DEFAULT_CHUNK_SIZE = 800   # characters; after padding is collapsed 800 chars hold ~4 table rows
+STRUCTURED_SUFFIXES = (".tables.md", ".tables.txt")
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_SEPARATOR_CELL_RE = re.compile(r"^:?-{2,}:?$")
+_TABLE_SEPARATOR_LINE_RE = re.compile(r"^\|\s*:?-{3,}")
+_DOT_LEADER_RE = re.compile(r"(?:\s*\.){4,}\s*")
+_SPACE_RE = re.compile(r"[ \t]+")
+
+def is_structured(source: str, text: str) -> bool:
+    """Docling-style export: a ``*.tables.*`` file, or any text containing a markdown table."""
+    if source.lower().endswith(STRUCTURED_SUFFIXES):
+        return True
+    return any(_TABLE_SEPARATOR_LINE_RE.match(line) for line in text.splitlines())
+
+# ----------------------------------------------------------------------------
+# Parsing
+# ----------------------------------------------------------------------------
+
+def _clean(text: str) -> str:
+    return _SPACE_RE.sub(" ", _DOT_LEADER_RE.sub(" … ", html.unescape(text))).strip()
+
+def _cells(line: str) -> List[str]:
+    body = line.strip()
+    body = body[1:] if body.startswith("|") else body
+    body = body[:-1] if body.endswith("|") else body
+    return [_clean(c) for c in body.split("|")]
+
+def _span_columns(rows: Sequence[List[str]]) -> Set[int]:
+    """Columns repeating their left neighbour in every row that has them (at least two rows):
+    Docling's cells merged across the table. One row alone cannot tell a span from equal values."""
+    width = max((len(r) for r in rows), default=0)
+    spans = set()
+    for j in range(1, width):
+        having = [r for r in rows if j < len(r)]
+        if len(having) >= 2 and all(r[j] == r[j - 1] for r in having):
+            spans.add(j)
+    return spans
+
+def _dedupe_cells(cells: List[str], span_columns: Set[int] = frozenset()) -> List[str]:
+    """Drop merged-cell repeats and trailing empty cells.
+
+    Equal neighbours are only merged cells when the whole column repeats (``span_columns``)
+    or the whole row is one spanned value; "| Max TFR | 15 | 15 |" keeps its columns.
+    """
+    out = [c for j, c in enumerate(cells) if j not in span_columns]
+    if len(out) > 1 and out[0] and all(c == out[0] for c in out):
+        out = out[:1]
+    while len(out) > 1 and not out[-1]:
+        out.pop()
+    return out
+
+def _row(cells: Sequence[str]) -> str:
+    return "| " + " | ".join(cells) + " |"
+
+@dataclass
+class Table:
+    header: Optional[str]   # rendered header + separator lines, or None
+    rows: List[str]
+
+def parse_table(lines: Sequence[str]) -> Table:
+    """Compact a markdown table; the row above the ``|---|`` separator becomes the header."""
+    parsed: List[List[str]] = []
+    header_index = None
+    for line in lines:
+        cells = _cells(line)
+        if cells and all(_SEPARATOR_CELL_RE.match(c) for c in cells if c):
+            if header_index is None and len(parsed) == 1:
+                header_index = 0
+            continue
+        parsed.append(cells)
+    spans = _span_columns(parsed)
+    header = None
+    rows: List[str] = []
+    for i, cells in enumerate(parsed):
+        cells = _dedupe_cells(cells, spans)
+        if i == header_index:
+            header = _row(cells) + "\n" + _row(["---"] * len(cells))
+        elif any(cells):
+            rows.append(_row(cells))
+    return Table(header, rows)
+
+def sections(text: str) -> List[Tuple[str, List[object]]]:
+    """Split into (heading path, blocks); blocks are paragraph strings or ``Table``s."""
+    out: List[Tuple[str, List[object]]] = [("", [])]
+    stack: List[Tuple[int, str]] = []
+    para: List[str] = []
+    table: List[str] = []
+
+    def close() -> None:
+        if para:
+            out[-1][1].append(" ".join(para))
+            para.clear()
+        if table:
+            out[-1][1].append(parse_table(table))
+            table.clear()
+
+    for raw in text.splitlines():
+        line = raw.strip()
+        heading = _HEADING_RE.match(line)
+        if heading:
+            close()
+            level, title = len(heading.group(1)), _clean(heading.group(2))
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            stack.append((level, title))
+            out.append((" > ".join(t for _l, t in stack if t), []))
+        elif line.startswith("|"):
+            if para:
+                close()
+            table.append(line)
+        elif not line or line == "<!-- image -->":
+            close()
+        else:
+            if table:
+                close()
+            para.append(_clean(line))
+    close()
+    return [(path, blocks) for path, blocks in out if path or blocks]
+
+# ----------------------------------------------------------------------------
+# Splitter
+# ----------------------------------------------------------------------------
+
+class TableAwareSplitter:
+    """``split_documents``-compatible splitter that respects headings and table rows."""
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE, fallback=None) -> None:
+        """
+        Args:
+            chunk_size: Target maximum characters per chunk (a single table row can exceed it)
+            fallback: Splitter for unstructured files and oversized paragraphs
+                      (default: RecursiveCharacterTextSplitter 500/50, as before)
+        """
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        self.chunk_size = chunk_size
+        self.fallback = fallback or RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+        self._paragraphs = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
+
+    @property
+    def splitter_id(self) -> str:
+        """Recorded in the KB manifest; changing it re-splits every file."""
+        return f"tables-v1/{self.chunk_size}/{splitter_id(self.fallback)}"
+
+    def _pieces(self, block: object, budget: int) -> List[str]:
+        if isinstance(block, str):
+            return [block] if len(block) <= budget else self._paragraphs.split_text(block)
+        header, rows = block.header, block.rows
+        pieces: List[str] = []
+        current: List[str] = [header] if header else []
+        for row in rows:
+            if len(current) > bool(header) and len("\n".join(current + [row])) > budget:
+                pieces.append("\n".join(current))
+                current = [header] if header else []
+            current.append(row)
+        if len(current) > bool(header) or (header and not rows):
+            pieces.append("\n".join(current))
+        return pieces
+
+    def split_sections(self, text: str) -> List[Tuple[str, str]]:
+        """(section, chunk text) pairs for a structured document."""
+        chunks: List[Tuple[str, str]] = []
+        buf: List[str] = []
+        buf_section = ""
+
+        def flush() -> None:
+            if buf:
+                chunks.append((buf_section, "\n\n".join(buf)))
+                buf.clear()
+
+        for path, blocks in sections(text):
+            title = f"## {path}" if path else ""
+            budget = max(1, self.chunk_size - len(title) - 2)
+            pieces = [title] if title else []
+            for block in blocks:
+                pieces.extend(self._pieces(block, budget))
+            for i, piece in enumerate(pieces):
+                if buf and len("\n\n".join(buf + [piece])) > self.chunk_size:
+                    flush()
+                if not buf:
+                    buf_section = path
+                    if title and i > 0:   # section continues in a new chunk: repeat its heading
+                        buf.append(title)
+                buf.append(piece)
+        flush()
+        return chunks
+
+    def split_text(self, text: str) -> List[str]:
+        return [chunk for _section, chunk in self.split_sections(text)]
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        out: List[Document] = []
+        for doc in documents:
+            if not is_structured(doc.metadata.get("source", ""), doc.page_content):
+                out.extend(self.fallback.split_documents([doc]))
+                continue
+            for section, chunk in self.split_sections(doc.page_content):
+                metadata = dict(doc.metadata)
+                if section:
+                    metadata["section"] = section
+                out.append(Document(page_content=chunk, metadata=metadata))
+        return out
+
+def splitter_id(splitter) -> str:
+    """Stable description of a splitter's configuration (for the KB manifest)."""
+    if hasattr(splitter, "splitter_id"):
+        return splitter.splitter_id
+    size, overlap = getattr(splitter, "_chunk_size", None), getattr(splitter, "_chunk_overlap", None)
+    return f"{type(splitter).__name__}/{size}/{overlap}"
+
+# ----------------------------------------------------------------------------
+# Report
+# ----------------------------------------------------------------------------
+
+def token_counter() -> Callable[[str], int]:
+    """cl100k token counter (tiktoken), or the chars/4 estimate when tiktoken is missing."""
+    try:
+        import tiktoken
+        enc = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(enc.encode(text, disallowed_special=()))
+    except Exception:
+        return lambda text: len(text) // 4
+
+def compare_splitters(kb_dir: str, splitters: Dict[str, object],
+                      extensions: Sequence[str] = (".txt", ".md")) -> Dict[str, Dict[str, float]]:
+    """Chunk count, characters and tokens each splitter produces over ``kb_dir``."""
+    count = token_counter()
+    exts = tuple(extensions)
+    files = [p for p in sorted(Path(kb_dir).rglob("*")) if p.is_file() and p.name.lower().endswith(exts)]
+    docs = [Document(page_content=p.read_text(encoding="utf-8", errors="ignore"),
+                     metadata={"source": p.relative_to(kb_dir).as_posix()}) for p in files]
+    results: Dict[str, Dict[str, float]] = {}
+    for name, splitter in splitters.items():
+        chunks = splitter.split_documents(docs)
+        results[name] = {"files": len(docs), "chunks": len(chunks),
+                         "chars": sum(len(c.page_content) for c in chunks),
+                         "tokens": sum(count(c.page_content) for c in chunks)}
+    return results
+
+def main() -> None:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Compare the table-aware splitter with the recursive 500/50 splitter")
+    parser.add_argument("--kb-dir", default=os.path.join(here, "Knowledge_base/txt"))
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    results = compare_splitters(args.kb_dir, {
+        "recursive 500/50": RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50),
+        f"table-aware {args.chunk_size}": TableAwareSplitter(chunk_size=args.chunk_size),
+    })
+    print(f"{'splitter':<20} {'files':>6} {'chunks':>8} {'chars':>10} {'tokens':>9}")
+    for name, r in results.items():
+        print(f"{name:<20} {r['files']:>6} {r['chunks']:>8} {r['chars']:>10} {r['tokens']:>9}")
+    base, new = list(results.values())
+    if base["chunks"] and base["tokens"]:
+        print(f"chunks -{1 - new['chunks'] / base['chunks']:.0%}, tokens -{1 - new['tokens'] / base['tokens']:.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -77,32 +77,68 @@ Run:
   $ python tamara_graph.py --log      # also saves ./logs/tamara_graph.log
 
 Environment hints:
-  OPENAI_API_KEY  - required for RAG/LLM. Without it, the agent still runs with a heuristic router
-                    and simple answers.
+  OPENAI_API_KEY  - required for RAG/LLM with the default OpenAI backends. Without it, the agent still
+                    runs with a heuristic router and simple answers.
+  EMBEDDING_PROVIDER / LLM_PROVIDER - openai (default), local, or hashing (embeddings only) for
+                    air-gapped use; see providers.py (LOCAL_EMBEDDING_*, LOCAL_LLM_*).
+  VECTOR_STORE    - chroma (default) or flat: memory-mapped NumPy index, no chromadb import at start-up
+                    (see flat_store.py)
   KB_CHROMA_DIR   - override Chroma persist dir (default: ./db/chroma_db_with_metadata_Knowledge_base)
-  KB_TXT_DIR      - directory of .txt/.md files to (re)ingest if no Chroma exists yet (default: ./Knowledge_base/txt)
+  KB_FLAT_DIR     - override the flat index dir (default: ./db/flat_db_Knowledge_base)
+  RAG_WEB         - 1 (default) also retrieves from the website crawl (./db/chroma_db_InsideTxWeb_firecrawl,
+                    or ./db/flat_db_InsideTxWeb with VECTOR_STORE=flat once built by web_crawl.py --store flat),
+                    in parallel with the KB; see federated.py (WEB_CHROMA_DIR, WEB_FLAT_DIR, WEB_QUOTA, WEB_WEIGHT,
+                    WEB_MIN_SIM, WEB_FULL_SIM); merged chunks share the KB_CONTEXT_TOKENS budget
+  KB_TXT_DIR      - directory of .txt/.md files kept in sync with Chroma at start-up; only changed
+                    chunks are re-embedded (default: ./Knowledge_base/txt)
+  KB_RETRIEVER    - hybrid (default: BM25 + vector fused with RRF, see retrieval.py) or vector
+  KB_TOP_K        - chunks passed to the LLM (default 6)
+  KB_FILTER       - 1 (default, hybrid only) restricts retrieval to chunks whose metadata matches the
+                    chips, solvents, modes or document types named in the question; see chunk_metadata.py
+  KB_COMPRESS     - 1 (default) reranks KB_FETCH_K (15) candidates, drops near-duplicates and weak
+                    matches and trims to KB_CONTEXT_TOKENS (1500); 0 passes the top KB_TOP_K through.
+                    See context_compression.py (KB_RELEVANCE_FLOOR, KB_MMR_LAMBDA, RERANKER)
+  RAG_REFORMULATE_MIN_SIM - cosine above which a question with pronouns is retrieved as-is,
+                    without the history-reformulation LLM call (default 0.65)
+  ANSWER_CACHE    - 0 disables the semantic answer cache (see answer_cache.py for ANSWER_CACHE_*)
+  RAG_HISTORY_TURNS - knowledge turns passed verbatim as chat history (default 4); older turns are
+                    folded into a running summary (RAG_HISTORY_SUMMARY=0 drops them), see history.py
+  ROUTER          - embedding (default: local nearest-example intent classifier with a clarification
+                    fallback, see intent_router.py) or keyword (previous substring rules)
+  RAG_PROMPT      - QA system prompt from ./Prompts by name (latest version) or file stem (default
+                    AdvancedPrompt_V0); edited prompt files are reloaded without a restart, see
+                    prompt_registry.py (PROMPT_RELOAD_INTERVAL)
+  RAG_STREAM      - 1 (default) prints RAG answers token by token and logs the time to first token;
+                    0 prints them once complete
+  RAG_WARMUP      - 1 (default) builds the RAG chain in a background thread at REPL start-up;
+                    0 builds it on the first knowledge question
   PLC_*           - same as in plc_tool.py (PLC_SIM=1 by default).
 
 """
 
 import os
+import json
+import shutil
 import time
 import argparse
 import logging
 import logging.handlers
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import TypedDict, List, Literal, Optional, Dict, Any, Tuple
 from pathlib import Path
 from dotenv import load_dotenv
 
 # LangChain / LangGraph minimal set
 try:
-    from langchain_chroma import Chroma  # Updated import for Chroma
     from langchain_openai import OpenAIEmbeddings, ChatOpenAI
     from langchain.text_splitter import RecursiveCharacterTextSplitter
     from langchain_core.documents import Document
+    from langchain_core.vectorstores import VectorStore
     from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
     from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-    from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+    from langchain.chains import create_retrieval_chain
     from langchain.chains.combine_documents import create_stuff_documents_chain
     from langgraph.graph import StateGraph, END
 except Exception as e:
@@ -118,6 +154,38 @@ try:
 except Exception:
     Image = None  # type: ignore
 
+# Vector store backend selected by VECTOR_STORE (Chroma, or the memory-mapped flat index)
+from flat_store import META_NAME as FLAT_META_NAME, bulk_writes, open_vectorstore, vector_store_backend
+# Incremental KB ingestion (manifest of content hashes beside the vector index)
+from kb_ingest import MANIFEST_NAME, sync_knowledge_base
+# Embedding / chat backends selected by EMBEDDING_PROVIDER / LLM_PROVIDER (openai, local, hashing)
+from providers import embedding_id, get_chat_model, get_embeddings, index_suffix
+# Hybrid BM25 + vector retrieval (BM25 index maintained by kb_ingest)
+from retrieval import DEFAULT_TOP_K, BM25Index, HybridRetriever, bm25_path
+# Chunk metadata (doc type, chip/solvent/mode entities) and the question-side filter
+from chunk_metadata import infer_filter
+# Post-retrieval rerank / MMR / relevance floor / token budget
+from context_compression import (
+    DEFAULT_FETCH_K, DEFAULT_MMR_LAMBDA, DEFAULT_RELEVANCE_FLOOR, DEFAULT_TOKEN_BUDGET,
+    CompressingRetriever, get_reranker,
+)
+# Parallel KB + website retrieval with score normalisation and per-source quotas
+from federated import (
+    DEFAULT_WEB_FULL_SIM, DEFAULT_WEB_MIN_SIM, DEFAULT_WEB_QUOTA, DEFAULT_WEB_WEIGHT, FederatedRetriever, Source,
+)
+# History-aware retrieval that skips the rewrite LLM call when it cannot help
+from reformulation import REFORMULATION_STATS, create_conditional_history_aware_retriever, reference_reason
+# Semantic cache of answers to repeated knowledge questions (cleared when the KB manifest changes)
+from answer_cache import SemanticAnswerCache
+# Token streaming of RAG answers through the graph (time to first token per question)
+from streaming import ANSWER_TAG, STREAM_STATS, stream_turn, token_printer
+# Bounded RAG chat history: last N knowledge turns + running summary of older ones
+from history import DEFAULT_MAX_TURNS, build_history, fold_turns, mark_rag, turns_to_fold
+# Local intent classification for the router (no LLM call, sub-millisecond)
+from intent_router import CLARIFY, IntentRouter, keyword_intent, names_intent
+# Prompt files by name/version, reloaded when edited
+from prompt_registry import DEFAULT_RAG_PROMPT, Prompt, PromptRegistry
+
 # Local PLC tool
 from plc_tool import (
     PLCInterface, InputPayload, CustomSolvent,
@@ -271,69 +339,243 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 def _persist_dir() -> str:
     # Try user's POC path first for compatibility; otherwise default to local ./db/..
+    # Non-default embedding backends get their own index (vectors of different models never mix),
+    # and so does each vector store backend (each has its own manifest)
+    if vector_store_backend() == "flat":
+        local_dir, override = os.path.join(SCRIPT_DIR, "db/flat_db_Knowledge_base" + index_suffix()), "KB_FLAT_DIR"
+    else:
+        local_dir, override = os.path.join(SCRIPT_DIR, "db/chroma_db_with_metadata_Knowledge_base" + index_suffix()), "KB_CHROMA_DIR"
     candidates = [
-        os.getenv("KB_CHROMA_DIR"),
-        os.path.join(SCRIPT_DIR, "db/chroma_db_with_metadata_Knowledge_base"),
+        os.getenv(override),
+        local_dir,
         # os.path.join(SCRIPT_DIR, "../6_Tamara_workflow/db/chroma_db_with_metadata_Knowledge_base"),
     ]
     for c in candidates:
         if c and os.path.isdir(c):
             return c
     # default to local
-    default_dir = os.path.join(SCRIPT_DIR, "db/chroma_db_with_metadata_Knowledge_base")
+    default_dir = local_dir
     os.makedirs(default_dir, exist_ok=True)
     return default_dir
 
+KB_SEED_ID = "seed"
+
 def _txt_dir() -> str:
     default_dir = os.path.join(SCRIPT_DIR, "Knowledge_base/txt")
     return os.getenv("KB_TXT_DIR", default_dir)
 
-def _ingest_if_needed(persist_directory: str, txt_dir: str) -> Chroma:
+def _ingest_if_needed(persist_directory: str, txt_dir: str) -> VectorStore:
     """
-    If a persist dir exists, open it. Otherwise, build from txt_dir.
-    Uses text-embedding-3-small, chunk_size=500, overlap=50.
+    Open the persist dir and incrementally sync it with txt_dir (see kb_ingest.py):
+    only new or edited chunks are embedded, removed files are dropped.
+    Uses the EMBEDDING_PROVIDER backend (default text-embedding-3-small) and
+    kb_ingest.default_splitter: table-aware chunks of up to 800 characters for Docling
+    exports (see table_chunker.py), recursive 500/50 for plain text.
     """
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small",
-        openai_api_key=os.getenv("OPENAI_API_KEY")
-    )
-    if os.path.isdir(persist_directory) and os.listdir(persist_directory):
-        return Chroma(persist_directory=persist_directory, embedding_function=embeddings)
-
-    # Build from scratch (very small and robust to missing files)
-    docs: List[Document] = []
-    if os.path.isdir(txt_dir):
-        for root, _dirs, files in os.walk(txt_dir):
-            for fn in files:
-                if fn.lower().endswith((".txt", ".md")):
-                    p = os.path.join(root, fn)
-                    try:
-                        with open(p, "r", encoding="utf-8", errors="ignore") as f:
-                            docs.append(Document(page_content=f.read(), metadata={"source": p}))
-                    except Exception as e:
-                        log.warning(f"Failed to read {p}: {e}")
-    if not docs:
+    embeddings = get_embeddings()  # cached + pipelined unless EMBEDDING_PROVIDER=hashing
+    vectorstore = open_vectorstore(persist_directory, embeddings)   # VECTOR_STORE=chroma|flat
+    try:
+        with bulk_writes(vectorstore):
+            sync_knowledge_base(vectorstore, txt_dir, persist_directory, embedding=embedding_id())
+    except Exception as e:
+        log.warning(f"KB sync failed, using the existing index: {e}")
+
+    has_seed = bool(vectorstore.get(ids=[KB_SEED_ID], include=[])["ids"])
+    has_kb = len(vectorstore.get(include=[])["ids"]) > has_seed
+    if not has_kb and not has_seed:
         # Fallback single doc so RAG still works
         seed = "TAMARA is a microfluidic system. Keep the lid closed during operations. Use Run, Clean, and Pressure Test modes."
-        docs = [Document(page_content=seed, metadata={"source": "seed"})]
-
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    splits = splitter.split_documents(docs)
-    vectorstore = Chroma.from_documents(splits, embedding=embeddings, persist_directory=persist_directory)
-    vectorstore.persist()
+        vectorstore.add_documents([Document(page_content=seed, metadata={"source": "seed"})], ids=[KB_SEED_ID])
+    elif has_kb and has_seed:
+        vectorstore.delete(ids=[KB_SEED_ID])
     return vectorstore
 
-def build_rag_chain():
-    persist = _persist_dir()
-    txt_dir = _txt_dir()
-    vectorstore = _ingest_if_needed(persist, txt_dir)
-
-    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 15})
-    llm = ChatOpenAI(
-        model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
-        temperature=0.1, # temperature is the randomness of the model's output, 0 is the most deterministic, 1 is the most random(creative)
-        openai_api_key=os.getenv("OPENAI_API_KEY")
+def _kb_retriever(vectorstore: VectorStore, persist_directory: str):
+    """
+    Hybrid (BM25 + vector, RRF-fused) retriever by default; KB_RETRIEVER=vector restores pure similarity.
+    Exact terms (FRR, chip names, PLC states) are found by BM25, so fewer chunks (KB_TOP_K) are needed.
+    The hybrid search is pre-filtered on metadata inferred from the question (KB_FILTER=0 disables this).
+    The candidates are then reranked and trimmed to a token budget (KB_COMPRESS=0 disables this).
+    """
+    k = int(os.getenv("KB_TOP_K", DEFAULT_TOP_K))
+    compress = os.getenv("KB_COMPRESS", "1") != "0"
+    fetch_k = max(k, int(os.getenv("KB_FETCH_K", DEFAULT_FETCH_K))) if compress else k
+    bm25 = None
+    if os.getenv("KB_RETRIEVER", "hybrid").lower() == "vector":
+        base = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": fetch_k})
+    else:
+        bm25 = BM25Index.load(bm25_path(persist_directory)) or BM25Index.from_vectorstore(vectorstore)
+        use_filter = os.getenv("KB_FILTER", "1") != "0"
+        log.info(f"Hybrid retriever: {len(bm25)} chunks in BM25 index, k={fetch_k}, metadata filter={use_filter}")
+        base = HybridRetriever(vectorstore=vectorstore, bm25=bm25, k=fetch_k,
+                               infer_filter=infer_filter if use_filter else None)
+    if not compress:
+        return base
+    # Rerank the candidates and keep at most k chunks within the context token budget
+    compressor = CompressingRetriever(
+        base=base, reranker=get_reranker(bm25), max_docs=k,
+        token_budget=int(os.getenv("KB_CONTEXT_TOKENS", DEFAULT_TOKEN_BUDGET)),
+        relevance_floor=float(os.getenv("KB_RELEVANCE_FLOOR", DEFAULT_RELEVANCE_FLOOR)),
+        mmr_lambda=float(os.getenv("KB_MMR_LAMBDA", DEFAULT_MMR_LAMBDA)),
     )
+    log.info(f"Context compression: {fetch_k} candidates -> at most {k} chunks / {compressor.token_budget} tokens")
+    return compressor
+
+def _working_copy(persist_dir: str) -> str:
+    """Copy of a shipped Chroma directory under ./db/runtime (not tracked), refreshed when it changes.
+
+    Chroma writes to a directory as soon as it opens it (it persists the HNSW index built
+    from its SQLite log), so querying the committed website collection in place rewrote
+    its binaries on every local run.
+    """
+    source = os.path.abspath(persist_dir)
+    stamp = sorted([os.path.relpath(os.path.join(root, name), source), os.path.getsize(os.path.join(root, name)),
+                    os.stat(os.path.join(root, name)).st_mtime_ns]
+                   for root, _dirs, files in os.walk(source) for name in files)
+    copy = os.path.join(SCRIPT_DIR, "db", "runtime", os.path.basename(source))
+    stamp_path = os.path.join(copy, ".source.json")
+    try:
+        with open(stamp_path, "r", encoding="utf-8") as f:
+            if json.load(f) == stamp:
+                return copy
+    except (OSError, ValueError):
+        pass
+    shutil.rmtree(copy, ignore_errors=True)
+    shutil.copytree(source, copy)
+    with open(stamp_path, "w", encoding="utf-8") as f:
+        json.dump(stamp, f)
+    log.info(f"Working copy of {source} in {copy}")
+    return copy
+
+def _web_index() -> Tuple[str, str]:
+    """(directory, backend) of the website collection: its flat index with VECTOR_STORE=flat
+    when one has been built (python web_crawl.py --store flat), else the Chroma collection."""
+    chroma_dir = os.getenv("WEB_CHROMA_DIR", os.path.join(SCRIPT_DIR, "db/chroma_db_InsideTxWeb_firecrawl"))
+    if vector_store_backend() != "flat":
+        return chroma_dir, "chroma"
+    flat_dir = os.getenv("WEB_FLAT_DIR", os.path.join(SCRIPT_DIR, "db/flat_db_InsideTxWeb"))
+    if os.path.isfile(os.path.join(flat_dir, FLAT_META_NAME)):
+        return flat_dir, "flat"
+    log.info(f"No flat website index in {flat_dir} (python web_crawl.py --store flat); "
+             f"opening the Chroma collection, which imports chromadb")
+    return chroma_dir, "chroma"
+
+def _federated_retriever(kb_retriever):
+    """KB retriever federated with the website collection, or the KB retriever alone (RAG_WEB=0,
+    no website index, or an embedding model other than the one the crawl was embedded with)."""
+    if os.getenv("RAG_WEB", "1") == "0":
+        return kb_retriever
+    web_dir, web_backend = _web_index()
+    if not os.path.isdir(web_dir):
+        return kb_retriever
+    if index_suffix():
+        log.info(f"Website collection skipped: it is embedded with text-embedding-3-small, not {embedding_id()}")
+        return kb_retriever
+    k = int(os.getenv("KB_TOP_K", DEFAULT_TOP_K))
+    quota = int(os.getenv("WEB_QUOTA", DEFAULT_WEB_QUOTA))
+    if web_backend == "chroma":
+        web = open_vectorstore(_working_copy(web_dir), get_embeddings(), "chroma")   # never the shipped dir
+    else:
+        web = open_vectorstore(web_dir, get_embeddings(), "flat")
+    # The KB budget is applied again after the merge, so website chunks count against it too
+    budget = int(os.getenv("KB_CONTEXT_TOKENS", DEFAULT_TOKEN_BUDGET)) if os.getenv("KB_COMPRESS", "1") != "0" else None
+    log.info(f"Federated retrieval: kb (up to {k}) + web (up to {quota}) from {web_dir}, token budget {budget}")
+    return FederatedRetriever(k=k, token_budget=budget, sources=[
+        Source.from_retriever("kb", kb_retriever, quota=k),
+        Source.from_vectorstore("web", web, quota=quota,
+                                weight=float(os.getenv("WEB_WEIGHT", DEFAULT_WEB_WEIGHT)),
+                                min_similarity=float(os.getenv("WEB_MIN_SIM", DEFAULT_WEB_MIN_SIM)),
+                                full_similarity=float(os.getenv("WEB_FULL_SIM", DEFAULT_WEB_FULL_SIM))),
+    ])
+
+@contextmanager
+def _init_phase(name: str, timings: Dict[str, float]):
+    """Time one RAG start-up phase (logged, and recorded in ``timings``)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+        log.info(f"RAG init: {name} took {timings[name]:.2f}s")
+
+# Process-wide prompt files (Prompts/*.txt); edits are picked up without a restart
+prompt_registry = PromptRegistry.from_env()
+
+class PromptedRAGChain:
+    """Retrieval chain whose QA system prompt follows the prompt registry.
+
+    The retriever and LLM are built once; the stuff-documents and retrieval chains are
+    rebuilt only when the prompt's text (sha256) changes, so an edited prompt file is
+    used from the next question on. The system message stays first and unchanged
+    between calls, which keeps its static prefix eligible for provider-side caching.
+    """
+    def __init__(self, llm, retriever, prompt_name: str, registry: Optional[PromptRegistry] = None,
+                 on_change=None):
+        self.llm = llm
+        self.retriever = retriever
+        self.prompt_name = prompt_name
+        self.registry = registry or prompt_registry
+        self.on_change = on_change            # called with the new Prompt after a rebuild
+        self.prompt: Optional[Prompt] = None
+        self._chain = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """The chain for the current prompt text (rebuilt after a prompt file change)."""
+        prompt = self.registry.get(self.prompt_name)
+        with self._lock:
+            if self.prompt is None or self.prompt.sha256 != prompt.sha256:
+                if self.prompt is not None:
+                    log.info(f"QA prompt {prompt.stem} changed ({prompt.sha256[:12]}); rebuilding the QA chain")
+                qa_prompt = ChatPromptTemplate.from_messages([
+                    ("system", prompt.text),
+                    MessagesPlaceholder("chat_history"),
+                    ("human", "{input}"),
+                ])
+                # Tagged so the REPL streams only the answer tokens, not the reformulation call's
+                question_answer_chain = create_stuff_documents_chain(self.llm.with_config(tags=[ANSWER_TAG]), qa_prompt)
+                # (3) Final RAG chain
+                self._chain = create_retrieval_chain(self.retriever, question_answer_chain)
+                changed, self.prompt = self.prompt is not None, prompt
+            else:
+                changed = False
+            chain = self._chain
+        if changed and self.on_change is not None:
+            self.on_change(prompt)
+        return chain
+
+    def invoke(self, inputs, config=None, **kwargs):
+        return self.current().invoke(inputs, config, **kwargs)
+
+def _rag_prompt_name() -> str:
+    return os.getenv("RAG_PROMPT", DEFAULT_RAG_PROMPT)
+
+def _prompt_version() -> Optional[str]:
+    """sha256 of the active QA prompt (answer cache version), None if it cannot be loaded."""
+    try:
+        return prompt_registry.get(_rag_prompt_name()).sha256
+    except KeyError as e:
+        log.warning(f"QA prompt unavailable: {e}")
+        return None
+
+def _clear_answer_cache(prompt: Prompt) -> None:
+    cache = get_answer_cache()
+    if cache is not None:
+        log.info(f"QA prompt {prompt.stem} changed; clearing the answer cache")
+        cache.clear()
+
+def build_rag_chain(timings: Optional[Dict[str, float]] = None):
+    timings = {} if timings is None else timings
+    with _init_phase("kb_sync", timings):   # embeddings backend, vector store, incremental KB sync
+        persist = _persist_dir()
+        txt_dir = _txt_dir()
+        vectorstore = _ingest_if_needed(persist, txt_dir)
+
+    with _init_phase("retriever", timings):
+        retriever = _federated_retriever(_kb_retriever(vectorstore, persist))
+    with _init_phase("llm", timings):
+        # temperature is the randomness of the model's output, 0 is the most deterministic, 1 is the most random(creative)
+        llm = get_chat_model(temperature=0.1)  # LLM_PROVIDER=openai (OPENAI_MODEL) or local endpoint
 
     # (1) History-aware question reformulation
     contextualize_q_system_prompt = (
@@ -346,44 +588,17 @@ def build_rag_chain():
         MessagesPlaceholder("chat_history"),
         ("human", "{input}"),
     ])
-    history_aware_retriever = create_history_aware_retriever(llm, retriever, contextualize_q_prompt)
-
-    # (2) Focused QA chain
-    # qa_system_prompt = (
-    #     "You are an AI assistant specializing in TAMARA. Provide precise, technical, step-by-step answers "
-    #     "and include safety considerations when relevant. Use ONLY the provided context.\n\n{context}"
-    # )
-    # qa_system_prompt = """You are an AI assistant specializing in TAMARA, a microfluidic system. 
-    #     Your role is to provide accurate, precise, technical, step-by-step answers, and helpful information 
-    #     about TAMARA's operation, specifications, and best practices. Include safety considerations when relevant.
-        
-    #     When answering:
-    #     1. Be precise and technical when discussing specifications
-    #     2. Provide step-by-step guidance for operational questions
-    #     3. Include relevant safety considerations
-    #     4. If you're unsure or the information isn't in the context, say so
-    #     5. Keep responses focused and relevant to TAMARA and Nanolipid partical synthesis
-        
-    #     Use ONLY the following context to answer the question:
-    #     \n{context}
-        
-    #     Base your answers solely on the provided context."""
-
-    prompt_path = os.path.join(SCRIPT_DIR, "Prompts", "AdvancedPrompt_V0.txt") # Basic_01.txt, Basic_02.txt, AdvancedPrompt_V0.txt
-
-    # Read the QA system prompt from file
-    with open(prompt_path, 'r') as file:
-        qa_system_prompt = file.read().strip()
-    
-    qa_prompt = ChatPromptTemplate.from_messages([
-        ("system", qa_system_prompt),
-        MessagesPlaceholder("chat_history"),
-        ("human", "{input}"),
-    ])
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-
-    # (3) Final RAG chain
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+    # Rewrites only questions that reference earlier turns (see reformulation.py)
+    history_aware_retriever = create_conditional_history_aware_retriever(
+        llm, retriever, contextualize_q_prompt, vectorstore=vectorstore)
+
+    # (2) Focused QA chain, system prompt from the registry (RAG_PROMPT, hot-reloaded)
+    prompt_name = _rag_prompt_name()
+    with _init_phase("prompt", timings):
+        prompt_registry.get(prompt_name)   # loads the prompt files; an unknown name fails here
+    with _init_phase("chain", timings):
+        rag_chain = PromptedRAGChain(llm, history_aware_retriever, prompt_name, on_change=_clear_answer_cache)
+        rag_chain.current()
     return rag_chain, llm
 
 # ------------------------------------------------------------------------------------
@@ -398,6 +613,9 @@ class GraphState(TypedDict, total=False):
     # confirmed: bool
     # last_tool_result: Optional[str]
     last_mode_check: float           # timestamp of last operation mode check
+    history_summary: Optional[str]   # running summary of older knowledge turns (history.py)
+    history_summarized: int          # knowledge turns covered by history_summary
+    history_fold: Optional[Future]   # summary being written in the background: (summary, turns folded)
 
 # ------------------------------------------------------------------------------------
 # Router
@@ -409,22 +627,36 @@ class GraphState(TypedDict, total=False):
 #     "Return just the label."
 # )
 
-def _heuristic_route(text: str) -> str:
-    t = text.lower()
-    if any(k in t for k in ["run", "formulate", "mix"]):
-        return "run"
-    if "clean" in t:
-        return "clean"
-    if "pressure" in t and "test" in t:
-        return "ptest"
-    # default: knowledge
-    return "ask_kb"
+_intent_router: Optional[IntentRouter] = None
+
+CLARIFY_TEXT = {
+    "pause": "pause the current operation", "play": "resume the paused operation",
+    "stop": "stop the current operation", "status": "read the machine status",
+    "run": "start a formulation run", "clean": "start a cleaning cycle", "ptest": "start a pressure test",
+}
+CLARIFY_COMMAND = {"ptest": "pressure test", "play": "resume"}
+
+def _classify_intent(text: str) -> Tuple[str, str]:
+    """(label, best intent) for a user message; label is CLARIFY for an uncertain command.
+    ROUTER=keyword restores the substring rules."""
+    global _intent_router
+    if os.getenv("ROUTER", "embedding").lower() == "keyword":
+        label = keyword_intent(text)
+        return label, label
+    if _intent_router is None:
+        _intent_router = IntentRouter.from_env()
+    decision = _intent_router.classify(text)
+    log.info(f"Intent: {decision.label} (best {decision.intent}, confidence {decision.confidence:.2f}, "
+             f"margin {decision.margin:.2f}, {decision.elapsed_ms:.2f} ms)")
+    return decision.label, decision.intent
 
 def route(state: GraphState, *, llm=None) -> GraphState:
     """Route user messages to appropriate handlers based on intent and current state.
     
     This function is the primary routing hub for the TAMARA agent. It handles:
-    1. Command Recognition: Identifies operation commands (run/clean/test)
+    1. Command Recognition: Identifies operation commands (run/clean/test) with the local
+       intent classifier (intent_router.py); an uncertain command is answered with a
+       clarification question instead of a PLC command
     2. Control Commands: Manages pause/play/stop operations
     3. Status Queries: Provides system state information
     4. Knowledge Queries: Routes to RAG for information requests
@@ -461,9 +693,24 @@ def route(state: GraphState, *, llm=None) -> GraphState:
         user_text = str(last).lower()
     
     log.info(f"Routing message: '{user_text}' (pending_action: {state.get('pending_action')})")
-    
+    intent, best = _classify_intent(user_text)
+
+    # Uncertain command: ask rather than send anything to the PLC
+    # Only offer the command the user's own words name (never "clean" for "stop the cleaning")
+    if intent == CLARIFY:
+        if names_intent(user_text, best):
+            command = CLARIFY_COMMAND.get(best, best)
+            question = f"Do you want me to {CLARIFY_TEXT[best]}? Say '{command}' to do it"
+        else:
+            question = ("I'm not sure which operation you mean. Say 'run', 'clean', 'pressure test', "
+                        "'pause', 'resume', 'stop' or 'status'")
+        state["messages"].append(AIMessage(content=(
+            f"{question}, or rephrase your question if you were asking about it.")))
+        state["intent"] = "other"
+        return state
+
     # Handle control commands
-    if "pause" in user_text:
+    if intent == "pause":
         log.info("Handling PAUSE command...")
         plc = PLCInterface()
         try:
@@ -500,7 +747,7 @@ def route(state: GraphState, *, llm=None) -> GraphState:
         state["intent"] = "other"
         return state
     
-    elif "play" in user_text or "resume" in user_text:
+    elif intent == "play":
         log.info("Handling PLAY/RESUME command...")
         plc = PLCInterface()
         try:
@@ -537,7 +784,7 @@ def route(state: GraphState, *, llm=None) -> GraphState:
         state["intent"] = "other"
         return state
     
-    elif "stop" in user_text:
+    elif intent == "stop":
         log.info("Handling STOP command...")
         plc = PLCInterface()
         try:
@@ -579,7 +826,7 @@ def route(state: GraphState, *, llm=None) -> GraphState:
         state["intent"] = "other"
         return state
     
-    elif "status" in user_text:
+    elif intent == "status":
         plc = PLCInterface()
         try:
             status_code = plc.read_status()
@@ -619,8 +866,7 @@ def route(state: GraphState, *, llm=None) -> GraphState:
         return state
 
     # Standard operation routing (only if no control command was processed)
-    label = _heuristic_route(user_text)
-    state["intent"] = label  # keep simple & deterministic
+    state["intent"] = intent  # run | clean | ptest | ask_kb
     return state
 
 # ------------------------------------------------------------------------------------
@@ -873,32 +1119,170 @@ def do_ptest(state: GraphState) -> GraphState:
 # ------------------------------------------------------------------------------------
 
 class RAGManager:
-    """Thread-safe RAG chain manager"""
+    """Thread-safe RAG chain manager.
+
+    ``start_background()`` builds the chain in a daemon thread (REPL start-up), so the
+    first knowledge question only waits for whatever initialization is still running.
+    ``ensure_initialized()`` waits on that build, or builds inline if none was started
+    or the background build failed.
+    """
     def __init__(self):
         self._chain = None
         self._llm = None
+        self._future: Optional[Future] = None
+        self._lock = threading.Lock()
+        self.timings: Dict[str, float] = {}
+
+    def _build(self):
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        chain, llm = build_rag_chain(timings)
+        timings["total"] = time.perf_counter() - start
+        log.info(f"RAG init: ready in {timings['total']:.2f}s")
+        self.timings = timings
+        return chain, llm
+
+    def start_background(self) -> Future:
+        """Kick off initialization in a daemon thread (no-op if already started or ready)."""
+        with self._lock:
+            if self._future is None:
+                future: Future = Future()
+                self._future = future
+                if self._chain is not None:
+                    future.set_result((self._chain, self._llm))
+                else:
+                    def _run():
+                        try:
+                            future.set_result(self._build())
+                        except BaseException as e:
+                            log.warning(f"RAG background initialization failed: {e}")
+                            future.set_exception(e)
+                    threading.Thread(target=_run, name="rag-warmup", daemon=True).start()
+            return self._future
 
     def ensure_initialized(self):
-        if self._chain is None:
-            self._chain, self._llm = build_rag_chain()
+        if self._chain is not None:
+            return self._chain, self._llm
+        with self._lock:
+            future = self._future
+        if future is not None:
+            if not future.done():
+                start = time.perf_counter()
+                log.info("RAG init still running; waiting for it")
+                future.exception()  # blocks until the background build finishes
+                log.info(f"RAG init: question waited {time.perf_counter() - start:.2f}s")
+            if future.exception() is None:
+                with self._lock:
+                    self._chain, self._llm = future.result()
+                return self._chain, self._llm
+            with self._lock:
+                if self._future is future:
+                    self._future = None   # failed in the background: retry inline below
+        with self._lock:
+            if self._chain is None:
+                self._chain, self._llm = self._build()
         return self._chain, self._llm
 
 # Global RAG manager instance
 rag_manager = RAGManager()
 
+_answer_cache: Optional[SemanticAnswerCache] = None
+_answer_cache_failed = False
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    """Process-wide semantic answer cache (None when ANSWER_CACHE=0 or no embedder is available)."""
+    global _answer_cache, _answer_cache_failed
+    with _answer_cache_lock:
+        if _answer_cache is None and not _answer_cache_failed and os.getenv("ANSWER_CACHE", "1") != "0":
+            try:
+                _answer_cache = SemanticAnswerCache.from_env(
+                    get_embeddings(), manifest_path=os.path.join(_persist_dir(), MANIFEST_NAME))
+            except Exception as e:
+                log.warning(f"Answer cache disabled: {e}")
+                _answer_cache_failed = True
+        return _answer_cache
+
+# One summary at a time, off the answer path (history.py)
+_fold_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-fold")
+
+def _summarize_turns(summary: Optional[str], turns) -> Tuple[Optional[str], int]:
+    start = time.perf_counter()
+    try:
+        _, llm = rag_manager.ensure_initialized()
+        summary = fold_turns(llm, summary, turns)
+    except Exception as e:
+        log.warning(f"History summary failed, dropping {len(turns)} old turns from RAG history: {e}")
+    else:
+        log.info(f"Folded {len(turns)} knowledge turns into the history summary "
+                 f"in {time.perf_counter() - start:.2f}s")
+    return summary, len(turns)
+
+def _join_history_fold(state: GraphState) -> None:
+    """Wait for the summary started after the previous answer and apply it to ``state``."""
+    future = state.get("history_fold")
+    if future is None:
+        return
+    if not future.done():
+        start = time.perf_counter()
+        future.result()
+        log.info(f"Question waited {time.perf_counter() - start:.2f}s for the history summary")
+    state["history_summary"], folded = future.result()
+    state["history_summarized"] = (state.get("history_summarized") or 0) + folded
+    state["history_fold"] = None
+
+def _fold_history(state: GraphState, max_turns: int) -> None:
+    """Fold knowledge turns beyond the verbatim window into the running summary, in the
+    background: the answer is returned at once and the next question joins the fold."""
+    summarized = state.get("history_summarized") or 0
+    turns = turns_to_fold(state["messages"], summarized, max_turns)
+    if not turns:
+        return
+    if os.getenv("RAG_HISTORY_SUMMARY", "1") == "0":
+        state["history_summarized"] = summarized + len(turns)
+        return
+    state["history_fold"] = _fold_executor.submit(_summarize_turns, state.get("history_summary"), turns)
+
 def answer_with_rag(state: GraphState) -> GraphState:
+    # Last knowledge turns + running summary; PLC commands and operation flows are left out
+    _join_history_fold(state)
+    max_turns = int(os.getenv("RAG_HISTORY_TURNS", DEFAULT_MAX_TURNS))
+    chat_history: List = build_history(state["messages"][:-1], state.get("history_summary"),
+                                       state.get("history_summarized") or 0, max_turns)
+    user_text = state["messages"][-1].content if isinstance(state["messages"][-1], HumanMessage) else ""
+    # Answers to questions that don't lean on the conversation are reusable (see answer_cache.py)
+    cache = get_answer_cache() if user_text and (not chat_history or reference_reason(user_text) is None) else None
+    # Answers are only reused under the QA prompt that produced them
+    version = _prompt_version() if cache is not None else None
+    if cache is not None:
+        start = time.perf_counter()
+        try:
+            hit = cache.get(user_text, version)
+        except Exception as e:
+            log.warning(f"Answer cache lookup failed: {e}")
+            hit = None
+        if hit is not None:
+            log.info(f"Answered from cache in {(time.perf_counter() - start) * 1000:.1f} ms "
+                     f"({hit.question!r}); {cache.summary()}")
+            state["messages"].append(mark_rag(AIMessage(content=hit.answer)))
+            _fold_history(state, max_turns)
+            return state
     try:
         chain, _ = rag_manager.ensure_initialized()
-        # use entire running transcript as history
-        chat_history: List = [m for m in state["messages"] if isinstance(m, (HumanMessage, AIMessage))][:-1]
-        user_text = state["messages"][-1].content if isinstance(state["messages"][-1], HumanMessage) else ""
-
         result = chain.invoke({"input": user_text, "chat_history": chat_history})
-        state["messages"].append(AIMessage(content=result["answer"]))
+        state["messages"].append(mark_rag(AIMessage(content=result["answer"])))
     except Exception as e:
         # degrade gracefully
         state["messages"].append(AIMessage(content=f"(RAG unavailable) Heuristic answer: {user_text}"))
         log.exception("RAG failed: %s", e)
+        return state
+    if cache is not None:
+        try:
+            used = getattr(chain, "prompt", None)   # PromptedRAGChain: the prompt this answer was written with
+            cache.put(user_text, result["answer"], used.sha256 if isinstance(used, Prompt) else version)
+        except Exception as e:
+            log.warning(f"Answer cache store failed: {e}")
+    _fold_history(state, max_turns)
     return state
 
 # ------------------------------------------------------------------------------------
@@ -1170,6 +1554,10 @@ def periodic_mode_check(state: GraphState) -> None:
 def repl(draw: bool = False):
     app = build_graph()
 
+    # Warm up the RAG chain (embeddings, KB sync, Chroma, prompt) while the PLC checks run
+    if os.getenv("RAG_WARMUP", "1") != "0":
+        rag_manager.start_background()
+
     # Optionally draw
     if draw:
         try:
@@ -1216,7 +1604,9 @@ def repl(draw: bool = False):
         "input_payload": None,
         "confirmed": False,
         "last_tool_result": None,
-        "last_mode_check": time.time()  # Initialize mode check timestamp
+        "last_mode_check": time.time(),  # Initialize mode check timestamp
+        "history_summary": None,
+        "history_summarized": 0,
     }
 
     print("== TAMARA Agent (LangGraph) ==")
@@ -1227,6 +1617,12 @@ def repl(draw: bool = False):
             if not user:
                 continue
             if user.lower() in ("exit", "quit"):
+                if REFORMULATION_STATS.questions:
+                    log.info(f"Session RAG metrics: {REFORMULATION_STATS.summary()}")
+                if _answer_cache is not None:
+                    log.info(f"Session RAG metrics: {_answer_cache.summary()}")
+                if STREAM_STATS.ttft_s:
+                    log.info(f"Session RAG metrics: {STREAM_STATS.summary()}")
                 break
 
             # Check operation mode before any state transition
@@ -1242,7 +1638,17 @@ def repl(draw: bool = False):
             # Add user message & run graph once
             state["messages"].append(HumanMessage(content=user))
             log.info(f"Current state before invoke: {state}")
-            state = app.invoke(state)
+            streamed = ""
+            if os.getenv("RAG_STREAM", "1") != "0":
+                state, timing = stream_turn(app, state, token_printer("\nAI: "))
+                if timing.streamed:
+                    print()
+                    streamed = timing.text
+                    STREAM_STATS.record(timing)
+                    log.info(f"RAG answer: first token after {timing.ttft_s:.2f}s, "
+                             f"complete after {timing.total_s:.2f}s ({timing.chunks} chunks)")
+            else:
+                state = app.invoke(state)
             log.info(f"Current state after invoke: {state}")
             
             # Emit all new AI messages since last user input
@@ -1256,6 +1662,8 @@ def repl(draw: bool = False):
             if last_user_index >= 0:
                 new_ai_messages = [m for m in state["messages"][last_user_index+1:] if isinstance(m, AIMessage)]
                 for ai_msg in new_ai_messages:
+                    if streamed and ai_msg.content == streamed:
+                        continue   # already printed token by token
                     print(f"\nAI: {ai_msg.content}")
             
             # Handle confirmation if we're in an action state
@@ -11,8 +11,12 @@ from pathlib import Path
 import pytest
 from langchain.docstore.document import Document
 from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
-from ..rag_build import KnowledgeBaseIndexer
+from rag_build import KnowledgeBaseIndexer
+
+@pytest.fixture(autouse=True)
+def offline_embeddings(monkeypatch):
+    # Deterministic hashing embedder: no OPENAI_API_KEY or network needed (see providers.py)
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "hashing")
 
 @pytest.fixture
 def sample_docs():
@@ -38,11 +42,11 @@ def temp_dirs():
     # Create sample files in knowledge base
     kb_path = Path(kb_dir)
     
-    with open(kb_path / "specs.md", "w") as f:
+    with open(kb_path / "specs.txt", "w") as f:
         f.write("""TAMARA operates with a total flow rate (TFR) range of 0.8-15.0 mL/min.
                 The system supports both HERRINGBONE and BAFFLE chip types.""")
     
-    with open(kb_path / "theory.md", "w") as f:
+    with open(kb_path / "theory.txt", "w") as f:
         f.write("""Temperature affects viscosity in microfluidic mixing.
                 Operating temperature range is 5-60°C with optimal mixing at 20-25°C.""")
     
@@ -57,7 +61,7 @@ def test_document_loading(temp_dirs):
     docs = indexer.load_documents(Path(temp_dirs["kb_dir"]))
     
     assert len(docs) == 2
-    assert any("TFR range" in doc.page_content for doc in docs)
+    assert any("(TFR) range" in doc.page_content for doc in docs)
     assert any("Temperature affects" in doc.page_content for doc in docs)
 
 def test_index_building(temp_dirs):
@@ -80,8 +84,8 @@ def test_retrieval_quality(temp_dirs):
     
     # Test queries
     queries = [
-        ("What is the flow rate range?", "specs.md"),
-        ("How does temperature affect mixing?", "theory.md")
+        ("What is the flow rate range?", "specs.txt"),
+        ("How does temperature affect mixing?", "theory.txt")
     ]
     
     for query, expected_source in queries:
@@ -0,0 +1,126 @@
+"""
+Unit tests for the semantic answer cache.
+"""
+import pytest
+from answer_cache import SemanticAnswerCache, normalize_question
+from providers import HashingEmbeddings
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class CountingEmbeddings(HashingEmbeddings):
+    def __init__(self):
+        super().__init__()
+        self.queries = 0
+
+    def embed_query(self, text):
+        self.queries += 1
+        return super().embed_query(text)
+
+def test_normalize_question():
+    """Test that case, punctuation and contractions don't change the key."""
+    assert normalize_question("What's the flow rate range?") == normalize_question("  what is the FLOW rate range ")
+    assert normalize_question("Is 0.8-15 mL/min OK?") == "is 0.8-15 ml/min ok"
+
+def test_exact_and_semantic_hits():
+    """Test exact hits skip the embedder, paraphrases hit above the threshold, others miss."""
+    emb = CountingEmbeddings()
+    cache = SemanticAnswerCache(emb, threshold=0.8)
+    cache.put("What is the flow rate range of TAMARA?", "0.8 to 15 mL/min")
+    emb.queries = 0
+    assert cache.get("what's the flow rate range of TAMARA").answer == "0.8 to 15 mL/min"
+    assert emb.queries == 0
+    assert cache.get("What is the flow rate range of the TAMARA system?").answer == "0.8 to 15 mL/min"
+    assert cache.get("How do I clean the chip after a run?") is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+def test_ttl_and_lru_eviction():
+    """Test that entries expire after the TTL and the least recently used one is evicted."""
+    clock = Clock()
+    cache = SemanticAnswerCache(HashingEmbeddings(), ttl_s=60, max_entries=2, clock=clock)
+    cache.put("What is the FRR range?", "1:1 to 1:10")
+    cache.put("What is the TFR range?", "0.8 to 15 mL/min")
+    assert cache.get("What is the FRR range?")          # FRR now most recently used
+    cache.put("How long is the cleaning protocol?", "about 10 minutes")
+    assert cache.get("What is the TFR range?") is None  # evicted
+    assert cache.get("What is the FRR range?") and len(cache) == 2
+    clock.now += 61
+    assert cache.get("What is the FRR range?") is None and len(cache) == 0
+
+def test_invalidated_when_kb_manifest_changes(tmp_path):
+    """Test that a KB update clears the cache but an identical rewrite of the manifest doesn't."""
+    manifest = tmp_path / "kb_manifest.json"
+    manifest.write_text('{"files": {}}')
+    cache = SemanticAnswerCache(HashingEmbeddings(), manifest_path=str(manifest))
+    cache.put("What is the FRR range?", "1:1 to 1:10")
+    manifest.write_text('{"files": {}}')
+    assert cache.get("What is the FRR range?")
+    manifest.write_text('{"files": {"manual.txt": {}}}')
+    assert cache.get("What is the FRR range?") is None
+    assert cache.invalidations == 1
+
+def test_invalidated_when_version_changes():
+    """Test that answers stored under one QA prompt version are dropped when the version changes."""
+    cache = SemanticAnswerCache(HashingEmbeddings())
+    cache.put("What is the FRR range?", "1:1 to 1:10", "prompt-a")
+    assert cache.get("What is the FRR range?", "prompt-a") and cache.get("What is the FRR range?")
+    assert cache.get("What is the FRR range?", "prompt-b") is None and cache.invalidations == 1
+
+def test_prompt_edit_bypasses_cached_answers(monkeypatch, tmp_path):
+    """Test that answer_with_rag does not serve an answer written under a previous QA prompt."""
+    tamara_graph = pytest.importorskip("tamara_graph")
+    from langchain_core.messages import HumanMessage
+    from prompt_registry import PromptRegistry
+
+    prompt = tmp_path / "QA_V0.txt"
+    prompt.write_text("Answer briefly.\n{context}")
+    monkeypatch.setattr(tamara_graph, "prompt_registry", PromptRegistry([str(tmp_path)], check_interval_s=0))
+    monkeypatch.setenv("RAG_PROMPT", "QA")
+
+    class Chain:
+        calls = 0
+
+        def invoke(self, inputs):
+            Chain.calls += 1
+            return {"answer": f"answer {Chain.calls}"}
+
+    monkeypatch.setattr(tamara_graph.rag_manager, "ensure_initialized", lambda: (Chain(), None))
+    monkeypatch.setattr(tamara_graph, "_answer_cache", SemanticAnswerCache(HashingEmbeddings()))
+
+    def ask(question):
+        return tamara_graph.answer_with_rag({"messages": [HumanMessage(content=question)]})["messages"][-1].content
+
+    assert ask("What is the flow rate range?") == ask("What is the flow rate range?") == "answer 1"
+    prompt.write_text("Answer in French.\n{context}")
+    assert ask("What is the flow rate range?") == "answer 2"
+
+def test_answer_with_rag_uses_cache(monkeypatch):
+    """Test that repeated standalone questions skip the chain and follow-ups are never cached."""
+    tamara_graph = pytest.importorskip("tamara_graph")
+    from history import mark_rag
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    class Chain:
+        calls = 0
+
+        def invoke(self, inputs):
+            Chain.calls += 1
+            return {"answer": f"answer {Chain.calls}"}
+
+    monkeypatch.setattr(tamara_graph.rag_manager, "ensure_initialized", lambda: (Chain(), None))
+    monkeypatch.setattr(tamara_graph, "_answer_cache", SemanticAnswerCache(HashingEmbeddings()))
+
+    def ask(question, history=()):
+        state = {"messages": list(history) + [HumanMessage(content=question)]}
+        return tamara_graph.answer_with_rag(state)["messages"][-1].content
+
+    assert ask("What is the flow rate range?") == "answer 1"
+    history = [HumanMessage(content="What is TAMARA?"), mark_rag(AIMessage(content="A microfluidic system."))]
+    assert ask("what's the flow rate range", history) == "answer 1"
+    assert Chain.calls == 1
+    assert ask("Is it adjustable?", history) == "answer 2"
+    assert ask("Is it adjustable?", history) == "answer 3"
@@ -0,0 +1,120 @@
+"""
+Unit tests for the campaign scheduler.
+"""
+import pytest
+from crunching import RunParameters, SOLVENT_PROPERTIES, MODE_RUN, MODE_CLEAN, MODE_PRESSURE_TEST
+from campaign import Formulation, MaintenanceRules, CampaignRunner, plan_campaign, decode_step, _schedule
+
+def _formulation(name: str, solvent: str = "ethanol", chip: str = "HERRINGBONE", tfr: float = 1.0) -> Formulation:
+    props = SOLVENT_PROPERTIES[solvent]
+    rp = RunParameters(
+        tfr=tfr, frr=3, tar_vol=1.0, temp=25.0, chip_id=chip, manifold="SMALL",
+        viscosity_org=props['viscosity'], viscosity_sens=props['sensitivity'],
+        molar_vol=props['molar_volume'], lab_pressure=2.0,
+    )
+    return Formulation(name, rp, solvent)
+
+def _modes(plan):
+    return [s.mode for s in plan.steps]
+
+def test_interleaved_solvents_are_grouped():
+    """Test that alternating solvents are reordered into one switch."""
+    queue = [_formulation("a1"), _formulation("m1", "methanol"), _formulation("a2"), _formulation("m2", "methanol")]
+    plan = plan_campaign(queue)
+    assert plan.solvent_switches == 1
+    assert _modes(plan) == [MODE_PRESSURE_TEST, MODE_RUN, MODE_RUN, MODE_CLEAN, MODE_RUN, MODE_RUN, MODE_CLEAN]
+    assert [s.formulation.name for s in plan.steps if s.mode == MODE_RUN] == ["a1", "a2", "m1", "m2"]
+    # Never worse than the queue order
+    naive = _schedule([[f] for f in queue], MaintenanceRules())
+    assert plan.total_s < sum(s.total_s for s in naive)
+
+def test_chip_change_requires_clean_pressure_test_and_operator():
+    """Test that a chip change inserts CLEAN + PRESSURE_TEST and flags the manual swap."""
+    plan = plan_campaign([_formulation("b", chip="BAFFLE"), _formulation("h")],
+                         MaintenanceRules(clean_at_end=False))
+    assert _modes(plan) == [MODE_PRESSURE_TEST, MODE_RUN, MODE_CLEAN, MODE_PRESSURE_TEST, MODE_RUN]
+    assert plan.steps[2].manual_action == "swap chip"
+    assert plan.chip_changes == 1
+
+def test_periodic_clean_every_n_runs():
+    """Test that clean_every_n_runs inserts a CLEAN after every N runs."""
+    rules = MaintenanceRules(clean_every_n_runs=2, pressure_test_at_start=False, clean_at_end=False)
+    plan = plan_campaign([_formulation(f"r{i}") for i in range(5)], rules)
+    assert _modes(plan) == [MODE_RUN, MODE_RUN, MODE_CLEAN, MODE_RUN, MODE_RUN, MODE_CLEAN, MODE_RUN]
+
+def test_steps_carry_wire_ready_sequences():
+    """Test that each step's packed sequence matches its mode and duration."""
+    plan = plan_campaign([_formulation("a1")])
+    for step in plan.steps:
+        values = decode_step(step)
+        assert values[0] == {MODE_RUN: 0.0, MODE_CLEAN: 1.0, MODE_PRESSURE_TEST: 3.0}[step.mode]
+        assert sum(values[7:]) == pytest.approx(step.duration_s, rel=1e-6)
+
+def test_invalid_formulation_rejected():
+    """Test that planning refuses formulations failing validation."""
+    with pytest.raises(ValueError, match="bad"):
+        plan_campaign([_formulation("bad", tfr=100.0)])
+
+def test_runner_executes_plan_on_simulator(plc_sim):
+    """Test that every step is written and progress reaches 100%."""
+    plan = plan_campaign([_formulation("a1"), _formulation("m1", "methanol")])
+    seen = []
+    progress = CampaignRunner(plc_sim, plan, on_progress=lambda p: seen.append(p.completed_steps),
+                              sim_time_scale=0).run()
+    assert progress.state == "done"
+    assert progress.completed_steps == len(plan.steps)
+    assert progress.percent == pytest.approx(100.0)
+    assert seen == sorted(seen) and seen[-1] == len(plan.steps)
+    assert plc_sim.read_sequence() == decode_step(plan.steps[-1])
+    assert not plc_sim._read_bool('SEQUENCE.b_START_SEQ')
+
+def test_runner_aborts_when_operator_declines(plc_sim):
+    """Test that declining a manual changeover stops the campaign before writing it."""
+    plan = plan_campaign([_formulation("a1"), _formulation("m1", "methanol")])
+    progress = CampaignRunner(plc_sim, plan, confirm=lambda step: False, sim_time_scale=0).run()
+    assert progress.state == "aborted"
+    assert progress.completed_steps == 2  # pressure test + first run
+
+class _ScriptedPLC:
+    """Hardware stand-in: MACHINE_MODE follows a script per step, as FB_StateHandler would."""
+    simulated = False
+
+    def __init__(self, states_per_step):
+        self.script = iter(states_per_step)
+        self.states, self.calls = [], []
+
+    def ensure_connected(self):
+        pass
+
+    def write_sequence(self, sequence):
+        self.states = list(next(self.script))
+        self.calls.append("write")
+
+    def read_status(self):
+        return self.states.pop(0) if len(self.states) > 1 else self.states[0]
+
+    def stop_sequence(self):
+        self.calls.append("clear")
+
+    def pulse_cmd(self, mode, cmd):
+        self.calls.append(f"{cmd.name} {mode.name}")
+
+def test_runner_waits_for_the_plc_to_return_to_standby():
+    """Test that a hardware step is done once MACHINE_MODE goes from its mode back to STANDBY."""
+    plan = plan_campaign([_formulation("a1")], MaintenanceRules(pressure_test_at_start=False, clean_at_end=False))
+    plc = _ScriptedPLC([[1, 1, 2, 2, 1]])   # still STANDBY right after the start request
+    progress = CampaignRunner(plc, plan, poll_s=0).run()
+    assert progress.state == "done" and progress.completed_steps == 1
+    assert plc.states == [1] and plc.calls == ["write", "clear"]
+
+def test_runner_fails_the_step_when_the_plc_faults():
+    """Test that a fault during a step stops that mode and fails the campaign."""
+    plan = plan_campaign([_formulation("a1")], MaintenanceRules(clean_at_end=False))
+    plc = _ScriptedPLC([[4, 1], [2, 6]])
+    progress = CampaignRunner(plc, plan, poll_s=0).run()
+    assert progress.state == "failed" and progress.completed_steps == 1
+    assert "FAULTED" in progress.error
+    assert plc.calls == ["write", "clear", "write", "STOP RUN", "clear"]
+
+    never_started = CampaignRunner(_ScriptedPLC([[1]]), plan, poll_s=0, start_timeout_s=0).run()
+    assert never_started.state == "failed" and "did not enter PRESSURE_TEST" in never_started.error
@@ -0,0 +1,105 @@
+"""
+Unit tests for chunk metadata and metadata-filtered retrieval.
+"""
+import json
+
+import pytest
+from chunk_metadata import chunk_metadata, detect_entities, doc_type, infer_filter, matches
+from providers import HashingEmbeddings
+
+def test_doc_type_from_file_name():
+    """Test the document type rules on the KB's file names."""
+    assert doc_type("txt/TAMARA_User_Manual_v2.txt") == "manual"
+    assert doc_type("txt/TAMARA Technical Specification.txt") == "spec"
+    assert doc_type("txt/NanoAssemblr vs TAMARA.txt") == "competitor"
+    assert doc_type("txt/Review Article - Liposomes vs LNPs.txt") == "review"
+    assert doc_type("txt/Microfluidic LNP formulation.txt") == "review"
+
+def test_chunk_metadata_flags_entities():
+    """Test that detected entities become true flags plus a readable summary, and absent ones are omitted."""
+    metadata = chunk_metadata("txt/TAMARA_User_Manual.txt",
+                              "Flush the herringbone chip with ethanol, then water.", "Cleaning procedure")
+    assert metadata["doc_type"] == "manual"
+    assert metadata["chip_herringbone"] is metadata["solvent_ethanol"] is metadata["mode_clean"] is True
+    assert "chip_baffle" not in metadata
+    assert metadata["entities"] == "chip:herringbone;solvent:ethanol;solvent:water;mode:clean"
+    assert detect_entities("No entities here.") == {}
+
+def test_infer_filter():
+    """Test OR within a category, AND across categories, and no filter for generic questions."""
+    assert infer_filter("What is TAMARA?") is None
+    assert infer_filter("How do I clean the chip?") == {"mode_clean": True}
+    assert infer_filter("Can I use DMSO or methanol with the baffle chip?") == {"$and": [
+        {"chip_baffle": True},
+        {"$or": [{"solvent_methanol": True}, {"solvent_dmso": True}]},
+    ]}
+    assert infer_filter("How does TAMARA compare with the NanoAssemblr Ignite?") == {"doc_type": "competitor"}
+
+def test_matches_evaluates_chroma_filters():
+    """Test the in-Python evaluation of Chroma where clauses."""
+    metadata = {"doc_type": "manual", "chip_herringbone": True}
+    assert matches(metadata, None)
+    assert matches(metadata, {"$and": [{"doc_type": "manual"}, {"$or": [{"chip_baffle": True}, {"chip_herringbone": True}]}]})
+    assert not matches(metadata, {"chip_baffle": True})
+    assert matches(metadata, {"doc_type": {"$in": ["manual", "spec"]}})
+    assert not matches(metadata, {"doc_type": {"$ne": "manual"}})
+    with pytest.raises(ValueError):
+        matches(metadata, {"doc_type": {"$gt": 1}})
+
+def _kb(path):
+    kb = path / "kb"
+    kb.mkdir()
+    (kb / "TAMARA_User_Manual.txt").write_text(
+        "Cleaning the herringbone chip: flush with ethanol then water after each run.")
+    (kb / "Baffle chip specification.txt").write_text(
+        "The baffle chip is rated for ethanol and DMSO at flow rates up to 20 mL/min.")
+    (kb / "NanoAssemblr vs TAMARA.txt").write_text(
+        "The NanoAssemblr Ignite uses a disposable cartridge instead of a reusable chip.")
+    return kb
+
+def test_ingestion_attaches_and_refreshes_metadata(tmp_path, monkeypatch):
+    """Test that kb_ingest stores chunk metadata and rewrites it when METADATA_VERSION changes."""
+    import kb_ingest
+    from flat_store import FlatVectorStore
+    from retrieval import BM25Index, bm25_path
+
+    kb, db = _kb(tmp_path), tmp_path / "db"
+    store = FlatVectorStore(str(db), HashingEmbeddings())
+    kb_ingest.sync_knowledge_base(store, str(kb), str(db))
+    metadatas = {m["source"].rsplit("/", 1)[-1]: m for m in store.get(include=["metadatas"])["metadatas"]}
+    assert metadatas["TAMARA_User_Manual.txt"]["mode_clean"] is True
+    assert metadatas["Baffle chip specification.txt"]["doc_type"] == "spec"
+    assert json.loads((db / kb_ingest.MANIFEST_NAME).read_text())["metadata"] == kb_ingest.METADATA_VERSION
+
+    monkeypatch.setattr(kb_ingest, "METADATA_VERSION", kb_ingest.METADATA_VERSION + 1)
+    monkeypatch.setattr(kb_ingest, "chunk_metadata", lambda source, text, section: {"doc_type": "relabelled"})
+    report = kb_ingest.sync_knowledge_base(store, str(kb), str(db))
+    assert report.chunks_added == 0 and len(store) == 3
+    assert {m["doc_type"] for m in store.get(include=["metadatas"])["metadatas"]} == {"relabelled"}
+    bm25 = BM25Index.load(bm25_path(str(db)))
+    assert {bm25.document(cid).metadata["doc_type"] for cid in store.get(include=[])["ids"]} == {"relabelled"}
+
+@pytest.mark.parametrize("backend", ["flat", "chroma"])
+def test_filtered_hybrid_retrieval_with_top_up(tmp_path, backend):
+    """Test that the inferred filter narrows both searches, and unfiltered results top up a short list."""
+    if backend == "chroma":
+        pytest.importorskip("langchain_chroma")
+    from flat_store import open_vectorstore
+    from kb_ingest import sync_knowledge_base
+    from retrieval import BM25Index, HybridRetriever
+
+    kb, db = _kb(tmp_path), tmp_path / "db"
+    store = open_vectorstore(str(db), HashingEmbeddings(), backend)
+    sync_knowledge_base(store, str(kb), str(db))
+    bm25 = BM25Index.from_vectorstore(store)
+
+    hits = store.similarity_search("ethanol chip", k=3, filter={"doc_type": "spec"})
+    assert [d.metadata["doc_type"] for d in hits] == ["spec"]
+    assert [cid for cid, _s in bm25.search("ethanol chip", where={"chip_herringbone": True})] == [
+        cid for cid, (_t, m) in bm25.docs.items() if m.get("chip_herringbone")]
+
+    retriever = HybridRetriever(vectorstore=store, bm25=bm25, k=3, min_filtered=1, infer_filter=infer_filter)
+    assert [d.metadata["doc_type"] for d in retriever.invoke("Which solvents does the baffle chip accept?")] == ["spec"]
+    retriever.min_filtered = 3
+    docs = retriever.invoke("Which solvents does the baffle chip accept?")
+    assert docs[0].metadata["doc_type"] == "spec" and len(docs) == 3 and len({d.id for d in docs}) == 3
@@ -0,0 +1,101 @@
+"""
+Unit tests for post-retrieval context compression.
+"""
+from typing import List
+
+import pytest
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from context_compression import CompressingRetriever, LexicalReranker, get_reranker, mmr_order
+from retrieval import BM25Index
+
+FLOW = "The total flow rate (TFR) range of TAMARA is 0.8 to 15 mL/min for all herringbone chips."
+FLOW_COPY = "The total flow rate (TFR) range of TAMARA is 0.8 to 15 mL/min for all the herringbone chips."
+FRR = "The flow rate ratio (FRR) can be set between 1:1 and 1:10 in the TAMARA software."
+CLEAN = "After each run, flush the chip with ethanol and then water for ten minutes."
+LID = "Keep the lid closed during a pressure test."
+
+class ListRetriever(BaseRetriever):
+    docs: List[Document] = []
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun = None) -> List[Document]:
+        return list(self.docs)
+
+def _docs(*texts):
+    return [Document(page_content=t, id=str(i), metadata={"source": f"doc{i}.txt"}) for i, t in enumerate(texts)]
+
+def _compressor(docs, **kwargs):
+    kwargs.setdefault("count_tokens", lambda text: len(text.split()))
+    return CompressingRetriever(base=ListRetriever(docs=docs), reranker=LexicalReranker(), **kwargs)
+
+def test_lexical_reranker_prefers_rare_terms():
+    """Test that BM25 IDF weights rare query terms above common ones."""
+    bm25 = BM25Index()
+    docs = _docs(FLOW, FRR, CLEAN, LID)
+    bm25.add_documents([d.id for d in docs], docs)
+    scores = LexicalReranker(bm25).score("What is the FRR of TAMARA?", docs)
+    assert scores[1] == max(scores) and scores[1] > scores[0] > scores[2] == 0.0
+    assert LexicalReranker().score("the", docs) == [0.0] * 4
+
+def test_mmr_skips_near_duplicates():
+    """Test that a near-copy of the best chunk is demoted below a different relevant chunk."""
+    docs = _docs(FLOW, FLOW_COPY, FRR)
+    assert mmr_order([0.9, 0.9, 0.6], docs, lambda_mult=1.0) == [0, 1, 2]
+    assert mmr_order([0.9, 0.9, 0.6], docs, lambda_mult=0.5) == [0, 2, 1]
+
+def test_floor_budget_and_max_docs():
+    """Test the relevance floor, the token budget and the chunk cap (the best chunk is always kept)."""
+    docs = _docs(CLEAN, FLOW, FLOW_COPY, FRR, LID)
+    retriever = _compressor(docs, max_docs=3, token_budget=40, relevance_floor=0.2, mmr_lambda=0.5)
+    kept = retriever.invoke("What is the flow rate range of TAMARA?")
+    assert [d.page_content for d in kept] == [FLOW, FRR]
+    assert kept[0].metadata["rerank_score"] >= kept[1].metadata["rerank_score"] >= 0.2
+    assert kept[0].metadata["source"] == "doc1.txt"
+    again, stats = retriever.compress_with_stats("What is the flow rate range of TAMARA?", docs)
+    assert again == kept
+    assert (stats.candidates, stats.kept) == (5, 2) and stats.below_floor >= 2
+    assert stats.tokens_out == sum(len(d.page_content.split()) for d in kept) < stats.tokens_in
+
+    weak = _compressor(_docs(CLEAN, LID), relevance_floor=0.9).invoke("What is the FRR?")
+    assert len(weak) == 1
+
+def test_calls_share_no_state():
+    """Test that concurrent calls on one retriever each get their own stats and the counter is set once."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    retriever = CompressingRetriever(base=ListRetriever(docs=[]), reranker=LexicalReranker())
+    count = retriever.count_tokens
+    assert count is not None
+    inputs = {"What is the flow rate range?": _docs(FLOW, FRR, CLEAN), "How do I clean the chip?": _docs(CLEAN)}
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = dict(zip(inputs, pool.map(lambda q: retriever.compress_with_stats(q, inputs[q]), inputs)))
+    assert {q: stats.candidates for q, (_kept, stats) in results.items()} == {q: len(d) for q, d in inputs.items()}
+    assert retriever.count_tokens is count
+
+def test_unknown_reranker():
+    """Test that a misspelt RERANKER is reported rather than silently ignored."""
+    with pytest.raises(ValueError):
+        get_reranker(kind="colbert")
+
+def test_kb_retriever_wraps_hybrid(tmp_path, monkeypatch):
+    """Test that the agent's KB retriever compresses by default and KB_COMPRESS=0 bypasses it."""
+    chroma = pytest.importorskip("langchain_chroma")
+    tamara_graph = pytest.importorskip("tamara_graph")
+    from providers import HashingEmbeddings
+
+    store = chroma.Chroma(collection_name="kb_compress", persist_directory=str(tmp_path),
+                          embedding_function=HashingEmbeddings())
+    store.add_documents(_docs(FLOW, FLOW_COPY, FRR, CLEAN, LID), ids=["0", "1", "2", "3", "4"])
+    monkeypatch.setenv("KB_TOP_K", "2")
+    retriever = tamara_graph._kb_retriever(store, str(tmp_path))
+    assert isinstance(retriever, CompressingRetriever)
+    kept = retriever.invoke("What is the total flow rate range?")
+    assert kept[0].page_content in (FLOW, FLOW_COPY) and len(kept) <= 2
+    _kept, stats = retriever.compress_with_stats("What is the total flow rate range?",
+                                                 retriever.base.invoke("What is the total flow rate range?"))
+    assert stats.candidates == 5
+
+    monkeypatch.setenv("KB_COMPRESS", "0")
+    assert not isinstance(tamara_graph._kb_retriever(store, str(tmp_path)), CompressingRetriever)
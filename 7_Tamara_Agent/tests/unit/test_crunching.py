@@ -0,0 +1,57 @@
+"""
+Unit tests for the crunching model's memoized, packed sequence builder.
+"""
+import struct
+import pytest
+from crunching import (
+    RunParameters, compute_derived_parameters, build_sequence, pack_sequence,
+    build_sequence_batch, iter_packed, sequence_cache_info, SEQUENCE_LENGTH, SOLVENT_PROPERTIES,
+    MODE_RUN, MODE_CLEAN, CLEAN_ALTERNATE,
+)
+from plc_tool import DB_CONFIG
+
+def _run(tfr: float = 1.0, frr: int = 3) -> RunParameters:
+    ethanol = SOLVENT_PROPERTIES['ethanol']
+    return RunParameters(
+        tfr=tfr, frr=frr, tar_vol=1.0, temp=25.0, chip_id="HERRINGBONE", manifold="SMALL",
+        viscosity_org=ethanol['viscosity'], viscosity_sens=ethanol['sensitivity'],
+        molar_vol=ethanol['molar_volume'], lab_pressure=2.0,
+    )
+
+def test_sequence_length_matches_plc_registry():
+    """Test that the model and the PLC tag registry agree on the array size."""
+    assert SEQUENCE_LENGTH == DB_CONFIG['SEQUENCE']['r_SEQUENCE']['count']
+
+@pytest.mark.parametrize("mode,clean_type", [(MODE_RUN, None), (MODE_CLEAN, CLEAN_ALTERNATE)])
+def test_pack_sequence_matches_build_sequence(mode, clean_type):
+    """Test that packed bytes decode to the float32-rounded list sequence."""
+    rp = _run()
+    compute_derived_parameters(rp)
+    expected = build_sequence(rp, mode, clean_type)
+
+    packed = pack_sequence(_run(), mode, clean_type)
+    assert len(packed) == 4 * SEQUENCE_LENGTH
+    assert list(struct.unpack(f">{SEQUENCE_LENGTH}f", packed)) == pytest.approx(expected, rel=1e-6)
+
+def test_pack_sequence_is_memoized():
+    """Test that identical (rounded) inputs hit the cache."""
+    pack_sequence(_run(tfr=1.25))
+    hits = sequence_cache_info().hits
+    pack_sequence(_run(tfr=1.25 + 1e-9))
+    assert sequence_cache_info().hits == hits + 1
+
+def test_batch_layout():
+    """Test that batch payloads are concatenated in queue order."""
+    runs = [_run(tfr=1.0), _run(tfr=2.0), _run(tfr=1.0)]
+    buffer = build_sequence_batch(runs)
+    views = iter_packed(buffer)
+    assert len(views) == 3
+    assert bytes(views[0]) == bytes(views[2]) == pack_sequence(runs[0])
+    assert bytes(views[1]) == pack_sequence(runs[1])
+
+def test_write_packed_sequence(plc_sim):
+    """Test that a packed payload goes to the PLC in one verified write."""
+    payload = pack_sequence(_run())
+    with plc_sim:
+        readback = plc_sim.write_sequence(payload)
+        assert struct.pack(f">{SEQUENCE_LENGTH}f", *readback) == payload
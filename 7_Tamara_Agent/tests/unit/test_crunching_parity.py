@@ -0,0 +1,51 @@
+"""
+Parity tests between the Python crunching model and the FB_2a-Crunching transcription.
+
+Set PARITY_SAMPLES to widen the sweep (e.g. PARITY_SAMPLES=1000000).
+"""
+import os
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from crunching import RunParameters, compute_derived_parameters, TFR_WINDOW_MIN, SOLVENT_PROPERTIES
+from crunching_parity import compare, sample_inputs, fb_2a_crunching
+
+SAMPLES = int(os.getenv("PARITY_SAMPLES", "50000"))
+REL_TOL = 1e-5        # float32 (S7 REAL) rounding
+ROOT_REL_TOL = 1e-4   # -r + sqrt(r² + 4·p·ra) cancels digits in float32
+
+@pytest.fixture(scope="module")
+def report():
+    return compare(SAMPLES, seed=1234)
+
+def test_numeric_outputs_match_plc(report):
+    """Test that every derived value agrees with the PLC within REAL precision."""
+    for name, dev in report.max_rel_dev.items():
+        tol = ROOT_REL_TOL if name in ("tfrmin", "tfrmax") else REL_TOL
+        assert dev <= tol, f"{name}: max rel. deviation {dev:.3e} > {tol:.0e}"
+
+def test_validity_disagreements_are_all_explained(report):
+    """Test that CRUNCH_VALID only differs for the documented divergences."""
+    assert report.unexplained_disagreements == 0, report.format()
+
+def test_tfr_window_fallback_matches_plc():
+    """Test that the TFRmax <= TFRmin fallback uses the PLC's 0.1 mL/min window."""
+    ethanol = SOLVENT_PROPERTIES['ethanol']
+    # Lab pressure below P_MIN_BAR / 0.9 forces TFRmax below TFRmin on both sides
+    rp = RunParameters(tfr=1.0, frr=3, tar_vol=20.0, temp=20.0, chip_id="BAFFLE", manifold="LARGE",
+                       viscosity_org=ethanol['viscosity'], viscosity_sens=ethanol['sensitivity'],
+                       molar_vol=ethanol['molar_volume'], lab_pressure=0.1)
+    compute_derived_parameters(rp)
+    assert rp.tfrmax == pytest.approx(rp.tfrmin + TFR_WINDOW_MIN)
+
+    plc = fb_2a_crunching({k: np.asarray(v) for k, v in {
+        'tfr': [1.0], 'frr': [3], 'tar_vol': [20.0], 'temp': [20.0], 'chip': [0], 'manifold': [1],
+        'visc': [rp.viscosity_org], 'sens': [rp.viscosity_sens], 'molar': [rp.molar_vol],
+        'lab_pressure': [0.1]}.items()})
+    assert float(plc['r_tfrmax'][0]) == pytest.approx(rp.tfrmax, rel=ROOT_REL_TOL)
+
+def test_sampler_is_deterministic():
+    """Test that the same seed reproduces the same inputs."""
+    a, b = sample_inputs(100, seed=7), sample_inputs(100, seed=7)
+    assert all(np.array_equal(a[k], b[k]) for k in a)
@@ -0,0 +1,94 @@
+"""
+Unit tests for ingestion-time chunk deduplication.
+"""
+import pytest
+from dedupe import ChunkDeduper, exact_key, jaccard, minhash, shingles
+
+PASSAGE = (
+    "The TAMARA system mixes the aqueous and solvent streams in a herringbone microfluidic chip. "
+    "Total flow rate ranges from 0.8 to 15 mL/min and the flow rate ratio from 1:1 to 1:10, "
+    "which sets the final solvent fraction and therefore the lipid nanoparticle size. "
+    "Keep the lid closed during a run and clean the chip with ethanol and water afterwards, "
+    "then run a pressure test before the next formulation so that leaks are detected early."
+)
+OTHER = (
+    "Dialysis removes residual ethanol from the nanoparticle suspension through a membrane whose "
+    "molecular weight cut-off is chosen for the payload; several buffer exchanges over a few hours "
+    "are usually needed, and tangential flow filtration is the scalable alternative for larger batches."
+)
+
+def test_exact_key_ignores_formatting():
+    """Test that markup, padding and case do not change the normalised hash."""
+    assert exact_key("| TFR      | 0.8 to 15 mL/min |") == exact_key("tfr 0.8 to 15 ML/MIN")
+    assert exact_key(PASSAGE) != exact_key(OTHER)
+
+def test_minhash_estimates_similarity():
+    """Test that a lightly edited copy scores high and unrelated text low."""
+    edited = PASSAGE.replace("early", "as early as possible")
+    assert jaccard(minhash(shingles(PASSAGE)), minhash(shingles(edited))) > 0.85
+    assert jaccard(minhash(shingles(PASSAGE)), minhash(shingles(OTHER))) < 0.2
+
+def test_deduper_finds_exact_and_near_copies():
+    """Test canonical lookup for copies, near copies, distinct text and after removal."""
+    deduper = ChunkDeduper()
+    deduper.add("a", PASSAGE)
+    assert deduper.find("## " + PASSAGE.upper()) == "a"
+    assert deduper.find(PASSAGE.replace("early", "as early as possible")) == "a"
+    assert deduper.find(OTHER) is None
+    assert deduper.find("Keep the lid closed") is None   # too short for MinHash, no exact match
+    deduper.remove("a")
+    assert deduper.find(PASSAGE) is None and len(deduper) == 0
+
+@pytest.fixture
+def parallel_kb(tmp_path):
+    chroma = pytest.importorskip("langchain_chroma")
+    from providers import HashingEmbeddings
+    kb_dir, db_dir = tmp_path / "kb", tmp_path / "db"
+    for sub, ext in (("md", ".tables.md"), ("txt", ".tables.txt")):
+        (kb_dir / sub).mkdir(parents=True)
+        (kb_dir / sub / f"guide{ext}").write_text(f"## Run\n\n{PASSAGE}\n\n## Purification\n\n{OTHER} {OTHER}\n")
+    (kb_dir / "txt" / "notes.txt").write_text(PASSAGE.replace("early", "as early as possible") + "\n")
+    db_dir.mkdir()
+    store = chroma.Chroma(collection_name="kb_dedupe", persist_directory=str(db_dir),
+                          embedding_function=HashingEmbeddings())
+    return store, kb_dir, db_dir
+
+def test_sync_stores_one_chunk_per_passage(parallel_kb):
+    """Test that md/txt copies and near copies are recorded as duplicates, not embedded."""
+    from kb_ingest import load_manifest, manifest_path, sync_knowledge_base
+
+    store, kb_dir, db_dir = parallel_kb
+    report = sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    files = load_manifest(manifest_path(str(db_dir)))["files"]
+    canonical = files["md/guide.tables.md"]["chunks"]
+    assert len(store.get(include=[])["ids"]) == len(canonical) == report.chunks_added
+    assert files["txt/guide.tables.txt"]["chunks"] == []
+    assert set(files["txt/guide.tables.txt"]["duplicates"].values()) == set(canonical)
+    assert files["txt/notes.txt"]["chunks"] == []
+    assert report.chunks_deduplicated == len(canonical) + 1
+    assert "duplicates skipped" in report.summary()
+
+def test_removing_canonical_promotes_duplicates(parallel_kb):
+    """Test that deleting the canonical copy re-embeds its passages from the remaining copy."""
+    from kb_ingest import load_manifest, manifest_path, sync_knowledge_base
+
+    store, kb_dir, db_dir = parallel_kb
+    sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    (kb_dir / "md" / "guide.tables.md").unlink()
+    report = sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    files = load_manifest(manifest_path(str(db_dir)))["files"]
+    promoted = files["txt/guide.tables.txt"]["chunks"]
+    assert promoted and report.updated_files and report.chunks_added == len(promoted)
+    assert set(store.get(include=[])["ids"]) == set(promoted)
+    assert set(files["txt/notes.txt"]["duplicates"].values()) <= set(promoted)
+    assert not sync_knowledge_base(store, str(kb_dir), str(db_dir)).changed
+
+def test_dedupe_can_be_disabled(parallel_kb):
+    """Test that turning deduplication off re-evaluates the KB and stores every copy."""
+    from kb_ingest import sync_knowledge_base
+
+    store, kb_dir, db_dir = parallel_kb
+    first = sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    report = sync_knowledge_base(store, str(kb_dir), str(db_dir), dedupe=False)
+    assert report.chunks_deduplicated == 0
+    assert len(store.get(include=[])["ids"]) == first.chunks_added + first.chunks_deduplicated
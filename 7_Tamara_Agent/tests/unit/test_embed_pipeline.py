@@ -0,0 +1,177 @@
+"""
+Unit tests for the concurrent, rate-limited embedding pipeline against a local
+OpenAI-compatible stand-in embedding server.
+"""
+import base64
+import hashlib
+import json
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+langchain_openai = pytest.importorskip("langchain_openai")
+from embed_pipeline import ConcurrentEmbeddings, TokenBucket, close_embeddings
+
+DIM = 8
+
+def _vector(text: str):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [b / 255.0 for b in digest[:DIM]]
+
+class StandInEmbeddingServer(ThreadingHTTPServer):
+    """Serves POST /v1/embeddings; can reject the first N requests with 429."""
+    daemon_threads = True
+
+    def __init__(self, latency_s: float = 0.02, fail_first: int = 0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency_s = latency_s
+        self.fail_first = fail_first
+        self.requests = 0
+        self.texts = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+class _Handler(BaseHTTPRequestHandler):
+    server: StandInEmbeddingServer
+
+    def log_message(self, *_args):
+        pass
+
+    def _reply(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        srv = self.server
+        with srv.lock:
+            srv.requests += 1
+            reject = srv.requests <= srv.fail_first
+            srv.in_flight += 1
+            srv.max_in_flight = max(srv.max_in_flight, srv.in_flight)
+        try:
+            time.sleep(srv.latency_s)
+            if reject:
+                return self._reply(429, {"error": {"message": "Rate limit reached", "type": "requests"}})
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            with srv.lock:
+                srv.texts += len(inputs)
+            data = []
+            for i, text in enumerate(inputs):
+                vec = _vector(text)
+                if body.get("encoding_format") == "base64":
+                    vec = base64.b64encode(struct.pack(f"<{DIM}f", *vec)).decode()
+                data.append({"object": "embedding", "index": i, "embedding": vec})
+            self._reply(200, {"object": "list", "data": data, "model": body["model"],
+                              "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)}})
+        finally:
+            with srv.lock:
+                srv.in_flight -= 1
+
+@pytest.fixture
+def server_factory():
+    servers = []
+
+    def _start(**kwargs) -> StandInEmbeddingServer:
+        srv = StandInEmbeddingServer(**kwargs)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        servers.append(srv)
+        return srv
+
+    yield _start
+    for srv in servers:
+        srv.shutdown()
+        srv.server_close()
+
+def _provider(srv: StandInEmbeddingServer):
+    return langchain_openai.OpenAIEmbeddings(model="text-embedding-3-small", base_url=srv.base_url,
+                                             api_key="test", max_retries=0, check_embedding_ctx_length=False)
+
+def test_batches_run_concurrently_and_preserve_order(server_factory):
+    """Test that batches fan out over the worker pool and vectors come back in input order."""
+    srv = server_factory(latency_s=0.05)
+    pipeline = ConcurrentEmbeddings(_provider(srv), batch_size=4, workers=4)
+    texts = [f"chunk {i}" for i in range(32)] + ["chunk 0", "chunk 1"]
+    vectors = pipeline.embed_documents(texts)
+    assert [v == pytest.approx(_vector(t), abs=1e-6) for t, v in zip(texts, vectors)] == [True] * len(texts)
+    assert srv.texts == 32   # duplicates embedded once
+    assert srv.requests == pipeline.last.batches == 8
+    assert 1 < srv.max_in_flight <= 4
+    assert pipeline.last.chunks_per_s > 0
+
+def test_rate_limited_requests_are_retried(server_factory):
+    """Test that 429 responses are retried with backoff until the batch succeeds."""
+    srv = server_factory(fail_first=2, latency_s=0)
+    pipeline = ConcurrentEmbeddings(_provider(srv), batch_size=8, workers=1, backoff_s=0.01)
+    vectors = pipeline.embed_documents(["a", "b"])
+    assert vectors[0] == pytest.approx(_vector("a"), abs=1e-6)
+    assert pipeline.last.retries == 2
+
+def test_retries_exhausted_raise(server_factory):
+    """Test that a persistently failing provider surfaces its error."""
+    srv = server_factory(fail_first=100, latency_s=0)
+    pipeline = ConcurrentEmbeddings(_provider(srv), workers=1, max_retries=1, backoff_s=0.01)
+    with pytest.raises(Exception):
+        pipeline.embed_documents(["a"])
+    assert srv.requests == 2
+
+def test_requests_per_minute_limit_is_enforced(server_factory):
+    """Test that the request bucket spaces out requests beyond its burst."""
+    srv = server_factory(latency_s=0)
+    pipeline = ConcurrentEmbeddings(_provider(srv), batch_size=1, workers=4, requests_per_min=600)  # 10/s
+    start = time.perf_counter()
+    pipeline.embed_documents([str(i) for i in range(13)])
+    assert time.perf_counter() - start >= 0.25   # burst of 10, then 3 more at 10/s
+    assert pipeline.last.throttled_s > 0
+
+def test_close_shuts_the_pool_down(server_factory, tmp_path):
+    """Test that the pool is shut down by the context manager and through a cache wrapper."""
+    from embedding_cache import CachedEmbeddings
+    from providers import HashingEmbeddings
+
+    srv = server_factory(latency_s=0)
+    with ConcurrentEmbeddings(_provider(srv), workers=2) as pipeline:
+        pipeline.embed_documents(["a", "b"])
+    with pytest.raises(RuntimeError):
+        pipeline.embed_documents(["c"])
+
+    cached = CachedEmbeddings(ConcurrentEmbeddings(_provider(srv), workers=2), path=str(tmp_path / "cache.db"))
+    cached.embed_documents(["a"])
+    close_embeddings(cached)
+    assert cached.embeddings._pool._shutdown
+    close_embeddings(HashingEmbeddings())   # nothing to release
+
+def test_token_bucket_refills():
+    """Test the token bucket's burst and refill behaviour."""
+    bucket = TokenBucket(rate=100.0, capacity=5)
+    assert bucket.acquire(5) == 0.0
+    assert bucket.acquire(1) > 0.0
+
+def test_kb_sync_streams_through_pipeline(server_factory, tmp_path):
+    """Test an incremental KB sync end to end against the stand-in server."""
+    chroma = pytest.importorskip("langchain_chroma")
+    from kb_ingest import sync_knowledge_base
+
+    srv = server_factory(latency_s=0.01)
+    kb_dir, db_dir = tmp_path / "kb", tmp_path / "db"
+    kb_dir.mkdir()
+    for i in range(5):
+        (kb_dir / f"doc{i}.txt").write_text(f"Document {i}. " + "TAMARA formulation notes. " * 60)
+    pipeline = ConcurrentEmbeddings(_provider(srv), batch_size=8, workers=3)
+    store = chroma.Chroma(collection_name="kb_pipeline", persist_directory=str(db_dir), embedding_function=pipeline)
+    report = sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    assert report.chunks_added == len(store.get(include=[])["ids"]) > 5
+    assert srv.texts == pipeline.stats.unique
+    assert report.chunks_per_s > 0 and "chunks/s" in report.summary()
@@ -0,0 +1,52 @@
+"""
+Unit tests for the persistent (model, chunk hash) embedding cache.
+"""
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from embedding_cache import CachedEmbeddings
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """Deterministic embeddings that record every text sent to the 'API'."""
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls = self.calls + list(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls = self.calls + [text]
+        return super().embed_query(text)
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache.sqlite3")
+
+def test_second_call_is_served_from_cache(cache_path):
+    """Test that identical texts are only embedded once, across calls."""
+    inner = CountingEmbedding(size=8)
+    cache = CachedEmbeddings(inner, path=cache_path, model="fake")
+    first = cache.embed_documents(["a", "b", "a"])
+    second = cache.embed_documents(["b", "a", "c"])
+    assert inner.calls == ["a", "b", "c"]
+    assert second[:2] == [first[1], first[0]]
+    assert (cache.hits, cache.misses) == (3, 3)
+
+def test_cache_persists_across_instances(cache_path):
+    """Test that a rebuild in a new process reuses stored float32 vectors."""
+    vectors = CachedEmbeddings(CountingEmbedding(size=8), path=cache_path, model="fake").embed_documents(["x"])
+    inner = CountingEmbedding(size=8)
+    again = CachedEmbeddings(inner, path=cache_path, model="fake").embed_documents(["x"])
+    assert inner.calls == []
+    assert again == vectors
+    assert again[0] == pytest.approx(DeterministicFakeEmbedding(size=8).embed_documents(["x"])[0], rel=1e-6)
+
+def test_models_and_queries_are_separate_namespaces(cache_path):
+    """Test that the cache never returns a vector from another model or from document mode for a query."""
+    CachedEmbeddings(CountingEmbedding(size=8), path=cache_path, model="m1").embed_documents(["x"])
+    inner = CountingEmbedding(size=8)
+    other = CachedEmbeddings(inner, path=cache_path, model="m2")
+    other.embed_documents(["x"])
+    other.embed_query("x")
+    other.embed_query("x")
+    assert inner.calls == ["x", "x"]
+    assert len(other) == 1
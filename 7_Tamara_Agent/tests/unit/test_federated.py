@@ -0,0 +1,171 @@
+"""
+Unit tests for federated retrieval across collections.
+"""
+import logging
+import time
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+from federated import FederatedRetriever, Source, calibrate_scores, fit_budget, merge, normalize_scores, rerank_or_normalize
+
+def _source(name, hits, quota=3, weight=1.0, delay=0.0):
+    def search(query, callbacks=None):
+        time.sleep(delay)
+        return [(Document(page_content=text, metadata={"source": f"{name}.txt"}), score) for text, score in hits]
+    return Source(name, search, quota, weight)
+
+def test_normalize_scores():
+    """Test min-max normalisation within a source."""
+    docs = [Document(page_content=str(i)) for i in range(3)]
+    assert [s for _d, s in normalize_scores(list(zip(docs, [0.9, 0.6, 0.3])))] == pytest.approx([1.0, 0.5, 0.0])
+    assert [s for _d, s in normalize_scores([(docs[0], 0.2)])] == [1.0]
+    assert normalize_scores([]) == []
+
+def test_merge_respects_quotas_weights_and_duplicates():
+    """Test the merge order, per-source quotas, cross-source dedup and origin tags."""
+    kb = _source("kb", [("kb 1", 12.0), ("kb 2", 9.0), ("shared text", 6.0), ("kb 4", 3.0)], quota=3)
+    web = _source("web", [("web 1", 0.71), ("Shared  TEXT", 0.6), ("web 3", 0.5)], quota=2, weight=0.8)
+    results = {s.name: s.search("q") for s in (kb, web)}
+    merged = merge(results, [kb, web], k=10)
+    # web "Shared TEXT" (0.38) outranks the kb copy (0.33); web 3 is over the web quota
+    assert [d.page_content for d in merged] == ["kb 1", "web 1", "kb 2", "Shared  TEXT", "kb 4"]
+    assert [d.metadata["origin"] for d in merged] == ["kb", "web", "kb", "web", "kb"]
+    assert merged[1].metadata["federated_score"] == pytest.approx(0.8)
+    assert [d.page_content for d in merge(results, [kb, web], k=2)] == ["kb 1", "web 1"]
+
+def test_weak_web_hit_does_not_outrank_strong_kb_chunks():
+    """Test that rerank scores and website cosines stay absolute, so a weak web hit ranks last."""
+    def kb_search(query, callbacks=None):
+        return [(Document(page_content=f"kb {i}", metadata={"rerank_score": score}), score)
+                for i, score in enumerate([0.95, 0.9, 0.88, 0.87, 0.86, 0.85])]
+
+    kb = Source("kb", kb_search, quota=6, normalize=rerank_or_normalize)
+    web = _source("web", [("weak web", 0.31)], quota=2, weight=0.8)
+    web.normalize = calibrate_scores(0.3, 0.75)
+    merged = merge({s.name: s.search("q") for s in (kb, web)}, [kb, web], k=6)
+    assert [d.metadata["origin"] for d in merged] == ["kb"] * 6
+    assert merged[-1].metadata["federated_score"] == pytest.approx(0.85)
+
+    strong = _source("web", [("strong web", 0.8)], quota=2, weight=1.0)
+    strong.normalize = calibrate_scores(0.3, 0.75)
+    merged = merge({"kb": kb.search("q"), "web": strong.search("q")}, [kb, strong], k=6)
+    assert merged[0].page_content == "strong web" and "kb 5" not in [d.page_content for d in merged]
+    assert [s for _d, s in rerank_or_normalize([(Document(page_content="x"), 12.0)])] == [1.0]   # RRF-style
+
+def test_token_budget_after_merge():
+    """Test that the merged chunks, website ones included, are trimmed to the token budget."""
+    docs = [Document(page_content=" ".join(["w"] * n)) for n in (50, 30, 40, 10)]
+    count = lambda text: len(text.split())
+    assert [len(d.page_content.split()) for d in fit_budget(docs, 90, count)] == [50, 30, 10]
+    assert len(fit_budget(docs[:1], 5, count)) == 1   # the best chunk is always kept
+
+    retriever = FederatedRetriever(k=4, token_budget=60, count_tokens=count, sources=[
+        _source("kb", [(" ".join(["kb"] * 40), 1.0), (" ".join(["kb2"] * 30), 0.5)]),
+        _source("web", [(" ".join(["web"] * 15), 0.9)], weight=0.8),
+    ])
+    assert [d.metadata["origin"] for d in retriever.invoke("q")] == ["kb", "web"]
+
+def test_sources_are_queried_concurrently_and_failures_skipped(caplog):
+    """Test that latency is the slowest source, not the sum, and a failing or slow source is dropped."""
+    def broken(query, callbacks=None):
+        raise RuntimeError("index missing")
+
+    retriever = FederatedRetriever(k=4, sources=[
+        _source("kb", [("kb 1", 1.0)], delay=0.3),
+        _source("web", [("web 1", 0.5)], delay=0.3),
+        Source("broken", broken, quota=2),
+    ])
+    start = time.perf_counter()
+    with caplog.at_level(logging.DEBUG, logger="federated"):
+        docs = retriever.invoke("What is TAMARA?")
+    assert time.perf_counter() - start < 0.55
+    assert {d.metadata["origin"] for d in docs} == {"kb", "web"}
+    assert all(f"'{name}':" in caplog.text for name in ("kb", "web", "broken", "total"))
+    assert not hasattr(retriever, "last_timings")
+
+    slow = FederatedRetriever(k=4, timeout_s=0.1, sources=[_source("kb", [("kb 1", 1.0)]),
+                                                           _source("web", [("web 1", 0.5)], delay=0.5)])
+    assert [d.metadata["origin"] for d in slow.invoke("q")] == ["kb"]
+
+def test_sub_retrievers_run_under_the_federated_run():
+    """Test that tracing callbacks reach the sub-retriever calls as child runs."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class Runs(BaseCallbackHandler):
+        def __init__(self):
+            self.retriever_runs, self.chain_parents = [], []
+
+        def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+            self.retriever_runs.append(run_id)
+
+        def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+            self.chain_parents.append(parent_run_id)
+
+    kb = RunnableLambda(lambda _q: [Document(page_content="kb 1")])
+    retriever = FederatedRetriever(k=2, sources=[Source.from_retriever("kb", kb, quota=2)])
+    handler = Runs()
+    assert [d.page_content for d in retriever.invoke("q", config={"callbacks": [handler]})] == ["kb 1"]
+    assert handler.chain_parents == handler.retriever_runs   # the kb run is a child of the federated run
+
+def test_vectorstore_source_uses_cosine_floor(tmp_path):
+    """Test that vector-store hits are converted to cosine similarity and filtered by the floor."""
+    chroma = pytest.importorskip("langchain_chroma")
+    from providers import HashingEmbeddings
+
+    store = chroma.Chroma(collection_name="web_fed", persist_directory=str(tmp_path),
+                          embedding_function=HashingEmbeddings())
+    store.add_texts(["Inside Therapeutics builds LNP formulation platforms.", "Contact and opening hours."],
+                    metadatas=[{"sourceURL": "https://insidetx.com/"}, {"sourceURL": "https://insidetx.com/contact"}])
+    hits = Source.from_vectorstore("web", store, quota=2, min_similarity=0.99).search(
+        "Inside Therapeutics builds LNP formulation platforms.")
+    assert len(hits) == 1 and hits[0][1] == pytest.approx(1.0, abs=1e-3)
+    merged = merge({"web": hits}, [Source("web", None, quota=2)], k=2)
+    assert merged[0].metadata["source"] == "https://insidetx.com/"
+
+def test_website_collection_opened_from_a_working_copy(tmp_path, monkeypatch):
+    """Test that the agent queries a copy of the shipped collection, refreshed only when it changes."""
+    tamara_graph = pytest.importorskip("tamara_graph")
+    monkeypatch.setattr(tamara_graph, "SCRIPT_DIR", str(tmp_path / "agent"))
+    shipped = tmp_path / "chroma_web"
+    (shipped / "segment").mkdir(parents=True)
+    (shipped / "chroma.sqlite3").write_bytes(b"v1")
+    (shipped / "segment" / "header.bin").write_bytes(b"h")
+
+    copy = tamara_graph._working_copy(str(shipped))
+    assert copy == str(tmp_path / "agent" / "db" / "runtime" / "chroma_web")
+    (tmp_path / "agent" / "db" / "runtime" / "chroma_web" / "segment" / "header.bin").write_bytes(b"rewritten")
+    assert tamara_graph._working_copy(str(shipped)) == copy
+    assert (shipped / "segment" / "header.bin").read_bytes() == b"h"          # the shipped files are untouched
+    assert (tmp_path / "agent" / "db" / "runtime" / "chroma_web" / "segment" / "header.bin").read_bytes() == b"rewritten"
+
+    (shipped / "chroma.sqlite3").write_bytes(b"v2, recrawled")
+    tamara_graph._working_copy(str(shipped))
+    assert (tmp_path / "agent" / "db" / "runtime" / "chroma_web" / "chroma.sqlite3").read_bytes() == b"v2, recrawled"
+
+def test_flat_backend_opens_the_flat_website_index(tmp_path, monkeypatch):
+    """Test that VECTOR_STORE=flat queries the website's flat index, and falls back to Chroma without one."""
+    tamara_graph = pytest.importorskip("tamara_graph")
+    from flat_store import FlatVectorStore
+    from providers import HashingEmbeddings
+
+    embeddings = HashingEmbeddings()
+    FlatVectorStore(str(tmp_path / "flat_web"), embeddings).add_documents(
+        [Document(page_content="TAMARA ships with a herringbone chip.", metadata={"sourceURL": "https://insidetx.com"})],
+        ids=["w1"])
+    monkeypatch.setattr(tamara_graph, "get_embeddings", lambda: embeddings)
+    monkeypatch.setattr(tamara_graph, "index_suffix", lambda: "")
+    monkeypatch.setenv("VECTOR_STORE", "flat")
+    monkeypatch.setenv("WEB_FLAT_DIR", str(tmp_path / "flat_web"))
+    monkeypatch.setenv("WEB_CHROMA_DIR", str(tmp_path / "chroma_web"))
+    monkeypatch.setenv("WEB_MIN_SIM", "0")
+
+    assert tamara_graph._web_index() == (str(tmp_path / "flat_web"), "flat")
+    retriever = tamara_graph._federated_retriever(RunnableLambda(lambda _q: []))
+    hits = retriever.sources[1].search("herringbone chip")
+    assert [d.metadata["sourceURL"] for d, _s in hits] == ["https://insidetx.com"]
+
+    monkeypatch.setenv("WEB_FLAT_DIR", str(tmp_path / "missing"))
+    assert tamara_graph._web_index() == (str(tmp_path / "chroma_web"), "chroma")
+    monkeypatch.setenv("VECTOR_STORE", "chroma")
+    assert tamara_graph._web_index() == (str(tmp_path / "chroma_web"), "chroma")
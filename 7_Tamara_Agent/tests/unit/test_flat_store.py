@@ -0,0 +1,107 @@
+"""
+Unit tests for the memory-mapped flat vector store.
+"""
+import os
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from flat_store import META_NAME, FlatVectorStore, bulk_writes, checkpoint, open_vectorstore
+from providers import HashingEmbeddings
+
+TEXTS = {
+    "frr": "The FRR sets the ratio between the aqueous and solvent flows.",
+    "chip": "The herringbone chip mixes by chaotic advection at low flow rates.",
+    "lid": "Keep the lid closed during a pressure test.",
+}
+
+def _store(path):
+    store = FlatVectorStore(str(path), HashingEmbeddings())
+    store.add_documents([Document(page_content=t, metadata={"source": f"{cid}.txt"}) for cid, t in TEXTS.items()],
+                        ids=list(TEXTS))
+    return store
+
+def _files(path):
+    return sorted(p for p in os.listdir(path) if p.startswith("flat_vectors"))
+
+def test_search_and_memory_mapped_reload(tmp_path):
+    """Test exact cosine top-k, ids/metadata on hits, and a memory-mapped reopen."""
+    store = _store(tmp_path)
+    doc, distance = store.similarity_search_with_score(TEXTS["lid"], k=1)[0]
+    assert (doc.id, doc.metadata["source"]) == ("lid", "lid.txt") and distance == pytest.approx(0.0, abs=1e-5)
+    assert [d.id for d in store.similarity_search("herringbone chip advection", k=3)][0] == "chip"
+
+    reopened = FlatVectorStore(str(tmp_path), HashingEmbeddings())
+    assert isinstance(reopened._vectors, np.memmap) and len(reopened) == 3
+    assert [d.id for d in reopened.similarity_search(TEXTS["frr"], k=2)] == [d.id for d in store.similarity_search(TEXTS["frr"], k=2)]
+    assert len(_files(tmp_path)) == 1
+
+def test_upsert_delete_and_get(tmp_path):
+    """Test Chroma-compatible upsert, delete and get(ids=, include=)."""
+    store = _store(tmp_path)
+    store.add_texts(["Keep the lid closed at all times."], [{"source": "lid2.txt"}], ids=["lid"])
+    assert len(store) == 3 and store.get(ids=["lid"])["documents"] == ["Keep the lid closed at all times."]
+    store.delete(ids=["frr", "missing"])
+    assert store.get(include=[]) == {"ids": ["chip", "lid"]}
+    assert store.get(ids=["chip"], include=["metadatas"])["metadatas"] == [{"source": "chip.txt"}]
+
+    reopened = FlatVectorStore(str(tmp_path), HashingEmbeddings())
+    assert reopened.get(include=["documents"])["documents"] == ["The herringbone chip mixes by chaotic advection at low flow rates.",
+                                                                 "Keep the lid closed at all times."]
+    reopened.delete(ids=["chip", "lid"])
+    assert len(FlatVectorStore(str(tmp_path), HashingEmbeddings())) == 0 and _files(tmp_path) == []
+
+def test_bulk_writes_defer_saving(tmp_path):
+    """Test that saves inside bulk_writes happen once, at the end of the block."""
+    store = FlatVectorStore(str(tmp_path), HashingEmbeddings())
+    with bulk_writes(store):
+        store.add_texts(["first chunk"], ids=["a"])
+        store.add_texts(["second chunk"], ids=["b"])
+        assert not (tmp_path / META_NAME).exists()
+    assert FlatVectorStore(str(tmp_path), HashingEmbeddings()).get(include=[])["ids"] == ["a", "b"]
+
+def test_checkpoint_inside_bulk_writes(tmp_path):
+    """Test that every chunk a KB manifest lists is on disk mid-sync (as after a crash)."""
+    from kb_ingest import MANIFEST_NAME, load_manifest, sync_knowledge_base
+
+    store = FlatVectorStore(str(tmp_path / "db"), HashingEmbeddings())
+    with bulk_writes(store):
+        store.add_texts(["first chunk"], ids=["a"])
+        checkpoint(store)
+        assert FlatVectorStore(str(tmp_path / "db"), HashingEmbeddings()).get(include=[])["ids"] == ["a"]
+
+        kb = tmp_path / "kb"
+        kb.mkdir()
+        for cid, text in TEXTS.items():
+            (kb / f"{cid}.txt").write_text(text)
+        sync_knowledge_base(store, str(kb), str(tmp_path / "db"))
+        listed = {cid for entry in load_manifest(str(tmp_path / "db" / MANIFEST_NAME))["files"].values()
+                  for cid in entry["chunks"]}
+        on_disk = set(FlatVectorStore(str(tmp_path / "db"), HashingEmbeddings()).get(include=[])["ids"])
+        assert listed and listed <= on_disk
+
+def test_kb_sync_and_retrievers_on_flat_store(tmp_path):
+    """Test that kb_ingest, the hybrid retriever and the reformulation pre-check work on the flat backend."""
+    from kb_ingest import sync_knowledge_base
+    from reformulation import top_similarity
+    from retrieval import BM25Index, HybridRetriever
+
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    for cid, text in TEXTS.items():
+        (kb / f"{cid}.txt").write_text(text * 3)
+    db = tmp_path / "db"
+    store = open_vectorstore(str(db), HashingEmbeddings(), "flat")
+    with bulk_writes(store):
+        report = sync_knowledge_base(store, str(kb), str(db))
+    assert report.chunks_added == len(store) == 3
+    assert sync_knowledge_base(open_vectorstore(str(db), HashingEmbeddings(), "flat"), str(kb), str(db)).chunks_added == 0
+
+    retriever = HybridRetriever(vectorstore=store, bm25=BM25Index.from_vectorstore(store), k=1)
+    assert retriever.invoke("What does the FRR set?")[0].metadata["source"] == "frr.txt"
+    assert top_similarity(store, TEXTS["lid"] * 3) == pytest.approx(1.0, abs=1e-3)
+
+def test_unknown_backend():
+    """Test that a misspelt VECTOR_STORE is reported."""
+    with pytest.raises(ValueError):
+        open_vectorstore("unused", HashingEmbeddings(), "faiss")
@@ -0,0 +1,119 @@
+"""
+Unit tests for the bounded RAG chat history.
+"""
+import threading
+from typing import List
+
+import pytest
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from history import FOLD_BATCH, build_history, fold_turns, mark_rag, rag_turns, turns_to_fold
+
+class RecordingLLM(FakeListChatModel):
+    prompts: List[str] = []
+
+    def _call(self, messages, *args, **kwargs):
+        self.prompts.append(messages[0].content)
+        return super()._call(messages, *args, **kwargs)
+
+def _transcript(n):
+    messages = []
+    for i in range(n):
+        messages += [HumanMessage(content=f"question {i}"), mark_rag(AIMessage(content=f"answer {i}"))]
+    return messages
+
+def test_control_messages_are_left_out():
+    """Test that PLC commands, operation flows and unmarked replies never enter the RAG history."""
+    messages = [
+        HumanMessage(content="What is the FRR range?"), mark_rag(AIMessage(content="1:1 to 1:10")),
+        HumanMessage(content="status"), AIMessage(content="TAMARA Status: READY"),
+        HumanMessage(content="run"), AIMessage(content="Parameters sent to PLC. Checking validation..."),
+        AIMessage(content="Safety checklist: close the lid ..."),
+        HumanMessage(content="And the TFR?"), mark_rag(AIMessage(content="0.8 to 15 mL/min")),
+    ]
+    assert [q.content for q, _a in rag_turns(messages)] == ["What is the FRR range?", "And the TFR?"]
+    history = build_history(messages)
+    assert [m.content for m in history] == ["What is the FRR range?", "1:1 to 1:10", "And the TFR?", "0.8 to 15 mL/min"]
+    assert not any(m.additional_kwargs for m in history)
+
+def test_window_and_summary():
+    """Test that only the unsummarised window is verbatim and the summary leads the history."""
+    messages = _transcript(10)
+    history = build_history(messages, summary="Asked about flow rates.", summarized=6, max_turns=4)
+    assert isinstance(history[0], SystemMessage) and "Asked about flow rates." in history[0].content
+    assert [m.content for m in history[1::2]] == [f"question {i}" for i in range(6, 10)]
+    # summarisation disabled or failing: the window is still capped
+    assert len(build_history(messages, max_turns=4)) == 2 * (4 + FOLD_BATCH - 1)
+
+def test_turns_are_folded_in_batches():
+    """Test that turns are folded FOLD_BATCH at a time once the window overflows."""
+    assert turns_to_fold(_transcript(4 + FOLD_BATCH - 1), max_turns=4) == []
+    folded = turns_to_fold(_transcript(4 + FOLD_BATCH), max_turns=4)
+    assert [q.content for q, _a in folded] == [f"question {i}" for i in range(FOLD_BATCH)]
+    assert turns_to_fold(_transcript(4 + FOLD_BATCH), summarized=FOLD_BATCH, max_turns=4) == []
+
+def test_fold_turns_extends_summary():
+    """Test that the summary prompt carries the previous summary and the new exchanges."""
+    llm = RecordingLLM(responses=[" FRR 1:1-1:10 discussed. "])
+    summary = fold_turns(llm, "Operator asked about TFR.", rag_turns(_transcript(2)))
+    assert summary == "FRR 1:1-1:10 discussed."
+    assert "Operator asked about TFR." in llm.prompts[0]
+    assert "Operator: question 1\nAssistant: answer 1" in llm.prompts[0]
+
+def test_prompt_history_stays_bounded(monkeypatch):
+    """Test that over a long session answer_with_rag passes a bounded history and a rolling summary."""
+    tamara_graph = pytest.importorskip("tamara_graph")
+    history_sizes = []
+
+    class Chain:
+        def invoke(self, inputs):
+            history_sizes.append(len(inputs["chat_history"]))
+            return {"answer": "See the manual, section 4."}
+
+    summarizer = FakeListChatModel(responses=["summary"])
+    monkeypatch.setattr(tamara_graph.rag_manager, "ensure_initialized", lambda: (Chain(), summarizer))
+    monkeypatch.setattr(tamara_graph, "get_answer_cache", lambda: None)
+    monkeypatch.setenv("RAG_HISTORY_TURNS", "4")
+
+    state = {"messages": []}
+    for i in range(20):
+        state["messages"].append(HumanMessage(content=f"What is parameter {i}?"))
+        state = tamara_graph.answer_with_rag(state)
+        state["messages"] += [HumanMessage(content="status"), AIMessage(content="TAMARA Status: READY " * 50)]
+    assert max(history_sizes) == 1 + 2 * (4 + FOLD_BATCH - 1)
+    assert history_sizes[-6:] == [9, 11] * 3
+    tamara_graph._join_history_fold(state)
+    assert state["history_summary"] == "summary" and state["history_summarized"] == 16
+
+def test_summary_is_written_after_the_answer(monkeypatch):
+    """Test that answer_with_rag returns before the summarizer finishes and the next question joins it."""
+    tamara_graph = pytest.importorskip("tamara_graph")
+    release = threading.Event()
+    histories = []
+
+    class Chain:
+        def invoke(self, inputs):
+            histories.append(inputs["chat_history"])
+            return {"answer": "See the manual."}
+
+    class SlowSummarizer:
+        def invoke(self, messages):
+            assert release.wait(5)
+            return AIMessage(content="operator asked about parameters")
+
+    monkeypatch.setattr(tamara_graph.rag_manager, "ensure_initialized", lambda: (Chain(), SlowSummarizer()))
+    monkeypatch.setattr(tamara_graph, "get_answer_cache", lambda: None)
+    monkeypatch.setenv("RAG_HISTORY_TURNS", "1")
+
+    state = {"messages": []}
+    for i in range(3):    # the third answer folds the first two turns
+        state["messages"].append(HumanMessage(content=f"What is parameter {i}?"))
+        state = tamara_graph.answer_with_rag(state)
+    fold = state["history_fold"]
+    assert state["messages"][-1].content == "See the manual." and not fold.done()   # answered, summary pending
+
+    release.set()
+    state["messages"].append(HumanMessage(content="And parameter 3?"))
+    state = tamara_graph.answer_with_rag(state)
+    assert fold.done() and state["history_summarized"] == 2
+    assert histories[-1][0].content.endswith("operator asked about parameters")
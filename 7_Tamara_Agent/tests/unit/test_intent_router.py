@@ -0,0 +1,147 @@
+"""
+Unit tests for the local intent router.
+"""
+import statistics
+
+import pytest
+from langchain_core.messages import HumanMessage
+from intent_router import CLARIFY, EXACT, EXAMPLES, IntentRouter, keyword_intent, names_intent
+
+@pytest.fixture(scope="module")
+def router():
+    return IntentRouter()
+
+# Phrasings that are not among the router's examples
+COMMANDS = {
+    "please stop the run": "stop",
+    "hold on, pause": "pause",
+    "stop the cleaning": "stop",
+    "start a run with FRR 3": "run",
+    "kick off a formulation at FRR 3:1": "run",
+    "begin cleaning": "clean",
+    "let's do a leak test": "ptest",
+    "how is the machine doing?": "status",
+    "is the machine running?": "status",
+    "Pressure test": "ptest",
+    "resume": "play",
+    # stop/pause verbs win over whatever else the imperative mentions
+    "stop the cleaning now": "stop",
+    "pause the machine": "pause",
+    "halt": "stop",
+    "cancel": "stop",
+    "kill the run": "stop",
+    "shut it down": "stop",
+    "abort the pressure test": "stop",
+    "cancel the cleaning cycle": "stop",
+    "now stop": "stop",
+}
+QUESTIONS = [
+    "display the history of runs",
+    "what stops the flow?",
+    "what does the stop button do?",
+    "how do I resume after an error?",
+    "how do I clean the herringbone chip?",
+    "Which chip should I use to mix lipids?",
+    "why did the pressure test fail?",
+    "what is the recommended flow rate?",
+    "what is the maximum inlet gas pressure?",
+    # imperatives whose stop/pause word is not the leading verb
+    "show me the chip holder",
+    "explain the hold time",
+    "explain the shutdown procedure",
+    "describe the abort procedure",
+    "give me the cancellation policy",
+]
+
+# Questions the substring rules sent to the PLC, none of them among the router's examples
+FALSE_POSITIVES = {
+    "show me the log of previous runs": "run",
+    "what keeps stopping my runs?": "stop",
+    "what stops the chip from clogging?": "stop",
+    "why does the pump pause during priming?": "pause",
+    "can clogging stop a run?": "stop",
+    "describe what the stop button does": "stop",
+    "explain what the pause key does": "pause",
+    "tell me about the stop button": "stop",
+    "list the stopping criteria": "stop",
+    "explain why the pump pauses during priming": "pause",
+}
+
+def test_probe_phrasings_are_held_out():
+    """Test that no test utterance (other than an exact command) is copied from the router's examples."""
+    examples = {text for texts in EXAMPLES.values() for text in texts}
+    probes = {" ".join(t.lower().replace("?", "").replace(",", "").split()) for t in
+              list(COMMANDS) + QUESTIONS + list(FALSE_POSITIVES)}
+    assert not probes & (examples - set(EXACT))
+
+@pytest.mark.parametrize("text,keyword", sorted(FALSE_POSITIVES.items()))
+def test_substring_false_positives_are_knowledge_questions(router, text, keyword):
+    """Test unseen questions that the substring rules sent to the PLC."""
+    assert keyword_intent(text) == keyword
+    assert router.classify(text).label == "ask_kb"
+
+@pytest.mark.parametrize("text,intent", sorted(COMMANDS.items()))
+def test_commands(router, text, intent):
+    """Test that commands, including unseen phrasings, get their intent."""
+    assert router.classify(text).label == intent
+
+@pytest.mark.parametrize("text", QUESTIONS)
+def test_questions_mentioning_commands(router, text):
+    """Test that questions mentioning run/stop/clean/pressure test go to the knowledge base."""
+    assert router.classify(text).label == "ask_kb"
+
+def test_uncertain_commands_ask_for_clarification(router):
+    """Test the clarification fallback for low-confidence, tied or negated commands."""
+    decision = router.classify("start")
+    assert decision.label == CLARIFY and decision.intent == "run" and decision.margin < router.min_margin
+    assert router.classify("don't stop the run").label == CLARIFY
+    strict = IntentRouter(min_confidence=0.99)
+    assert strict.classify("start a run with FRR 3").label == CLARIFY
+    assert strict.classify("please stop the run").label == "stop"   # stopping is never second-guessed
+    assert strict.classify("stop").label == "stop"   # exact commands are never second-guessed
+
+def test_names_intent():
+    """Test that only the user's own verbs name an intent for the clarification question."""
+    assert names_intent("stop the cleaning now", "stop") and names_intent("stop the cleaning now", "clean")
+    assert names_intent("kick off a formulation", "run") and not names_intent("launch it", "pause")
+
+def test_latency_budget(router):
+    """Test that classification stays well under 5 ms per utterance."""
+    utterances = list(COMMANDS) + QUESTIONS
+    timings = [router.classify(text).elapsed_ms for text in utterances * 5]
+    assert statistics.median(timings) < 5.0
+
+class FakePLC:
+    instances = 0
+
+    def __init__(self):
+        FakePLC.instances += 1
+
+    def read_status(self):
+        import tamara_graph
+        return tamara_graph.PLC_STATUS["READY"]
+
+    def disconnect(self):
+        pass
+
+def test_route_uses_router(monkeypatch):
+    """Test that route answers questions and clarifies uncertain commands without touching the PLC."""
+    tamara_graph = pytest.importorskip("tamara_graph")
+    monkeypatch.setattr(tamara_graph, "PLCInterface", FakePLC)
+    monkeypatch.delenv("ROUTER", raising=False)
+    FakePLC.instances = 0
+
+    state = tamara_graph.route({"messages": [HumanMessage(content="What stops clogging?")]})
+    assert state["intent"] == "ask_kb"
+    state = tamara_graph.route({"messages": [HumanMessage(content="don't stop the run")]})
+    assert state["intent"] == "other" and "'stop'" in state["messages"][-1].content
+    state = tamara_graph.route({"messages": [HumanMessage(content="launch it")]})
+    assert state["intent"] == "other" and "not sure which operation" in state["messages"][-1].content
+    assert FakePLC.instances == 0
+
+    state = tamara_graph.route({"messages": [HumanMessage(content="stop")]})
+    assert state["intent"] == "other" and FakePLC.instances == 1
+
+    monkeypatch.setenv("ROUTER", "keyword")
+    tamara_graph.route({"messages": [HumanMessage(content="What stops clogging?")]})
+    assert FakePLC.instances == 2
@@ -0,0 +1,84 @@
+"""
+Unit tests for incremental, content-hashed knowledge-base ingestion.
+"""
+import json
+import pytest
+
+chroma = pytest.importorskip("langchain_chroma")
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from kb_ingest import sync_knowledge_base, manifest_path, MANIFEST_NAME
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """Deterministic embeddings that record how many texts were embedded."""
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+PARAGRAPH = "TAMARA mixes lipids in ethanol with an aqueous buffer at a controlled flow rate ratio. "
+
+@pytest.fixture
+def kb(tmp_path):
+    kb_dir, db_dir = tmp_path / "kb", tmp_path / "db"
+    kb_dir.mkdir()
+    db_dir.mkdir()
+    (kb_dir / "a.txt").write_text(PARAGRAPH * 20)
+    (kb_dir / "b.md").write_text("# Cleaning\n" + "Flush the chip with solvent after each run. " * 20)
+    embedding = CountingEmbedding(size=16)
+    store = chroma.Chroma(collection_name="kb_test", persist_directory=str(db_dir), embedding_function=embedding)
+    return kb_dir, db_dir, store, embedding
+
+def _count(store) -> int:
+    return len(store.get(include=[])["ids"])
+
+def test_first_sync_embeds_everything_and_writes_manifest(kb):
+    """Test that the initial sync ingests every chunk and records it in the manifest."""
+    kb_dir, db_dir, store, embedding = kb
+    report = sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    assert sorted(report.added_files) == ["a.txt", "b.md"]
+    assert report.chunks_added == embedding.embedded == _count(store)
+    manifest = json.loads((db_dir / MANIFEST_NAME).read_text())
+    assert sum(len(f["chunks"]) for f in manifest["files"].values()) == _count(store)
+
+def test_unchanged_kb_embeds_nothing(kb):
+    """Test that a second sync with no changes costs no embeddings."""
+    kb_dir, db_dir, store, embedding = kb
+    sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    before = embedding.embedded
+    report = sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    assert not report.changed
+    assert embedding.embedded == before
+
+def test_edit_reembeds_only_changed_chunks(kb):
+    """Test that appending to a file embeds only the new chunks and keeps the rest."""
+    kb_dir, db_dir, store, embedding = kb
+    first = sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    before = embedding.embedded
+    (kb_dir / "b.md").write_text((kb_dir / "b.md").read_text() + "\n\nNew section on pressure tests.")
+    report = sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    assert report.updated_files == ["b.md"]
+    assert 0 < embedding.embedded - before < first.chunks_added
+    assert report.chunks_kept > 0
+    assert _count(store) == report.chunks_kept + report.chunks_added
+
+def test_deleted_file_chunks_are_removed(kb):
+    """Test that removing a file deletes exactly its chunks."""
+    kb_dir, db_dir, store, _ = kb
+    sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    b_chunks = len(json.loads((db_dir / MANIFEST_NAME).read_text())["files"]["b.md"]["chunks"])
+    total = _count(store)
+    (kb_dir / "b.md").unlink()
+    report = sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    assert report.deleted_files == ["b.md"]
+    assert _count(store) == total - b_chunks
+    assert {d["source"] for d in store.get()["metadatas"]} == {"a.txt"}
+
+def test_legacy_collection_without_manifest_is_rebuilt(kb):
+    """Test that a collection built without a manifest is replaced, not duplicated."""
+    kb_dir, db_dir, store, _ = kb
+    store.add_texts(["legacy chunk"], metadatas=[{"source": "old.txt"}])
+    report = sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    assert report.rebuilt
+    assert "legacy chunk" not in store.get()["documents"]
+    assert manifest_path(str(db_dir)).endswith(MANIFEST_NAME)
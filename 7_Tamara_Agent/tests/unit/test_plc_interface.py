@@ -122,3 +122,73 @@ def test_stop_command_clearing(plc_sim):
         assert not plc_sim._read_bool('COMMANDS_RUN.b_START')
         assert not plc_sim._read_bool('COMMANDS_RUN.b_PAUSE_PLAY')
         assert not plc_sim._read_bool('COMMANDS_RUN.b_CONFIRM')
+
+def test_bit_address_rounding():
+    """Test that 'byte.bit' addresses are not truncated by float error."""
+    from plc_tool import _bit_address
+    assert _bit_address(258.2) == (258, 2)
+    assert _bit_address(166.1) == (166, 1)
+    assert _bit_address(202.0) == (202, 0)
+
+def test_confirm_and_pause_bits_are_distinct(plc_sim):
+    """Test that CONFIRM (x.2) no longer aliases PAUSE_PLAY (x.1)."""
+    with plc_sim:
+        plc_sim._write_bool('COMMANDS_RUN.b_CONFIRM', True)
+        assert plc_sim._read_bool('COMMANDS_RUN.b_CONFIRM')
+        assert not plc_sim._read_bool('COMMANDS_RUN.b_PAUSE_PLAY')
+
+def test_write_sequence(plc_sim):
+    """Test block write, read-back and start bit of the sequence array."""
+    sequence = [0.0, 0.3, 0.6, 1.0, 0.15, 0.3, 0.5, 1.2, 1.2, 9.6]
+    with plc_sim:
+        readback = plc_sim.write_sequence(sequence)
+        assert readback == pytest.approx(sequence, abs=1e-6)
+        assert plc_sim.read_sequence() == readback
+        assert plc_sim._read_bool('SEQUENCE.b_START_SEQ')
+
+def test_write_sequence_rejects_wrong_length(plc_sim):
+    """Test that a malformed sequence is rejected before touching the PLC."""
+    with plc_sim:
+        with pytest.raises(ValueError):
+            plc_sim.write_sequence([1.0, 2.0])
+        assert not plc_sim._read_bool('SEQUENCE.b_START_SEQ')
+
+def test_read_status_snapshot(plc_sim):
+    """Test that the block status read matches the single-tag reads."""
+    with plc_sim:
+        plc_sim._write_int('OPERATION_MODE', int(OperationMode.AGENTIC))
+        plc_sim._write_int('MACHINE_MODE', int(MachineMode.CLEAN))
+        plc_sim._write_bool('CRUNCH_VALID', True)
+        plc_sim._write_bool('COMMANDS_CLEAN.b_START', True)
+
+        snapshot = plc_sim.read_status_snapshot()
+        assert snapshot['operation_mode'] == int(OperationMode.AGENTIC)
+        assert snapshot['machine_mode'] == int(MachineMode.CLEAN)
+        assert snapshot['crunch_valid']
+        assert snapshot['commands']['CLEAN']['b_START']
+        assert not any(snapshot['commands']['RUN'].values())
+        assert not snapshot['start_seq']
+
+def test_hardware_without_fallback_never_switches_to_the_simulator(monkeypatch):
+    """Test that an unreachable PLC raises instead of silently running on the simulator."""
+    import plc_tool
+    if plc_tool.snap7 is None:
+        with pytest.raises(ImportError):
+            PLCInterface(simulate=False, fallback_to_sim=False)
+        return
+
+    class Unreachable:
+        def connect(self, *_args):
+            raise RuntimeError("TCP : Unreachable peer")
+
+        def get_connected(self):
+            return False
+
+    monkeypatch.setattr(plc_tool.snap7.client, "Client", Unreachable)
+    plc = PLCInterface(ip="192.0.2.1", simulate=False, fallback_to_sim=False)
+    assert not plc.simulated
+    with pytest.raises(ConnectionError, match="192.0.2.1"):
+        plc.ensure_connected()
+    assert not plc.simulated
+
+    assert PLCInterface(ip="192.0.2.1", simulate=False).simulated   # library default keeps the fallback
@@ -0,0 +1,105 @@
+"""
+Unit tests for the prompt registry and the hot-reloaded QA chain.
+"""
+import os
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.runnables import RunnableLambda
+from prompt_registry import DEFAULT_PROMPT_DIR, DEFAULT_RAG_PROMPT, PromptRegistry, parse_stem
+
+def _write(path, text, mtime=None):
+    path.write_text(text)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+@pytest.fixture
+def prompt_dir(tmp_path):
+    _write(tmp_path / "Basic_01.txt", "Answer briefly.\n\n{context}\n", 1_000)
+    _write(tmp_path / "Basic_V2.txt", "Answer briefly, citing sources.\n\n{context}", 1_000)
+    _write(tmp_path / "Expert.txt", "You are a TAMARA expert. {{not a variable}}\n{context}", 1_000)
+    _write(tmp_path / "notes.md", "ignored", 1_000)
+    return tmp_path
+
+def test_names_and_versions(prompt_dir):
+    """Test stem parsing, latest-version lookup, pinned versions and the unknown-name error."""
+    assert parse_stem("AdvancedPrompt_V0") == ("AdvancedPrompt", 0)
+    assert parse_stem("BasicPrompt_01") == ("BasicPrompt", 1) and parse_stem("Basic") == ("Basic", 0)
+
+    registry = PromptRegistry([str(prompt_dir)])
+    assert [(p.name, p.version) for p in registry.available()] == [("Basic", 1), ("Basic", 2), ("Expert", 0)]
+    assert registry.get("Basic").version == 2
+    assert registry.get("Basic", 1).text == "Answer briefly.\n\n{context}"   # stripped
+    assert registry.get("Basic_01") is registry.get("Basic", 1)
+    expert = registry.get("Expert")
+    assert expert.variables == ["context"] and expert.static_prefix == "You are a TAMARA expert. {{not a variable}}\n"
+    with pytest.raises(KeyError, match="Basic_01, Basic_V2, Expert"):
+        registry.get("Advanced")
+    with pytest.raises(KeyError):
+        registry.get("Basic", 3)
+
+    _write(prompt_dir / "Basic.txt", "Unversioned.\n{context}", 1_000)
+    registry.refresh(force=True)
+    assert registry.get("Basic").version == 2 and registry.get("Basic", 0).stem == "Basic"
+
+def test_shipped_prompts():
+    """Test that the default RAG prompt exists and ends with its {context} slot."""
+    prompt = PromptRegistry([DEFAULT_PROMPT_DIR]).get(DEFAULT_RAG_PROMPT)
+    assert prompt.variables == ["context"] and prompt.text.endswith("{context}")
+    assert len(prompt.static_prefix) > 1000
+
+def test_hot_reload(prompt_dir):
+    """Test that unchanged files keep the same object, edits are reloaded, files come and go."""
+    registry = PromptRegistry([str(prompt_dir)], check_interval_s=0)
+    first = registry.get("Basic")
+    assert registry.get("Basic") is first
+
+    _write(prompt_dir / "Basic_V2.txt", "Answer briefly, citing sources.\n\n{context}", 2_000)   # touched only
+    assert registry.get("Basic") is first and registry.reloads == 0
+
+    _write(prompt_dir / "Basic_V2.txt", "Answer in French.\n\n{context}", 3_000)
+    edited = registry.get("Basic")
+    assert edited.text == "Answer in French.\n\n{context}" and edited.sha256 != first.sha256
+    assert registry.reloads == 1
+
+    _write(prompt_dir / "Basic_V3.txt", "Answer in German.\n{context}", 3_000)
+    assert registry.get("Basic").version == 3
+    (prompt_dir / "Basic_V3.txt").unlink()
+    (prompt_dir / "Expert.txt").unlink()
+    assert registry.get("Basic") is edited
+    with pytest.raises(KeyError):
+        registry.get("Expert")
+
+def test_check_interval(prompt_dir):
+    """Test that files are not re-checked before the interval elapses (unless forced)."""
+    registry = PromptRegistry([str(prompt_dir)], check_interval_s=3600)
+    first = registry.get("Basic")
+    _write(prompt_dir / "Basic_V2.txt", "Changed.\n{context}", 5_000)
+    assert registry.get("Basic") is first
+    registry.refresh(force=True)
+    assert registry.get("Basic").text == "Changed.\n{context}"
+
+def test_prompted_chain_rebuilds_on_change(prompt_dir):
+    """Test that the RAG chain keeps its system message byte-identical and follows prompt edits."""
+    tamara_graph = pytest.importorskip("tamara_graph")
+    registry = PromptRegistry([str(prompt_dir)], check_interval_s=0)
+    retriever = RunnableLambda(lambda inputs: [Document(page_content="TFR is 0.8 to 15 mL/min.")])
+    seen = []
+
+    def capture(prompt_value):
+        seen.append(prompt_value.to_messages()[0].content)
+        return prompt_value
+
+    llm = RunnableLambda(capture) | FakeListChatModel(responses=["ok"] * 3)
+    changes = []
+    chain = tamara_graph.PromptedRAGChain(llm, retriever, "Basic", registry, on_change=changes.append)
+    assert chain.current() is chain.current()
+    for _ in range(2):
+        assert chain.invoke({"input": "What is the TFR?", "chat_history": []})["answer"] == "ok"
+    assert seen[0] == seen[1] and seen[0].startswith(registry.get("Basic").static_prefix)
+
+    _write(prompt_dir / "Basic_V2.txt", "Answer in French.\n\n{context}", 3_000)
+    chain.invoke({"input": "What is the TFR?", "chat_history": []})
+    assert seen[-1] == "Answer in French.\n\nTFR is 0.8 to 15 mL/min."
+    assert [p.text for p in changes] == ["Answer in French.\n\n{context}"]   # e.g. clears the answer cache
@@ -0,0 +1,64 @@
+"""
+Unit tests for the pluggable embedding / LLM provider layer.
+"""
+import math
+import pytest
+from providers import (
+    HashingEmbeddings, benchmark, embedding_id, get_chat_model, get_embeddings, index_suffix, require_api_key,
+)
+
+def _cos(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+def test_hashing_embedder_is_deterministic_and_normalised():
+    """Test that the offline embedder is stable, unit length and ranks related text higher."""
+    emb = HashingEmbeddings()
+    q = emb.embed_query("How does temperature affect mixing?")
+    assert q == HashingEmbeddings().embed_query("How does temperature affect mixing?")
+    assert math.isclose(math.sqrt(sum(v * v for v in q)), 1.0, rel_tol=1e-9)
+    related, unrelated = emb.embed_documents([
+        "Temperature affects viscosity in microfluidic mixing.",
+        "The chip supports a total flow rate range of 0.8-15 mL/min.",
+    ])
+    assert _cos(q, related) > _cos(q, unrelated)
+
+def test_provider_selection(monkeypatch):
+    """Test config-driven selection, index separation and error on unknown providers."""
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "hashing")
+    assert isinstance(get_embeddings(), HashingEmbeddings)
+    assert index_suffix() == "__hashing-384"
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "openai")
+    monkeypatch.delenv("OPENAI_EMBEDDING_MODEL", raising=False)
+    assert index_suffix() == "" and embedding_id() == "text-embedding-3-small"
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "cloud9")
+    with pytest.raises(ValueError, match="EMBEDDING_PROVIDER"):
+        get_embeddings()
+
+def test_api_key_only_required_for_openai(monkeypatch):
+    """Test that offline backends run without OPENAI_API_KEY."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "hashing")
+    monkeypatch.setenv("LLM_PROVIDER", "local")
+    require_api_key()
+    monkeypatch.setenv("LLM_PROVIDER", "openai")
+    require_api_key(llm=False)
+    with pytest.raises(ValueError, match="OPENAI_API_KEY"):
+        require_api_key()
+
+def test_local_llm_uses_configured_endpoint(monkeypatch):
+    """Test that LLM_PROVIDER=local targets the local OpenAI-compatible endpoint."""
+    pytest.importorskip("langchain_openai")
+    monkeypatch.setenv("LLM_PROVIDER", "local")
+    monkeypatch.setenv("LOCAL_LLM_BASE_URL", "http://127.0.0.1:8080/v1")
+    monkeypatch.setenv("LOCAL_LLM_MODEL", "qwen2.5:7b")
+    llm = get_chat_model()
+    assert llm.openai_api_base == "http://127.0.0.1:8080/v1"
+    assert llm.model_name == "qwen2.5:7b"
+
+def test_benchmark_runs_offline(tmp_path):
+    """Test the latency benchmark end to end with the hashing backend."""
+    pytest.importorskip("langchain_chroma")
+    (tmp_path / "a.txt").write_text("TAMARA flow rate range is 0.8-15 mL/min. " * 30)
+    results = benchmark(["hashing"], str(tmp_path), queries=3)
+    assert results["hashing"]["chunks"] > 0
+    assert results["hashing"]["p95_ms"] >= results["hashing"]["p50_ms"] > 0
@@ -0,0 +1,76 @@
+"""
+Unit tests for background RAG warm-up in the LangGraph agent.
+"""
+import threading
+import time
+
+import pytest
+
+tamara_graph = pytest.importorskip("tamara_graph")
+
+class SlowBuild:
+    """Stand-in for build_rag_chain that records calls and can fail once."""
+
+    def __init__(self, delay_s=0.2, fail_first=False):
+        self.delay_s = delay_s
+        self.fail_first = fail_first
+        self.calls = 0
+        self.threads = []
+
+    def __call__(self, timings=None):
+        self.calls += 1
+        self.threads.append(threading.current_thread().name)
+        time.sleep(self.delay_s)
+        if self.fail_first and self.calls == 1:
+            raise RuntimeError("vector store unavailable")
+        timings["kb_sync"] = self.delay_s
+        return f"chain{self.calls}", "llm"
+
+def test_background_init_does_not_block(monkeypatch):
+    """Test that start-up returns at once and the first question waits only for the remainder."""
+    build = SlowBuild(delay_s=0.3)
+    monkeypatch.setattr(tamara_graph, "build_rag_chain", build)
+    manager = tamara_graph.RAGManager()
+
+    start = time.perf_counter()
+    future = manager.start_background()
+    assert time.perf_counter() - start < 0.1
+    assert manager.start_background() is future
+
+    time.sleep(0.2)   # operator types the question while init runs
+    start = time.perf_counter()
+    assert manager.ensure_initialized() == ("chain1", "llm")
+    assert time.perf_counter() - start < 0.25
+    assert build.calls == 1 and build.threads == ["rag-warmup"]
+    assert manager.timings["kb_sync"] == 0.3 and manager.timings["total"] >= 0.3
+
+def test_concurrent_callers_share_one_build(monkeypatch):
+    """Test that simultaneous questions during warm-up all get the same chain."""
+    build = SlowBuild(delay_s=0.1)
+    monkeypatch.setattr(tamara_graph, "build_rag_chain", build)
+    manager = tamara_graph.RAGManager()
+    manager.start_background()
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(manager.ensure_initialized())) for _ in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert results == [("chain1", "llm")] * 4 and build.calls == 1
+
+def test_failed_background_init_retries_inline(monkeypatch):
+    """Test that a failed warm-up is retried on the first question."""
+    build = SlowBuild(delay_s=0.01, fail_first=True)
+    monkeypatch.setattr(tamara_graph, "build_rag_chain", build)
+    manager = tamara_graph.RAGManager()
+    manager.start_background().exception()
+    assert manager.ensure_initialized() == ("chain2", "llm")
+    assert build.calls == 2 and build.threads[1] == threading.current_thread().name
+
+def test_lazy_init_without_warmup(monkeypatch):
+    """Test that the manager still builds on first use when no warm-up was started."""
+    build = SlowBuild(delay_s=0)
+    monkeypatch.setattr(tamara_graph, "build_rag_chain", build)
+    manager = tamara_graph.RAGManager()
+    assert manager.ensure_initialized() == manager.ensure_initialized() == ("chain1", "llm")
+    assert build.calls == 1
@@ -0,0 +1,95 @@
+"""
+Unit tests for the conditional history-aware retriever.
+"""
+from typing import List
+
+import pytest
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.retrievers import BaseRetriever
+from reformulation import (
+    ReformulationStats, create_conditional_history_aware_retriever, reference_reason, top_similarity,
+)
+
+PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Rewrite the question as a standalone question."),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+HISTORY = [HumanMessage(content="What is the TFR range of TAMARA?"), AIMessage(content="0.8 to 15 mL/min.")]
+
+class RecordingRetriever(BaseRetriever):
+    queries: List[str] = []
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun = None) -> List[Document]:
+        self.queries.append(query)
+        return [Document(page_content=f"doc for {query}")]
+
+class CountingLLM(FakeListChatModel):
+    calls: int = 0
+
+    def _call(self, *args, **kwargs):
+        self.calls += 1
+        return super()._call(*args, **kwargs)
+
+def _chain(stats, vectorstore=None):
+    llm = CountingLLM(responses=["What is the FRR range of TAMARA?"])
+    retriever = RecordingRetriever(queries=[])
+    chain = create_conditional_history_aware_retriever(llm, retriever, PROMPT, vectorstore=vectorstore,
+                                                       min_similarity=0.65, stats=stats)
+    return chain, llm, retriever
+
+@pytest.mark.parametrize("question, reason", [
+    ("What is the maximum pressure of the inlet gas supply?", None),
+    ("How do I clean the herringbone chip after an ethanol run?", None),
+    ("What about the FRR?", "follow_up"),
+    ("And the FRR range?", "follow_up"),
+    ("Is it compatible with DMSO?", "reference:it"),
+    ("Can those chips be reused?", "reference:those"),
+    ("Why?", "short"),
+])
+def test_reference_detection(question, reason):
+    """Test the anaphora / follow-up pre-check."""
+    assert reference_reason(question) == reason
+
+def test_skips_when_reformulation_cannot_help():
+    """Test that first turns and self-contained questions bypass the LLM call."""
+    stats = ReformulationStats()
+    chain, llm, retriever = _chain(stats)
+    chain.invoke({"input": "What is TAMARA?", "chat_history": []})
+    chain.invoke({"input": "What is the operating temperature range of the controller?", "chat_history": HISTORY})
+    assert llm.calls == 0
+    assert retriever.queries == ["What is TAMARA?", "What is the operating temperature range of the controller?"]
+    assert stats.skipped == {"empty_history": 1, "self_contained": 1} and stats.skip_rate == 1.0
+
+def test_reformulates_follow_ups_and_reports_savings():
+    """Test that follow-ups are rewritten and the saved latency is estimated from real calls."""
+    stats = ReformulationStats()
+    chain, llm, retriever = _chain(stats)
+    docs = chain.invoke({"input": "And what about the FRR?", "chat_history": HISTORY})
+    chain.invoke({"input": "How long does the standard cleaning protocol take?", "chat_history": HISTORY})
+    assert llm.calls == 1 and retriever.queries[0] == "What is the FRR range of TAMARA?"
+    assert docs[0].page_content == "doc for What is the FRR range of TAMARA?"
+    assert stats.reformulated == 1 and stats.skipped_total == 1
+    assert stats.saved_s == pytest.approx(stats.mean_reformulation_s)
+    assert "skipped 1/2" in stats.summary()
+
+def test_confident_retrieval_skips_rewrite(tmp_path):
+    """Test the similarity pre-check: a strong own-retrieval hit avoids the rewrite."""
+    chroma = pytest.importorskip("langchain_chroma")
+    from providers import HashingEmbeddings
+
+    store = chroma.Chroma(collection_name="kb_reform", persist_directory=str(tmp_path),
+                          embedding_function=HashingEmbeddings())
+    store.add_texts(["Is it safe to open the lid during a pressure test?", "Dialysis membranes and buffers."])
+    assert top_similarity(store, "Is it safe to open the lid during a pressure test?") == pytest.approx(1.0, abs=1e-3)
+
+    stats = ReformulationStats()
+    chain, llm, _retriever = _chain(stats, vectorstore=store)
+    chain.invoke({"input": "Is it safe to open the lid during a pressure test?", "chat_history": HISTORY})
+    chain.invoke({"input": "Is it compatible with chloroform?", "chat_history": HISTORY})
+    assert stats.skipped == {"confident": 1} and llm.calls == 1
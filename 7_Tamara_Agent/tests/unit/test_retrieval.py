@@ -0,0 +1,109 @@
+"""
+Unit tests for the BM25 index, reciprocal-rank fusion and the hybrid KB retriever.
+"""
+import os
+import pytest
+from langchain_core.documents import Document
+from retrieval import BM25_NAME, BM25Index, HybridRetriever, rrf_fuse, tokenize
+
+MANUAL = {
+    "manual.txt": "The FRR sets the ratio between the aqueous and solvent flows. " * 3,
+    "chips.txt": "The HERRINGBONE chip mixes by chaotic advection at low flow rates. " * 3,
+    "states.txt": "In state READY the PLC accepts b_START_SEQ; in state ERROR it waits for a reset. " * 3,
+    "general.txt": "TAMARA is a microfluidic formulation system for lipid nanoparticles. " * 3,
+}
+
+def test_tokenize_keeps_identifiers():
+    """Test that compound identifiers are indexed whole and by their parts."""
+    tokens = tokenize("Check DB9.DBX258 and FB_2a at 0.8-15 mL/min")
+    assert {"db9.dbx258", "db9", "dbx258", "fb_2a", "fb", "2a", "0.8-15"} <= set(tokens)
+    assert "and" not in tokens
+
+def test_bm25_ranks_exact_terms_and_supports_removal(tmp_path):
+    """Test BM25 ranking, incremental removal and JSON round trip."""
+    index = BM25Index()
+    for name, text in MANUAL.items():
+        index.add(name, text, {"source": name})
+    assert index.search("What is the FRR?", k=1)[0][0] == "manual.txt"
+    assert index.search("b_START_SEQ", k=1)[0][0] == "states.txt"
+    assert index.search("unrelated words") == []
+
+    path = str(tmp_path / BM25_NAME)
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.search("herringbone") == index.search("herringbone")
+
+    loaded.remove("manual.txt")
+    assert "manual.txt" not in loaded and loaded.search("FRR") == []
+    assert loaded.postings.get("frr") is None
+
+def test_rrf_fuse():
+    """Test that items ranked well by both lists win and every item is kept."""
+    fused = dict(rrf_fuse([["a", "b", "c"], ["c", "a", "d"]], k=60))
+    assert max(fused, key=fused.get) == "a"
+    assert set(fused) == {"a", "b", "c", "d"}
+    assert fused["a"] == pytest.approx(1 / 61 + 1 / 62)
+
+@pytest.fixture
+def kb(tmp_path):
+    chroma = pytest.importorskip("langchain_chroma")
+    from providers import HashingEmbeddings
+    kb_dir, db_dir = tmp_path / "kb", tmp_path / "db"
+    kb_dir.mkdir()
+    db_dir.mkdir()
+    for name, text in MANUAL.items():
+        (kb_dir / name).write_text(text)
+    store = chroma.Chroma(collection_name="kb_hybrid", persist_directory=str(db_dir),
+                          embedding_function=HashingEmbeddings())
+    return store, kb_dir, db_dir
+
+def test_sync_keeps_bm25_in_step_with_manifest(kb):
+    """Test that ingestion builds, updates and backfills the BM25 index alongside the vectors."""
+    from kb_ingest import load_manifest, manifest_path, sync_knowledge_base
+
+    def manifest_ids():
+        files = load_manifest(manifest_path(str(db_dir)))["files"]
+        return {cid for entry in files.values() for cid in entry["chunks"]}
+
+    store, kb_dir, db_dir = kb
+    sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    path = os.path.join(db_dir, BM25_NAME)
+    assert set(BM25Index.load(path).lengths) == manifest_ids()
+
+    (kb_dir / "manual.txt").unlink()
+    (kb_dir / "chips.txt").write_text("The STAGGERED chip replaces the herringbone design. " * 3)
+    sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    index = BM25Index.load(path)
+    assert set(index.lengths) == manifest_ids()
+    assert index.search("FRR") == [] and index.search("staggered")
+
+    os.remove(path)  # index built before hybrid retrieval existed: backfilled without re-embedding
+    report = sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    assert report.chunks_added == 0
+    assert set(BM25Index.load(path).lengths) == manifest_ids()
+
+def test_hybrid_retriever_surfaces_exact_term_matches(kb):
+    """Test that a lexical-only hit makes it into the fused top k with its metadata."""
+    from kb_ingest import sync_knowledge_base
+
+    store, kb_dir, db_dir = kb
+    sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    bm25 = BM25Index.load(os.path.join(db_dir, BM25_NAME))
+    retriever = HybridRetriever(vectorstore=store, bm25=bm25, k=2)
+    docs = retriever.invoke("FRR")
+    assert len(docs) == 2
+    assert docs[0].metadata["source"] == "manual.txt"
+    assert docs[0].metadata["rrf_score"] >= docs[1].metadata["rrf_score"]
+
+def test_hybrid_retriever_fills_from_bm25_store():
+    """Test that chunks found only by BM25 are materialised from the index's own copy."""
+
+    class EmptyStore:
+        def similarity_search(self, query, k):
+            return [Document(page_content="vector only", metadata={"source": "v"}, id="v1")]
+
+    bm25 = BM25Index()
+    bm25.add("b1", "FRR flow rate ratio", {"source": "manual.txt"})
+    docs = HybridRetriever(vectorstore=EmptyStore(), bm25=bm25, k=5).invoke("FRR")
+    assert {d.id for d in docs} == {"v1", "b1"}
+    assert next(d for d in docs if d.id == "b1").metadata["source"] == "manual.txt"
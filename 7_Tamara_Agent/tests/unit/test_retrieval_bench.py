@@ -0,0 +1,73 @@
+"""
+Unit tests for the retrieval benchmark harness and its golden set.
+"""
+import json
+import os
+
+import pytest
+from langchain_core.documents import Document
+from providers import HashingEmbeddings
+from retrieval_bench import (
+    DEFAULT_GOLDEN, GoldenQuestion, load_golden, matches_target, percentile, recall_at_k, reciprocal_rank,
+    run_benchmark,
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+KB_DIR = os.path.join(HERE, "..", "..", "Knowledge_base", "txt")
+
+def _doc(text, source="User_Manual_TAMARA.txt", section=""):
+    return Document(page_content=text, metadata={"source": f"txt/{source}", "section": section})
+
+def test_target_matching_and_metrics():
+    """Test target matching (source, section, text, heading fallback), recall@k, reciprocal rank and percentiles."""
+    clean = _doc("Clean the chip after every run.", section="How often should I clean the chip?")
+    assert matches_target(clean, {"source": "User_Manual_TAMARA.txt", "section": "how often"})
+    assert not matches_target(clean, {"source": "TAMARA specifications.tables.txt"})
+    assert matches_target(_doc("## How often should I clean the chip?\nAfter every run."), {"section": "clean the chip"})
+    assert not matches_target(_doc("How often should I clean the chip?"), {"section": "clean the chip"})
+
+    docs = [_doc("unrelated"), clean, _doc("TFR 0.8 to 15 mL/min")]
+    targets = [{"section": "clean the chip"}, {"contains": "0.8 TO 15"}]
+    assert (recall_at_k(docs, targets, 1), recall_at_k(docs, targets, 2), recall_at_k(docs, targets, 3)) == (0.0, 0.5, 1.0)
+    assert reciprocal_rank(docs, targets) == 0.5 and reciprocal_rank(docs[:1], targets) == 0.0
+    assert (percentile([5, 1, 3, 2, 4], 50), percentile([5, 1, 3, 2, 4], 95), percentile([], 50)) == (3, 5, 0.0)
+
+def test_golden_set_is_valid(tmp_path):
+    """Test that the shipped golden set loads and only names KB files that exist; malformed sets are rejected."""
+    version, questions = load_golden(DEFAULT_GOLDEN)
+    assert version >= 1 and len(questions) >= 20
+    sources = {t["source"] for q in questions for t in q.targets if "source" in t}
+    assert sources <= set(os.listdir(KB_DIR))
+
+    bad = tmp_path / "bad.json"
+    bad.write_text(json.dumps({"version": 1, "questions": [{"id": "a", "question": "?", "targets": [{"file": "x"}]}]}))
+    with pytest.raises(ValueError):
+        load_golden(str(bad))
+
+def test_run_benchmark(tmp_path):
+    """Test an offline benchmark run: index stats plus per-retriever recall, MRR and latency."""
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    (kb / "manual.md").write_text("## Cleaning\nFlush the chip with ethanol after every run.\n\n"
+                                  "## Pressure test\nClose the lid and start the pressure test from the menu.\n")
+    (kb / "specs.md").write_text("## Specifications\nThe total flow rate ranges from 0.8 to 15 mL/min.\n")
+    questions = [GoldenQuestion("clean", "How do I clean the chip?", [{"section": "Cleaning"}]),
+                 GoldenQuestion("tfr", "What is the total flow rate range?", [{"contains": "0.8 to 15"}])]
+    indexes, results = run_benchmark(str(kb), questions, str(tmp_path / "work"), HashingEmbeddings(),
+                                     backends=["flat"], retrievers=["vector", "hybrid"], k_values=[2], ks=[1, 5])
+    assert [(i.backend, i.chunking) for i in indexes] == [("flat", "table")] and indexes[0].chunks >= 2
+    assert indexes[0].index_bytes > 0 and indexes[0].ingest_s > 0
+    assert [(r.retriever, r.k) for r in results] == [("vector", 2), ("hybrid", 2)]
+    hybrid = results[1]
+    assert set(hybrid.recall) == {"recall@1", "recall@2"}
+    assert hybrid.recall["recall@2"] == 1.0 and hybrid.mrr > 0.5 and hybrid.misses == []
+    assert 0 < hybrid.p50_ms <= hybrid.p95_ms
+
+def test_golden_recall_floor(tmp_path):
+    """Test that hybrid retrieval on the real KB keeps its golden-set recall (deterministic hashing embedder)."""
+    _version, questions = load_golden(DEFAULT_GOLDEN)
+    _indexes, results = run_benchmark(KB_DIR, questions, str(tmp_path), HashingEmbeddings(),
+                                      backends=["flat"], retrievers=["vector", "hybrid"], k_values=[6])
+    vector, hybrid = results
+    assert hybrid.recall["recall@6"] >= 0.7 and hybrid.mrr >= 0.55
+    assert hybrid.recall["recall@6"] > vector.recall["recall@6"]
@@ -0,0 +1,75 @@
+"""
+Unit tests for token streaming through the agent graph.
+"""
+from typing import List, TypedDict
+
+import pytest
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import END, StateGraph
+from streaming import ANSWER_TAG, LatencyStats, TurnTiming, stream_turn
+
+class State(TypedDict):
+    messages: List
+
+def _graph(answer_llm, other_llm):
+    def node(state: State) -> State:
+        other_llm.invoke("rewrite the question")
+        reply = answer_llm.invoke(state["messages"])
+        return {"messages": state["messages"] + [AIMessage(content=reply.content)]}
+
+    graph = StateGraph(State)
+    graph.add_node("answer", node)
+    graph.set_entry_point("answer")
+    graph.add_edge("answer", END)
+    return graph.compile()
+
+def test_streams_only_tagged_answer_tokens():
+    """Test that answer tokens arrive incrementally and untagged LLM calls are not streamed."""
+    answer = FakeListChatModel(responses=["0.8 to 15 mL/min"]).with_config(tags=[ANSWER_TAG])
+    other = FakeListChatModel(responses=["What is the TFR range?"])
+    tokens: List[str] = []
+    state, timing = stream_turn(_graph(answer, other), {"messages": [HumanMessage(content="TFR?")]}, tokens.append)
+    assert "".join(tokens) == timing.text == "0.8 to 15 mL/min"
+    assert len(tokens) == timing.chunks > 1
+    assert state["messages"][-1].content == "0.8 to 15 mL/min"
+    assert 0 <= timing.ttft_s <= timing.total_s
+
+def test_untagged_turn_is_not_streamed():
+    """Test that a turn without answer tokens reports no time to first token."""
+    llm = FakeListChatModel(responses=["ok"])
+    state, timing = stream_turn(_graph(llm, llm), {"messages": [HumanMessage(content="status")]}, print)
+    assert not timing.streamed and timing.text == ""
+    assert state["messages"][-1].content == "ok"
+
+def test_latency_stats():
+    """Test that only streamed turns count towards the session medians."""
+    stats = LatencyStats()
+    assert stats.summary() == "streamed answers 0"
+    for ttft, total in [(0.5, 2.0), (0.3, 1.0), (0.4, 3.0)]:
+        stats.record(TurnTiming(ttft_s=ttft, total_s=total))
+    stats.record(TurnTiming(total_s=9.0))
+    assert stats.summary() == "streamed answers 3, median first token 0.40s, median complete 2.00s"
+
+def test_agent_graph_streams_rag_answer(monkeypatch):
+    """Test that a knowledge question streams through the agent graph's ask_kb node."""
+    tamara_graph = pytest.importorskip("tamara_graph")
+    from langchain.chains import create_retrieval_chain
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+    from langchain_core.documents import Document
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.runnables import RunnableLambda
+
+    llm = FakeListChatModel(responses=["See the inlet gas specification."])
+    prompt = ChatPromptTemplate.from_messages([("system", "{context}"), ("human", "{input}")])
+    chain = create_retrieval_chain(
+        RunnableLambda(lambda _q: [Document(page_content="Inlet gas specification table.")]),
+        create_stuff_documents_chain(llm.with_config(tags=[ANSWER_TAG]), prompt))
+    monkeypatch.setattr(tamara_graph.rag_manager, "ensure_initialized", lambda: (chain, llm))
+    monkeypatch.setattr(tamara_graph, "get_answer_cache", lambda: None)
+
+    tokens: List[str] = []
+    state = {"messages": [HumanMessage(content="What is the maximum inlet gas pressure?")]}
+    state, timing = stream_turn(tamara_graph.build_graph(), state, tokens.append)
+    assert timing.streamed and len(tokens) > 1
+    assert "".join(tokens) == state["messages"][-1].content == "See the inlet gas specification."
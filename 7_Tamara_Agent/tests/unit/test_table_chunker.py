@@ -0,0 +1,109 @@
+"""
+Unit tests for the table-aware splitter used on the Docling-style KB exports.
+"""
+import pytest
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from table_chunker import TableAwareSplitter, compare_splitters, is_structured, parse_table, sections
+
+PAD = " " * 120
+SPEC = "\n".join([
+    "## TAMARA specifications",
+    "",
+    f"| Inlet volumes {PAD}| Depends on reservoir size {PAD}| Depends on reservoir size {PAD}|",
+    f"|{'-' * 140}|{'-' * 140}|{'-' * 140}|",
+] + [f"| Parameter {i} {PAD}| value {i} mL/min {PAD}| value {i} mL/min {PAD}|" for i in range(30)] + [
+    "",
+    "## Cleaning",
+    "",
+    "Rinse the chip with ethanol &amp; water after every run.",
+    "",
+    "| Contents .................................... | 34 |",
+    "|---|---|",
+])
+
+def test_parse_table_collapses_padding_and_merged_cells():
+    """Test that padding, dot leaders and repeated merged cells are removed."""
+    table = parse_table([
+        f"| TFR {PAD}| 0.8 to 15 mL/min {PAD}| 0.8 to 15 mL/min {PAD}|",
+        "|------|------|------|",
+        f"| FRR {PAD}| 1:1 to 1:10 {PAD}| 1:1 to 1:10 {PAD}|",
+        "| Standard Cleaning protocol ............................. 34 | |",
+        "| Specifications | Specifications | Specifications |",
+    ])
+    assert table.header == "| TFR | 0.8 to 15 mL/min |\n| --- | --- |"
+    assert table.rows == ["| FRR | 1:1 to 1:10 |", "| Standard Cleaning protocol … 34 |", "| Specifications |"]
+
+def test_parse_table_keeps_equal_values_in_distinct_columns():
+    """Test that equal neighbouring values are kept when the column is not merged across the table."""
+    table = parse_table([
+        "| Parameter | Chip A | Chip B |",
+        "|---|---|---|",
+        "| Max TFR | 15 | 15 |",
+        "| Repeatability | Low | Great |",
+    ])
+    assert table.header == "| Parameter | Chip A | Chip B |\n| --- | --- | --- |"
+    assert table.rows == ["| Max TFR | 15 | 15 |", "| Repeatability | Low | Great |"]
+    assert parse_table(["| Max TFR | 15 | 15 |"]).rows == ["| Max TFR | 15 | 15 |"]
+
+def test_sections_follow_headings():
+    """Test that blocks are grouped under their heading and HTML entities are decoded."""
+    parsed = dict(sections(SPEC))
+    assert list(parsed) == ["TAMARA specifications", "Cleaning"]
+    assert parsed["Cleaning"][0] == "Rinse the chip with ethanol & water after every run."
+
+def test_rows_stay_with_header_and_heading():
+    """Test that a long table is split between rows, each chunk repeating heading and header."""
+    splitter = TableAwareSplitter(chunk_size=300)
+    chunks = splitter.split_sections(SPEC)
+    table_chunks = [c for s, c in chunks if s == "TAMARA specifications"]
+    assert len(table_chunks) > 1
+    rows_seen = []
+    for chunk in table_chunks:
+        assert chunk.startswith("## TAMARA specifications\n\n| Inlet volumes | Depends on reservoir size |\n| --- | --- |")
+        assert len(chunk) <= 300
+        rows_seen += [line for line in chunk.splitlines() if line.startswith("| Parameter")]
+    assert rows_seen == [f"| Parameter {i} | value {i} mL/min |" for i in range(30)]
+    assert all("  " not in c for _s, c in chunks)
+
+def test_split_documents_routes_by_structure():
+    """Test that Docling exports get section metadata and plain text uses the fallback splitter."""
+    splitter = TableAwareSplitter(chunk_size=300, fallback=RecursiveCharacterTextSplitter(chunk_size=50, chunk_overlap=0))
+    assert is_structured("notes.tables.md", "plain") and is_structured("manual.txt", SPEC)
+    docs = splitter.split_documents([
+        Document(page_content=SPEC, metadata={"source": "spec.tables.txt"}),
+        Document(page_content="Plain notes about the chip. " * 10, metadata={"source": "notes.txt"}),
+    ])
+    structured = [d for d in docs if d.metadata["source"] == "spec.tables.txt"]
+    plain = [d for d in docs if d.metadata["source"] == "notes.txt"]
+    assert {d.metadata["section"] for d in structured} == {"TAMARA specifications", "Cleaning"}
+    assert len(plain) > 1 and all("section" not in d.metadata for d in plain)
+
+def test_report_shows_reduction(tmp_path):
+    """Test that the comparison report counts fewer chunks and tokens for padded tables."""
+    (tmp_path / "spec.tables.txt").write_text(SPEC)
+    results = compare_splitters(str(tmp_path), {
+        "recursive": RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50),
+        "tables": TableAwareSplitter(),
+    })
+    assert results["tables"]["chunks"] < results["recursive"]["chunks"]
+    assert results["tables"]["tokens"] < results["recursive"]["tokens"] / 2
+
+def test_changing_splitter_resplits_kb(tmp_path):
+    """Test that a KB synced with the recursive splitter is re-split when the default changes."""
+    chroma = pytest.importorskip("langchain_chroma")
+    from kb_ingest import load_manifest, manifest_path, sync_knowledge_base
+    from providers import HashingEmbeddings
+
+    kb_dir, db_dir = tmp_path / "kb", tmp_path / "db"
+    kb_dir.mkdir()
+    db_dir.mkdir()
+    (kb_dir / "spec.tables.txt").write_text(SPEC)
+    store = chroma.Chroma(collection_name="kb_tables", persist_directory=str(db_dir),
+                          embedding_function=HashingEmbeddings())
+    sync_knowledge_base(store, str(kb_dir), str(db_dir),
+                        splitter=RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50))
+    report = sync_knowledge_base(store, str(kb_dir), str(db_dir))
+    assert report.updated_files == ["spec.tables.txt"] and report.chunks_deleted > 0
+    assert load_manifest(manifest_path(str(db_dir)))["splitter"].startswith("tables-v1/")
+    assert not sync_knowledge_base(store, str(kb_dir), str(db_dir)).changed
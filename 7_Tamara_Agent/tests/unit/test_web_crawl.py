@@ -0,0 +1,203 @@
+"""
+Unit tests for the incremental website crawler, against a local HTTP server.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from providers import HashingEmbeddings
+from web_crawl import HostLimiter, extract_page, normalize_url, sync_website
+
+def _html(title, body, links=()):
+    anchors = "".join(f'<a href="{href}">link</a>' for href in links)
+    return (f"<html><head><title>{title}</title><style>p {{color: red}}</style></head>"
+            f"<body><nav>{anchors}</nav><p>{body}</p><script>var x = 1;</script></body></html>")
+
+class Site:
+    """Pages served by the fixture: path → (html, etag, last_modified); None = 404, "error" = 500,
+    "304" = an unconditional 304."""
+
+    def __init__(self):
+        self.pages = {
+            "/": (_html("Home", "Inside Therapeutics builds the TAMARA LNP formulation platform.",
+                        ["/products", "/news#latest", "https://elsewhere.example/", "/private/x", "/brochure.pdf"]),
+                  '"home-1"', None),
+            "/products": (_html("Products", "TAMARA mixes lipids and RNA on a herringbone chip.", ["/"]),
+                          None, "Mon, 01 Sep 2025 10:00:00 GMT"),
+            "/news": (_html("News", "TAMARA now supports the baffle chip."), None, None),
+            "/private/x": (_html("Private", "Not for crawlers."), None, None),
+        }
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+@pytest.fixture
+def site():
+    state = Site()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with state.lock:
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            try:
+                time.sleep(0.05)
+                self._serve()
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+        def _serve(self):
+            if self.path == "/robots.txt":
+                body = b"User-agent: *\nDisallow: /private/\n"
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain")
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            state.requests.append(self.path)
+            page = state.pages.get(self.path)
+            if page == "304":
+                self.send_response(304)
+                self.end_headers()
+                return
+            if page is None or page == "error":
+                self.send_error(404 if page is None else 500)
+                return
+            html, etag, last_modified = page
+            if (etag and self.headers.get("If-None-Match") == etag) or \
+               (last_modified and self.headers.get("If-Modified-Since") == last_modified):
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            if etag:
+                self.send_header("ETag", etag)
+            if last_modified:
+                self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            self.wfile.write(html.encode("utf-8"))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state.url = f"http://127.0.0.1:{server.server_port}"
+    yield state
+    server.shutdown()
+    server.server_close()
+
+def _sync(store, db, site, **kwargs):
+    kwargs.setdefault("delay_s", 0.0)
+    return sync_website(store, str(db), seeds=[site.url], **kwargs)
+
+def test_extract_page_and_normalize_url():
+    """Test visible-text extraction and URL normalisation."""
+    text, title, links = extract_page(_html("Home", "Hello &amp; welcome.", ["/a/", "#top"]))
+    assert (text, title, links) == ("Hello & welcome.", "Home", ["/a/", "#top"])
+    assert normalize_url("/a/?q=1#frag", "http://Host.example/x") == "http://host.example/a?q=1"
+    assert normalize_url("mailto:info@insidetx.com") is None
+    assert normalize_url("/brochure.PDF", "http://host.example/") is None
+
+def test_incremental_recrawl(site, tmp_path):
+    """Test that a re-crawl re-embeds only changed pages and removes vanished ones."""
+    from flat_store import FlatVectorStore
+
+    db = tmp_path / "db"
+    store = FlatVectorStore(str(db), HashingEmbeddings())
+    first = _sync(store, db, site)
+    pages = {site.url + p for p in ("/", "/products", "/news")}
+    assert set(first.added_pages) == pages and first.disallowed == 1
+    assert "/private/x" not in site.requests and not any("elsewhere" in r for r in site.requests)
+    sources = {m["sourceURL"] for m in store.get(include=["metadatas"])["metadatas"]}
+    assert sources == pages and first.chunks_added == len(store) == 3
+
+    # ETag and Last-Modified pages answer 304; the page without validators hashes the same
+    second = _sync(store, db, site)
+    assert (second.not_modified, second.unchanged, second.chunks_added, second.changed) == (2, 1, 0, False)
+
+    site.pages["/"] = (_html("Home", "Inside Therapeutics builds TAMARA and TAMARA Mini.", ["/products"]),
+                       '"home-2"', None)
+    site.pages["/news"] = None
+    third = _sync(store, db, site)
+    assert third.updated_pages == [site.url + "/"] and third.removed_pages == [site.url + "/news"]
+    assert (third.chunks_added, third.chunks_deleted, len(store)) == (1, 2, 2)
+    assert any("TAMARA Mini" in d.page_content for d in store.similarity_search("TAMARA Mini", k=2))
+
+def test_failed_page_keeps_chunks_and_legacy_collection_is_replaced(site, tmp_path):
+    """Test that a server error keeps a page's chunks and a manifest-less collection is replaced once."""
+    chroma = pytest.importorskip("langchain_chroma")
+    db = tmp_path / "db"
+    store = chroma.Chroma(collection_name="web", persist_directory=str(db), embedding_function=HashingEmbeddings())
+    store.add_texts(["Firecrawl scrape of the home page."], ids=["legacy-1"])
+
+    report = _sync(store, db, site, max_pages=2)
+    assert report.rebuilt and "legacy-1" not in store.get(include=[])["ids"]
+    assert len(report.added_pages) == 2
+
+    site.pages["/products"] = "error"
+    failed = _sync(store, db, site)
+    assert failed.failed == [site.url + "/products"] and failed.chunks_deleted == 0
+    assert site.url + "/products" in {m["sourceURL"] for m in store.get(include=["metadatas"])["metadatas"]}
+
+def test_legacy_chunks_survive_a_failed_first_crawl(site, tmp_path):
+    """Test that legacy chunks are still replaced when the first crawl failed (or was interrupted)."""
+    from flat_store import FlatVectorStore
+
+    db = tmp_path / "db"
+    store = FlatVectorStore(str(db), HashingEmbeddings())
+    store.add_texts(["Firecrawl scrape of the home page."], ids=["legacy-1"])
+    site.pages["/"] = "error"
+    failed = _sync(store, db, site)
+    assert failed.failed == [site.url + "/"] and not failed.rebuilt and "legacy-1" in store.get(include=[])["ids"]
+
+    site.pages["/"] = (_html("Home", "Inside Therapeutics builds TAMARA."), None, None)
+    report = _sync(store, db, site)
+    assert report.rebuilt and report.added_pages == [site.url + "/"]
+    assert store.get(include=[])["ids"] and "legacy-1" not in store.get(include=[])["ids"]
+    assert not _sync(store, db, site).rebuilt
+
+def test_recheck_cap_and_limits(site, tmp_path):
+    """Test that known pages are re-checked past max_pages, and 304-without-entry / oversized pages."""
+    from flat_store import FlatVectorStore
+
+    db = tmp_path / "db"
+    store = FlatVectorStore(str(db), HashingEmbeddings())
+    _sync(store, db, site)
+    site.pages["/extra"] = (_html("Extra", "New page."), None, None)
+    site.pages["/"] = (_html("Home", "Inside Therapeutics builds TAMARA.", ["/extra", "/products", "/news"]),
+                       '"home-2"', None)
+    site.pages["/news"] = None
+    capped = _sync(store, db, site, max_pages=1)
+    assert capped.updated_pages == [site.url + "/"] and capped.removed_pages == [site.url + "/news"]
+    assert capped.not_modified == 1 and "/extra" not in site.requests
+
+    site.pages["/extra"] = "304"
+    site.pages["/big"] = (_html("Big", "x" * 5000), None, None)
+    site.pages["/"] = (_html("Home", "Inside Therapeutics builds TAMARA.", ["/extra", "/big"]), '"home-3"', None)
+    report = _sync(store, db, site, max_bytes=2000)
+    assert report.failed == [site.url + "/big"] and report.not_modified == 2   # /products, /extra
+    assert site.url + "/extra" not in {m["sourceURL"] for m in store.get(include=["metadatas"])["metadatas"]}
+
+def test_politeness_limits(site, tmp_path):
+    """Test that requests to one host are capped at per_host in flight and spaced by delay_s."""
+    from flat_store import FlatVectorStore
+
+    for i in range(6):
+        site.pages[f"/p{i}"] = (_html(f"P{i}", f"Page number {i}."), None, None)
+    site.pages["/"] = (_html("Home", "Index.", [f"/p{i}" for i in range(6)]), None, None)
+    store = FlatVectorStore(None, HashingEmbeddings())
+    _sync(store, tmp_path, site, concurrency=6, per_host=2)
+    assert site.max_in_flight == 2 and len(site.requests) == 7
+
+    limiter = HostLimiter(per_host=4, delay_s=0.1)
+    start = time.perf_counter()
+    for _ in range(3):
+        limiter.acquire("h")
+        limiter.release("h")
+    assert time.perf_counter() - start >= 0.2
@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+web_crawl.py — Incremental re-crawl of the Inside Therapeutics website into a vector store
+
+6_Tamara_workflow/Rag_web_scrape_firecrawl.py scraped the site once; refreshing it
+meant deleting the collection and re-embedding every page. ``sync_website`` crawls
+the site itself and keeps a manifest (``web_manifest.json``, beside the collection)
+with, per URL, the ETag, Last-Modified, SHA-256 of the extracted text and chunk ids:
+
+- pages are re-requested conditionally (If-None-Match / If-Modified-Since), so an
+  unchanged page costs a 304 and nothing else
+- a 200 whose extracted text hashes the same is not re-split nor re-embedded
+- a changed page is re-split; only chunks whose text changed are embedded (chunk ids
+  are kb_ingest.chunk_id(url, text, occurrence)), vanished chunks are deleted
+- a page answering 404/410 has its chunks deleted; other errors keep the old chunks
+
+Crawling starts from the seed URLs plus every page already in the manifest (those are
+always re-checked), follows links on the seeds' hosts breadth-first up to
+``max_depth``/``max_pages`` (new pages only), reads at most ``max_bytes`` per response,
+and is polite: robots.txt is honoured (including Crawl-delay), at most ``per_host``
+requests per host are in flight and request starts on a host are ``delay_s`` apart.
+Fetches run concurrently on a thread pool; splitting and upserts stay on the caller's
+thread. Chunk metadata mirrors the Firecrawl loader (``source``, ``sourceURL``,
+``title``), so federated.py cites website chunks the same way.
+
+A collection without a manifest (built by the Firecrawl script) is replaced once, after
+a crawl succeeded: its chunk ids are kept in the manifest (``legacy``) until then, so a
+first crawl that fails or is interrupted does not forget them. A manifest for another
+embedding model forces a rebuild the same way.
+
+Run:
+  $ python web_crawl.py                              # refresh ./db/chroma_db_InsideTxWeb_firecrawl
+  $ python web_crawl.py --store flat                 # ./db/flat_db_InsideTxWeb (VECTOR_STORE=flat agent)
+  $ python web_crawl.py --seed https://www.insidetx.com --max-pages 50 --db-dir DIR
+"""
+
+from __future__ import annotations
+import argparse
+import hashlib
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import urllib.robotparser
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urldefrag, urljoin, urlsplit
+
+from langchain_core.documents import Document
+
+from flat_store import BACKENDS, bulk_writes, checkpoint, open_vectorstore, vector_store_backend
+from kb_ingest import ADD_BATCH_SIZE, chunk_id, load_manifest, save_manifest
+
+logger = logging.getLogger(__name__)
+
+WEB_MANIFEST_NAME = "web_manifest.json"
+DEFAULT_SEEDS = ("https://www.insidetx.com",)
+USER_AGENT = "TamaraWebCrawler/1.0"
+CHUNK_SIZE = 1000      # as the Firecrawl build
+CHUNK_OVERLAP = 0
+DEFAULT_MAX_PAGES = 200
+DEFAULT_MAX_DEPTH = 3
+DEFAULT_CONCURRENCY = 4
+DEFAULT_PER_HOST = 2
+DEFAULT_DELAY_S = 0.5
+DEFAULT_TIMEOUT_S = 15.0
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024   # per response; larger pages are reported as failed
+GONE = (404, 410)
+SKIPPED_EXTENSIONS = (".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".zip", ".mp4", ".css", ".js")
+
+# ----------------------------------------------------------------------------
+# HTML → text
+# ----------------------------------------------------------------------------
+
+_SKIP_TAGS = {"script", "style", "noscript", "svg", "template", "head", "nav"}   # nav: same menu on every page
+_BLOCK_TAGS = {"p", "div", "section", "article", "header", "footer", "main", "li", "ul", "ol", "br",
+               "h1", "h2", "h3", "h4", "h5", "h6", "tr", "table", "blockquote", "aside"}
+
+class _PageParser(HTMLParser):
+    """Visible text (one line per block element), <title> and <a href> targets."""
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.lines: List[str] = [""]
+        self.title = ""
+        self.links: List[str] = []
+        self._skip = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._in_title = True
+        elif tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+        if tag in _BLOCK_TAGS:
+            self.lines.append("")
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag in _SKIP_TAGS and self._skip:
+            self._skip -= 1
+        if tag in _BLOCK_TAGS:
+            self.lines.append("")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip:
+            self.lines[-1] += data
+
+    def text(self) -> str:
+        lines = (" ".join(line.split()) for line in self.lines)
+        return "\n".join(line for line in lines if line)
+
+def extract_page(html: str) -> Tuple[str, str, List[str]]:
+    """(text, title, raw link targets) of an HTML page."""
+    parser = _PageParser()
+    parser.feed(html)
+    parser.close()
+    return parser.text(), " ".join(parser.title.split()), parser.links
+
+def normalize_url(url: str, base: Optional[str] = None) -> Optional[str]:
+    """Absolute http(s) URL without fragment (trailing "/" dropped except for the root), or None."""
+    url = urldefrag(urljoin(base, url) if base else url)[0]
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return None
+    if parts.path.lower().endswith(SKIPPED_EXTENSIONS):
+        return None
+    path = parts.path.rstrip("/") or "/"
+    return f"{parts.scheme}://{parts.netloc.lower()}{path}" + (f"?{parts.query}" if parts.query else "")
+
+# ----------------------------------------------------------------------------
+# Fetching & politeness
+# ----------------------------------------------------------------------------
+
+@dataclass
+class FetchResult:
+    url: str
+    status: int                       # HTTP status; 0 = network error
+    text: str = ""
+    title: str = ""
+    links: List[str] = field(default_factory=list)
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    error: Optional[str] = None
+
+class HostLimiter:
+    """At most ``per_host`` requests in flight per host, request starts ``delay_s`` apart."""
+
+    def __init__(self, per_host: int = DEFAULT_PER_HOST, delay_s: float = DEFAULT_DELAY_S) -> None:
+        self.per_host = per_host
+        self.delay_s = delay_s
+        self._lock = threading.Lock()
+        self._slots: Dict[str, threading.Semaphore] = {}
+        self._next_start: Dict[str, float] = {}
+        self._delays: Dict[str, float] = {}
+
+    def set_delay(self, host: str, delay_s: float) -> None:
+        with self._lock:
+            self._delays[host] = max(self.delay_s, delay_s)
+
+    def acquire(self, host: str) -> None:
+        with self._lock:
+            slot = self._slots.setdefault(host, threading.Semaphore(self.per_host))
+        slot.acquire()
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self._delays.get(host, self.delay_s)
+        if start > now:
+            time.sleep(start - now)
+
+    def release(self, host: str) -> None:
+        self._slots[host].release()
+
+class Fetcher:
+    """Conditional GETs through the host limiter, with robots.txt checked per host."""
+
+    def __init__(self, limiter: HostLimiter, timeout_s: float = DEFAULT_TIMEOUT_S,
+                 user_agent: str = USER_AGENT, respect_robots: bool = True,
+                 max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.limiter = limiter
+        self.timeout_s = timeout_s
+        self.max_bytes = max_bytes
+        self.user_agent = user_agent
+        self.respect_robots = respect_robots
+        self._robots: Dict[str, Optional[urllib.robotparser.RobotFileParser]] = {}
+        self._robots_lock = threading.Lock()
+
+    def _robots_for(self, url: str) -> Optional[urllib.robotparser.RobotFileParser]:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        with self._robots_lock:
+            if origin in self._robots:
+                return self._robots[origin]
+            robots = None
+            try:
+                request = urllib.request.Request(f"{origin}/robots.txt", headers={"User-Agent": self.user_agent})
+                with urllib.request.urlopen(request, timeout=self.timeout_s) as response:
+                    robots = urllib.robotparser.RobotFileParser()
+                    robots.parse(self._read(response).decode("utf-8", errors="ignore").splitlines())
+                delay = robots.crawl_delay(self.user_agent)
+                if delay:
+                    self.limiter.set_delay(parts.netloc, float(delay))
+            except (urllib.error.URLError, OSError, ValueError):
+                robots = None   # no robots.txt (or unreachable): everything allowed
+            self._robots[origin] = robots
+            return robots
+
+    def _read(self, response) -> bytes:
+        """The response body, or ValueError past ``max_bytes``."""
+        body = response.read(self.max_bytes + 1)
+        if len(body) > self.max_bytes:
+            raise ValueError(f"response larger than {self.max_bytes} bytes")
+        return body
+
+    def allowed(self, url: str) -> bool:
+        if not self.respect_robots:
+            return True
+        robots = self._robots_for(url)
+        return robots is None or robots.can_fetch(self.user_agent, url)
+
+    def fetch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+        headers = {"User-Agent": self.user_agent, "Accept": "text/html,text/plain;q=0.9"}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        host = urlsplit(url).netloc
+        self.limiter.acquire(host)
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers),
+                                        timeout=self.timeout_s) as response:
+                status = response.status
+                content_type = response.headers.get_content_type()
+                charset = response.headers.get_content_charset() or "utf-8"
+                body = self._read(response).decode(charset, errors="ignore")
+                result = FetchResult(url, status, etag=response.headers.get("ETag"),
+                                     last_modified=response.headers.get("Last-Modified"))
+        except urllib.error.HTTPError as e:
+            return FetchResult(url, e.code, etag=etag, last_modified=last_modified,
+                               error=None if e.code == 304 else str(e))
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            return FetchResult(url, 0, error=str(e))
+        finally:
+            self.limiter.release(host)
+        if content_type == "text/html":
+            result.text, result.title, links = extract_page(body)
+            result.links = [link for link in (normalize_url(href, url) for href in links) if link]
+        elif content_type == "text/plain":
+            result.text = body.strip()
+        else:
+            result.error = f"unsupported content type {content_type}"
+        return result
+
+# ----------------------------------------------------------------------------
+# Sync
+# ----------------------------------------------------------------------------
+
+@dataclass
+class CrawlReport:
+    added_pages: List[str] = field(default_factory=list)
+    updated_pages: List[str] = field(default_factory=list)
+    removed_pages: List[str] = field(default_factory=list)
+    not_modified: int = 0          # 304 answers (for a page not in the manifest: nothing to keep)
+    unchanged: int = 0             # 200 with the same text hash
+    failed: List[str] = field(default_factory=list)
+    disallowed: int = 0            # skipped by robots.txt
+    chunks_added: int = 0
+    chunks_deleted: int = 0
+    rebuilt: bool = False
+    crawl_s: float = 0.0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added_pages or self.updated_pages or self.removed_pages or self.rebuilt)
+
+    def summary(self) -> str:
+        return (f"pages +{len(self.added_pages)} ~{len(self.updated_pages)} -{len(self.removed_pages)} "
+                f"304:{self.not_modified} ={self.unchanged}"
+                + (f" failed {len(self.failed)}" if self.failed else "")
+                + f"; chunks embedded {self.chunks_added}, deleted {self.chunks_deleted}"
+                + (" (rebuilt)" if self.rebuilt else "") + f"; {self.crawl_s:.1f}s")
+
+def default_web_splitter():
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+def web_manifest_path(persist_directory: str) -> str:
+    return os.path.join(persist_directory, WEB_MANIFEST_NAME)
+
+def _split_page(page: FetchResult, splitter) -> List[Tuple[str, Document]]:
+    metadata = {"source": page.url, "sourceURL": page.url, "title": page.title}
+    seen: Dict[str, int] = {}
+    out = []
+    for text in splitter.split_text(page.text):
+        occurrence = seen.get(text, 0)
+        seen[text] = occurrence + 1
+        out.append((chunk_id(page.url, text, occurrence), Document(page_content=text, metadata=dict(metadata))))
+    return out
+
+def _add(vectorstore, docs: List[Tuple[str, Document]]) -> None:
+    for i in range(0, len(docs), ADD_BATCH_SIZE):
+        batch = docs[i:i + ADD_BATCH_SIZE]
+        vectorstore.add_documents([d for _id, d in batch], ids=[_id for _id, _d in batch])
+
+def sync_website(vectorstore, persist_directory: str, seeds: Sequence[str] = DEFAULT_SEEDS, splitter=None,
+                 embedding: Optional[str] = None, max_pages: int = DEFAULT_MAX_PAGES,
+                 max_depth: int = DEFAULT_MAX_DEPTH, concurrency: int = DEFAULT_CONCURRENCY,
+                 per_host: int = DEFAULT_PER_HOST, delay_s: float = DEFAULT_DELAY_S,
+                 timeout_s: float = DEFAULT_TIMEOUT_S, respect_robots: bool = True,
+                 max_bytes: int = DEFAULT_MAX_BYTES) -> CrawlReport:
+    """Re-crawl the site and bring ``vectorstore`` in line with it, embedding only changed pages.
+
+    Args:
+        vectorstore: Chroma or FlatVectorStore (add_documents(ids=), delete(ids=), get())
+        persist_directory: Where the manifest lives (the collection's persist dir)
+        seeds: Start URLs; links are followed on their hosts only
+        splitter: Text splitter (default: recursive 1000/0, as the Firecrawl build)
+        embedding: Vector space id; a manifest for another one forces a rebuild
+        max_pages / max_depth: Crawl bounds for new pages (pages already in the manifest are
+            always re-checked, first)
+        concurrency: Fetch threads; per_host / delay_s: politeness limits per host
+        respect_robots: Honour robots.txt (Disallow and Crawl-delay)
+        max_bytes: Largest response body read; bigger pages are reported as failed
+
+    Returns:
+        Pages added, updated, removed, not modified and failed; chunks embedded and deleted.
+    """
+    start = time.perf_counter()
+    splitter = splitter or default_web_splitter()
+    path = web_manifest_path(persist_directory)
+    manifest = load_manifest(path)
+    report = CrawlReport()
+    if manifest and embedding and manifest.get("embedding", embedding) != embedding:
+        logger.info(f"Website index was embedded with {manifest['embedding']}, now {embedding}; rebuilding")
+        manifest = None
+    if manifest is None:
+        # Replaced once a crawl has produced pages, so a failed crawl keeps the old index;
+        # the ids stay in the manifest until then (a crawl may fail or be interrupted first)
+        manifest = {"version": 1, "pages": {}}
+        legacy = vectorstore.get(include=[])["ids"]
+        if legacy:
+            manifest["legacy"] = legacy
+    if embedding:
+        manifest["embedding"] = embedding
+    pages: Dict[str, Dict] = manifest["pages"]
+
+    hosts = {urlsplit(u).netloc for u in (normalize_url(s) for s in seeds) if u}
+    limiter = HostLimiter(per_host=per_host, delay_s=delay_s)
+    fetcher = Fetcher(limiter, timeout_s=timeout_s, respect_robots=respect_robots, max_bytes=max_bytes)
+    frontier = list(dict.fromkeys([u for u in (normalize_url(s) for s in seeds) if u] + list(pages)))
+    visited = set()
+    pending: List[Tuple[str, Document]] = []
+
+    def handle(page: FetchResult) -> None:
+        entry = pages.get(page.url)
+        if page.status == 304:
+            report.not_modified += 1
+            if entry is None:   # no validators were sent: nothing cached to keep or index
+                logger.warning(f"{page.url}: 304 without a conditional request; not indexed")
+                return
+            entry.update(etag=page.etag or entry.get("etag"), last_modified=page.last_modified or entry.get("last_modified"))
+            return
+        if page.status in GONE:
+            if entry:
+                vectorstore.delete(ids=entry["chunks"])
+                report.chunks_deleted += len(entry["chunks"])
+                report.removed_pages.append(page.url)
+                del pages[page.url]
+            return
+        if page.error or page.status != 200:
+            report.failed.append(page.url)
+            logger.warning(f"{page.url}: {page.error or page.status}; keeping its previous chunks")
+            return
+        digest = hashlib.sha256(page.text.encode("utf-8")).hexdigest()
+        validators = {"etag": page.etag, "last_modified": page.last_modified}
+        if entry and entry["sha256"] == digest:
+            report.unchanged += 1
+            entry.update(validators)
+            return
+        chunks = _split_page(page, splitter)
+        old_ids = set(entry["chunks"]) if entry else set()
+        new_ids = [cid for cid, _doc in chunks]
+        stale = sorted(old_ids.difference(new_ids))
+        if stale:
+            vectorstore.delete(ids=stale)
+        fresh = [(cid, doc) for cid, doc in chunks if cid not in old_ids]
+        pending.extend(fresh)
+        report.chunks_added += len(fresh)
+        report.chunks_deleted += len(stale)
+        (report.updated_pages if entry else report.added_pages).append(page.url)
+        pages[page.url] = {"sha256": digest, "chunks": new_ids, "title": page.title, **validators}
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="crawl") as pool:
+        for depth in range(max_depth + 1):
+            wave = []
+            for url in frontier:
+                if url in visited or (url not in pages and len(visited) >= max_pages):
+                    continue
+                visited.add(url)
+                if not fetcher.allowed(url):
+                    report.disallowed += 1
+                    continue
+                wave.append(url)
+            if not wave:
+                break
+            futures = [pool.submit(fetcher.fetch, url, pages.get(url, {}).get("etag"),
+                                   pages.get(url, {}).get("last_modified")) for url in wave]
+            frontier = []
+            for future in futures:
+                page = future.result()
+                handle(page)
+                frontier.extend(link for link in page.links if urlsplit(link).netloc in hosts)
+            _add(vectorstore, pending)
+            pending.clear()
+            checkpoint(vectorstore)        # vectors on disk before the manifest lists them
+            save_manifest(path, manifest)  # progress survives an interrupted crawl
+
+    if "legacy" in manifest and pages:
+        current = {cid for entry in pages.values() for cid in entry["chunks"]}
+        legacy = [cid for cid in manifest["legacy"] if cid not in current]
+        logger.info(f"Replacing {len(legacy)} chunks from before the incremental crawler")
+        if legacy:
+            vectorstore.delete(ids=legacy)
+        report.chunks_deleted += len(legacy)
+        report.rebuilt = True
+        del manifest["legacy"]
+    checkpoint(vectorstore)
+    save_manifest(path, manifest)
+    report.crawl_s = time.perf_counter() - start
+    logger.info(f"Website sync: {report.summary()}")
+    return report
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Incrementally re-crawl the website into its vector store")
+    parser.add_argument("--seed", action="append", help=f"start URL (repeatable, default {DEFAULT_SEEDS[0]})")
+    parser.add_argument("--store", choices=BACKENDS, default=None, help="vector store backend (default: VECTOR_STORE)")
+    parser.add_argument("--db-dir", default=None,
+                        help="collection dir (default: ./db/chroma_db_InsideTxWeb_firecrawl or ./db/flat_db_InsideTxWeb)")
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_PAGES)
+    parser.add_argument("--max-depth", type=int, default=DEFAULT_MAX_DEPTH)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--delay", type=float, default=DEFAULT_DELAY_S, help="seconds between requests per host")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from embed_pipeline import close_embeddings
+    from embedding_cache import cached_embeddings
+
+    load_dotenv()
+    backend = vector_store_backend(args.store)
+    default_dir = "db/flat_db_InsideTxWeb" if backend == "flat" else "db/chroma_db_InsideTxWeb_firecrawl"
+    db_dir = args.db_dir or os.path.join(script_dir, default_dir)
+    # the website collection is queried with text-embedding-3-small (see federated.py)
+    embeddings = cached_embeddings(model="text-embedding-3-small")
+    try:
+        store = open_vectorstore(db_dir, embeddings, backend)
+        with bulk_writes(store):
+            report = sync_website(store, db_dir, seeds=args.seed or DEFAULT_SEEDS,
+                                  embedding="text-embedding-3-small", max_pages=args.max_pages,
+                                  max_depth=args.max_depth, concurrency=args.concurrency, delay_s=args.delay)
+    finally:
+        close_embeddings(embeddings)
+    print(report.summary())
+
+if __name__ == "__main__":
+    main()